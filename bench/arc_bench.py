@@ -0,0 +1,319 @@
+# -*- coding: ascii -*-
+"""
+Benchmark de arcos G2/G3 con RTCP
+=================================
+Genera programas de acabado 5 ejes con arcos (G2/G3 con A/C cambiando a lo
+largo del arco, M451 activo) y reporta para cada uno los bloques del
+planificador generados y el tiempo de ciclo simulado.
+
+Con RTCP, mc_arc() divide el arco en cuerdas ($12) y cada cuerda con
+rotacion pasa por rtcp_segment_line() ($645). El programa arc_planar (sin
+rotacion) es el control: debe dar los mismos bloques en ambos builds.
+
+Uso:
+    python bench/arc_bench.py                        # build/
+    python bench/arc_bench.py --build RUTA           # otro directorio de build
+    python bench/arc_bench.py --compare RUTA_BASE    # compara contra otro build
+    python bench/arc_bench.py --out bench_gcode      # guarda los programas generados
+    python bench/arc_bench.py --arcs 50 --arc-tolerance 0.002
+    python bench/arc_bench.py --no-sim               # solo bloques (rapido)
+
+Bloques: resumen de grblHAL_validator -a (exacto, no ejecuta el movimiento).
+Tiempo de ciclo: grblHAL_sim con el programa enviado por TCP contando
+caracteres; desde el fin del bloque de posicionamiento inicial hasta el fin
+del ultimo bloque, en tiempo simulado. El simulador avanza casi en tiempo
+real, un programa de 20 arcos tarda del orden de un minuto por build.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILD_DIR = os.path.join(REPO_DIR, "build")
+EXE_SUFFIX = ".exe" if os.name == "nt" else ""
+ARCS = 20
+ARC_TOLERANCE = 0.01
+TIME_FACTOR = "0"
+TIMEOUT = 600.0
+PRINT_TIME = "1000000"  # -r: sin muestras periodicas, solo fin de bloque
+RX_WINDOW = 1000        # bytes en vuelo, RX_BUFFER_SIZE del simulador es 1024
+
+
+# =====================================================================
+# PROGRAMAS
+# =====================================================================
+
+def _arcs(rnd, n, da, dc, helix=0.0, tangent=False):
+    """Arcos encadenados G2/G3 de radio 3-20 mm alrededor de X60 Y20 (a 60 mm del
+    pivote), con A inclinado 20 grados. A y C avanzan hasta da/dc grados por arco;
+    con tangent=True C sigue la tangente del arco (acabado con herramienta orientada)."""
+    x0, y0 = 60.0, 20.0
+    out = ["G21 G90 G17 G94", "M451", "G1 X%.1f Y%.1f Z-50 A20 C0 F2000" % (x0, y0)]
+    x, y, z, a, c = x0, y0, -50.0, 20.0, 0.0
+    for i in range(n):
+        r = rnd.uniform(3.0, 20.0)
+        ang = rnd.uniform(0.3, 1.5) * math.pi
+        side = 1.0 if x < x0 else -1.0
+        cx, cy = x + side * r, y
+        ex, ey = cx - side * r * math.cos(ang), cy + (1.0 if y < y0 else -1.0) * r * math.sin(ang)
+        ccw = i % 2 == 1
+        travel = (math.atan2(ey - cy, ex - cx) - math.atan2(y - cy, x - cx)) % (2.0 * math.pi)
+        if not ccw:
+            travel -= 2.0 * math.pi
+        x, y = ex, ey
+        a = max(5.0, min(35.0, a + rnd.uniform(-da, da)))
+        c += math.degrees(travel) if tangent else rnd.uniform(0.5, 1.0) * dc
+        z += helix
+        out.append("G%d X%.4f Y%.4f Z%.4f I%.4f J0 A%.4f C%.4f F1000"
+                   % (3 if ccw else 2, x, y, z, side * r, a, c))
+    out.append("M450")
+    return out
+
+
+PROGRAMS = {
+    "arc_planar": lambda rnd, n: _arcs(rnd, n, 0.0, 0.0),
+    "arc_rot_small": lambda rnd, n: _arcs(rnd, n, 1.0, 3.0),
+    "arc_rot_large": lambda rnd, n: _arcs(rnd, n, 5.0, 30.0),
+    "arc_tangent_c": lambda rnd, n: _arcs(rnd, n, 0.0, 0.0, tangent=True),
+    "arc_helical_c": lambda rnd, n: _arcs(rnd, n, 0.0, 15.0, 0.05),
+}
+
+
+def generate(out_dir, arcs=ARCS, arc_tolerance=ARC_TOLERANCE, programs=PROGRAMS):
+    """Escribe los programas (deterministas, semilla fija). Retorna {nombre: ruta}."""
+    paths = {}
+    for name, gen in programs.items():
+        path = os.path.join(out_dir, name + ".nc")
+        with open(path, "w") as f:
+            f.write("\n".join(["$12=%g" % arc_tolerance] + gen(random.Random(name), arcs)) + "\n")
+        paths[name] = path
+    return paths
+
+
+# =====================================================================
+# MEDICION
+# =====================================================================
+
+def run_validator(exe, path):
+    """Bloques del planificador segun el resumen de grblHAL_validator -a.
+    Retorna (bloques, error o None)."""
+    workdir = tempfile.mkdtemp(prefix="arc_bench_")    # $12 escribe EEPROM.DAT
+    try:
+        proc = subprocess.run([exe, "-a", path], cwd=workdir,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    records = [json.loads(l) for l in proc.stdout.decode(errors="replace").splitlines()
+               if l.startswith("{")]
+    if not records or "blocks" not in records[-1]:
+        return 0, "sin resumen (codigo de salida %d)" % proc.returncode
+    error = None
+    if len(records) > 1:
+        first = records[0]
+        error = "linea %d: %s" % (first["line"], first.get("message", "alarma %s" % first.get("alarm")))
+    return records[-1]["blocks"], error
+
+
+def parse_steps(path):
+    """Tiempo simulado desde el fin del primer bloque al fin del ultimo."""
+    ends = []
+    expect_end = False
+    with open(path) as f:
+        for line in f:
+            if line.startswith("# block number"):
+                expect_end = True
+            elif expect_end and line.strip():
+                ends.append(float(line.split()[0]))
+                expect_end = False
+    return ends[-1] - ends[0] if len(ends) > 1 else 0.0
+
+
+def _free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _connect(port, proc, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline and proc.poll() is None:
+        try:
+            return socket.create_connection(("127.0.0.1", port), timeout=1.0)
+        except OSError:
+            time.sleep(0.2)
+    raise ConnectionError("No se pudo conectar al simulador (puerto %d)" % port)
+
+
+def stream_sim(exe, lines, workdir, time_factor=TIME_FACTOR, timeout=TIMEOUT, print_time=PRINT_TIME):
+    """Arranca grblHAL_sim en workdir (EEPROM.DAT, steps.out y blocks.out) y le
+    envia las lineas por TCP (-p) contando caracteres, como un sender, para
+    mantener lleno el buffer del planificador. Al recibir la ultima respuesta
+    pide la salida (0x06), que guarda el EEPROM.
+    Retorna (lineas recibidas que no son ok, error o None)."""
+    port = _free_port()
+    cmd = [exe, "-p", str(port), "-t", time_factor, "-r", print_time,
+           "-s", os.path.join(workdir, "steps.out"), "-b", os.path.join(workdir, "blocks.out"),
+           "-e", os.path.join(workdir, "EEPROM.DAT")]
+    proc = subprocess.Popen(cmd, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    output = []
+    error = None
+    sock = None
+    try:
+        sock = _connect(port, proc)
+        sock.settimeout(timeout)
+        # Con EEPROM nuevo el arranque reporta error:7 antes del banner, no cuenta como respuesta
+        buf = b""
+        while b"GrblHAL" not in buf:
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionError("conexion cerrada antes del banner")
+            buf += data
+        buf = buf[buf.index(b"GrblHAL"):].partition(b"\n")[2]
+        pending = []    # longitudes de las lineas enviadas sin respuesta
+        sent = responses = 0
+        while responses < len(lines):
+            while sent < len(lines) and sum(pending) + len(lines[sent]) + 1 <= RX_WINDOW:
+                sock.sendall((lines[sent] + "\n").encode())
+                pending.append(len(lines[sent]) + 1)
+                sent += 1
+            data = sock.recv(4096)
+            if not data:
+                error = "conexion cerrada"
+                break
+            buf += data
+            while b"\n" in buf:
+                raw, buf = buf.split(b"\n", 1)
+                out = raw.decode(errors="replace").strip()
+                if out == "ok" or out.startswith("error"):
+                    if out != "ok" and error is None:
+                        error = "linea %d: %s" % (responses + 1, out)
+                    pending.pop(0)
+                    responses += 1
+                elif out.startswith("ALARM"):
+                    error = out
+                    responses = len(lines)
+                elif out:
+                    output.append(out)
+        sock.sendall(b"\x06")
+        proc.wait(timeout=30)
+    except socket.timeout:
+        error = "sin respuesta (timeout %.0f s)" % timeout
+    except (OSError, ConnectionError, subprocess.TimeoutExpired) as e:
+        error = error or str(e)
+    finally:
+        if sock:
+            sock.close()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+    return output, error
+
+
+def run_sim(exe, path, time_factor=TIME_FACTOR, timeout=TIMEOUT):
+    """Ejecuta el programa en el simulador, el G4 final responde cuando el
+    movimiento termino. Retorna (tiempo de ciclo s, error o None)."""
+    with open(path) as f:
+        lines = [l.strip() for l in f if l.strip()] + ["G4 P0.01"]
+
+    workdir = tempfile.mkdtemp(prefix="arc_bench_")
+    try:
+        _, error = stream_sim(exe, lines, workdir, time_factor, timeout)
+        cycle = parse_steps(os.path.join(workdir, "steps.out"))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return cycle, error
+
+
+def measure(build, path, sim=True, time_factor=TIME_FACTOR):
+    """(bloques, tiempo de ciclo o None, errores) de un programa con un build."""
+    blocks, err = run_validator(os.path.join(build, "grblHAL_validator" + EXE_SUFFIX), path)
+    errors = [err] if err else []
+    cycle = None
+    if sim:
+        cycle, err = run_sim(os.path.join(build, "grblHAL_sim" + EXE_SUFFIX), path, time_factor)
+        if err:
+            errors.append(err)
+    return blocks, cycle, errors
+
+
+def _cycle(value):
+    return "%10.3f" % value if value is not None else "%10s" % "-"
+
+
+def benchmark(paths, build, baseline=None, sim=True, time_factor=TIME_FACTOR):
+    print("%-16s %8s %10s%s" % ("programa", "bloques", "ciclo s",
+                                "  %8s %10s %8s %8s" % ("base blq", "base s", "blq", "ciclo")
+                                if baseline else ""))
+    ok = True
+    for name, path in paths.items():
+        blocks, cycle, errors = measure(build, path, sim, time_factor)
+        row = "%-16s %8d %s" % (name, blocks, _cycle(cycle))
+        if baseline:
+            blocks_b, cycle_b, errors_b = measure(baseline, path, sim, time_factor)
+            row += "  %8d %s %7.2fx" % (blocks_b, _cycle(cycle_b), float(blocks_b) / blocks if blocks else 0.0)
+            row += " %7.2fx" % (cycle_b / cycle) if cycle and cycle_b else "  %7s" % "-"
+            if errors_b:
+                row += "  [BASE: %s]" % "; ".join(errors_b)
+        if errors:
+            row += "  [ERROR: %s]" % "; ".join(errors)
+            ok = False
+        print(row)
+    return ok
+
+
+def main(programs=PROGRAMS):
+    parser = argparse.ArgumentParser(description="Benchmark de arcos RTCP (bloques y tiempo de ciclo)")
+    parser.add_argument("--build", default=BUILD_DIR, metavar="RUTA",
+                        help="Directorio con grblHAL_validator y grblHAL_sim (default: %(default)s)")
+    parser.add_argument("--compare", metavar="RUTA",
+                        help="Directorio de build de referencia (p.ej. build anterior)")
+    parser.add_argument("--arcs", type=int, default=ARCS, metavar="N",
+                        help="Arcos por programa (default: %(default)s)")
+    parser.add_argument("--arc-tolerance", type=float, default=ARC_TOLERANCE, metavar="MM",
+                        help="$12 para los programas (default: %(default)s)")
+    parser.add_argument("-t", "--time-factor", default=TIME_FACTOR, metavar="F",
+                        help="Factor de tiempo del simulador, 0 = lo mas rapido posible (default: %(default)s)")
+    parser.add_argument("--no-sim", action="store_true",
+                        help="No ejecutar el simulador, solo contar bloques")
+    parser.add_argument("--out", metavar="DIR",
+                        help="Guardar los programas generados en DIR")
+    parser.add_argument("--only", metavar="TEXTO",
+                        help="Ejecutar solo los programas cuyo nombre contiene TEXTO")
+    args = parser.parse_args()
+
+    if args.only:
+        programs = dict((k, v) for k, v in programs.items() if args.only in k)
+
+    for build in filter(None, [args.build, args.compare]):
+        for exe in ["grblHAL_validator"] + ([] if args.no_sim else ["grblHAL_sim"]):
+            if not os.path.isfile(os.path.join(build, exe + EXE_SUFFIX)):
+                print("[ERROR] No existe %s en %s" % (exe, build))
+                sys.exit(2)
+
+    out_dir = os.path.abspath(args.out or tempfile.mkdtemp(prefix="arc_bench_gcode_"))
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        paths = generate(out_dir, args.arcs, args.arc_tolerance, programs)
+        ok = benchmark(paths, os.path.abspath(args.build),
+                       args.compare and os.path.abspath(args.compare),
+                       not args.no_sim, args.time_factor)
+    finally:
+        if not args.out:
+            shutil.rmtree(out_dir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+# -*- coding: ascii -*-
+"""
+Barrido de tamanos de buffer con RTCP
+=====================================
+Compila grblHAL_sim con cada SEGMENT_BUFFER_SIZE (config.h, en tiempo de
+compilacion) y ejecuta programas 5 ejes de referencia con cada tamano del
+buffer del planificador ($398, se aplica al reiniciar) a -t 0. Para cada
+configuracion reporta:
+
+  ciclo      tiempo de ciclo simulado, del final de la pausa G4 que sigue
+             al posicionamiento (o del primer paso) al ultimo paso
+  bajo F     tiempo simulado con la velocidad del TCP por debajo del avance
+             programado (el ultimo F del programa) menos --feed-tolerance
+  Mticks/s   ticks del simulador (F_CPU) por segundo del host
+
+La velocidad del TCP sale de las posiciones de motor muestreadas cada
+--sample s en el fichero de pasos, con la cinematica de rtcp_preflight.py.
+Los settings de la maquina son los de testing_config.ini (--config).
+
+Uso:
+    python bench/buffer_sweep.py                               # 10,15,30 x 35,100,200
+    python bench/buffer_sweep.py --segments 8,15,24 --planner 35,200
+    python bench/buffer_sweep.py --program pieza.nc --json sweep.json
+    python bench/buffer_sweep.py --only fine --work /tmp/sweep
+
+Cada SEGMENT_BUFFER_SIZE se compila en --work/seg<N> (se reutiliza en las
+siguientes ejecuciones, solo recompila lo que cambio). Requiere NumPy.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import arc_bench
+
+sys.path.insert(0, arc_bench.REPO_DIR)
+import rtcp_preflight  # noqa: E402
+
+REPO_DIR = arc_bench.REPO_DIR
+CONFIG_FILE = os.path.join(REPO_DIR, "testing_config.ini")
+WORK_DIR = os.path.join(REPO_DIR, "build", "buffer_sweep")
+SEGMENTS = "10,15,30"       # SEGMENT_BUFFER_SIZE, 15 por defecto en config.h
+PLANNER = "35,100,200"      # $398, 30 a 1000
+SAMPLE = "0.002"            # -r: posicion cada 2 ms simulados
+FEED_TOLERANCE = 0.05
+F_CPU = 16e6                # add_compile_definitions(F_CPU=...) en CMakeLists.txt
+ARCS = 10
+PAUSE = 0.05                # G4 tras el posicionamiento, marca el inicio del ciclo
+AXES = "XYZABC"
+
+
+# =====================================================================
+# PROGRAMAS
+# =====================================================================
+
+def _lines(rnd, n, step, da, dc, feed=3000):
+    """Pasadas de acabado en zigzag con G1 cortos de step mm, A oscila y C gira
+    suavemente a lo largo de la pasada (salida tipica de CAM 5 ejes). da y dc
+    son grados por linea, la fase de A sale de rnd."""
+    out = ["G21 G90 G94", "M451", "G1 X0 Y0 Z-50 A10 C0 F%d" % feed, "G4 P%g" % PAUSE]
+    x = y = c = 0.0
+    phase = rnd.uniform(0.0, 2.0 * math.pi)
+    direction = 1.0
+    for i in range(n):
+        x += direction * step
+        if abs(x) > 40.0:
+            direction = -direction
+            y += 2.0
+        a = 10.0 + 10.0 * math.sin(phase + i * da / 10.0) - 10.0 * math.sin(phase)
+        c += dc
+        z = -50.0 + 2.0 * math.sin(x * 0.1) * math.cos(y * 0.1)
+        out.append("X%.4f Y%.4f Z%.4f A%.4f C%.4f" % (x, y, z, a, c))
+    out.append("M450")
+    return out
+
+
+PROGRAMS = {
+    "lines_fine": lambda rnd: _lines(rnd, 3000, 0.2, 0.05, 0.1),
+    "lines_coarse": lambda rnd: _lines(rnd, 400, 3.0, 1.0, 2.0),
+    "arc_tangent_c": lambda rnd: arc_bench.PROGRAMS["arc_tangent_c"](rnd, ARCS),
+}
+
+
+def generate(out_dir, programs=PROGRAMS):
+    """Escribe los programas (deterministas, semilla fija). Retorna {nombre: ruta}."""
+    paths = {}
+    for name, gen in programs.items():
+        path = os.path.join(out_dir, name + ".nc")
+        with open(path, "w") as f:
+            f.write("\n".join(gen(random.Random(name))) + "\n")
+        paths[name] = path
+    return paths
+
+
+def commanded_feed(lines):
+    """Ultimo F del programa, el avance de las pasadas."""
+    feeds = re.findall(r"F\s*([0-9.]+)", "\n".join(lines).upper())
+    return float(feeds[-1]) if feeds else 0.0
+
+
+# =====================================================================
+# BUILDS Y SETTINGS
+# =====================================================================
+
+def build(work, segments):
+    """Compila grblHAL_sim con SEGMENT_BUFFER_SIZE=segments. Retorna (ejecutable, error)."""
+    build_dir = os.path.join(work, "seg%d" % segments)
+    steps = []
+    if not os.path.isfile(os.path.join(build_dir, "CMakeCache.txt")):
+        steps.append(["cmake", "-S", REPO_DIR, "-B", build_dir, "-DCMAKE_BUILD_TYPE=Release",
+                      "-DCMAKE_C_FLAGS=-DSEGMENT_BUFFER_SIZE=%d" % segments])
+    steps.append(["cmake", "--build", build_dir, "--target", "grblHAL_sim"])
+    for cmd in steps:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if proc.returncode != 0:
+            return None, proc.stdout.decode(errors="replace").strip()[-500:]
+    return os.path.join(build_dir, "grblHAL_sim" + arc_bench.EXE_SUFFIX), None
+
+
+def prepare_eeprom(exe, config, planner, workdir):
+    """Escribe los settings de config y $398 en workdir/EEPROM.DAT, $398
+    se aplica al reiniciar. Retorna ({"$n": valor} segun $$, error o None)."""
+    settings = rtcp_preflight.load_settings(config)
+    lines = ["%s=%g" % (k, v) for k, v in sorted(settings.items()) if k != "$398"]
+    lines += ["$398=%d" % planner, "$$"]
+    output, error = arc_bench.stream_sim(exe, lines, workdir, "0")
+    current = {}
+    for out in output:
+        if out.startswith("$") and "=" in out:
+            key, val = out.split("=", 1)
+            try:
+                current[key] = float(val)
+            except ValueError:
+                pass
+    # Los settings que el simulador no tiene (error:53) se ignoran, solo se avisa
+    missing = [k for k in sorted(settings) if k != "$398" and k not in current]
+    if missing:
+        print("[AVISO] settings no disponibles: %s" % " ".join(missing))
+    if current.get("$398") != planner:
+        return current, error or "$398=%s en lugar de %d" % (current.get("$398"), planner)
+    return current, None
+
+
+# =====================================================================
+# MEDICION
+# =====================================================================
+
+def parse_samples(path):
+    """Muestras [t, pasos...] del fichero de pasos, sin las cabeceras de bloque."""
+    samples = []
+    with open(path) as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                samples.append([float(v) for v in line.split()])
+    return np.array(samples).reshape(-1, 1 + len(AXES))
+
+
+def analyze(path, settings, feed, tolerance=FEED_TOLERANCE):
+    """(ciclo s, s bajo el avance, tiempo simulado total s) de un fichero de pasos.
+    El ciclo empieza al final de la primera pausa (G4 tras el posicionamiento)
+    o en el primer paso si no hay pausa, y acaba en el ultimo paso."""
+    samples = parse_samples(path)
+    if len(samples) < 2:
+        return 0.0, 0.0, samples[-1, 0] if len(samples) else 0.0
+    t = samples[:, 0]
+    moving = np.nonzero(np.any(np.diff(samples[:, 1:], axis=0) != 0, axis=1))[0]
+    if not len(moving):
+        return 0.0, 0.0, t[-1]
+    # Sin bloque no hay muestras, una pausa es un hueco de tiempo entre pasos
+    pauses = np.nonzero(t[moving[1:]] - t[moving[:-1] + 1] >= PAUSE * 0.8)[0]
+    first = moving[pauses[0] + 1] if len(pauses) else moving[0]
+    window = samples[first:moving[-1] + 2]
+    pos = [window[:, 1 + i] / settings.get("$%d" % (100 + i), 250.0) for i in range(len(AXES))]
+    tcp = rtcp_preflight.rtcp_forward(rtcp_preflight.Machine(settings),
+                                      pos[0], pos[1], pos[2], pos[3], pos[5])
+    dt = np.diff(window[:, 0])
+    dist = np.sqrt(sum(np.diff(v) ** 2 for v in tcp))
+    valid = dt > 0.0
+    speed = np.where(valid, dist / np.where(valid, dt, 1.0) * 60.0, 0.0)
+    below = float(dt[valid & (speed < feed * (1.0 - tolerance))].sum())
+    return window[-1, 0] - window[0, 0], below, t[-1]
+
+
+def run_program(exe, eeprom, path, sample=SAMPLE, timeout=arc_bench.TIMEOUT):
+    """Ejecuta un programa con una copia de eeprom a -t 0.
+    Retorna (directorio de trabajo con steps.out, segundos del host, error)."""
+    with open(path) as f:
+        lines = [l.strip() for l in f if l.strip()] + ["G4 P0.01"]
+    workdir = tempfile.mkdtemp(prefix="buffer_sweep_")
+    shutil.copy(eeprom, os.path.join(workdir, "EEPROM.DAT"))
+    t0 = time.time()
+    _, error = arc_bench.stream_sim(exe, lines, workdir, "0", timeout, sample)
+    return workdir, time.time() - t0, error
+
+
+def sweep(paths, work, segments, planners, config, sample=SAMPLE, tolerance=FEED_TOLERANCE):
+    results = []
+    print("%5s %7s %-16s %10s %10s %7s %9s" % ("segm", "planner", "programa", "ciclo s", "bajo F s", "bajo %", "Mticks/s"))
+    for seg in segments:
+        exe, error = build(work, seg)
+        if error:
+            print("[ERROR] SEGMENT_BUFFER_SIZE=%d no compila:\n%s" % (seg, error))
+            results.append({"segments": seg, "error": error})
+            continue
+        for planner in planners:
+            prepdir = tempfile.mkdtemp(prefix="buffer_sweep_eeprom_")
+            try:
+                settings, error = prepare_eeprom(exe, config, planner, prepdir)
+                if error:
+                    print("[ERROR] settings con $398=%d: %s" % (planner, error))
+                    results.append({"segments": seg, "planner": planner, "error": error})
+                    continue
+                for name, path in paths.items():
+                    with open(path) as f:
+                        feed = commanded_feed(f.readlines())
+                    workdir, wall, error = run_program(exe, os.path.join(prepdir, "EEPROM.DAT"), path, sample)
+                    try:
+                        cycle, below, sim_time = analyze(os.path.join(workdir, "steps.out"), settings, feed, tolerance)
+                    finally:
+                        shutil.rmtree(workdir, ignore_errors=True)
+                    row = {"segments": seg, "planner": planner, "program": name, "feed": feed,
+                           "cycle": cycle, "below_feed": below, "ticks_per_sec": sim_time * F_CPU / wall if wall else 0.0}
+                    line = "%5d %7d %-16s %10.3f %10.3f %6.1f%% %9.2f" % (
+                        seg, planner, name, cycle, below, 100.0 * below / cycle if cycle else 0.0,
+                        row["ticks_per_sec"] * 1e-6)
+                    if error:
+                        row["error"] = error
+                        line += "  [ERROR: %s]" % error
+                    results.append(row)
+                    print(line)
+                    sys.stdout.flush()
+            finally:
+                shutil.rmtree(prepdir, ignore_errors=True)
+    return results
+
+
+def _sizes(text, low, high):
+    sizes = [int(v) for v in text.split(",") if v.strip()]
+    for size in sizes:
+        if not low <= size <= high:
+            raise argparse.ArgumentTypeError("%d fuera de %d-%d" % (size, low, high))
+    return sizes
+
+
+def main(programs=PROGRAMS):
+    parser = argparse.ArgumentParser(description="Barrido de SEGMENT_BUFFER_SIZE y $398 con programas RTCP")
+    parser.add_argument("--segments", type=lambda t: _sizes(t, 2, 255), default=_sizes(SEGMENTS, 2, 255),
+                        metavar="N,N", help="SEGMENT_BUFFER_SIZE a compilar (default: %s)" % SEGMENTS)
+    parser.add_argument("--planner", type=lambda t: _sizes(t, 30, 1000), default=_sizes(PLANNER, 30, 1000),
+                        metavar="N,N", help="Bloques del planificador, $398 (default: %s)" % PLANNER)
+    parser.add_argument("--config", default=CONFIG_FILE, metavar="INI",
+                        help="Settings de la maquina (default: %(default)s)")
+    parser.add_argument("--work", default=WORK_DIR, metavar="RUTA",
+                        help="Directorio de los builds (default: %(default)s)")
+    parser.add_argument("--program", action="append", default=[], metavar="NC",
+                        help="Programa adicional (repetible), el avance es su ultimo F")
+    parser.add_argument("--only", metavar="TEXTO",
+                        help="Ejecutar solo los programas cuyo nombre contiene TEXTO")
+    parser.add_argument("--sample", default=SAMPLE, metavar="S",
+                        help="Intervalo de muestreo de posicion en s simulados (default: %(default)s)")
+    parser.add_argument("--feed-tolerance", type=float, default=FEED_TOLERANCE, metavar="FRAC",
+                        help="Bajo F es velocidad < F * (1 - FRAC) (default: %(default)s)")
+    parser.add_argument("--json", metavar="FICHERO",
+                        help="Guardar los resultados en FICHERO")
+    args = parser.parse_args()
+
+    out_dir = tempfile.mkdtemp(prefix="buffer_sweep_gcode_")
+    try:
+        paths = generate(out_dir, programs)
+        for path in args.program:
+            paths[os.path.splitext(os.path.basename(path))[0]] = os.path.abspath(path)
+        if args.only:
+            paths = dict((k, v) for k, v in paths.items() if args.only in k)
+        results = sweep(paths, os.path.abspath(args.work), args.segments, args.planner,
+                        args.config, args.sample, args.feed_tolerance)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+    sys.exit(1 if any("error" in r for r in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
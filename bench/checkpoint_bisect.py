@@ -0,0 +1,303 @@
+# -*- coding: ascii -*-
+"""
+Checkpoints y biseccion de programas largos
+===========================================
+Localiza la linea de un programa largo que provoca un fallo en grblHAL_sim
+(error, ALARM, cuelgue o cierre del simulador, o una respuesta que coincide
+con --match) sin reejecutarlo desde el principio en cada prueba.
+
+  record   ejecuta el programa completo enviando $CHECKPOINT=<fichero> cada
+           --every lineas; los checkpoints quedan en --dir con un indice
+           (checkpoints.json) y el EEPROM.DAT de la ejecucion.
+  replay   restaura el checkpoint mas cercano antes de --line ($RESUME) y
+           envia el resto del programa (o hasta --to), opcionalmente con el
+           fichero de pasos (-s) para compararlo con la ejecucion original.
+  bisect   busca la primera linea L tal que ejecutar el programa hasta L
+           (restaurando el checkpoint anterior a L y reenviando solo la cola,
+           mas un G4 que espera el fin del movimiento) falla.
+
+Uso:
+    python bench/checkpoint_bisect.py record pieza.nc --dir ckp --every 500
+    python bench/checkpoint_bisect.py bisect pieza.nc --dir ckp
+    python bench/checkpoint_bisect.py bisect pieza.nc --dir ckp --match "RTCP:ON"
+    python bench/checkpoint_bisect.py replay pieza.nc --dir ckp --line 12000 --steps cola.out
+
+Un checkpoint solo lo acepta el mismo ejecutable y con los mismos settings que
+lo escribio: los programas que cambian settings ($n=) invalidan los anteriores.
+No se admiten $CHECKPOINT dentro de subrutinas o bucles O-word ni con G66.
+Tras $RESUME la cola llega por el puerto serie simulado como en un envio
+normal, el planificador puede llenarse unos ms (simulados) mas tarde que en la
+ejecucion original: el fallo debe depender del programa, no del instante exacto
+en que llegan las lineas.
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+
+import arc_bench
+
+BUILD_DIR = arc_bench.BUILD_DIR
+EVERY = 200
+TIMEOUT = 120.0           # s reales sin respuesta = cuelgue
+INDEX = "checkpoints.json"
+SYNC = "G4 P0.01"         # responde cuando termina el movimiento encolado
+
+
+def read_program(path):
+    """Lineas no vacias del programa, sin comentarios de linea completa."""
+    with open(path) as f:
+        return [l.strip() for l in f if l.strip() and not l.strip().startswith(";")]
+
+
+def checkpoint_name(line):
+    return "ckp_%07d.bin" % line
+
+
+# =====================================================================
+# ENVIO
+# =====================================================================
+
+def stream(exe, lines, workdir, resume=None, match=None, timeout=TIMEOUT, steps=None):
+    """Arranca grblHAL_sim en workdir (EEPROM.DAT) y envia las lineas por TCP
+    contando caracteres, primero $RESUME=resume si se indica. Se detiene en el
+    primer fallo. Retorna (lineas confirmadas, fallo o None) con fallo =
+    (indice de la linea en lines o None, texto), -1 si falla $RESUME."""
+    port = arc_bench._free_port()
+    cmd = [exe, "-p", str(port), "-t", "0", "-e", os.path.join(workdir, "EEPROM.DAT"),
+           "-b", os.devnull]
+    if steps:
+        cmd += ["-r", "0.001", "-s", steps]
+    proc = subprocess.Popen(cmd, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    if resume:
+        lines = ["$RESUME=" + os.path.abspath(resume)] + lines
+    offset = 1 if resume else 0
+    pattern = re.compile(match) if match else None
+    responses = 0
+    failure = None
+    sock = None
+    try:
+        sock = arc_bench._connect(port, proc)
+        sock.settimeout(timeout)
+        buf = b""
+        while b"GrblHAL" not in buf:
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionError("conexion cerrada antes del banner")
+            buf += data
+        buf = buf[buf.index(b"GrblHAL"):].partition(b"\n")[2]
+        pending = []
+        sent = 0
+        while responses < len(lines) and failure is None:
+            while sent < len(lines) and sum(pending) + len(lines[sent]) + 1 <= arc_bench.RX_WINDOW:
+                sock.sendall((lines[sent] + "\n").encode())
+                pending.append(len(lines[sent]) + 1)
+                sent += 1
+            data = sock.recv(4096)
+            if not data:
+                failure = (responses - offset, "simulador terminado (codigo %s)" % proc.wait(timeout=5))
+                break
+            buf += data
+            while b"\n" in buf and failure is None:
+                raw, buf = buf.split(b"\n", 1)
+                out = raw.decode(errors="replace").strip()
+                if out == "ok" or out.startswith("error"):
+                    if out != "ok":
+                        failure = (responses - offset, out)
+                    pending.pop(0)
+                    responses += 1
+                elif out.startswith("ALARM"):
+                    # la alarma llega durante el movimiento, la linea es aproximada
+                    failure = (responses - offset, out)
+                elif pattern and pattern.search(out):
+                    failure = (responses - offset, out)
+        if proc.poll() is None:
+            sock.sendall(b"\x06")
+            proc.wait(timeout=30)
+    except socket.timeout:
+        failure = (responses - offset, "sin respuesta en %.0f s" % timeout)
+    except (OSError, ConnectionError, subprocess.TimeoutExpired) as e:
+        failure = failure or (None, str(e))
+    finally:
+        if sock:
+            sock.close()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+    return responses - offset, failure
+
+
+# =====================================================================
+# CHECKPOINTS
+# =====================================================================
+
+def record(exe, program, ckp_dir, every=EVERY, match=None, timeout=TIMEOUT):
+    """Ejecuta el programa completo con $CHECKPOINT cada every lineas.
+    Retorna el indice {linea: fichero} y el fallo (o None)."""
+    lines = read_program(program)
+    os.makedirs(ckp_dir, exist_ok=True)
+    for name in os.listdir(ckp_dir):
+        if name.startswith("ckp_"):
+            os.remove(os.path.join(ckp_dir, name))
+
+    out, marks = [], {}     # marks: indice en out -> linea del programa
+    for i, line in enumerate(lines):
+        if i and i % every == 0:
+            marks[len(out)] = i
+            out.append("$CHECKPOINT=" + os.path.abspath(os.path.join(ckp_dir, checkpoint_name(i))))
+        out.append(line)
+
+    confirmed, failure = stream(exe, out, ckp_dir, match=match, timeout=timeout)
+
+    # solo los checkpoints confirmados con ok
+    index = dict((str(line), checkpoint_name(line)) for pos, line in marks.items() if pos < confirmed)
+    with open(os.path.join(ckp_dir, INDEX), "w") as f:
+        json.dump({"program": os.path.abspath(program), "lines": len(lines), "every": every,
+                   "checkpoints": index}, f, indent=1)
+
+    if failure and failure[0] is not None:
+        # indice en out -> linea del programa
+        failure = (failure[0] - sum(1 for pos in marks if pos < failure[0]), failure[1])
+    return index, failure
+
+
+def load_index(ckp_dir):
+    with open(os.path.join(ckp_dir, INDEX)) as f:
+        data = json.load(f)
+    return data, dict((int(k), os.path.join(ckp_dir, v)) for k, v in data["checkpoints"].items())
+
+
+def nearest(checkpoints, line):
+    """(linea, fichero) del ultimo checkpoint tomado con las lineas < line ya
+    procesadas, o (0, None) si no hay ninguno."""
+    before = [l for l in checkpoints if l <= line]
+    return (max(before), checkpoints[max(before)]) if before else (0, None)
+
+
+def replay(exe, program, ckp_dir, start, end=None, match=None, timeout=TIMEOUT, steps=None, sync=False):
+    """Restaura el checkpoint anterior a start y envia las lineas hasta end
+    (exclusiva). Retorna (linea del checkpoint, fallo o None), el fallo con el
+    numero de linea del programa."""
+    lines = read_program(program)
+    _, checkpoints = load_index(ckp_dir)
+    first, path = nearest(checkpoints, start)
+    tail = lines[first:end] + ([SYNC] if sync else [])
+
+    workdir = tempfile.mkdtemp(prefix="ckp_replay_")
+    try:
+        shutil.copy(os.path.join(ckp_dir, "EEPROM.DAT"), workdir)
+        _, failure = stream(exe, tail, workdir, resume=path, match=match, timeout=timeout, steps=steps)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failure and failure[0] is not None:
+        if failure[0] < 0:
+            raise RuntimeError("checkpoint %s no restaurado: %s" % (path, failure[1]))
+        failure = (first + failure[0], failure[1])
+    return first, failure
+
+
+def bisect(exe, program, ckp_dir, match=None, timeout=TIMEOUT, log=print):
+    """Primera linea L (base 0) tal que el programa hasta L inclusive falla.
+    Retorna (L, fallo) o (None, None) si el programa completo no falla."""
+    data, _ = load_index(ckp_dir)
+    lo, hi = 0, data["lines"]
+
+    def fails(n):
+        first, failure = replay(exe, program, ckp_dir, n, n, match, timeout, sync=True)
+        log("  lineas %7d-%-7d (checkpoint %7d): %s" % (first, n, first, failure[1] if failure else "ok"))
+        return failure
+
+    failure = fails(hi)
+    if not failure:
+        return None, None
+    # invariante: el programa hasta lo no falla, hasta hi si
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        f = fails(mid)
+        if f:
+            hi, failure = mid, f
+        else:
+            lo = mid
+    return hi - 1, failure
+
+
+# =====================================================================
+# MAIN
+# =====================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkpoints de grblHAL_sim y biseccion de programas largos")
+    parser.add_argument("mode", choices=["record", "replay", "bisect"])
+    parser.add_argument("program", help="Programa G-code")
+    parser.add_argument("--dir", required=True, metavar="RUTA",
+                        help="Directorio de los checkpoints")
+    parser.add_argument("--build", default=BUILD_DIR, metavar="RUTA",
+                        help="Directorio con grblHAL_sim (default: %(default)s)")
+    parser.add_argument("--every", type=int, default=EVERY, metavar="N",
+                        help="record: checkpoint cada N lineas (default: %(default)s)")
+    parser.add_argument("--match", metavar="REGEX",
+                        help="Cuenta tambien como fallo una respuesta que coincide con REGEX")
+    parser.add_argument("--line", type=int, default=0, metavar="N",
+                        help="replay: primera linea a reenviar (base 0), se restaura el checkpoint anterior")
+    parser.add_argument("--to", type=int, metavar="N",
+                        help="replay: ultima linea (exclusiva), por defecto hasta el final")
+    parser.add_argument("--steps", metavar="FICHERO",
+                        help="replay: fichero de pasos del simulador (-s, muestras cada 1 ms)")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, metavar="S",
+                        help="Segundos reales sin respuesta que cuentan como cuelgue (default: %(default)s)")
+    args = parser.parse_args()
+
+    exe = os.path.join(os.path.abspath(args.build), "grblHAL_sim" + arc_bench.EXE_SUFFIX)
+    if not os.path.isfile(exe):
+        print("[ERROR] No existe %s" % exe)
+        sys.exit(2)
+
+    try:
+        run(exe, args)
+    except RuntimeError as e:
+        print("[ERROR] %s" % e)
+        sys.exit(2)
+
+
+def _number(index):
+    """Numero de linea (base 1) para mostrar."""
+    return "?" if index is None else index + 1
+
+
+def run(exe, args):
+    if args.mode == "record":
+        index, failure = record(exe, args.program, args.dir, args.every, args.match, args.timeout)
+        print("%d checkpoints en %s" % (len(index), args.dir))
+        if failure:
+            print("Fallo cerca de la linea %s: %s" % (_number(failure[0]), failure[1]))
+        sys.exit(1 if failure else 0)
+
+    if args.mode == "replay":
+        steps = os.path.abspath(args.steps) if args.steps else None
+        first, failure = replay(exe, args.program, args.dir, args.line, args.to,
+                                args.match, args.timeout, steps)
+        print("Restaurado el checkpoint tras la linea %d" % first)
+        if failure:
+            print("Fallo en la linea %s: %s" % (_number(failure[0]), failure[1]))
+        sys.exit(1 if failure else 0)
+
+    line, failure = bisect(exe, args.program, args.dir, args.match, args.timeout)
+    if line is None:
+        print("El programa completo no falla")
+        sys.exit(0)
+    print("Primera linea que falla: %d: %s" % (line + 1, read_program(args.program)[line]))
+    print("  %s" % failure[1])
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
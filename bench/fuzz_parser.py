@@ -0,0 +1,526 @@
+# -*- coding: ascii -*-
+"""
+Fuzzing del parser G-code con cobertura
+=======================================
+gcode.c, ngc_expr.c y ngc_flowctrl.c interpretan la salida de posprocesadores
+CAM (no confiable). Este script compila grblHAL_validator con esos tres
+ficheros instrumentados (cmake -DVALIDATOR_FUZZ=ON, src/fuzz_coverage.c) y
+opcionalmente con ASan/UBSan, y lo ejecuta con entradas mutadas a partir de
+un corpus: una entrada que produce aristas nuevas (o un contador de paso en
+un rango nuevo, como AFL) se anade al corpus.
+
+Cada entrada se ejecuta en su propio proceso (validador -a, entrada por
+stdin) en un directorio de trabajo por hilo, con el EEPROM.DAT de referencia
+restaurado antes de cada ejecucion. Hay un hilo por nucleo (--jobs).
+
+Salida en --out:
+    corpus/          corpus minimizado (cobertura completa, entradas mas cortas)
+    crashes/         senal, salida de un sanitizer o sin resumen final
+    hangs/           sin terminar en --timeout s (p.ej. o100 while [1])
+    slow/            tiempo de parseo > --slow s (p.ej. expresiones anidadas)
+    results.jsonl    una linea por crash/hang/slow con el tiempo de parseo
+
+El tiempo de parseo es el "time" del resumen de -a (CPU del bucle de lectura,
+sin el arranque del proceso). Los crashes se agrupan por la primera linea
+del informe del sanitizer, los lentos por su cobertura.
+
+Uso:
+    python bench/fuzz_parser.py                          # 10 min, compila build/fuzz
+    python bench/fuzz_parser.py --duration 3600 --sanitize
+    python bench/fuzz_parser.py --seeds DIR_CAM          # programas reales como semillas
+    python bench/fuzz_parser.py --validator RUTA         # ejecutable ya instrumentado
+    python bench/fuzz_parser.py --minimize               # solo minimiza --out/corpus
+
+Un --out existente continua la sesion anterior: su corpus se usa como
+semilla. Requiere GCC o Clang (-fsanitize-coverage=trace-pc).
+"""
+
+import argparse
+import array
+import hashlib
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import arc_bench
+import ngc_bench
+
+REPO_DIR = arc_bench.REPO_DIR
+BUILD_DIR = os.path.join(REPO_DIR, "build", "fuzz")
+OUT_DIR = os.path.join(REPO_DIR, "build", "fuzz_out")
+SANITIZE = "-fsanitize=address,undefined"
+DURATION = 600.0
+TIMEOUT = 2.0             # s reales por entrada
+SLOW = 0.05               # s de parseo
+MAX_SIZE = 8192           # bytes por entrada
+STATS_EVERY = 10.0
+MAX_HANGS = 50            # ficheros guardados en hangs/, cada uno cuesta --timeout s
+
+
+# =====================================================================
+# SEMILLAS Y MUTACIONES
+# =====================================================================
+
+SNIPPETS = [
+    "G21 G90 G17 G94\nG0 X10 Y10 Z5\nG1 Z-1 F300\nG1 X20 Y20 F1200\nM2",
+    "G20 G91\nG1 X0.5 Y-0.25 F20\nG90 G0 X0 Y0\nG53 G0 Z0",
+    "G2 X10 Y0 I5 J0 F500\nG3 X0 Y0 R5\nG18 G2 X5 Z5 K2.5\nG19 G3 Y5 Z0 J-2.5",
+    "G10 L2 P1 X10 Y20\nG54\nG55 G10 L20 P2 X0\nG92 X5\nG92.1",
+    "G38.2 Z-10 F100\nG43.1 Z1.5\nG49\nG28\nG30 X0",
+    "M3 S1000\nM4 S500\nM5\nM7\nM8\nM9\nG4 P0.5\nT1 M6",
+    "G81 X10 Y10 Z-5 R2 F100\nG83 X20 Q1\nG80\nG73 X0 Y0 Z-2 R1 Q0.5",
+    "G96 S200 D3000\nG97 S1000\nG95 F0.1\nG94 F100\nG61\nG64",
+    "#1=[1+2*SIN[30]]\n#<_g>=[#1**2/ABS[-3]]\nG0 X#1 Y#<_g>",
+    "#1=[ATAN[1]/[2]+SQRT[2]-EXP[1]*LN[3]]\n#2=[ROUND[#1] MOD 3]\n#3=[FIX[-1.5]+FUP[1.5]+ACOS[0.5]+ASIN[0.5]+TAN[45]]",
+    "#1=[1 EQ 1 AND 2 GT 1 OR 3 LT 2 XOR 0 NE 1]\n#2=[#1 GE 0]\n#3=[#2 LE 1]",
+    "#5=4\n#[#5+1]=7\n##5=2\n(debug, value=#5)\n(print, x=#<_x>)",
+    "o100 if [#1 GT 0]\nG0 X1\no100 elseif [#1 LT 0]\nG0 X-1\no100 else\nG0 X0\no100 endif",
+    "#1=0\no101 while [#1 LT 5]\n#1=[#1+1]\no101 if [#1 EQ 3]\no101 continue\no101 endif\no101 endwhile",
+    "#1=0\no102 do\n#1=[#1+1]\no102 while [#1 LT 3]\no103 repeat [3]\nG91 G0 X1\no103 endrepeat",
+    "o104 repeat [2]\no105 repeat [2]\n#2=[#2+1]\no105 break\no105 endrepeat\no104 endrepeat",
+    "o<fuzz> call [1] [2] [3]\nG65 P<fuzz> A1 B2\nG66 P<fuzz> X1\nG0 X1\nG67",
+    "M98 P100\nM99\nM30",
+]
+
+MACROS = {
+    "fuzz": ["#<sum>=[#1+#2+#3]", "o1 if [#<sum> GT 100]", "o<fuzz> return [#<sum>]",
+             "o1 endif", "G0 X[#<sum>]", "o<fuzz> endsub"],
+}
+
+TOKENS = [
+    "G0", "G1", "G2", "G3", "G4", "G10", "G17", "G18", "G19", "G20", "G21", "G28", "G30",
+    "G38.2", "G43.1", "G53", "G54", "G59.3", "G61", "G64", "G65", "G66", "G67", "G80", "G81",
+    "G83", "G90", "G91", "G92", "G93", "G94", "G95", "G96", "G98", "G99",
+    "M2", "M3", "M5", "M6", "M30", "M98", "M99", "M451", "M450",
+    "X", "Y", "Z", "A", "B", "C", "I", "J", "K", "R", "P", "Q", "L", "F", "S", "T", "D", "H", "N",
+    "#", "#1", "#5220", "#<_x>", "#<a>", "#<_g>", "##1", "#[1+1]",
+    "[", "]", "[[", "]]", "+", "-", "*", "/", "**", " MOD ", " EQ ", " NE ", " GT ", " GE ",
+    " LT ", " LE ", " AND ", " OR ", " XOR ",
+    "SIN[", "COS[", "TAN[", "ASIN[", "ACOS[", "ATAN[", "]/[", "SQRT[", "EXP[", "LN[", "ABS[",
+    "ROUND[", "FIX[", "FUP[", "EXISTS[", "_x", "_value",
+    "o100 ", "o<fuzz> ", "sub", "endsub", "call", "return", "if ", "elseif ", "else", "endif",
+    "while ", "endwhile", "do", "repeat ", "endrepeat", "break", "continue",
+    "(", ")", ";", "(debug,", "(print,", "(msg,", "%", "$", "=", ".", "\n", " ",
+    "0", "-0", "1", "-1", "0.0001", "1e308", "1e-308", "9999999999", "4294967296", "2147483648",
+    "360", "NaN",
+]
+
+NUMBERS = ["0", "-0", "1", "-1", "0.5", "1e308", "-1e308", "1e-320", "3.4e38", "99999999",
+           "2147483647", "-2147483648", "65536", "255", "256", "5399", "5400", "31", "30", "999"]
+
+
+def seed_inputs(seed_dirs=()):
+    """Semillas: fragmentos propios, programas de ngc_bench y arc_bench (pocos bloques)
+    y los ficheros de seed_dirs. Retorna [bytes]."""
+    seeds = [s.encode() for s in SNIPPETS]
+    for name, gen in ngc_bench.PROGRAMS.items():
+        result = gen(random.Random(name), 40)
+        body = result[0] if isinstance(result, tuple) else result
+        seeds.append("\n".join(body).encode())
+    for name, gen in arc_bench.PROGRAMS.items():
+        seeds.append("\n".join(["M451"] + gen(random.Random(name), 3)).encode())
+    for seed_dir in seed_dirs:
+        for root, _, files in os.walk(seed_dir):
+            for name in sorted(files):
+                with open(os.path.join(root, name), "rb") as f:
+                    data = f.read(MAX_SIZE)
+                if data:
+                    seeds.append(data)
+    return seeds
+
+
+def _nested(rnd, depth):
+    """Expresion anidada depth niveles, el caso patologico de ngc_expr.c."""
+    kind = rnd.randrange(3)
+    if kind == 0:
+        expr = "[" * depth + "1" + "+1]" * depth
+    elif kind == 1:
+        expr = "SIN[" * depth + "1" + "]" * depth
+    else:
+        expr = "1" + "+[1" * depth + "]" * depth
+    return "#%d=%s" % (rnd.randrange(1, 40), expr)
+
+
+def mutate(rnd, data, corpus):
+    """Aplica 1..4 mutaciones a nivel de byte, token o linea."""
+    data = bytearray(data)
+    for _ in range(rnd.randint(1, 4)):
+        op = rnd.randrange(10)
+        pos = rnd.randrange(len(data) + 1)
+        if op == 0 and data:                                    # byte aleatorio
+            data[rnd.randrange(len(data))] = rnd.randrange(256)
+        elif op == 1 and data:                                  # borrar un trozo
+            end = min(len(data), pos + rnd.randint(1, 16))
+            del data[pos:end]
+        elif op == 2:                                           # insertar un token
+            data[pos:pos] = rnd.choice(TOKENS).encode()
+        elif op == 3 and data:                                  # duplicar un trozo
+            start = rnd.randrange(len(data))
+            data[pos:pos] = data[start:start + rnd.randint(1, 64)]
+        elif op == 4:                                           # cambiar un numero
+            digits = [i for i, c in enumerate(data) if 48 <= c <= 57]
+            if digits:
+                start = end = rnd.choice(digits)
+                while end < len(data) and (48 <= data[end] <= 57 or data[end] == 46):
+                    end += 1
+                data[start:end] = rnd.choice(NUMBERS).encode()
+        elif op == 5:                                           # anidamiento profundo
+            line = _nested(rnd, rnd.choice([8, 32, 100, 256, 1000])) + "\n"
+            data[pos:pos] = line.encode()
+        elif op == 6 and corpus:                                # cruce con otra entrada
+            other = rnd.choice(corpus)
+            cut = rnd.randrange(len(other) + 1)
+            data = data[:pos] + bytearray(other[cut:])
+        else:                                                   # lineas: duplicar, borrar, mover
+            lines = bytes(data).split(b"\n")
+            i = rnd.randrange(len(lines))
+            line = lines.pop(i) if rnd.random() < 0.5 else lines[i]
+            if rnd.random() < 0.7:
+                lines.insert(rnd.randrange(len(lines) + 1), line)
+            data = bytearray(b"\n".join(lines))
+    return bytes(data[:MAX_SIZE])
+
+
+# =====================================================================
+# EJECUCION
+# =====================================================================
+
+def build(build_dir=BUILD_DIR, sanitize=None):
+    """Compila grblHAL_validator instrumentado. Retorna (ejecutable, error)."""
+    steps = []
+    if not os.path.isfile(os.path.join(build_dir, "CMakeCache.txt")):
+        steps.append(["cmake", "-S", REPO_DIR, "-B", build_dir, "-DCMAKE_BUILD_TYPE=RelWithDebInfo",
+                      "-DVALIDATOR_FUZZ=ON", "-DVALIDATOR_FUZZ_SANITIZE=%s" % (sanitize or "")])
+    steps.append(["cmake", "--build", build_dir, "--target", "grblHAL_validator"])
+    for cmd in steps:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if proc.returncode != 0:
+            return None, proc.stdout.decode(errors="replace").strip()[-500:]
+    return os.path.join(build_dir, "grblHAL_validator" + arc_bench.EXE_SUFFIX), None
+
+
+class Result(object):
+    """Resultado de una ejecucion: kind es "ok", "crash" o "hang"."""
+
+    def __init__(self, kind, coverage=frozenset(), parse_time=None, wall=0.0, detail=""):
+        self.kind = kind
+        self.coverage = coverage
+        self.parse_time = parse_time
+        self.wall = wall
+        self.detail = detail
+
+
+def _crash_detail(stderr, returncode):
+    """Primera linea significativa del informe del sanitizer, agrupa crashes iguales."""
+    for line in stderr.splitlines():
+        if "SUMMARY:" in line or "runtime error:" in line:
+            return line.strip()[:200]
+    if returncode < 0:
+        try:
+            return "senal %s" % signal.Signals(-returncode).name
+        except ValueError:
+            return "senal %d" % -returncode
+    return "sin resumen, codigo de salida %d" % returncode
+
+
+class Runner(object):
+    """Ejecuta entradas en un directorio de trabajo propio (uno por hilo)."""
+
+    def __init__(self, exe, eeprom, timeout=TIMEOUT):
+        self.exe = exe
+        self.eeprom = eeprom
+        self.timeout = timeout
+        self.workdir = tempfile.mkdtemp(prefix="fuzz_parser_")
+        self.coverage_file = os.path.join(self.workdir, "coverage.bin")
+        for name, body in list(MACROS.items()) + list(_ngc_macros().items()):
+            with open(os.path.join(self.workdir, name + ".macro"), "w") as f:
+                f.write("\n".join(body) + "\n")
+        self.env = dict(os.environ, GRBL_FUZZ_COVERAGE=self.coverage_file,
+                        ASAN_OPTIONS="detect_leaks=0:abort_on_error=0:symbolize=1",
+                        UBSAN_OPTIONS="halt_on_error=1:print_stacktrace=1")
+
+    def run(self, data):
+        shutil.copyfile(self.eeprom, os.path.join(self.workdir, "EEPROM.DAT"))
+        if os.path.exists(self.coverage_file):
+            os.remove(self.coverage_file)
+        t0 = time.perf_counter()
+        try:
+            proc = subprocess.run([self.exe, "-a", "-d", self.workdir], input=data, cwd=self.workdir,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  timeout=self.timeout, env=self.env)
+        except subprocess.TimeoutExpired:
+            return Result("hang", wall=time.perf_counter() - t0, detail="timeout %gs" % self.timeout)
+        wall = time.perf_counter() - t0
+        summary = None
+        for line in reversed(proc.stdout.decode(errors="replace").splitlines()):
+            if line.startswith("{") and '"lines_per_sec"' in line:
+                try:
+                    summary = json.loads(line)
+                except ValueError:
+                    pass
+                break
+        stderr = proc.stderr.decode(errors="replace")
+        if summary is None or proc.returncode < 0 or "Sanitizer" in stderr or "runtime error:" in stderr:
+            return Result("crash", wall=wall, detail=_crash_detail(stderr, proc.returncode),
+                          parse_time=summary and summary.get("time"))
+        coverage = frozenset()
+        if os.path.exists(self.coverage_file):
+            with open(self.coverage_file, "rb") as f:
+                entries = array.array("I")
+                entries.frombytes(f.read())
+            coverage = frozenset(entries)
+        return Result("ok", coverage, summary.get("time"), wall)
+
+    def close(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def _ngc_macros():
+    """Macros de los programas loop_* de ngc_bench, para que sus semillas ejecuten los bucles."""
+    macros = {}
+    for name, gen in ngc_bench.PROGRAMS.items():
+        result = gen(random.Random(name), 40)
+        if isinstance(result, tuple):
+            macros.update(result[1])
+    return macros
+
+
+def baseline_eeprom(exe, path):
+    """EEPROM.DAT con los settings por defecto, escrito por el propio validador."""
+    workdir = tempfile.mkdtemp(prefix="fuzz_parser_")
+    try:
+        subprocess.run([exe, "-s"], input=b"", cwd=workdir,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.copyfile(os.path.join(workdir, "EEPROM.DAT"), path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# =====================================================================
+# FUZZING
+# =====================================================================
+
+def _name(data):
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+class Fuzzer(object):
+    """Estado compartido por los hilos: corpus, cobertura vista y hallazgos."""
+
+    def __init__(self, out_dir, slow=SLOW):
+        self.out_dir = out_dir
+        self.slow = slow
+        self.lock = threading.Lock()
+        self.corpus = []                # [(bytes, cobertura, tiempo de parseo)]
+        self.seen = set()
+        self.crashes = set()            # detalle
+        self.slow_seen = set()          # cobertura de las entradas lentas
+        self.hangs = 0
+        self.execs = 0
+        self.results = open(os.path.join(out_dir, "results.jsonl"), "a")
+        for sub in ("corpus", "crashes", "hangs", "slow"):
+            os.makedirs(os.path.join(out_dir, sub), exist_ok=True)
+
+    def _record(self, kind, data, result):
+        path = os.path.join(self.out_dir, {"crash": "crashes", "hang": "hangs"}.get(kind, kind),
+                            _name(data) + ".nc")
+        with open(path, "wb") as f:
+            f.write(data)
+        self.results.write(json.dumps({
+            "kind": kind, "file": os.path.relpath(path, self.out_dir), "size": len(data),
+            "parse_time": result.parse_time, "wall": round(result.wall, 6), "detail": result.detail,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S")}) + "\n")
+        self.results.flush()
+
+    def add(self, data, result):
+        """Procesa un resultado. Retorna True si la entrada entra en el corpus."""
+        with self.lock:
+            self.execs += 1
+            if result.kind == "crash":
+                if result.detail not in self.crashes:
+                    self.crashes.add(result.detail)
+                    self._record("crash", data, result)
+                return False
+            if result.kind == "hang":
+                self.hangs += 1
+                if self.hangs <= MAX_HANGS:
+                    self._record("hang", data, result)
+                return False
+            if result.parse_time is not None and result.parse_time > self.slow and \
+                    result.coverage not in self.slow_seen:
+                self.slow_seen.add(result.coverage)
+                result.detail = "%.1f ms/KB" % (result.parse_time * 1e3 * 1024 / max(len(data), 1))
+                self._record("slow", data, result)
+            if result.coverage - self.seen:
+                self.seen |= result.coverage
+                self.corpus.append((data, result.coverage, result.parse_time))
+                return True
+            return False
+
+    def pick(self, rnd):
+        with self.lock:
+            # Las entradas recientes (cobertura nueva) se eligen mas a menudo
+            n = len(self.corpus)
+            i = n - 1 - int(rnd.random() ** 2 * n)
+            return self.corpus[i][0], [c[0] for c in self.corpus[-32:]]
+
+    def stats(self, start):
+        with self.lock:
+            elapsed = time.time() - start
+            return "%7.0fs  ejecuciones %8d (%5.0f/s)  corpus %5d  aristas %6d  crashes %3d  hangs %3d  lentos %3d" % (
+                elapsed, self.execs, self.execs / max(elapsed, 1e-6), len(self.corpus),
+                len(set(e >> 8 for e in self.seen)), len(self.crashes), self.hangs, len(self.slow_seen))
+
+    def close(self):
+        self.results.close()
+
+
+def minimize(corpus):
+    """Para cada arista/rango de la cobertura total conserva la entrada mas corta
+    que la cubre (como afl-cmin). Retorna la lista de entradas conservadas."""
+    best = {}
+    for entry in sorted(corpus, key=lambda e: len(e[0])):
+        for feature in entry[1]:
+            if feature not in best:
+                best[feature] = entry
+    kept = {}
+    for entry in best.values():
+        kept[entry[0]] = entry
+    return sorted(kept.values(), key=lambda e: len(e[0]))
+
+
+def save_corpus(out_dir, entries):
+    corpus_dir = os.path.join(out_dir, "corpus")
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    os.makedirs(corpus_dir)
+    index = []
+    for data, coverage, parse_time in entries:
+        name = _name(data) + ".nc"
+        with open(os.path.join(corpus_dir, name), "wb") as f:
+            f.write(data)
+        index.append({"file": name, "size": len(data), "features": len(coverage), "parse_time": parse_time})
+    with open(os.path.join(out_dir, "corpus.json"), "w") as f:
+        json.dump(index, f, indent=1)
+
+
+def _worker(fuzzer, runner, rnd, deadline, stop):
+    while not stop.is_set() and time.time() < deadline:
+        parent, recent = fuzzer.pick(rnd)
+        data = mutate(rnd, parent, recent)
+        fuzzer.add(data, runner.run(data))
+
+
+def fuzz(exe, out_dir, seeds, jobs, duration, timeout=TIMEOUT, slow=SLOW, seed=None):
+    """Ejecuta las semillas y luego muta durante duration s con jobs hilos.
+    Retorna el Fuzzer con los resultados."""
+    eeprom = os.path.join(out_dir, "EEPROM.DAT")
+    baseline_eeprom(exe, eeprom)
+    fuzzer = Fuzzer(out_dir, slow)
+    runners = [Runner(exe, eeprom, timeout) for _ in range(jobs)]
+    start = time.time()
+    stop = threading.Event()
+    threads = []
+    try:
+        for data in seeds:
+            fuzzer.add(data, runners[0].run(data))
+        if not fuzzer.corpus:
+            fuzzer.corpus.append((b"G0 X0\n", frozenset(), None))
+        print("semillas: %d, en el corpus %d" % (len(seeds), len(fuzzer.corpus)))
+        base = random.Random(seed).randrange(1 << 30)
+        threads = [threading.Thread(target=_worker,
+                                    args=(fuzzer, runners[i], random.Random(base + i), start + duration, stop))
+                   for i in range(jobs)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(STATS_EVERY / jobs)
+            print(fuzzer.stats(start))
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        stop.set()
+        print("interrumpido, esperando a los hilos")
+        for t in threads:
+            t.join()
+    finally:
+        for runner in runners:
+            runner.close()
+        fuzzer.close()
+    return fuzzer
+
+
+def load_corpus_dir(out_dir):
+    corpus_dir = os.path.join(out_dir, "corpus")
+    if not os.path.isdir(corpus_dir):
+        return []
+    return [os.path.join(corpus_dir, name) for name in sorted(os.listdir(corpus_dir))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzzing del parser G-code con cobertura")
+    parser.add_argument("--validator", metavar="RUTA",
+                        help="grblHAL_validator compilado con -DVALIDATOR_FUZZ=ON (default: compilar en --build)")
+    parser.add_argument("--build", default=BUILD_DIR, metavar="DIR",
+                        help="Directorio de build (default: %(default)s)")
+    parser.add_argument("--sanitize", nargs="?", const=SANITIZE, metavar="OPCIONES",
+                        help="Compilar el parser con sanitizers (default: %s), solo en un build nuevo" % SANITIZE)
+    parser.add_argument("--out", default=OUT_DIR, metavar="DIR",
+                        help="Directorio de resultados (default: %(default)s)")
+    parser.add_argument("--seeds", action="append", default=[], metavar="DIR",
+                        help="Directorio con programas semilla (repetible)")
+    parser.add_argument("--duration", type=float, default=DURATION, metavar="S",
+                        help="Duracion en segundos reales (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, metavar="N",
+                        help="Hilos/procesos en paralelo (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, metavar="S",
+                        help="Limite por entrada, mas es un hang (default: %(default)s)")
+    parser.add_argument("--slow", type=float, default=SLOW, metavar="S",
+                        help="Tiempo de parseo a partir del cual una entrada es lenta (default: %(default)s)")
+    parser.add_argument("--seed", type=int, help="Semilla del generador aleatorio")
+    parser.add_argument("--minimize", action="store_true",
+                        help="Solo reejecutar y minimizar el corpus de --out")
+    args = parser.parse_args()
+
+    if args.validator:
+        exe = os.path.abspath(args.validator)
+    else:
+        print("compilando grblHAL_validator instrumentado en %s" % args.build)
+        exe, error = build(os.path.abspath(args.build), args.sanitize)
+        if error:
+            print("[ERROR] %s" % error)
+            sys.exit(2)
+    if not os.path.isfile(exe):
+        print("[ERROR] No existe el validador: %s" % exe)
+        sys.exit(2)
+
+    out_dir = os.path.abspath(args.out)
+    os.makedirs(out_dir, exist_ok=True)
+    seeds = []
+    for path in load_corpus_dir(out_dir):
+        with open(path, "rb") as f:
+            seeds.append(f.read())
+    if not args.minimize:
+        seeds += seed_inputs(args.seeds)
+
+    fuzzer = fuzz(exe, out_dir, seeds, max(1, args.jobs), 0.0 if args.minimize else args.duration,
+                  args.timeout, args.slow, args.seed)
+
+    kept = minimize(fuzzer.corpus)
+    save_corpus(out_dir, kept)
+    print("corpus minimizado: %d de %d entradas, %d aristas" % (
+        len(kept), len(fuzzer.corpus), len(set(e >> 8 for e in fuzzer.seen))))
+    print("crashes %d, hangs %d, lentos %d (%s)" % (
+        len(fuzzer.crashes), fuzzer.hangs, len(fuzzer.slow_seen), os.path.join(out_dir, "results.jsonl")))
+    sys.exit(1 if fuzzer.crashes else 0)
+
+
+if __name__ == "__main__":
+    main()
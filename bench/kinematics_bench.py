@@ -0,0 +1,171 @@
+# -*- coding: ascii -*-
+"""
+Benchmark de cinematicas
+========================
+Ejecuta los kinematics_bench_<nombre> de un build (uno por modulo de
+src/grbl/kinematics, se eligen al compilar) y junta sus resultados en un
+JSON. Con --baseline compara contra el JSON guardado de otro commit.
+
+    cmake -B build -DKINEMATICS_BENCH=ON && cmake --build build
+
+Uso:
+    python bench/kinematics_bench.py                         # build/
+    python bench/kinematics_bench.py --save base.json        # guarda resultados
+    python bench/kinematics_bench.py --baseline base.json    # compara
+    python bench/kinematics_bench.py --baseline base.json --max-regression 10
+    python bench/kinematics_bench.py --only delta --runs 5
+
+Cada ejecutable mide sobre una carga fija (semilla -s) de posiciones al azar
+dentro del area de trabajo de su modulo:
+  transform_from_cartesian  ns por llamada (cinematica inversa)
+  transform_to_cartesian    ns por llamada (directa, desde pasos)
+  segment_line              ns por linea y por segmento, segmentos por mm
+  check_travel_limits       ns por llamada
+Con --runs N se queda con el minimo de cada tiempo (menos ruido del host).
+Los segmentos por mm no dependen del host, un cambio indica un cambio de
+comportamiento y no de coste.
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILD_DIR = os.path.join(REPO_DIR, "build")
+EXE_SUFFIX = ".exe" if os.name == "nt" else ""
+PREFIX = "kinematics_bench_"
+RUNS = 3
+
+# (funcion, metrica, etiqueta) de tiempo comparadas, menor es mejor
+TIMES = [
+    ("transform_from_cartesian", "ns_per_call", "from_cartesian ns"),
+    ("transform_to_cartesian", "ns_per_call", "to_cartesian ns"),
+    ("segment_line", "ns_per_line", "segment_line ns/linea"),
+    ("segment_line", "ns_per_segment", "segment_line ns/segm"),
+    ("check_travel_limits", "ns_per_call", "travel_limits ns"),
+]
+
+
+def find_benchmarks(build):
+    """{nombre: ejecutable} de los kinematics_bench_* del build."""
+    found = {}
+    for path in sorted(glob.glob(os.path.join(build, PREFIX + "*" + EXE_SUFFIX))):
+        name = os.path.basename(path)[len(PREFIX):]
+        if EXE_SUFFIX:
+            name = name[:-len(EXE_SUFFIX)]
+        if os.access(path, os.X_OK):
+            found[name] = path
+    return found
+
+
+def run(exe, runs, args):
+    """Resultado de la primera ejecucion con el minimo de cada tiempo de todas."""
+    result = None
+    for _ in range(runs):
+        proc = subprocess.run([exe] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+        if proc.returncode != 0:
+            raise RuntimeError("%s: codigo %d %s" % (os.path.basename(exe), proc.returncode,
+                                                     (proc.stdout + proc.stderr).strip()[-200:]))
+        data = json.loads(proc.stdout)
+        if result is None:
+            result = data
+        else:
+            for func, metric, _ in TIMES:
+                result[func][metric] = min(result[func][metric], data[func][metric])
+    return result
+
+
+def _ratio(value, base):
+    return "%7.2fx" % (base / value) if value and base else "%8s" % "-"
+
+
+def report(results, baseline=None):
+    """Imprime la tabla, devuelve el peor empeoramiento en % frente a baseline."""
+    worst = 0.0
+    print("%-14s %-26s %12s%s" % ("cinematica", "medida", "valor",
+                                  "  %12s %8s" % ("base", "speedup") if baseline else ""))
+    for name, data in sorted(results.items()):
+        base = (baseline or {}).get(name)
+        rows = TIMES + [("segment_line", "segments_per_mm", "segmentos/mm")]
+        for func, metric, label in rows:
+            value = data[func][metric]
+            row = "%-14s %-26s %12.*f" % (name, label, 4 if metric == "segments_per_mm" else 2, value)
+            if base:
+                b = base[func][metric]
+                if metric == "segments_per_mm":
+                    row += "  %12.4f %8s" % (b, "" if abs(b - value) < 1e-4 else "CAMBIO")
+                else:
+                    row += "  %12.2f %s" % (b, _ratio(value, b))
+                    if b > 0.0:
+                        worst = max(worst, (value - b) * 100.0 / b)
+            print(row)
+            name = ""
+        if base and (base["points"], base["seed"]) != (data["points"], data["seed"]):
+            print("%-14s [AVISO] carga distinta de la base (points/seed)" % "")
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de cinematicas (ns por llamada, segmentos por mm)")
+    parser.add_argument("--build", default=BUILD_DIR, metavar="RUTA",
+                        help="Directorio con los kinematics_bench_* (default: %(default)s)")
+    parser.add_argument("--save", metavar="FICHERO",
+                        help="Guardar los resultados en FICHERO (JSON)")
+    parser.add_argument("--baseline", metavar="FICHERO",
+                        help="Comparar contra resultados guardados con --save")
+    parser.add_argument("--max-regression", type=float, metavar="PCT",
+                        help="Salir con 1 si algun tiempo empeora mas de PCT %% frente a --baseline")
+    parser.add_argument("--runs", type=int, default=RUNS, metavar="N",
+                        help="Ejecuciones por cinematica, minimo de cada tiempo (default: %(default)s)")
+    parser.add_argument("-n", "--points", type=int, metavar="N",
+                        help="Posiciones de la carga (default del ejecutable: 4096)")
+    parser.add_argument("-r", "--repeat", type=int, metavar="N",
+                        help="Repeticiones de la carga (default del ejecutable: 20)")
+    parser.add_argument("--only", metavar="TEXTO",
+                        help="Ejecutar solo las cinematicas cuyo nombre contiene TEXTO")
+    args = parser.parse_args()
+
+    benchmarks = find_benchmarks(args.build)
+    if args.only:
+        benchmarks = dict((k, v) for k, v in benchmarks.items() if args.only in k)
+    if not benchmarks:
+        print("[ERROR] No hay %s* en %s (cmake -DKINEMATICS_BENCH=ON)" % (PREFIX, args.build))
+        sys.exit(2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    exe_args = []
+    if args.points:
+        exe_args += ["-n", str(args.points)]
+    if args.repeat:
+        exe_args += ["-r", str(args.repeat)]
+
+    results = {}
+    ok = True
+    for name, exe in sorted(benchmarks.items()):
+        try:
+            results[name] = run(exe, max(1, args.runs), exe_args)
+        except (RuntimeError, ValueError, OSError) as e:
+            print("[ERROR] %s" % e)
+            ok = False
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    worst = report(results, baseline)
+    if baseline and args.max_regression is not None and worst > args.max_regression:
+        print("\n[ERROR] empeoramiento de %.1f %% (maximo %.1f %%)" % (worst, args.max_regression))
+        ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+# -*- coding: ascii -*-
+"""
+Benchmark de parametros NGC con grblHAL_validator
+=================================================
+Genera un set de programas G-code con uso intensivo de parametros
+(numerados, con nombre locales/globales y predefinidos, como en la salida
+de posprocesadores CAM con macros) y mide lineas/s a traves del validador.
+
+Los programas loop_* llaman a una subrutina con nombre (o<nombre> call ->
+nombre.macro en el directorio del programa) con bucles O-word while/repeat,
+donde las mismas expresiones se evaluan miles de veces. Para esos
+programas "lineas" son los bloques ejecutados, no las lineas del archivo.
+
+Uso:
+    python bench/ngc_bench.py                       # validador de build/
+    python bench/ngc_bench.py --validator RUTA      # otro ejecutable
+    python bench/ngc_bench.py --compare RUTA_BASE   # compara contra otro build
+    python bench/ngc_bench.py --out bench_gcode     # guarda los programas generados
+    python bench/ngc_bench.py --lines 20000 -n 5    # tamano y repeticiones
+    python bench/ngc_bench.py --only loop            # solo programas cuyo nombre contiene "loop"
+
+Para medir la cache de expresiones compiladas compilar un segundo validador
+sin cache y pasarlo con --compare:
+    cmake -DCMAKE_BUILD_TYPE=Release -DCMAKE_C_FLAGS=-DNGC_EXPRESSION_CACHE_SIZE=0 .. && make grblHAL_validator
+
+Se reporta el mejor de N tiempos por programa (menos ruido del sistema).
+
+Prueba diferencial de la cache: con --differential RUTA_SIN_CACHE se evaluan
+expresiones aleatorias (validas, con errores de sintaxis y con errores de
+evaluacion: parametros inexistentes, division por cero, NaN...) en los dos
+validadores con -a y se comparan los codigos de estado linea a linea. Cada
+expresion se evalua dos veces, la segunda sale de la cache:
+    python bench/ngc_bench.py --differential build_nocache/grblHAL_validator
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VALIDATOR_EXE = os.path.join(REPO_DIR, "build",
+                             "grblHAL_validator" + (".exe" if os.name == "nt" else ""))
+LINES = 10000
+REPEAT = 3
+CASES = 2000
+
+
+# =====================================================================
+# PROGRAMAS
+# =====================================================================
+
+def _numbered(rnd, n):
+    """Parametros numerados #1-#5000 como variables de trabajo."""
+    out = ["G21 G90 G17", "#1=0", "#2=0", "#3=-1"]
+    for i in range(n):
+        p = 31 + rnd.randrange(400)
+        out.append("#%d=[#%d+%.3f]" % (p, 31 + rnd.randrange(400), rnd.uniform(-1, 1)))
+        if i % 4 == 0:
+            out.append("G1 X[#%d*0.1] Y[#%d*0.1] Z#3 F[600+#%d]" % (p, 31 + rnd.randrange(400), p))
+    return out
+
+
+def _named(rnd, n, prefix=""):
+    """Parametros con nombre (locales o globales '_'), mayusculas mezcladas."""
+    names = ["%s%s_%d" % (prefix, rnd.choice(["Depth", "step", "PASS", "xOff", "yoff", "tool"]), i)
+             for i in range(120)]
+    out = ["G21 G90 G17"] + ["#<%s>=%d" % (nm, i) for i, nm in enumerate(names)]
+    for i in range(n):
+        a, b, c = rnd.choice(names), rnd.choice(names), rnd.choice(names)
+        out.append("#<%s>=[#<%s>*0.5+#<%s>*0.25]" % (a, b.upper(), c))
+        if i % 4 == 0:
+            out.append("G1 X[#<%s>*0.01] Y[#<%s>*0.01] F[500+#<%s>]" % (a, b, c))
+    return out
+
+
+def _predefined(rnd, n):
+    """Lecturas de parametros predefinidos (#<_x>, #<_metric>, #5221...)."""
+    ro = ["_x", "_y", "_z", "_metric", "_absolute", "_feed", "_coord_system",
+          "_current_tool", "_motion_mode", "_plane"]
+    out = ["G21 G90 G17", "G1 X1 Y1 F500"]
+    for i in range(n):
+        out.append("#%d=[#<%s>+#<%s>+#%d]" % (31 + i % 200, rnd.choice(ro), rnd.choice(ro),
+                                             rnd.choice([5221, 5222, 5223, 5420, 5421, 5400])))
+        if i % 4 == 0:
+            out.append("G1 X[#<_x>+0.01] Y[#<_y>-0.01]")
+    return out
+
+
+def _cam_post(rnd, n):
+    """Salida tipo posprocesador: cabecera de parametros y cortes que los referencian."""
+    out = ["G21 G90 G17 G94", "#<safe_z>=5", "#<cut_z>=-1.5", "#<feed>=800", "#<plunge>=200",
+           "#<_tool_dia>=6", "#<stepover>=[#<_tool_dia>*0.4]", "#1=0", "#2=0"]
+    for i in range(n // 6):
+        out += ["G0 Z#<safe_z>",
+                "#1=[#1+#<stepover>]",
+                "G0 X#1 Y#2",
+                "G1 Z#<cut_z> F#<plunge>",
+                "G1 X[#1+%.3f] Y[#2+%.3f] F#<feed>" % (rnd.uniform(5, 50), rnd.uniform(5, 50)),
+                "#2=[#2+#<stepover>*0.5]"]
+    return out
+
+
+def _loop_while(rnd, n):
+    """Bucle while con trigonometria y parametros, tipico de un patron de agujeros."""
+    body = ["#<x>=[#<r>*COS[#<i>*#<step>]+#<cx>]",
+            "#<y>=[#<r>*SIN[#<i>*#<step>]+#<cy>]",
+            "G0 X#<x> Y#<y>",
+            "G1 Z[#<depth>] F[#<feed>*0.5]",
+            "G0 Z[#<depth>+5]",
+            "#<i>=[#<i>+1]"]
+    iterations = max(1, n // (len(body) + 1))
+    macro = ["#<r>=25", "#<cx>=50", "#<cy>=50", "#<depth>=-2", "#<feed>=800",
+             "#<step>=[360/%d]" % iterations, "#<i>=0",
+             "o100 while [#<i> LT %d]" % iterations] + body + ["o100 endwhile", "o<loopwhile> endsub"]
+    return ["G21 G90 G17", "o<loopwhile> call"], {"loopwhile": macro}, iterations * (len(body) + 1)
+
+
+def _loop_nested(rnd, n):
+    """Bucles anidados con condicionales, tipico de un vaciado por pasadas."""
+    inner = 20
+    body = ["#<x>=[#<j>*#<stepover>]",
+            "o102 if [[#<j> MOD 2] EQ 0]",
+            "G1 X#<x> Y0 F#<feed>",
+            "o102 else",
+            "G1 X#<x> Y[#<width>] F#<feed>",
+            "o102 endif",
+            "#<j>=[#<j>+1]"]
+    outer = max(1, n // (inner * (len(body) - 1 + 1) + 3))
+    macro = ["#<stepover>=0.8", "#<width>=30", "#<feed>=1200", "#<k>=0",
+             "o100 while [#<k> LT %d]" % outer,
+             "G1 Z[-0.5*[#<k>+1]] F300",
+             "#<j>=0",
+             "o101 while [#<j> LT %d]" % inner] + body + [
+             "o101 endwhile",
+             "#<k>=[#<k>+1]",
+             "o100 endwhile", "o<loopnested> endsub"]
+    return ["G21 G90 G17", "o<loopnested> call"], {"loopnested": macro}, outer * (inner * len(body) + 5)
+
+
+def _loop_repeat(rnd, n):
+    """repeat con parametros numerados e indirectos (##n)."""
+    body = ["#1=[#1+1]",
+            "#[100+[#1 MOD 20]]=[#1*0.5+#2]",
+            "#2=[##3*2-ABS[#2]*0.1]",
+            "G1 X[#2] Y[#[100+[#1 MOD 20]]*0.01] F1000"]
+    count = max(1, n // len(body))
+    macro = ["#1=0", "#2=1", "#3=4", "#4=0.25", "o100 repeat [%d]" % count] + body + [
+             "o100 endrepeat", "o<looprepeat> endsub"]
+    return ["G21 G90 G17", "o<looprepeat> call"], {"looprepeat": macro}, count * len(body)
+
+
+def _loop_math(rnd, n):
+    """Calculo intensivo por punto (superficie parametrica rotada), un movimiento cada 8 bloques."""
+    body = ["#<u>=[#<i>*#<du>]",
+            "#<zs>=[#<a>*SIN[#<u>*3]*COS[#<u>*2]+#<b>*#<u>**2/[1+ABS[#<u>]]]",
+            "#<xr>=[[#<r>+#<zs>]*COS[#<u>+#<rot>]]",
+            "#<yr>=[[#<r>+#<zs>]*SIN[#<u>+#<rot>]]",
+            "#<f>=[#<feed>*[1-0.5*[ABS[#<zs>] GT #<zlim>]]]",
+            "#<acc>=[#<acc>+SQRT[#<xr>**2+#<yr>**2]]",
+            "G1 X[#<xr>] Y[#<yr>] Z[#<zs>] F[#<f>]",
+            "#<i>=[#<i>+1]"]
+    iterations = max(1, n // (len(body) + 1))
+    macro = ["#<a>=1.5", "#<b>=0.2", "#<r>=40", "#<rot>=15", "#<feed>=900", "#<zlim>=1",
+             "#<du>=[360/%d]" % iterations, "#<i>=0", "#<acc>=0",
+             "o100 while [#<i> LT %d]" % iterations] + body + ["o100 endwhile", "o<loopmath> endsub"]
+    return ["G21 G90 G17", "o<loopmath> call"], {"loopmath": macro}, iterations * (len(body) + 1)
+
+
+PROGRAMS = {
+    "params_numbered": _numbered,
+    "params_named_local": lambda rnd, n: _named(rnd, n),
+    "params_named_global": lambda rnd, n: _named(rnd, n, "_g"),
+    "params_predefined": _predefined,
+    "params_cam_post": _cam_post,
+    "loop_while": _loop_while,
+    "loop_nested": _loop_nested,
+    "loop_repeat": _loop_repeat,
+    "loop_math": _loop_math,
+}
+
+
+def generate(out_dir, lines=LINES, programs=PROGRAMS):
+    """Escribe los programas (deterministas, semilla fija) y sus macros.
+    Retorna {nombre: (ruta, bloques ejecutados)}."""
+    paths = {}
+    for name, gen in programs.items():
+        result = gen(random.Random(name), lines)
+        if isinstance(result, tuple):
+            body, macros, executed = result
+        else:
+            body, macros, executed = result, {}, None
+        for macro, macro_body in macros.items():
+            with open(os.path.join(out_dir, macro + ".macro"), "w") as f:
+                f.write("\n".join(macro_body) + "\n")
+        body = body + ["M2"]
+        path = os.path.join(out_dir, name + ".nc")
+        with open(path, "w") as f:
+            f.write("\n".join(body) + "\n")
+        paths[name] = (path, executed or len(body))
+    return paths
+
+
+# =====================================================================
+# PRUEBA DIFERENCIAL CACHE / PARSER
+# =====================================================================
+
+DIFF_SETUP = ["#1=3", "#2=-1", "#3=0", "#4=0.5", "#5=4", "#<a>=2", "#<_g>=1e30"]
+DIFF_ATOMS = ["0", "1", "-1", "2.5", ".5", "-.5", "1e38", "#1", "#2", "#3", "#4", "#5",
+              "##5", "#-1", "#99999", "#<a>", "#<A>", "#<_g>", "#<zz>", "#<_x>", "#5221",
+              "PRM[100]", "PRM[100,1]", "PRM[100,40]", "PRM[9999]", "EXISTS[#<a>]",
+              "EXISTS[#<zz>]", "1.5.5", "#", "#<a", "X"]
+DIFF_UNARY = ["SIN", "COS", "TAN", "ASIN", "ACOS", "SQRT", "EXP", "LN", "ABS", "ROUND",
+              "FIX", "FUP", "BOGUS"]
+DIFF_BINARY = ["+", "-", "*", "/", "**", " MOD ", "EQ", "NE", "GT", "GE", "LT", "LE",
+               " AND ", " OR ", " XOR ", "%"]
+DIFF_CASES = ["[[#<zz>LEROUND[[PRM[100]]]]NE#-1]", "[1/0]", "[SQRT[-1]]", "[LN[0]]",
+              "[ASIN[2]]", "[#<zz>+[1/0]]", "[[1/0]+#<zz>]", "[1e38*1e38]", "[-#<zz>]",
+              "[ATAN[1]/[0]]", "[ATAN[#<zz>]/[1/0]]", "[#[1/0]]", "[#[#<zz>]]", "[1+]",
+              "[1+2", "[[1]]]", "[PRM[#<zz>]]", "[PRM[1/0,1]]", "[0**-1]", "[-1**0.5]"]
+
+
+def random_expression(rnd, depth=3):
+    """Expresion entre corchetes, a veces con un error de sintaxis o de evaluacion."""
+    def value(d):
+        r = rnd.random()
+        if d <= 0 or r < 0.4:
+            return rnd.choice(DIFF_ATOMS)
+        if r < 0.55:
+            return "%s[%s]" % (rnd.choice(DIFF_UNARY), expr(d - 1))
+        if r < 0.6:
+            return "ATAN[%s]/[%s]" % (expr(d - 1), expr(d - 1))
+        if r < 0.7:
+            return "#[%s]" % expr(d - 1)
+        if r < 0.75:
+            return "-" + value(d - 1)
+        return "[%s]" % expr(d - 1)
+
+    def expr(d):
+        out = value(d)
+        for _ in range(rnd.randrange(3)):
+            out += rnd.choice(DIFF_BINARY) + value(d)
+        return out
+
+    text = "[%s]" % expr(depth)
+    if rnd.random() < 0.1:  # corchetes desbalanceados
+        i = rnd.randrange(len(text))
+        text = text[:i] + text[i + 1:] if text[i] in "[]" else text[:i] + "]" + text[i:]
+    return text
+
+
+def line_statuses(exe, path):
+    """{linea: status} de las lineas con error (validador -a)."""
+    workdir = tempfile.mkdtemp(prefix="ngc_diff_")
+    try:
+        proc = subprocess.run([exe, "-a", path], cwd=workdir,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    statuses = {}
+    for text in proc.stdout.decode(errors="replace").splitlines():
+        try:
+            row = json.loads(text)
+        except ValueError:
+            continue
+        if "line" in row:
+            statuses[row["line"]] = row["status"]
+    if proc.returncode < 0:
+        statuses[None] = "senal %d" % -proc.returncode
+    return statuses
+
+
+def differential(exe, uncached, cases=CASES, seed=0):
+    """Compara los estados de exe (con cache) y uncached (sin cache). Retorna True si coinciden."""
+    rnd = random.Random(seed)
+    exprs = DIFF_CASES + [random_expression(rnd, rnd.randrange(1, 4)) for _ in range(cases)]
+    lines = DIFF_SETUP[:]
+    for text in exprs:
+        lines += ["#10=" + text, "#10=" + text]
+    out_dir = tempfile.mkdtemp(prefix="ngc_diff_gcode_")
+    try:
+        path = os.path.join(out_dir, "differential.nc")
+        with open(path, "w") as f:
+            f.write("\n".join(lines + ["M2"]) + "\n")
+        cached = line_statuses(exe, path)
+        parsed = line_statuses(uncached, path)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    bad = sorted((n for n in set(cached) | set(parsed) if cached.get(n) != parsed.get(n)),
+                 key=lambda n: -1 if n is None else n)
+    errors = sum(1 for n in parsed if n is not None)
+    print("Diferencial: %d expresiones, %d lineas con error, %d discrepancias" % (
+        len(exprs), errors, len(bad)))
+    for n in bad[:20]:
+        text = lines[n - 1] if n is not None else "(proceso)"
+        print("  linea %s: cache=%s parser=%s  %s" % (n, cached.get(n, 0), parsed.get(n, 0), text))
+    return not bad
+
+
+# =====================================================================
+# MEDICION
+# =====================================================================
+
+def run_validator(exe, path, repeat=REPEAT):
+    """Mejor tiempo de N ejecuciones y resultado (None si OK, texto del error si no)."""
+    best = None
+    error = None
+    for _ in range(repeat):
+        workdir = tempfile.mkdtemp(prefix="ngc_bench_")
+        try:
+            t0 = time.perf_counter()
+            proc = subprocess.run([exe, "-s", path], cwd=workdir,
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            elapsed = time.perf_counter() - t0
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        out = proc.stdout.decode(errors="replace").strip()
+        if proc.returncode:
+            error = out.splitlines()[-1] if out else "codigo de salida %d" % proc.returncode
+        best = elapsed if best is None else min(best, elapsed)
+    return best, error
+
+
+def benchmark(paths, exe, baseline=None, repeat=REPEAT):
+    print("%-22s %8s %10s %12s%s" % ("programa", "lineas", "tiempo s", "lineas/s",
+                                     "  %10s %8s" % ("base l/s", "speedup") if baseline else ""))
+    ok = True
+    for name, (path, lines) in paths.items():
+        t, err = run_validator(exe, path, repeat)
+        row = "%-22s %8d %10.3f %12.0f" % (name, lines, t, lines / t)
+        if baseline:
+            tb, err_b = run_validator(baseline, path, repeat)
+            row += "  %10.0f %7.2fx" % (lines / tb, tb / t)
+            if err_b:
+                row += "  [BASE: %s]" % err_b
+        if err:
+            row += "  [ERROR: %s]" % err
+            ok = False
+        print(row)
+    return ok
+
+
+def main(programs=PROGRAMS):
+    parser = argparse.ArgumentParser(description="Benchmark NGC con grblHAL_validator")
+    parser.add_argument("--validator", default=VALIDATOR_EXE, metavar="RUTA",
+                        help="Ejecutable grblHAL_validator (default: %(default)s)")
+    parser.add_argument("--compare", metavar="RUTA",
+                        help="Validador de referencia (p.ej. build anterior) para calcular speedup")
+    parser.add_argument("--lines", type=int, default=LINES, metavar="N",
+                        help="Tamano aproximado de cada programa (default: %(default)s)")
+    parser.add_argument("-n", "--repeat", type=int, default=REPEAT, metavar="N",
+                        help="Repeticiones por programa, se toma el mejor (default: %(default)s)")
+    parser.add_argument("--out", metavar="DIR",
+                        help="Guardar los programas generados en DIR")
+    parser.add_argument("--only", metavar="TEXTO",
+                        help="Ejecutar solo los programas cuyo nombre contiene TEXTO")
+    parser.add_argument("--differential", metavar="RUTA",
+                        help="Comparar estados de error contra un validador sin cache"
+                             " (NGC_EXPRESSION_CACHE_SIZE=0) en vez de medir")
+    parser.add_argument("--cases", type=int, default=CASES, metavar="N",
+                        help="Expresiones aleatorias de --differential (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, metavar="N",
+                        help="Semilla de --differential (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.only:
+        programs = dict((k, v) for k, v in programs.items() if args.only in k)
+
+    if not os.path.isfile(args.validator):
+        print("[ERROR] No existe el validador: %s" % args.validator)
+        sys.exit(2)
+
+    if args.differential:
+        if not os.path.isfile(args.differential):
+            print("[ERROR] No existe el validador: %s" % args.differential)
+            sys.exit(2)
+        sys.exit(0 if differential(os.path.abspath(args.validator), os.path.abspath(args.differential),
+                                   args.cases, args.seed) else 1)
+
+    out_dir = os.path.abspath(args.out or tempfile.mkdtemp(prefix="ngc_bench_gcode_"))
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        paths = generate(out_dir, args.lines, programs)
+        ok = benchmark(paths, os.path.abspath(args.validator),
+                       args.compare and os.path.abspath(args.compare), args.repeat)
+    finally:
+        if not args.out:
+            shutil.rmtree(out_dir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
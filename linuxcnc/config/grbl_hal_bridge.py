@@ -8,60 +8,314 @@ a LinuxCNC como motor-pos-fb via HAL pins.
 LinuxCNC es un VISUALIZADOR PASIVO: no ejecuta G-code,
 no entiende M451/M450/$RTCP. Solo muestra posiciones.
 
+Las posiciones no se escriben al llegar: un hilo recibe las lineas
+"POS x y z a b c t" (t = tiempo del simulador) y las guarda en un buffer
+de jitter, y el bucle principal escribe los pines a --hz fijos con la
+posicion interpolada --delay segundos por detras de la ultima recibida.
+Las rafagas de red y el --rate de grbl_capture.py ya no se ven como
+tirones. Sin t (capture antiguo) se usa la hora de llegada.
+
+Las lineas completas son "POS x y z a b c t seq enviado edad" y permiten
+medir la latencia del simulador al pin: edad es la de grbl_capture.py
+(simulador, pipe, msg_queue), a la que se suma la de la red (recv contra
+enviado, sobre la minima vista porque los relojes de los dos equipos no
+tienen origen comun), el parseo y el buffer de jitter. Cada --stats s se
+imprimen los percentiles por etapa.
+
+Con grbl_capture.py en el mismo equipo (--shm NOMBRE en los dos) las
+muestras se leen del anillo en memoria compartida en lugar de TCP, sin
+llamadas al sistema por muestra. ShmReader sirve tambien para otras
+herramientas locales:
+
+  ring = ShmReader("grbl_pos")
+  ring.latest()      # (seq, t, x, y, z, a, b, c, enviado, edad) o None
+  ring.read_new()    # registros nuevos desde la llamada anterior
+
+Con grbl_capture.py --fleet las lineas son "MPOS ID x y z ..."; --machine ID
+se suscribe a esa maquina enviando "SUB ID" al conectar. Sin --machine se
+sigue la primera maquina que llega y se avisa con los ID vistos. Con --shm el
+anillo de cada maquina es NOMBRE_ID.
+
 Uso (desde LinuxCNC):
   loadusr -Wn grbl_remote python3 grbl_hal_bridge.py --ip 192.168.1.76
+  loadusr -Wn grbl_remote python3 grbl_hal_bridge.py --shm grbl_pos
+  loadusr -Wn grbl_remote python3 grbl_hal_bridge.py --machine m2
 
 Argumentos:
-  --ip    IP de la maquina Windows con grbl_capture.py (default: 192.168.1.76)
-  --port  Puerto TCP del bridge (default: 5007)
+  --ip      IP de la maquina Windows con grbl_capture.py (default: 192.168.1.76)
+  --port    Puerto TCP del bridge (default: 5007)
+  --hz      Frecuencia de escritura de los pines (default: 100)
+  --delay   Retardo del buffer de jitter en s, 0 = sin buffer (default: 0.1)
+  --speed   Factor de velocidad del simulador, el --speed de grbl_capture.py (default: 1.0)
+  --interp  linear o rotary: A, B y C por el camino corto modulo 360 (default: linear)
+  --shm     Leer del anillo en memoria compartida NOMBRE en lugar de TCP
+  --machine ID de la maquina de grbl_capture.py --fleet (default: la primera que llega)
+
+Pines ademas de axis.*.pos y connected:
+  buffer-depth  ms de posiciones en el buffer por delante de la mostrada
+  underrun      el buffer se vacio y se mantiene la ultima posicion (tambien al parar)
+  underruns     veces que el buffer se vacio
+  latency-ms    edad de la posicion mostrada desde el tick del simulador
+  samples-dropped  muestras perdidas (huecos de seq o buffer lleno)
 """
 import argparse
+import collections
+import os
 import socket
+import struct
 import sys
+import threading
 import time
+from multiprocessing import shared_memory
 
 WINDOWS_IP = "192.168.1.76"
 BRIDGE_PORT = 5007
+HZ = 100
+DELAY = 0.1
+BUFFER_SIZE = 4096
+ROTARY = (3, 4, 5)  # A, B, C
+STATS_SIZE = 10000
+SHM_POLL = 0.002
 
+# Anillo en memoria compartida, mismo formato que en grbl_capture.py
+SHM_MAGIC = b"GRBLPOS1"
+SHM_HEADER = struct.Struct("<8sIIQ")   # magia, capacidad, tamano de registro, registros escritos
+SHM_COUNT_OFFSET = 16
+SHM_RECORD = struct.Struct("<Qd6ddd")  # seq, t, x..c, enviado (monotonic), edad ms
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--ip", default=WINDOWS_IP, help="IP del bridge Windows")
-    parser.add_argument("--port", type=int, default=BRIDGE_PORT, help="Puerto TCP")
-    args = parser.parse_args()
 
+def _lerp(p0, p1, f, rotary):
+    pos = [a + (b - a) * f for a, b in zip(p0, p1)]
+    if rotary:
+        for i in ROTARY:
+            pos[i] = p0[i] + ((p1[i] - p0[i] + 180.0) % 360.0 - 180.0) * f
+    return pos
+
+
+class LatencyStats:
+    """Latencias por etapa en ms, percentiles de las ultimas STATS_SIZE.
+
+    Copia identica de la de grbl_capture.py: el bridge corre en el equipo de
+    LinuxCNC, que solo recibe esta carpeta config/ (loadusr desde el
+    directorio de la configuracion), y grbl_capture.py en el PC Windows del
+    simulador, asi que no pueden compartir un modulo. Un cambio alli se copia
+    aqui."""
+
+    def __init__(self, stages, size=STATS_SIZE):
+        self.values = {stage: collections.deque(maxlen=size) for stage in stages}
+        self.lowest = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, ms):
+        with self.lock:
+            self.values[stage].append(ms)
+        return ms
+
+    def add_relative(self, stage, ms, origin=None):
+        """Para diferencias entre relojes sin origen comun: latencia sobre la minima
+        vista para ese reloj (origin, p.ej. la maquina de la flota)."""
+        with self.lock:
+            low = self.lowest.get((stage, origin))
+            if low is None or ms < low:
+                self.lowest[(stage, origin)] = low = ms
+            self.values[stage].append(ms - low)
+        return ms - low
+
+    def report(self):
+        lines = []
+        with self.lock:
+            for stage, values in self.values.items():
+                if not values:
+                    continue
+                v = sorted(values)
+                n = len(v)
+                p = [v[min(n - 1, n * q // 100)] for q in (50, 95, 99)]
+                lines.append(f"{stage:<8} p50={p[0]:.2f} p95={p[1]:.2f} p99={p[2]:.2f} max={v[-1]:.2f} ms ({n})")
+        return lines
+
+
+class JitterBuffer:
+    """Posiciones con tiempo del simulador, reproducidas con un retardo fijo.
+
+    push() se llama desde el hilo de red, sample() desde el bucle de pines.
+    El reloj de reproduccion avanza con el del host (por --speed) y se
+    mantiene delay segundos por detras de la ultima muestra: si la alcanza
+    se queda en ella (underrun) hasta volver a tener delay de margen, si se
+    queda a mas de 2 * delay salta hacia delante.
+    """
+
+    def __init__(self, delay=DELAY, speed=1.0, rotary=False, size=BUFFER_SIZE):
+        self.delay = delay
+        self.speed = speed
+        self.rotary = rotary
+        self.samples = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.play_t = None
+        self.underrun = True
+        self.underruns = 0
+        self.resyncs = 0
+        self.dropped = 0
+        self.received = None  # (monotonic de llegada, ms desde el simulador) de la ultima
+
+    def push(self, t, pos, received=None):
+        with self.lock:
+            if self.samples and t <= self.samples[-1][0]:
+                if t > self.samples[-1][0] - 1.0:
+                    self.dropped += 1  # repetida o desordenada
+                    return
+                # El simulador se reinicio
+                self.samples.clear()
+                self.play_t = None
+            if len(self.samples) == self.samples.maxlen:
+                self.dropped += 1
+            self.samples.append((t, pos))
+            self.received = received
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+            self.play_t = None
+
+    def sample(self, dt):
+        """Avanza el reloj dt s del host. Retorna (posicion o None, profundidad s)."""
+        with self.lock:
+            if not self.samples:
+                return None, 0.0
+            newest_t, newest = self.samples[-1]
+            if self.delay <= 0.0:
+                self.samples.clear()
+                self.samples.append((newest_t, newest))
+                return newest, 0.0
+            if self.play_t is None:
+                self.play_t = newest_t - self.delay
+            elif not self.underrun:
+                self.play_t += dt * self.speed
+            depth = newest_t - self.play_t
+
+            if self.underrun:
+                if depth < self.delay:
+                    return self._hold(), max(depth, 0.0)
+                self.underrun = False
+            elif depth <= 0.0:
+                self.underrun = True
+                self.underruns += 1
+                self.play_t = newest_t
+                return newest, 0.0
+            if depth > 2.0 * self.delay:
+                self.resyncs += 1
+                self.play_t = newest_t - self.delay
+                depth = self.delay
+
+            # Se conserva la muestra anterior a play_t para interpolar
+            while len(self.samples) > 1 and self.samples[1][0] <= self.play_t:
+                self.samples.popleft()
+            t0, p0 = self.samples[0]
+            if len(self.samples) == 1 or self.play_t <= t0:
+                return p0, depth
+            t1, p1 = self.samples[1]
+            return _lerp(p0, p1, (self.play_t - t0) / (t1 - t0), self.rotary), depth
+
+    def _hold(self):
+        # Posicion en play_t mientras se rellena el buffer
+        for t, pos in self.samples:
+            if t >= self.play_t:
+                return pos
+        return self.samples[-1][1]
+
+
+class ShmReader:
+    """Lector del anillo de posiciones de grbl_capture.py --shm.
+
+    Un registro leido es valido si al terminar de leerlo el productor
+    todavia no ha empezado a sobrescribir su hueco (contador < seq +
+    capacidad), asi que el lector dispone de capacidad - 1 muestras.
+    """
+
+    def __init__(self, name):
+        try:
+            self.shm = shared_memory.SharedMemory(name, track=False)  # Python 3.13+
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name)
+            if os.name == "posix":
+                # Si no, el resource_tracker del lector borra el anillo al salir
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+        magic, self.capacity, record_size, _ = SHM_HEADER.unpack_from(self.shm.buf, 0)
+        if magic != SHM_MAGIC or record_size != SHM_RECORD.size:
+            self.shm.close()
+            raise ValueError(f"{name} no es un anillo de grbl_capture.py")
+        self.next = self.count()
+        self.dropped = 0
+
+    def count(self):
+        return struct.unpack_from("<Q", self.shm.buf, SHM_COUNT_OFFSET)[0]
+
+    def _record(self, seq):
+        return SHM_RECORD.unpack_from(self.shm.buf, SHM_HEADER.size + (seq % self.capacity) * SHM_RECORD.size)
+
+    def latest(self):
+        """Ultimo registro escrito, None si no hay."""
+        while True:
+            count = self.count()
+            if count == 0:
+                return None
+            record = self._record(count - 1)
+            if self.count() < count - 1 + self.capacity and record[0] == count - 1:
+                return record
+
+    def read_new(self):
+        """Registros escritos desde la llamada anterior, los sobrescritos cuentan en dropped."""
+        count = self.count()
+        if count < self.next:
+            self.next = count  # anillo nuevo con el mismo nombre
+        first = max(self.next, count - self.capacity + 1)
+        records = [self._record(seq) for seq in range(first, count)]
+        # Los que el productor empezo a sobrescribir mientras se leian
+        valid_from = max(first, self.count() - self.capacity + 1)
+        records = records[valid_from - first:]
+        self.dropped += valid_from - self.next
+        self.next = count
+        return records
+
+    def close(self):
+        self.shm.close()
+
+
+def parse_pos(msg, machine=None):
+    """(t, [x, y, z, a, b, c], seq, enviado, edad) de una linea POS, o MPOS de
+    la maquina machine, los campos que no envian los capture antiguos son None.
+    None si no es valida."""
+    if msg.startswith("MPOS "):
+        parts = msg.split()
+        if len(parts) < 2 or parts[1] != machine:
+            return None
+        del parts[1]
+    elif msg.startswith("POS ") and machine is None:
+        parts = msg.split()
+    else:
+        return None
+    if len(parts) not in (7, 8, 11):
+        return None
     try:
-        import hal
-        h = hal.component("grbl_remote")
-        h.newpin("axis.x.pos", hal.HAL_FLOAT, hal.HAL_OUT)
-        h.newpin("axis.y.pos", hal.HAL_FLOAT, hal.HAL_OUT)
-        h.newpin("axis.z.pos", hal.HAL_FLOAT, hal.HAL_OUT)
-        h.newpin("axis.a.pos", hal.HAL_FLOAT, hal.HAL_OUT)
-        h.newpin("axis.b.pos", hal.HAL_FLOAT, hal.HAL_OUT)
-        h.newpin("axis.c.pos", hal.HAL_FLOAT, hal.HAL_OUT)
-        h.newpin("connected", hal.HAL_BIT, hal.HAL_OUT)
-        h.ready()
-        use_hal = True
-        print("[HAL] Componente grbl_remote listo")
-    except ImportError:
-        print("[WARN] modulo hal no disponible, modo standalone")
-        use_hal = False
-        h = None
+        vals = [float(p) for p in parts[1:]]
+    except ValueError:
+        return None
+    extra = vals[6:] + [None] * (5 - len(vals[6:]))
+    return extra[0], vals[:6], (int(extra[1]) if extra[1] is not None else None), extra[2], extra[3]
 
-    def update_pos(x, y, z, a, b, c):
-        if use_hal:
-            h["axis.x.pos"] = x
-            h["axis.y.pos"] = y
-            h["axis.z.pos"] = z
-            h["axis.a.pos"] = a
-            h["axis.b.pos"] = b
-            h["axis.c.pos"] = c
-            h["connected"] = True
-
-    def set_disconnected():
-        if use_hal:
-            h["connected"] = False
 
+def fleet_id(msg):
+    """ID de maquina de una linea MPOS, None para cualquier otra."""
+    parts = msg.split(None, 2)
+    if len(parts) >= 2 and parts[0] == "MPOS":
+        return parts[1]
+    return None
+
+
+def receive_loop(args, jitter, state, stats):
+    """Hilo de red: conecta (y reconecta) con grbl_capture.py y llena el buffer."""
+    machine = args.machine
+    seen = set()
     while True:
         sock = None
         try:
@@ -71,11 +325,17 @@ def main():
             sock.connect((args.ip, args.port))
             sock.settimeout(None)
             print(f"[TCP] Conectado a {args.ip}:{args.port}")
+            if machine:
+                sock.sendall(f"SUB {machine}\n".encode())
+            state["connected"] = True
 
             buf = b""
             count = 0
+            last_seq = None
+            t_start = time.monotonic()
             while True:
                 data = sock.recv(4096)
+                t_recv = time.monotonic()
                 if not data:
                     print("[TCP] Conexion cerrada")
                     break
@@ -83,27 +343,39 @@ def main():
                 while b"\n" in buf:
                     line, buf = buf.split(b"\n", 1)
                     msg = line.decode(errors="replace").strip()
-                    if not msg.startswith("POS "):
-                        continue
-                    parts = msg.split()
-                    if len(parts) != 7:
-                        continue
-                    try:
-                        vals = [float(p) for p in parts[1:]]
-                    except ValueError:
+                    ident = fleet_id(msg)
+                    if args.machine is None and ident is not None and ident not in seen:
+                        # Captura de flota sin --machine: seguir la primera maquina
+                        seen.add(ident)
+                        if machine is None:
+                            machine = ident
+                            sock.sendall(f"SUB {machine}\n".encode())
+                        print(f"[WARN] Captura de flota sin --machine, maquinas vistas: "
+                              f"{', '.join(sorted(seen))}; se sigue {machine} (usar --machine ID)")
+                    result = parse_pos(msg, machine)
+                    if result is None:
                         continue
-                    update_pos(*vals)
+                    t, vals, seq, sent, age = result
+                    t_parsed = time.monotonic()
+                    if t is None:
+                        t = (t_parsed - t_start) * args.speed
+                    if seq is not None:
+                        if last_seq is not None and seq > last_seq + 1:
+                            state["dropped"] += seq - last_seq - 1
+                        last_seq = seq  # menor que el anterior: capture reiniciado
+                    latency = stats.add("parseo", (t_parsed - t_recv) * 1000.0)
+                    if sent is not None:
+                        latency += stats.add_relative("red", (t_recv - sent) * 1000.0) + age
+                    jitter.push(t, vals, (t_parsed, latency))
                     count += 1
                     if count % 100 == 0:
                         print(f"[DATA] #{count} X={vals[0]:.2f} Y={vals[1]:.2f} Z={vals[2]:.2f} A={vals[3]:.2f}")
 
-        except KeyboardInterrupt:
-            print("\n[EXIT]")
-            break
         except (ConnectionRefusedError, socket.timeout, OSError) as e:
             print(f"[TCP] Error: {e}")
         finally:
-            set_disconnected()
+            state["connected"] = False
+            jitter.clear()
             if sock:
                 try:
                     sock.close()
@@ -114,5 +386,144 @@ def main():
         time.sleep(3.0)
 
 
+def shm_loop(args, jitter, state, stats):
+    """Hilo local: lee el anillo de grbl_capture.py --shm y llena el buffer.
+    Reabre el anillo tras 3 s sin muestras por si el capture se reinicio."""
+    while True:
+        ring = None
+        try:
+            ring = ShmReader(args.shm)
+            print(f"[SHM] Leyendo anillo {args.shm} ({ring.capacity} muestras)")
+            state["connected"] = True
+            idle = 0.0
+            count = 0
+            dropped = 0
+            while idle < 3.0:
+                records = ring.read_new()
+                # acumulado entre reaperturas: ring.dropped vuelve a 0 con cada ShmReader
+                state["dropped"] += ring.dropped - dropped
+                dropped = ring.dropped
+                if not records:
+                    time.sleep(SHM_POLL)
+                    idle += SHM_POLL
+                    continue
+                idle = 0.0
+                now = time.monotonic()
+                for seq, t, x, y, z, a, b, c, sent, age in records:
+                    jitter.push(t, [x, y, z, a, b, c], (now, age + stats.add("shm", (now - sent) * 1000.0)))
+                count += len(records)
+                if count % 100 < len(records):
+                    print(f"[DATA] #{count} X={x:.2f} Y={y:.2f} Z={z:.2f} A={a:.2f}")
+        except (FileNotFoundError, ValueError) as e:
+            print(f"[SHM] Error: {e}")
+            time.sleep(3.0)
+        finally:
+            state["connected"] = False
+            if ring:
+                ring.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ip", default=WINDOWS_IP, help="IP del bridge Windows")
+    parser.add_argument("--port", type=int, default=BRIDGE_PORT, help="Puerto TCP")
+    parser.add_argument("--hz", type=float, default=HZ, help="Escrituras de pines por segundo")
+    parser.add_argument("--delay", type=float, default=DELAY, help="Retardo del buffer de jitter en s (0 = sin buffer)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Factor de velocidad del simulador")
+    parser.add_argument("--interp", choices=("linear", "rotary"), default="linear",
+                        help="Interpolacion, rotary: A/B/C por el camino corto modulo 360")
+    parser.add_argument("--stats", type=float, default=10.0,
+                        help="Intervalo en s de los percentiles de latencia, 0 = solo al salir")
+    parser.add_argument("--shm", metavar="NOMBRE",
+                        help="Leer del anillo en memoria compartida de grbl_capture.py --shm en lugar de TCP")
+    parser.add_argument("--machine", metavar="ID",
+                        help="Maquina de grbl_capture.py --fleet a mostrar (lineas MPOS ID), "
+                             "default: la primera que llega")
+    args = parser.parse_args()
+
+    try:
+        import hal
+        h = hal.component("grbl_remote")
+        h.newpin("axis.x.pos", hal.HAL_FLOAT, hal.HAL_OUT)
+        h.newpin("axis.y.pos", hal.HAL_FLOAT, hal.HAL_OUT)
+        h.newpin("axis.z.pos", hal.HAL_FLOAT, hal.HAL_OUT)
+        h.newpin("axis.a.pos", hal.HAL_FLOAT, hal.HAL_OUT)
+        h.newpin("axis.b.pos", hal.HAL_FLOAT, hal.HAL_OUT)
+        h.newpin("axis.c.pos", hal.HAL_FLOAT, hal.HAL_OUT)
+        h.newpin("connected", hal.HAL_BIT, hal.HAL_OUT)
+        h.newpin("buffer-depth", hal.HAL_FLOAT, hal.HAL_OUT)
+        h.newpin("underrun", hal.HAL_BIT, hal.HAL_OUT)
+        h.newpin("underruns", hal.HAL_U32, hal.HAL_OUT)
+        h.newpin("latency-ms", hal.HAL_FLOAT, hal.HAL_OUT)
+        h.newpin("samples-dropped", hal.HAL_U32, hal.HAL_OUT)
+        h.ready()
+        use_hal = True
+        print("[HAL] Componente grbl_remote listo")
+    except ImportError:
+        print("[WARN] modulo hal no disponible, modo standalone")
+        use_hal = False
+        h = None
+
+    # Con --delay 0 el reloj siempre esta en la ultima muestra
+    jitter = JitterBuffer(max(args.delay, 0.0), args.speed, args.interp == "rotary")
+    state = {"connected": False, "dropped": 0}
+    if args.shm:
+        stats = LatencyStats(("shm", "buffer", "total"))
+        threading.Thread(target=shm_loop, args=(args, jitter, state, stats), daemon=True).start()
+    else:
+        stats = LatencyStats(("red", "parseo", "buffer", "total"))
+        threading.Thread(target=receive_loop, args=(args, jitter, state, stats), daemon=True).start()
+
+    def update_pins(pos, depth, latency):
+        if use_hal:
+            if pos is not None:
+                h["axis.x.pos"] = pos[0]
+                h["axis.y.pos"] = pos[1]
+                h["axis.z.pos"] = pos[2]
+                h["axis.a.pos"] = pos[3]
+                h["axis.b.pos"] = pos[4]
+                h["axis.c.pos"] = pos[5]
+            h["connected"] = state["connected"]
+            h["buffer-depth"] = depth * 1000.0
+            h["underrun"] = jitter.underrun
+            h["underruns"] = jitter.underruns
+            h["latency-ms"] = latency
+            h["samples-dropped"] = state["dropped"] + jitter.dropped
+
+    period = 1.0 / args.hz
+    last = next_tick = time.monotonic()
+    next_stats = last + args.stats
+    latency = 0.0
+    try:
+        while True:
+            now = time.monotonic()
+            pos, depth = jitter.sample(now - last)
+            last = now
+            # Parada o buffer vacio: la posicion no envejece, se mantiene la ultima latencia
+            if pos is not None and not jitter.underrun and jitter.received:
+                received, upstream = jitter.received
+                buffered = stats.add("buffer", ((now - received) + depth / args.speed) * 1000.0)
+                latency = stats.add("total", upstream + buffered)
+            update_pins(pos, depth, latency)
+            if args.stats > 0 and now >= next_stats:
+                next_stats = now + args.stats
+                for line in stats.report():
+                    print(f"[LATENCIA] {line}")
+            next_tick += period
+            if next_tick < now:
+                next_tick = now  # el host se retraso, no recuperar ticks
+            time.sleep(max(next_tick - time.monotonic(), 0.0))
+    except KeyboardInterrupt:
+        print("\n[EXIT]")
+    finally:
+        state["connected"] = False
+        update_pins(None, 0.0, latency)
+        for line in stats.report():
+            print(f"[LATENCIA] {line}")
+        if jitter.underruns or jitter.resyncs or state["dropped"] or jitter.dropped:
+            print(f"[BUFFER] {jitter.underruns} underruns, {jitter.resyncs} saltos, "
+                  f"{state['dropped'] + jitter.dropped} muestras perdidas")
+
+
 if __name__ == "__main__":
     main()
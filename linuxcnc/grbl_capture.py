@@ -11,24 +11,124 @@ Flujo:
 Arquitectura interna:
   stderr_reader (hilo) --> Queue --> main loop --> broadcast TCP
 
+Cada linea enviada es "POS x y z a b c t seq enviado edad": t es el tiempo del
+simulador, seq un contador por muestra (los huecos son muestras perdidas),
+enviado el time.monotonic() del envio y edad los ms desde el tick del
+simulador. Cada --stats s se imprimen los percentiles de latencia por etapa:
+  sim     tick del simulador -> lectura de stderr (buffer del simulador y pipe),
+          sobre la minima vista: el reloj del simulador no tiene origen comun
+  cola    lectura de stderr -> salida de msg_queue
+  envio   sendall a todos los clientes (y escritura en el anillo --shm)
+
+Con --shm NOMBRE las muestras se escriben ademas en un anillo en memoria
+compartida para consumidores en el mismo equipo (grbl_hal_bridge.py --shm,
+herramientas de graficos), sin formateo, sendall ni parseo por muestra:
+  cabecera  SHM_HEADER: magia, capacidad, tamano de registro, registros escritos
+  registros SHM_RECORD: seq, t, x, y, z, a, b, c, enviado, edad
+El registro seq esta en el hueco seq % capacidad y se escribe antes de
+actualizar el contador de la cabecera. Un lector que lea el hueco de seq
+puede fiarse de el si, despues de leerlo, el contador es < seq + capacidad.
+
+Con --fleet FICHERO un solo proceso supervisa varios simuladores. Cada linea
+del fichero es "ID PUERTO_SIM CONFIG": el ID de la maquina, el puerto -p de
+su simulador y su testing_config.ini (steps/mm y parametros iniciales). Cada
+simulador corre en su propio directorio fleet/ID (su EEPROM.DAT) y un unico
+hilo lee todas las tuberias stderr con selectors (en Windows las tuberias no
+admiten select: el mismo hilo consulta cada FLEET_POLL s con PeekNamedPipe
+cuales tienen datos). La latencia "sim" se mide sobre la minima de cada
+maquina, sus relojes arrancan en instantes distintos. Todas las maquinas salen por
+el mismo --port con lineas "MPOS ID x y z a b c t seq enviado edad", seq por
+maquina. Un cliente recibe todas las maquinas hasta que envia "SUB ID ..."
+con las que quiere ("SUB *" vuelve a todas). Con --shm cada maquina tiene su
+anillo NOMBRE_ID.
+
+Con --step-mode change el simulador solo escribe si la posicion cambio (nada
+en pausas, feed hold o reposo) y con events cada --step-every pasos de
+cualquier eje; en los dos se escribe siempre la posicion exacta al entrar y
+salir de cada bloque y al parar.
+
+Con --status HOST:PUERTO no se lanza el simulador: se conecta como cliente al
+socket -p de un simulador que ya corre, o a un grblHAL real por TCP, y las
+posiciones salen de sus status reports. Se lee $481 (intervalo de los reports
+automaticos); no se escribe porque es persistente y requiere reinicio. Si
+coincide con --status-interval y el controlador lo permite (campo |AR de
+0x87), se activan los reports automaticos con 0x8C; si no, o si no llegan, se
+piden con '?' a ese intervalo.
+StatusParser parsea los reports por trozos segun llegan: MPos, o WPos mas el
+ultimo WCO, y |RTCP:ON/OFF. t es el tiempo de llegada por --speed, en mm/deg.
+Se reconecta cada 3 s si se corta.
+
+Con --metrics-port PUERTO se sirven metricas en texto de Prometheus en
+http://127.0.0.1:PUERTO/metrics para ver donde esta el cuello de botella:
+muestras/s leidas y enviadas, profundidad de msg_queue, bytes pendientes y
+muestras descartadas por cliente, errores de parseo, factor de velocidad del
+simulador (tiempo simulado / tiempo real de las muestras leidas), CPU y RSS.
+En el camino caliente solo se incrementan contadores; el resto se calcula al
+pedir /metrics. Los clientes no bloquean el envio: lo que no cabe en su
+socket queda pendiente y si pasa de CLIENT_BACKLOG bytes se descarta la
+muestra para ese cliente.
+
 Uso:
   python grbl_capture.py
   python grbl_capture.py --port 5007 --sim-port 23 --rate 0.02
+  python grbl_capture.py --shm grbl_pos
+  python grbl_capture.py --metrics-port 9107
+  python grbl_capture.py --fleet fleet.txt
+  python grbl_capture.py --status 192.168.1.50:23 --status-interval 100
 """
 import argparse
+import collections
+import http.server
 import os
 import queue
+import select
+import selectors
 import socket
+import struct
 import subprocess
 import sys
 import threading
 import time
+from multiprocessing import shared_memory
 
 SIM_EXE = r"c:\simulador\build\grblHAL_sim.exe"
 CONFIG_FILE = r"c:\simulador\testing_config.ini"
 IOSENDER_EXE = r"C:\Users\diseño\Downloads\ioSender.2.0.46\ioSender 2.0.46\ioSender.exe"
 
 DEFAULT_STEPS_PER_MM = [250.0, 250.0, 250.0, 250.0, 250.0, 250.0]
+STATS_SIZE = 10000  # ultimas latencias por etapa para los percentiles
+
+# Anillo en memoria compartida, mismo formato en grbl_hal_bridge.py
+SHM_MAGIC = b"GRBLPOS1"
+SHM_HEADER = struct.Struct("<8sIIQ")   # magia, capacidad, tamano de registro, registros escritos
+SHM_COUNT_OFFSET = 16
+SHM_RECORD = struct.Struct("<Qd6ddd")  # seq, t, x..c, enviado (monotonic), edad ms
+SHM_SIZE = 4096
+
+STATUS_INTERVAL = 100  # ms entre status reports en --status
+CMD_STATUS_REPORT = b"?"
+CMD_STATUS_REPORT_ALL = b"\x87"
+CMD_AUTO_REPORTING_TOGGLE = b"\x8c"
+
+FLEET_POLL = 0.002  # s entre consultas de las tuberias de la flota en Windows
+CLIENT_BACKLOG = 256 * 1024  # bytes pendientes por cliente antes de descartar muestras
+
+
+def load_fleet(path):
+    """[(id, puerto del simulador, config)] de un fichero de flota."""
+    machines = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+            parts = line.split(None, 2)
+            if len(parts) != 3:
+                raise ValueError(f"{path}: se esperaba 'ID PUERTO_SIM CONFIG': {line}")
+            machines.append((parts[0], int(parts[1]), parts[2]))
+    if len({m[0] for m in machines}) != len(machines):
+        raise ValueError(f"{path}: IDs de maquina repetidos")
+    return machines
 
 
 def load_steps_per_mm(config_path):
@@ -50,11 +150,233 @@ def load_steps_per_mm(config_path):
     return steps
 
 
+class LatencyStats:
+    """Latencias por etapa en ms, percentiles de las ultimas STATS_SIZE.
+
+    Copia identica en config/grbl_hal_bridge.py: este script corre en el PC
+    Windows del simulador (iniciar_servidor.bat) y el bridge en el equipo de
+    LinuxCNC, que solo recibe la carpeta config/ y lo carga con loadusr sin
+    este directorio en sys.path. Un cambio aqui se copia alli."""
+
+    def __init__(self, stages, size=STATS_SIZE):
+        self.values = {stage: collections.deque(maxlen=size) for stage in stages}
+        self.lowest = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, ms):
+        with self.lock:
+            self.values[stage].append(ms)
+        return ms
+
+    def add_relative(self, stage, ms, origin=None):
+        """Para diferencias entre relojes sin origen comun: latencia sobre la minima
+        vista para ese reloj (origin, p.ej. la maquina de la flota)."""
+        with self.lock:
+            low = self.lowest.get((stage, origin))
+            if low is None or ms < low:
+                self.lowest[(stage, origin)] = low = ms
+            self.values[stage].append(ms - low)
+        return ms - low
+
+    def report(self):
+        lines = []
+        with self.lock:
+            for stage, values in self.values.items():
+                if not values:
+                    continue
+                v = sorted(values)
+                n = len(v)
+                p = [v[min(n - 1, n * q // 100)] for q in (50, 95, 99)]
+                lines.append(f"{stage:<8} p50={p[0]:.2f} p95={p[1]:.2f} p99={p[2]:.2f} max={v[-1]:.2f} ms ({n})")
+        return lines
+
+
+class ShmRing:
+    """Anillo de posiciones en memoria compartida, un productor y varios lectores."""
+
+    def __init__(self, name, capacity=SHM_SIZE):
+        size = SHM_HEADER.size + capacity * SHM_RECORD.size
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Quedo de una ejecucion anterior que no termino bien
+            old = shared_memory.SharedMemory(name)
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.capacity = capacity
+        self.count = 0
+        SHM_HEADER.pack_into(self.shm.buf, 0, SHM_MAGIC, capacity, SHM_RECORD.size, 0)
+
+    def write(self, t, pos, sent, age):
+        seq = self.count
+        SHM_RECORD.pack_into(self.shm.buf, SHM_HEADER.size + (seq % self.capacity) * SHM_RECORD.size,
+                             seq, t, *pos, sent, age)
+        self.count = seq + 1
+        struct.pack_into("<Q", self.shm.buf, SHM_COUNT_OFFSET, self.count)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def process_usage():
+    """(segundos de CPU, bytes de RSS) del proceso, None si no se puede leer."""
+    t = os.times()
+    cpu = t.user + t.system
+    rss = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            kernel32 = ctypes.WinDLL("kernel32")
+            kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            psapi = ctypes.WinDLL("psapi")
+            psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD]
+            if psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+                rss = counters.WorkingSetSize
+        else:
+            try:
+                import resource
+                rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # pico, no actual
+            except ImportError:
+                pass
+    return cpu, rss
+
+
+class Metrics:
+    """Contadores del camino caliente; las tasas y gauges se calculan al servir /metrics."""
+
+    def __init__(self, msg_queue, bridge):
+        self.msg_queue = msg_queue
+        self.bridge = bridge
+        self.samples_in = 0
+        self.samples_out = 0
+        self.parse_errors = 0
+        self.sim_time = {}        # tiempo del simulador de la ultima muestra leida por maquina
+        self.rtcp = None          # ultimo |RTCP: de los status reports en --status
+        self.lock = threading.Lock()
+        self.prev = (time.monotonic(), 0, 0, {})
+        self.rates = (0.0, 0.0, {})
+
+    def _update_rates(self):
+        now = time.monotonic()
+        t0, n_in, n_out, sim0 = self.prev
+        dt = now - t0
+        if dt >= 0.5:
+            sim = dict(self.sim_time)
+            self.rates = ((self.samples_in - n_in) / dt, (self.samples_out - n_out) / dt,
+                          {m: max(t - sim0.get(m, t), 0.0) / dt for m, t in sim.items()})
+            self.prev = (now, self.samples_in, self.samples_out, sim)
+        return self.rates
+
+    def render(self):
+        with self.lock:
+            rate_in, rate_out, speedup = self._update_rates()
+        cpu, rss = process_usage()
+        out = []
+
+        def metric(name, kind, help_text, samples):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                out.append(f"{name}{labels} {value}")
+
+        metric("grbl_capture_samples_in_total", "counter", "Muestras leidas de stderr del simulador",
+               [("", self.samples_in)])
+        metric("grbl_capture_samples_out_total", "counter", "Muestras difundidas a los clientes",
+               [("", self.samples_out)])
+        metric("grbl_capture_samples_in_per_second", "gauge", "Muestras/s leidas desde el ultimo scrape",
+               [("", f"{rate_in:.2f}")])
+        metric("grbl_capture_samples_out_per_second", "gauge", "Muestras/s difundidas desde el ultimo scrape",
+               [("", f"{rate_out:.2f}")])
+        metric("grbl_capture_parse_errors_total", "counter", "Lineas de stderr que no son muestras ni comentarios",
+               [("", self.parse_errors)])
+        metric("grbl_capture_queue_depth", "gauge", "Muestras esperando en msg_queue",
+               [("", self.msg_queue.qsize())])
+        metric("grbl_capture_sim_speedup", "gauge", "Tiempo simulado / tiempo real desde el ultimo scrape",
+               [(f'{{machine="{m}"}}' if m is not None else "", f"{v:.3f}") for m, v in speedup.items()])
+        if self.rtcp is not None:
+            metric("grbl_capture_rtcp", "gauge", "RTCP activo segun el ultimo status report",
+                   [("", int(self.rtcp))])
+        clients = self.bridge.client_stats()
+        metric("grbl_capture_clients", "gauge", "Clientes TCP conectados", [("", len(clients))])
+        metric("grbl_capture_client_backlog_bytes", "gauge", "Bytes pendientes de enviar por cliente",
+               [(f'{{client="{addr}"}}', backlog) for addr, backlog, _ in clients])
+        metric("grbl_capture_client_dropped_total", "counter", "Muestras descartadas por cliente lento",
+               [(f'{{client="{addr}"}}', drops) for addr, _, drops in clients])
+        metric("grbl_capture_client_dropped_closed_total", "counter",
+               "Muestras descartadas por clientes ya desconectados", [("", self.bridge.closed_drops)])
+        metric("process_cpu_seconds_total", "counter", "CPU de usuario y sistema del proceso", [("", f"{cpu:.2f}")])
+        if rss is not None:
+            metric("process_resident_memory_bytes", "gauge", "Memoria residente del proceso", [("", rss)])
+        return "\n".join(out) + "\n"
+
+
+def serve_metrics(metrics, port):
+    """Servidor HTTP local en un hilo daemon con GET /metrics."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class BridgeClient:
+    """Socket de un cliente con lo que aun no se pudo enviar."""
+
+    def __init__(self, conn, addr):
+        self.conn = conn
+        self.addr = f"{addr[0]}:{addr[1]}"
+        self.pending = bytearray()
+        self.drops = 0
+        self.machines = None  # None = todas, o el conjunto de IDs de "SUB"
+        self.commands = b""
+
+    def handle_commands(self, data):
+        self.commands += data
+        while b"\n" in self.commands:
+            line, self.commands = self.commands.split(b"\n", 1)
+            parts = line.decode(errors="replace").split()
+            if parts and parts[0].upper() == "SUB":
+                self.machines = None if not parts[1:] or "*" in parts[1:] else set(parts[1:])
+                print(f"[BRIDGE] {self.addr} suscrito a: {'todas' if self.machines is None else ' '.join(sorted(self.machines))}")
+
+
 class BridgeServer:
     def __init__(self, host, port):
         self.host = host
         self.port = port
         self.clients = []
+        self.closed_drops = 0
         self.lock = threading.Lock()
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -63,38 +385,77 @@ class BridgeServer:
         self.running = True
 
     def accept_loop(self):
-        self.server.settimeout(1.0)
+        """Acepta clientes y lee sus comandos "SUB"."""
         while self.running:
+            with self.lock:
+                socks = {c.conn: c for c in self.clients}
             try:
-                conn, addr = self.server.accept()
-                with self.lock:
-                    self.clients.append(conn)
-                print(f"[BRIDGE] Cliente conectado: {addr}")
-            except socket.timeout:
-                continue
+                readable, _, _ = select.select([self.server] + list(socks), [], [], 1.0)
+            except (OSError, ValueError):
+                continue  # un cliente se cerro entre la copia y el select
+            for sock in readable:
+                if sock is self.server:
+                    conn, addr = self.server.accept()
+                    conn.setblocking(False)
+                    with self.lock:
+                        self.clients.append(BridgeClient(conn, addr))
+                    print(f"[BRIDGE] Cliente conectado: {addr}")
+                    continue
+                c = socks[sock]
+                try:
+                    data = sock.recv(1024)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except OSError:
+                    data = b""
+                if data:
+                    c.handle_commands(data)
+                else:
+                    self._drop_clients([c])
+
+    def _drop_clients(self, dead):
+        with self.lock:
+            for c in dead:
+                if c not in self.clients:
+                    continue
+                self.clients.remove(c)
+                self.closed_drops += c.drops
+                try:
+                    c.conn.close()
+                except Exception:
+                    pass
 
-    def broadcast(self, message):
+    def broadcast(self, message, machine=None):
         data = (message + "\n").encode()
         dead = []
         with self.lock:
             for c in self.clients:
+                if machine is not None and c.machines is not None and machine not in c.machines:
+                    continue
+                if len(c.pending) + len(data) > CLIENT_BACKLOG:
+                    c.drops += 1
+                else:
+                    c.pending += data
                 try:
-                    c.sendall(data)
+                    sent = c.conn.send(c.pending)
+                    del c.pending[:sent]
+                except (BlockingIOError, InterruptedError):
+                    pass
                 except (BrokenPipeError, ConnectionResetError, OSError):
                     dead.append(c)
-            for c in dead:
-                self.clients.remove(c)
-                try:
-                    c.close()
-                except Exception:
-                    pass
+        self._drop_clients(dead)
+
+    def client_stats(self):
+        """[(direccion, bytes pendientes, muestras descartadas)] por cliente."""
+        with self.lock:
+            return [(c.addr, len(c.pending), c.drops) for c in self.clients]
 
     def close(self):
         self.running = False
         with self.lock:
             for c in self.clients:
                 try:
-                    c.close()
+                    c.conn.close()
                 except Exception:
                     pass
         self.server.close()
@@ -116,6 +477,151 @@ def parse_step_line(line, steps_per_mm):
     return timestamp, pos
 
 
+class StatusParser:
+    """Parser incremental de status reports "<Estado|MPos:...|...>" de grblHAL.
+
+    feed() recibe los bytes tal como llegan del socket y devuelve las
+    posiciones de maquina de los reports completos. WPos se pasa a maquina con
+    el ultimo WCO recibido (grblHAL lo envia cada pocos reports)."""
+
+    def __init__(self):
+        self.buf = b""
+        self.wco = None
+        self.state = None
+        self.rtcp = None
+        self.auto_report = None  # True/False segun |AR, None si no llego
+        self.settings = {}       # respuestas "$n=valor"
+        self.reports = 0
+        self.errors = 0
+
+    def feed(self, data):
+        positions = []
+        self.buf += data
+        if b"\n" not in self.buf:
+            return positions
+        lines = self.buf.split(b"\n")
+        self.buf = lines.pop()
+        for raw in lines:
+            line = raw.strip()
+            if line.startswith(b"$") and b"=" in line:
+                key, value = line.decode(errors="replace").split("=", 1)
+                self.settings[key] = value
+                continue
+            if not line.startswith(b"<"):
+                continue  # ok, error:, [MSG:...]
+            pos = self.parse_report(line.decode(errors="replace"))
+            if pos is None:
+                self.errors += 1
+            else:
+                positions.append(pos)
+        return positions
+
+    def parse_report(self, line):
+        if not line.endswith(">"):
+            return None
+        fields = line[1:-1].split("|")
+        mpos = wpos = None
+        try:
+            for field in fields[1:]:
+                if field.startswith("MPos:"):
+                    mpos = [float(v) for v in field[5:].split(",")]
+                elif field.startswith("WPos:"):
+                    wpos = [float(v) for v in field[5:].split(",")]
+                elif field.startswith("WCO:"):
+                    self.wco = [float(v) for v in field[4:].split(",")]
+                elif field.startswith("RTCP:"):
+                    self.rtcp = field[5:] == "ON"
+                elif field == "AR" or field.startswith("AR:"):
+                    self.auto_report = field != "AR"
+        except ValueError:
+            return None
+        if mpos is None:
+            if wpos is None:
+                return None
+            mpos = [w + o for w, o in zip(wpos, self.wco)] if self.wco else wpos
+        self.state = fields[0]
+        self.reports += 1
+        return (mpos + [0.0] * 6)[:6]
+
+
+def status_reader(host, port, interval, speed, msg_queue, stop_event, metrics):
+    """Hilo de --status: conecta (y reconecta) con el simulador o controlador y
+    encola las posiciones de sus status reports."""
+    t_start = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            sock = None
+            try:
+                print(f"[STATUS] Conectando a {host}:{port}...")
+                sock = socket.create_connection((host, port), timeout=5.0)
+                sock.settimeout(None)
+                parser = StatusParser()
+                sock.sendall(b"$481\r\n")
+                sock.sendall(CMD_STATUS_REPORT_ALL)
+                print(f"[STATUS] Conectado, status reports cada {interval} ms")
+                polling = False
+                toggled = False
+                auto_interval = None
+                now = time.monotonic()
+                last_report = now
+                next_poll = now
+                state = rtcp = None
+                while not stop_event.is_set():
+                    now = time.monotonic()
+                    if polling and now >= next_poll:
+                        sock.sendall(CMD_STATUS_REPORT)
+                        next_poll = now + interval / 1000.0
+                    readable, _, _ = select.select([sock], [], [], interval / 1000.0)
+                    if not readable:
+                        if not polling and now - last_report > 3 * interval / 1000.0 + 1.0:
+                            print("[STATUS] Sin reports automaticos, se piden con '?'")
+                            polling = True
+                        continue
+                    data = sock.recv(4096)
+                    t_read = time.monotonic()
+                    if not data:
+                        print("[STATUS] Conexion cerrada")
+                        break
+                    errors = parser.errors
+                    for pos in parser.feed(data):
+                        last_report = t_read
+                        timestamp = (t_read - t_start) * speed
+                        metrics.samples_in += 1
+                        metrics.sim_time[None] = timestamp
+                        msg_queue.put((None, timestamp, pos, t_read))
+                    metrics.parse_errors += parser.errors - errors
+                    if auto_interval is None and "$481" in parser.settings:
+                        auto_interval = parser.settings["$481"]
+                        try:
+                            same = float(auto_interval) == interval
+                        except ValueError:
+                            same = False
+                        if not same and not polling:
+                            print(f"[STATUS] $481={auto_interval} distinto de {interval} ms (no se cambia:"
+                                  " es persistente y requiere reinicio), se piden con '?'")
+                            polling = True
+                    if (parser.auto_report is False and auto_interval is not None
+                            and not toggled and not polling):
+                        sock.sendall(CMD_AUTO_REPORTING_TOGGLE)
+                        toggled = True
+                    if parser.state != state or parser.rtcp != rtcp:
+                        state, rtcp = parser.state, parser.rtcp
+                        metrics.rtcp = rtcp
+                        print(f"[STATUS] {state}" + ("" if rtcp is None else f" RTCP:{'ON' if rtcp else 'OFF'}"))
+            except OSError as e:
+                print(f"[STATUS] Error: {e}")
+            finally:
+                if sock:
+                    try:
+                        sock.close()
+                    except Exception:
+                        pass
+            if not stop_event.wait(3.0):
+                print("[STATUS] Reconectando...")
+    finally:
+        msg_queue.put(None)  # sentinel
+
+
 def send_initial_config(sim_port, config_path):
     print(f"[CONFIG] Enviando parametros al simulador en TCP:{sim_port}...")
     try:
@@ -169,7 +675,7 @@ def send_initial_config(sim_port, config_path):
     time.sleep(0.5) # pausa para asegurar que el simulador cierre su socket internamente
 
 
-def stderr_reader(proc, steps_per_mm, msg_queue, stop_event):
+def stderr_reader(proc, steps_per_mm, msg_queue, stop_event, metrics, machine=None):
     """Hilo dedicado: drena stderr lo mas rapido posible y encola mensajes."""
     try:
         for raw in proc.stderr:
@@ -178,10 +684,13 @@ def stderr_reader(proc, steps_per_mm, msg_queue, stop_event):
             line = raw.decode(errors="replace").strip()
             result = parse_step_line(line, steps_per_mm)
             if result is None:
+                if line and not line.startswith("#"):
+                    metrics.parse_errors += 1
                 continue
             timestamp, pos = result
-            msg = f"POS {pos[0]:.4f} {pos[1]:.4f} {pos[2]:.4f} {pos[3]:.4f} {pos[4]:.4f} {pos[5]:.4f}"
-            msg_queue.put((timestamp, pos, msg))
+            metrics.samples_in += 1
+            metrics.sim_time[machine] = timestamp
+            msg_queue.put((machine, timestamp, pos, time.monotonic()))
     except Exception as e:
         if not stop_event.is_set():
             print(f"[READER] Error: {e}")
@@ -189,96 +698,289 @@ def stderr_reader(proc, steps_per_mm, msg_queue, stop_event):
         msg_queue.put(None)  # sentinel
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Captura grblHAL sim → retransmite a LinuxCNC")
-    parser.add_argument("--port", type=int, default=5007, help="Puerto TCP para clientes (default: 5007)")
-    parser.add_argument("--sim-port", type=int, default=23, help="Puerto TCP del simulador para ioSender (default: 23)")
-    parser.add_argument("--rate", type=float, default=0.02, help="Intervalo de print_steps en seg (default: 0.02)")
-    parser.add_argument("--speed", type=float, default=1.0, help="Factor de velocidad del simulador (default: 1.0)")
-    args = parser.parse_args()
+def pipe_peeker():
+    """Windows: funcion fd -> bytes pendientes en la tuberia (-1 si esta cerrada)."""
+    import ctypes
+    import msvcrt
+    from ctypes import wintypes
+    peek = ctypes.windll.kernel32.PeekNamedPipe
+    peek.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD, ctypes.c_void_p,
+                     ctypes.POINTER(wintypes.DWORD), ctypes.c_void_p]
+    peek.restype = wintypes.BOOL
+
+    def available(fd):
+        avail = wintypes.DWORD(0)
+        if not peek(msvcrt.get_osfhandle(fd), None, 0, None, ctypes.byref(avail), None):
+            return -1
+        return avail.value
+    return available
+
+
+def fleet_reader(sims, msg_queue, stop_event, metrics):
+    """Hilo unico para toda la flota: espera con selectors en las tuberias stderr
+    de todos los simuladores (en Windows las consulta con PeekNamedPipe),
+    sims = {id: (proc, steps_per_mm)}."""
+    pipes = {proc.stderr.fileno(): (machine, steps_per_mm, bytearray())
+             for machine, (proc, steps_per_mm) in sims.items()}
+    sel = None
+    if os.name == "nt":
+        available = pipe_peeker()
+
+        def ready():
+            fds = []
+            for fd in pipes:
+                n = available(fd)
+                if n:  # -1 (cerrada) tambien: os.read da b"" y se quita
+                    fds.append((fd, min(n, 65536) if n > 0 else 1))
+            if not fds:
+                time.sleep(FLEET_POLL)
+            return fds
+    else:
+        sel = selectors.DefaultSelector()
+        for fd in pipes:
+            sel.register(fd, selectors.EVENT_READ)
 
-    steps_per_mm = load_steps_per_mm(CONFIG_FILE)
-    print(f"[CONFIG] Steps/mm: {steps_per_mm}")
+        def ready():
+            return [(key.fd, 65536) for key, _ in sel.select(timeout=0.5)]
+    try:
+        while pipes and not stop_event.is_set():
+            for fd, size in ready():
+                machine, steps_per_mm, buf = pipes[fd]
+                chunk = os.read(fd, size)
+                t_read = time.monotonic()
+                if not chunk:
+                    del pipes[fd]
+                    if sel:
+                        sel.unregister(fd)
+                    print(f"[READER] {machine}: stderr cerrado")
+                    continue
+                buf += chunk
+                end = buf.rfind(b"\n")
+                if end < 0:
+                    continue
+                lines = buf[:end].decode(errors="replace").split("\n")
+                del buf[:end + 1]
+                for line in lines:
+                    result = parse_step_line(line, steps_per_mm)
+                    if result is None:
+                        line = line.strip()
+                        if line and not line.startswith("#"):
+                            metrics.parse_errors += 1
+                        continue
+                    timestamp, pos = result
+                    metrics.samples_in += 1
+                    metrics.sim_time[machine] = timestamp
+                    msg_queue.put((machine, timestamp, pos, t_read))
+    except Exception as e:
+        if not stop_event.is_set():
+            print(f"[READER] Error: {e}")
+    finally:
+        if sel:
+            sel.close()
+        msg_queue.put(None)  # sentinel
 
-    eeprom = os.path.join(os.path.dirname(SIM_EXE), "EEPROM.DAT")
-    if os.path.exists(eeprom):
-        os.remove(eeprom)
-        print("[CONFIG] EEPROM.DAT eliminado")
 
-    sim_cmd = [SIM_EXE, "-p", str(args.sim_port), "-r", str(args.rate), "-t", str(args.speed)]
-    print(f"[SIM] Lanzando: {' '.join(sim_cmd)}")
+def launch_simulator(sim_port, rate, speed, cwd=None, step_mode="interval", step_every=1):
+    """Lanza grblHAL_sim con print_steps por stderr, None si no arranca."""
+    sim_cmd = [SIM_EXE, "-p", str(sim_port), "-r", str(rate), "-t", str(speed)]
+    if step_mode != "interval":
+        sim_cmd += ["-m", step_mode, "-d", str(step_every)]
+    print(f"[SIM] Lanzando: {' '.join(sim_cmd)}" + (f" en {cwd}" if cwd else ""))
     proc = subprocess.Popen(
         sim_cmd,
+        cwd=cwd,
         stdout=subprocess.DEVNULL,
         stderr=subprocess.PIPE,
-        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
+        creationflags=getattr(subprocess, "CREATE_NEW_PROCESS_GROUP", 0),
     )
     time.sleep(2.0)
     if proc.poll() is not None:
         err = proc.stderr.read().decode(errors="replace")
         print(f"[ERROR] Simulador fallo: {err}")
-        sys.exit(1)
+        return None
+    print(f"[SIM] PID={proc.pid}, puerto TCP={sim_port}")
+    return proc
 
-    print(f"[SIM] PID={proc.pid}, puerto TCP={args.sim_port}")
-    
-    # NUEVO: Enviar configuración MIENTRAS ioSender todavía no acapara el puerto 23
-    send_initial_config(args.sim_port, CONFIG_FILE)
-    
-    print(f"[SIM] Esperando conexion de ioSender en TCP:{args.sim_port}...")
 
-    if os.path.exists(IOSENDER_EXE):
-        print(f"[IOSENDER] Lanzando ioSender desde: {IOSENDER_EXE}")
+def main():
+    parser = argparse.ArgumentParser(description="Captura grblHAL sim → retransmite a LinuxCNC")
+    parser.add_argument("--port", type=int, default=5007, help="Puerto TCP para clientes (default: 5007)")
+    parser.add_argument("--sim-port", type=int, default=23, help="Puerto TCP del simulador para ioSender (default: 23)")
+    parser.add_argument("--rate", type=float, default=0.02, help="Intervalo de print_steps en seg (default: 0.02)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Factor de velocidad del simulador (default: 1.0)")
+    parser.add_argument("--step-mode", choices=("interval", "change", "events"), default="interval",
+                        help="-m de print_steps: cada --rate, solo si hubo movimiento o cada --step-every pasos (default: interval)")
+    parser.add_argument("--step-every", type=int, default=1, help="Pasos de un eje entre muestras con --step-mode events (default: 1)")
+    parser.add_argument("--stats", type=float, default=10.0, help="Intervalo en s de los percentiles de latencia, 0 = solo al salir (default: 10)")
+    parser.add_argument("--shm", metavar="NOMBRE", help="Escribir tambien las muestras en el anillo de memoria compartida NOMBRE")
+    parser.add_argument("--shm-size", type=int, default=SHM_SIZE, help=f"Muestras del anillo --shm (default: {SHM_SIZE})")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Puerto local de las metricas HTTP /metrics, 0 = desactivado (default: 0)")
+    parser.add_argument("--fleet", metavar="FICHERO", help="Supervisar varios simuladores, lineas 'ID PUERTO_SIM CONFIG'")
+    parser.add_argument("--status", metavar="HOST:PUERTO", help="Leer status reports de un simulador o grblHAL ya en marcha en lugar de lanzar el simulador")
+    parser.add_argument("--status-interval", type=int, default=STATUS_INTERVAL, help=f"ms entre status reports con --status (default: {STATUS_INTERVAL})")
+    args = parser.parse_args()
+    if args.status and args.fleet:
+        parser.error("--status y --fleet son excluyentes")
+
+    # {id: (proc, steps_per_mm)}, id None fuera del modo flota
+    sims = {}
+    if args.status:
+        host, _, port = args.status.rpartition(":")
+        if not host or not port.isdigit():
+            parser.error("--status espera HOST:PUERTO")
+        status_addr = (host, int(port))
+    elif args.fleet:
         try:
-            subprocess.Popen([IOSENDER_EXE], cwd=os.path.dirname(IOSENDER_EXE), creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
-        except Exception as e:
-            print(f"[ERROR] No se pudo iniciar ioSender: {e}")
+            machines = load_fleet(args.fleet)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] Flota: {e}")
+            sys.exit(1)
+        for machine, sim_port, config in machines:
+            steps_per_mm = load_steps_per_mm(config)
+            print(f"[CONFIG] {machine} steps/mm: {steps_per_mm}")
+            cwd = os.path.join(os.path.dirname(SIM_EXE), "fleet", machine)
+            os.makedirs(cwd, exist_ok=True)
+            eeprom = os.path.join(cwd, "EEPROM.DAT")
+            if os.path.exists(eeprom):
+                os.remove(eeprom)
+            proc = launch_simulator(sim_port, args.rate, args.speed, cwd, args.step_mode, args.step_every)
+            if proc is None:
+                for other, _ in sims.values():
+                    other.terminate()
+                sys.exit(1)
+            send_initial_config(sim_port, config)
+            sims[machine] = (proc, steps_per_mm)
+        print(f"[FLOTA] {len(sims)} simuladores: {' '.join(sims)}")
     else:
-        print(f"[WARN] ioSender no encontrado en: {IOSENDER_EXE}")
+        steps_per_mm = load_steps_per_mm(CONFIG_FILE)
+        print(f"[CONFIG] Steps/mm: {steps_per_mm}")
+
+        eeprom = os.path.join(os.path.dirname(SIM_EXE), "EEPROM.DAT")
+        if os.path.exists(eeprom):
+            os.remove(eeprom)
+            print("[CONFIG] EEPROM.DAT eliminado")
+
+        proc = launch_simulator(args.sim_port, args.rate, args.speed, step_mode=args.step_mode, step_every=args.step_every)
+        if proc is None:
+            sys.exit(1)
+        sims[None] = (proc, steps_per_mm)
+
+        # NUEVO: Enviar configuración MIENTRAS ioSender todavía no acapara el puerto 23
+        send_initial_config(args.sim_port, CONFIG_FILE)
+
+        print(f"[SIM] Esperando conexion de ioSender en TCP:{args.sim_port}...")
+
+        if os.path.exists(IOSENDER_EXE):
+            print(f"[IOSENDER] Lanzando ioSender desde: {IOSENDER_EXE}")
+            try:
+                subprocess.Popen([IOSENDER_EXE], cwd=os.path.dirname(IOSENDER_EXE), creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+            except Exception as e:
+                print(f"[ERROR] No se pudo iniciar ioSender: {e}")
+        else:
+            print(f"[WARN] ioSender no encontrado en: {IOSENDER_EXE}")
 
     bridge = BridgeServer("0.0.0.0", args.port)
     accept_thread = threading.Thread(target=bridge.accept_loop, daemon=True)
     accept_thread.start()
     print(f"[BRIDGE] Escuchando en 0.0.0.0:{args.port}")
 
+    rings = {}
+    if args.shm:
+        for machine in sims or [None]:
+            name = args.shm if machine is None else f"{args.shm}_{machine}"
+            rings[machine] = ring = ShmRing(name, max(args.shm_size, 2))
+            print(f"[SHM] Anillo {name}: {ring.capacity} muestras de {SHM_RECORD.size} bytes")
+
     msg_queue = queue.Queue()
-    stop_event = threading.Event()
-    reader_thread = threading.Thread(
-        target=stderr_reader,
-        args=(proc, steps_per_mm, msg_queue, stop_event),
-        daemon=True,
-    )
-    reader_thread.start()
-    print("[READER] Hilo lector de stderr iniciado")
+    metrics = Metrics(msg_queue, bridge)
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = serve_metrics(metrics, args.metrics_port)
+        print(f"[METRICS] http://127.0.0.1:{args.metrics_port}/metrics")
 
+    stop_event = threading.Event()
+    if args.status:
+        readers = [threading.Thread(target=status_reader,
+                                    args=(*status_addr, args.status_interval, args.speed, msg_queue, stop_event, metrics),
+                                    daemon=True)]
+    elif args.fleet:
+        readers = [threading.Thread(target=fleet_reader, args=(sims, msg_queue, stop_event, metrics), daemon=True)]
+        print("[READER] Hilo lector de la flota iniciado")
+    else:
+        readers = [threading.Thread(target=stderr_reader, args=(proc, steps, msg_queue, stop_event, metrics, machine),
+                                    daemon=True)
+                   for machine, (proc, steps) in sims.items()]
+        print(f"[READER] {len(readers)} hilo(s) lector(es) de stderr iniciado(s)")
+    for reader_thread in readers:
+        reader_thread.start()
+    readers_left = len(readers)
+
+    stats = LatencyStats(("sim", "cola", "envio"))
+    next_stats = time.monotonic() + args.stats
+    seqs = dict.fromkeys(sims or [None], 0)
     line_count = 0
     try:
         while True:
             try:
                 item = msg_queue.get(timeout=0.5)
             except queue.Empty:
-                if proc.poll() is not None:
+                if sims and all(proc.poll() is not None for proc, _ in sims.values()):
                     print("[SIM] Proceso terminado")
                     break
                 continue
 
             if item is None:  # sentinel del reader
-                break
+                readers_left -= 1
+                if readers_left == 0:
+                    break
+                continue
 
-            timestamp, pos, msg = item
-            bridge.broadcast(msg)
+            machine, timestamp, pos, t_read = item
+            t_get = time.monotonic()
+            age = stats.add_relative("sim", (t_read - timestamp / args.speed) * 1000.0, machine)
+            age += stats.add("cola", (t_get - t_read) * 1000.0)
+            # seq cuenta por maquina, el buffer de jitter de grbl_hal_bridge.py usa el tiempo del simulador
+            seq = seqs[machine]
+            seqs[machine] = seq + 1
+            sent = time.monotonic()
+            age += (sent - t_get) * 1000.0
+            ring = rings.get(machine)
+            if ring:
+                ring.write(timestamp, pos, sent, age)
+            frame = (f"{pos[0]:.4f} {pos[1]:.4f} {pos[2]:.4f} {pos[3]:.4f} {pos[4]:.4f} {pos[5]:.4f} "
+                     f"{timestamp:.5f} {seq} {sent:.6f} {age:.3f}")
+            if machine is None:
+                bridge.broadcast(f"POS {frame}")
+            else:
+                bridge.broadcast(f"MPOS {machine} {frame}", machine)
+            stats.add("envio", (time.monotonic() - sent) * 1000.0)
             line_count += 1
-            if line_count % 50 == 0:
-                print(f"[DATA] t={timestamp:.3f}s X={pos[0]:.2f} Y={pos[1]:.2f} Z={pos[2]:.2f} A={pos[3]:.2f} B={pos[4]:.2f} C={pos[5]:.2f}")
+            metrics.samples_out = line_count
+            if args.stats > 0 and sent >= next_stats:
+                next_stats = sent + args.stats
+                for line in stats.report():
+                    print(f"[LATENCIA] {line}")
+            if seq % 50 == 49:
+                tag = f" {machine}" if machine is not None else ""
+                print(f"[DATA{tag}] t={timestamp:.3f}s X={pos[0]:.2f} Y={pos[1]:.2f} Z={pos[2]:.2f} A={pos[3]:.2f} B={pos[4]:.2f} C={pos[5]:.2f}")
     except KeyboardInterrupt:
         print("\n[EXIT] Ctrl+C")
     finally:
         stop_event.set()
         bridge.close()
-        proc.terminate()
-        try:
-            proc.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            proc.kill()
+        if metrics_server:
+            metrics_server.shutdown()
+        for ring in rings.values():
+            ring.close()
+        for proc, _ in sims.values():
+            proc.terminate()
+        for proc, _ in sims.values():
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        for line in stats.report():
+            print(f"[LATENCIA] {line}")
         print(f"[EXIT] {line_count} posiciones procesadas")
 
 
@@ -0,0 +1,557 @@
+# -*- coding: ascii -*-
+"""
+Pre-flight RTCP offline
+=======================
+Revisa un programa G-code completo contra la cinematica AC de rtcp.c antes
+de correrlo, en lugar de descubrir un ALARM a mitad del trabajo. Los
+movimientos se expanden a espacio motor con NumPy (vectorizado, por
+bloques) usando la misma formula que transform_from_cartesian().
+
+Se reporta cada linea que:
+    envolvente - la trayectoria motor sale de $130-$135 (X/Y/Z segun el
+                 origen de homing, A/C simetrico +-max travel como
+                 rtcp_check_travel_limits)
+    singular   - con RTCP activo A pasa a menos de --singular grados de +-90
+                 (gimbal lock, test_singularidad)
+    rotativo   - G1/G2/G3 necesita mas velocidad en A o C que $113/$115
+                 para mantener el feed programado (el planner la recorta)
+
+Uso basico:
+    python rtcp_preflight.py programa.nc
+    python rtcp_preflight.py programa.nc --config maquina.ini
+    python rtcp_preflight.py programa.nc --set "$642=150 $133=120"
+    python rtcp_preflight.py programa.nc --wco 100,50,-20 --tlo 35
+    python rtcp_preflight.py programa.nc --json reporte.json
+
+Modelo:
+    - Settings de testing_config.ini (--config), --set los reemplaza.
+    - Coordenadas de programa + --wco (G53 las toma como maquina), --tlo
+      participa en la rotacion como en rtcp.c.
+    - RTCP empieza apagado (como el firmware) salvo --rtcp; M451/M450 lo
+      cambian. Con RTCP el TCP y A/C se interpolan linealmente, igual que
+      rtcp_segment_line(); se evaluan --samples puntos por linea.
+    - G2/G3 se revisan como cuerda (punto final), G20/G21, G90/G91, G93/G94.
+    - Lineas con parametros, expresiones u O-words no se evaluan: se cuentan
+      y se listan como omitidas (usar grblHAL_validator para esas). Los
+      comandos $ (jogs $J=...) tambien se omiten y no cambian el estado modal.
+
+Autotest (programas cortos con resultado conocido):
+    python rtcp_preflight.py --selftest
+
+Requiere NumPy.
+
+Codigo de salida:
+    0 = sin problemas
+    1 = al menos una linea reportada
+    2 = error de ejecucion (archivo o config no encontrados, etc.)
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    print("[ERROR] rtcp_preflight.py requiere NumPy (pip install numpy)")
+    sys.exit(2)
+
+# =====================================================================
+# CONFIGURACION
+# =====================================================================
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(REPO_DIR, "testing_config.ini")
+SAMPLES = 8              # puntos evaluados por linea con RTCP activo
+SINGULAR_MARGIN = 0.5    # grados alrededor de A=+-90 (cos < 0.0087 como test_singularidad)
+BLOCK = 1 << 18          # movimientos por bloque vectorizado
+MAX_SHOWN = 20           # lineas listadas por categoria (el JSON las tiene todas)
+INCH = 25.4
+
+AXES = "XYZAC"
+COMMENT_RE = re.compile(rb"\([^)\n]*\)|;[^\n]*")
+NUMBER_WIDTH = 16        # caracteres leidos despues de cada letra
+
+
+def load_settings(path, overrides=""):
+    """Settings $n=v de un .ini como testing_config.ini, con --set aplicado."""
+    settings = {}
+    with open(path, "r") as f:
+        for line in f:
+            cmd = line.split("#")[0].strip()
+            if cmd.startswith("$") and "=" in cmd:
+                key, val = cmd.split("=", 1)
+                settings[key.strip()] = float(val)
+    for item in overrides.replace(";", " ").split():
+        if "=" not in item or not item.startswith("$"):
+            raise ValueError("Setting invalido: %s" % item)
+        key, val = item.split("=", 1)
+        settings[key] = float(val)
+    return settings
+
+
+class Machine:
+    """Geometria y limites en el formato que usan los chequeos."""
+
+    def __init__(self, settings, origin="neg", tlo=0.0):
+        get = lambda n, d=0.0: settings.get("$%d" % n, d)
+        self.pivot = (get(640), get(641), get(642, 150.0))
+        self.offset_y, self.offset_z = get(643), get(644)
+        self.tlo = tlo
+        travel = [abs(get(130 + i, 200.0)) for i in (0, 1, 2, 3, 5)]
+        # grblHAL guarda max travel negativo: envolvente [-travel, 0] salvo
+        # $HOMING_FORCE_SET_ORIGIN / homing hacia positivo
+        self.min = [-t if origin == "neg" else 0.0 for t in travel[:3]] + [-t for t in travel[3:]]
+        self.max = [0.0 if origin == "neg" else t for t in travel[:3]] + travel[3:]
+        self.max_rate_a, self.max_rate_c = get(113, 1e9), get(115, 1e9)
+
+
+# =====================================================================
+# PARSER (vectorizado)
+# =====================================================================
+# Un programa de millones de lineas no se puede recorrer linea a linea en
+# Python en pocos segundos. Cada letra se busca en todo el texto a la vez
+# (regex + NumPy), se asigna a su linea y el estado modal (G90/G91, G20,
+# G93, M451...) se propaga hacia adelante con acumulados.
+
+def read_numbers(buf, pos):
+    """Numero que sigue a cada posicion pos de buf (NaN si no hay), vectorizado.
+
+    Equivale a float() de [ \\t]*[-+]?[0-9]*.?[0-9]* pero sobre todas las
+    palabras a la vez: se toman NUMBER_WIDTH bytes por palabra (una fila por
+    columna de caracteres) y los digitos se acumulan columna por columna.
+    buf debe terminar con NUMBER_WIDTH ceros.
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(buf, NUMBER_WIDTH)
+    offset = pos + 1
+    chars = np.ascontiguousarray(windows[offset].T)
+    blank = (chars == ord(" ")) | (chars == ord("\t"))
+    if blank[0].any():
+        offset = offset + np.argmin(blank, axis=0)
+        chars = np.ascontiguousarray(windows[offset].T)
+    negative = chars[0] == ord("-")
+    signed = negative | (chars[0] == ord("+"))
+    if signed.any():
+        chars = np.ascontiguousarray(windows[offset + signed].T)
+
+    mantissa = np.zeros(len(pos))
+    decimals = np.zeros(len(pos))
+    run = np.ones(len(pos), dtype=bool)
+    seen_dot = np.zeros(len(pos), dtype=bool)
+    any_digit = np.zeros(len(pos), dtype=bool)
+    for c in chars:
+        d = c - np.uint8(ord("0"))  # uint8: no digitos dan >= 10
+        digit = run & (d < 10)
+        dot = run & (c == ord(".")) & ~seen_dot
+        run = digit | dot
+        if not run.any():
+            break
+        mantissa = np.where(digit, mantissa * 10.0 + d, mantissa)
+        decimals += digit & seen_dot
+        seen_dot |= dot
+        any_digit |= digit
+    value = mantissa / 10.0 ** decimals
+    return np.where(any_digit, np.where(negative, -value, value), np.nan)
+
+
+def ffill_index(mask):
+    """Para cada posicion, indice de la ultima posicion con mask True (-1 si no hay)."""
+    return np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+
+
+def ffill(values, initial):
+    """Propaga el ultimo valor no NaN hacia adelante, initial antes del primero."""
+    idx = ffill_index(~np.isnan(values))
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], initial)
+
+
+def parse_program(path, wco=(0.0, 0.0, 0.0), start=(0.0,) * 5, rtcp=False):
+    """Lee el programa y retorna (movimientos, lineas omitidas, total lineas).
+
+    movimientos es un dict de arrays: line, x y z a c (destino maquina en
+    mm/grados), feed (mm/min, o 1/min con G93) y rapid/rtcp/inverse (bool).
+    """
+    with open(path, "rb") as f:
+        text = COMMENT_RE.sub(b"", f.read().upper())
+    buf = np.frombuffer(text + bytes(NUMBER_WIDTH), dtype=np.uint8)
+    eol = np.flatnonzero(buf == ord("\n"))
+    n_lines = len(eol) + (1 if text and not text.endswith(b"\n") else 0)
+
+    def words(letter):
+        """(linea 0-based, valor) de cada palabra letter en el programa."""
+        pos = np.flatnonzero(buf == ord(letter))
+        return np.searchsorted(eol, pos), read_numbers(buf, pos)
+
+    def per_line(letter):
+        """Valor de la palabra letter en cada linea (NaN si no esta)."""
+        line, value = words(letter)
+        out = np.full(n_lines, np.nan)
+        sel = ~skip[line]
+        out[line[sel]] = value[sel]
+        return out
+
+    def modal(line, value, on, off, initial):
+        """Estado modal (bool) por linea: True desde la palabra on, False desde off."""
+        state = np.full(n_lines, np.nan)
+        for code, v in ((off, 0.0), (on, 1.0)):
+            state[line[np.abs(value - code) < 1e-3]] = v
+        return ffill(state, 1.0 if initial else 0.0) > 0.5
+
+    # Lineas que no se pueden evaluar offline: parametros, expresiones,
+    # O-words y comandos que dejan la posicion desconocida
+    skip = np.zeros(n_lines + 1, dtype=bool)
+    for c in b"#[O":
+        skip[np.searchsorted(eol, np.flatnonzero(buf == c))] = True
+    # Comandos de sistema ($J=, $H, $X...): primer caracter no blanco '$'.
+    # Un jog no es modal, su G91/G20 no debe pasar a las lineas siguientes
+    first = np.flatnonzero(~np.isin(buf, (0, 9, 10, 13, 32)))
+    if len(first):
+        starts = np.concatenate(([0], eol + 1))[:n_lines]
+        first = first[np.minimum(np.searchsorted(first, starts), len(first) - 1)]
+        system = (buf[first] == ord("$")) & (np.searchsorted(eol, first) == np.arange(n_lines))
+        skip[:n_lines] |= system
+    g_line, g_val = words("G")
+    unknown = np.isin(np.floor(g_val), (10, 28, 30, 38, 92))
+    skip[g_line[unknown]] = True
+    skip = skip[:n_lines]
+    sel = ~skip[g_line]
+    g_line, g_val = g_line[sel], g_val[sel]
+
+    motion = np.full(n_lines, np.nan)
+    is_motion = np.isin(g_val, (0, 1, 2, 3))
+    motion[g_line[is_motion]] = g_val[is_motion]
+    motion = ffill(motion, 0.0)
+    absolute = modal(g_line, g_val, 90, 91, True)
+    inch = modal(g_line, g_val, 20, 21, False)
+    inverse = modal(g_line, g_val, 93, 94, False)
+    machine = np.zeros(n_lines, dtype=bool)
+    machine[g_line[g_val == 53]] = True
+    m_line, m_val = words("M")
+    sel = ~skip[m_line]
+    rtcp_on = modal(m_line[sel], m_val[sel], 451, 450, rtcp)
+
+    scale = np.where(inch, INCH, 1.0)
+    present = np.zeros(n_lines, dtype=bool)
+    pos = []
+    for i, letter in enumerate(AXES):
+        val = per_line(letter)
+        has = ~np.isnan(val)
+        present |= has
+        if i < 3:
+            val = val * scale
+            val = np.where(machine & absolute, val - wco[i], val)
+        prog0 = start[i] - (wco[i] if i < 3 else 0.0)
+        # G90 fija el valor, G91 suma: posicion = ultimo absoluto + incrementos desde entonces
+        inc = np.cumsum(np.where(has & ~absolute, val, 0.0))
+        last = ffill_index(has & absolute)
+        base = np.where(last >= 0, val[np.maximum(last, 0)] - inc[np.maximum(last, 0)], prog0)
+        pos.append(base + inc + (wco[i] if i < 3 else 0.0))
+
+    feed = per_line("F")
+    feed = ffill(np.where(inverse, feed, feed * scale), 0.0)
+
+    idx = np.flatnonzero(present)
+    moves = {"line": idx + 1, "feed": feed[idx], "rapid": motion[idx] == 0,
+             "rtcp": rtcp_on[idx], "inverse": inverse[idx]}
+    moves.update((k, p[idx]) for k, p in zip("xyzac", pos))
+    return moves, (np.flatnonzero(skip) + 1).tolist(), n_lines
+
+
+# =====================================================================
+# CINEMATICA
+# =====================================================================
+
+def rtcp_inverse(m, x, y, z, a_deg, c_deg):
+    """transform_from_cartesian() vectorizado: TCP (+ TLO en z) -> motores X Y Z."""
+    a = np.radians(a_deg)
+    c = np.radians(c_deg)
+    ca, sa = np.cos(a), np.sin(a)
+    cc, sc = np.cos(c), np.sin(c)
+    px, py, pz = m.pivot
+    dy, dz = m.offset_y, m.offset_z + m.tlo
+    dx_, dy_, dz_ = x - px, y - py, (z - m.tlo) - pz
+    xc = dx_ * cc - dy_ * sc
+    yc = dx_ * sc + dy_ * cc
+    return (xc + px,
+            yc * ca - dz_ * sa - ca * dy + sa * dz + dy + py,
+            yc * sa + dz_ * ca - sa * dy - ca * dz + dz + pz)
+
+
+def rtcp_forward(m, xm, ym, zm, a_deg, c_deg):
+    """Inversa de rtcp_inverse(): motores X Y Z -> TCP (+ TLO en z)."""
+    a = np.radians(a_deg)
+    c = np.radians(c_deg)
+    ca, sa = np.cos(a), np.sin(a)
+    cc, sc = np.cos(c), np.sin(c)
+    px, py, pz = m.pivot
+    dy, dz = m.offset_y, m.offset_z + m.tlo
+    u = ym - py - dy + ca * dy - sa * dz
+    v = zm - pz - dz + sa * dy + ca * dz
+    xc = xm - px
+    yc = u * ca + v * sa
+    return (xc * cc + yc * sc + px,
+            yc * cc - xc * sc + py,
+            v * ca - u * sa + pz + m.tlo)
+
+
+def motor_positions(m, p, rtcp):
+    """Motores (X Y Z A C) de puntos cartesianos p, identidad sin RTCP."""
+    if not rtcp.any():
+        return p
+    x, y, z = rtcp_inverse(m, p[0], p[1], p[2], p[3], p[4])
+    return [np.where(rtcp, x, p[0]), np.where(rtcp, y, p[1]), np.where(rtcp, z, p[2]),
+            p[3], p[4]]
+
+
+def distance_to_singularity(a0, a1):
+    """Distancia en grados del intervalo [a0, a1] al angulo 90 + 180*k mas cercano."""
+    lo = np.minimum(a0, a1) - 90.0
+    hi = np.maximum(a0, a1) - 90.0
+    k_lo = np.ceil(lo / 180.0)
+    crosses = np.floor(hi / 180.0) >= k_lo
+    dist = np.minimum(lo - (k_lo - 1.0) * 180.0, k_lo * 180.0 - hi)
+    return np.where(crosses, 0.0, dist)
+
+
+# =====================================================================
+# CHEQUEOS
+# =====================================================================
+
+def check_block(m, mv, prev, samples, singular):
+    """Chequea un bloque de movimientos. prev = destino del movimiento anterior
+    a cada uno (5 arrays). Retorna dict categoria -> dict de columnas."""
+    end = [mv[k] for k in "xyzac"]
+    rtcp = mv["rtcp"]
+    lo = [np.full(len(end[0]), np.inf) for _ in range(5)]
+    hi = [np.full(len(end[0]), -np.inf) for _ in range(5)]
+
+    # Trayectoria motor: sin RTCP es una recta en espacio motor (basta el
+    # destino), con RTCP se evaluan puntos intermedios del TCP interpolado.
+    # El origen de cada linea es el destino de la anterior, ya chequeado.
+    n_samples = samples if rtcp.any() else 1
+    for j in range(1, n_samples + 1):
+        t = j / float(n_samples)
+        motors = motor_positions(m, [s + (e - s) * t for s, e in zip(prev, end)], rtcp)
+        for i in range(5):
+            v = motors[i] if j == n_samples else np.where(rtcp, motors[i], end[i])
+            lo[i] = np.minimum(lo[i], v)
+            hi[i] = np.maximum(hi[i], v)
+
+    over = np.zeros(len(end[0]))
+    axis_mask = np.zeros(len(end[0]), dtype=np.int64)
+    for i in range(5):
+        excess = np.maximum(m.min[i] - lo[i], hi[i] - m.max[i])
+        bad = excess > 1e-6
+        axis_mask |= np.where(bad, 1 << i, 0)
+        over = np.maximum(over, np.where(bad, excess, 0.0))
+    idx = np.flatnonzero(axis_mask)
+    found = {"envolvente": {"line": mv["line"][idx], "axes": axis_mask[idx], "excess": over[idx]}}
+
+    sing = distance_to_singularity(prev[3], end[3])
+    idx = np.flatnonzero(rtcp & (sing < singular))
+    found["singular"] = {"line": mv["line"][idx], "a": end[3][idx], "distance": sing[idx]}
+
+    # Velocidad rotativa: tiempo del movimiento segun el feed programado. Con
+    # RTCP el feed es la velocidad del TCP, sin desplazamiento TCP (o sin
+    # RTCP) grblHAL lo aplica a la distancia de todos los ejes.
+    d_xyz = np.sqrt(sum((e - s) ** 2 for e, s in zip(end[:3], prev[:3])))
+    d_all = np.sqrt(d_xyz ** 2 + (end[3] - prev[3]) ** 2 + (end[4] - prev[4]) ** 2)
+    dist = np.where(rtcp & (d_xyz > 1e-6), d_xyz, d_all)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        minutes = np.where(mv["inverse"], 1.0 / mv["feed"], dist / mv["feed"])
+        ratio = np.maximum(np.abs(end[3] - prev[3]) / minutes / m.max_rate_a,
+                           np.abs(end[4] - prev[4]) / minutes / m.max_rate_c)
+    ratio = np.where(~mv["rapid"] & (mv["feed"] > 0) & np.isfinite(ratio), ratio, 0.0)
+    idx = np.flatnonzero(ratio > 1.0)
+    found["rotativo"] = {"line": mv["line"][idx], "ratio": ratio[idx]}
+
+    return found
+
+
+def check_program(m, moves, start, samples=SAMPLES, singular=SINGULAR_MARGIN, block=BLOCK):
+    """Chequea todos los movimientos por bloques. Retorna dict categoria -> dict de columnas."""
+    parts = []
+    n = len(moves["line"])
+    for b in range(0, n, block):
+        mv = {k: v[b:b + block] for k, v in moves.items()}
+        prev = []
+        for i, k in enumerate("xyzac"):
+            p = np.empty(len(mv[k]))
+            p[0] = moves[k][b - 1] if b else start[i]
+            p[1:] = mv[k][:-1]
+            prev.append(p)
+        parts.append(check_block(m, mv, prev, samples, singular))
+    if not parts:
+        parts.append(check_block(m, moves, [np.empty(0)] * 5, samples, singular))
+    return {name: {k: np.concatenate([p[name][k] for p in parts]) for k in parts[0][name]}
+            for name in parts[0]}
+
+
+def report_rows(report, name, limit=None):
+    """Filas de una categoria como dicts (las primeras limit)."""
+    cols = {k: v[:limit] for k, v in report[name].items()}
+    rows = []
+    for i in range(len(cols["line"])):
+        row = {"line": int(cols["line"][i])}
+        if name == "envolvente":
+            row["axes"] = "".join(a for j, a in enumerate(AXES) if cols["axes"][i] & (1 << j))
+            row["excess"] = round(float(cols["excess"][i]), 4)
+        elif name == "singular":
+            row["a"] = float(cols["a"][i])
+            row["distance"] = round(float(cols["distance"][i]), 4)
+        else:
+            row["ratio"] = round(float(cols["ratio"][i]), 3)
+        rows.append(row)
+    return rows
+
+
+# =====================================================================
+# REPORTE
+# =====================================================================
+
+def print_report(report, skipped, summary, max_shown=MAX_SHOWN):
+    details = {
+        "envolvente": lambda r: "ejes %s fuera por %.3f" % (r["axes"], r["excess"]),
+        "singular": lambda r: "A=%.3f a %.3f grados de +-90" % (r["a"], r["distance"]),
+        "rotativo": lambda r: "%.2fx sobre $113/$115" % r["ratio"],
+    }
+    for name in report:
+        total = summary[name]
+        if not total:
+            continue
+        print("\n[%s] %d lineas" % (name.upper(), total))
+        for r in report_rows(report, name, max_shown):
+            print("  linea %d: %s" % (r["line"], details[name](r)))
+        if total > max_shown:
+            print("  ... %d mas" % (total - max_shown))
+    if skipped:
+        print("\n[OMITIDAS] %d lineas con parametros/expresiones/O-words o posicion desconocida"
+              % len(skipped))
+        print("  lineas %s%s" % (", ".join(str(n) for n in skipped[:max_shown]),
+                                 " ..." if len(skipped) > max_shown else ""))
+
+    print("\n" + "=" * 60)
+    print("Lineas: %d  Movimientos: %d  Omitidas: %d" % (
+        summary["lines"], summary["moves"], summary["skipped"]))
+    print("Envolvente: %d  Singular: %d  Rotativo: %d" % (
+        summary["envolvente"], summary["singular"], summary["rotativo"]))
+    print("Tiempo: %.2fs (parser %.2fs), %.0f l/s" % (
+        summary["time"], summary["parse_time"], summary["lines_per_sec"]))
+    print("=" * 60)
+
+
+# nombre -> (programa, lineas fuera de envolvente, lineas omitidas, X final)
+# con los settings por defecto de Machine (recorrido 200 mm, origen negativo)
+SELFTEST_PROGRAMS = {
+    "jog_en_medio": ("G90 G21\nG0 X-10 Y-10 Z0\n$J=G91 X1000 F500\nG1 X-20 F100\n",
+                     [], [3], -20.0),
+    "jog_indentado": ("G90\nG0 X-10\n  $J=G91 G20 X1 F10\nG1 X-30 F100\nG91 X-5\n",
+                      [], [3], -35.0),
+    "fuera_de_envolvente": ("G90\nG0 X-10\nG1 X10 F100\n$H\nG1 X-250\n",
+                            [3, 5], [4], -250.0),
+}
+
+
+def selftest():
+    """Chequea SELFTEST_PROGRAMS. Retorna True si todos dan lo esperado."""
+    import tempfile
+    machine = Machine({})
+    failed = 0
+    for name, (text, expected, expected_skip, x_end) in sorted(SELFTEST_PROGRAMS.items()):
+        fd, path = tempfile.mkstemp(prefix="preflight_", suffix=".nc")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(text)
+            moves, skipped, _ = parse_program(path)
+        finally:
+            os.remove(path)
+        lines = check_program(machine, moves, (0.0,) * 5)["envolvente"]["line"].tolist()
+        got = (lines, skipped, float(moves["x"][-1]))
+        if got != (expected, expected_skip, x_end):
+            failed += 1
+            print("  [FAIL] %-20s esperado envolvente=%s omitidas=%s X=%g, obtenido %s %s X=%g" % (
+                name, expected, expected_skip, x_end, got[0], got[1], got[2]))
+    print("Autotest: %d/%d programas con el resultado esperado" % (
+        len(SELFTEST_PROGRAMS) - failed, len(SELFTEST_PROGRAMS)))
+    return failed == 0
+
+
+def parse_triplet(text, n):
+    values = [float(v) for v in text.split(",")]
+    if len(values) != n:
+        raise argparse.ArgumentTypeError("se esperaban %d valores separados por coma" % n)
+    return tuple(values)
+
+
+# =====================================================================
+# MAIN
+# =====================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pre-flight RTCP offline de programas G-code",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("program", nargs="?", metavar="ARCHIVO", help="Programa G-code")
+    parser.add_argument("--config", default=CONFIG_FILE, metavar="RUTA",
+                        help="Settings $n=v de la maquina (default: %(default)s)")
+    parser.add_argument("--set", default="", metavar="'$n=v ...'",
+                        help="Reemplaza settings de --config")
+    parser.add_argument("--origin", choices=("neg", "pos"), default="neg",
+                        help="Envolvente X/Y/Z: neg=[-max travel, 0] (grbl), "
+                             "pos=[0, max travel] (default: %(default)s)")
+    parser.add_argument("--wco", type=lambda s: parse_triplet(s, 3), default=(0.0, 0.0, 0.0),
+                        metavar="X,Y,Z", help="Offset de trabajo activo (G54...) en mm")
+    parser.add_argument("--tlo", type=float, default=0.0, metavar="MM",
+                        help="Offset de largo de herramienta (G43) en mm")
+    parser.add_argument("--start", type=lambda s: parse_triplet(s, 5), default=(0.0,) * 5,
+                        metavar="X,Y,Z,A,C", help="Posicion maquina inicial")
+    parser.add_argument("--rtcp", action="store_true", help="RTCP activo desde el inicio")
+    parser.add_argument("--samples", type=int, default=SAMPLES, metavar="N",
+                        help="Puntos evaluados por linea con RTCP (default: %(default)s)")
+    parser.add_argument("--singular", type=float, default=SINGULAR_MARGIN, metavar="GRADOS",
+                        help="Margen alrededor de A=+-90 (default: %(default)s)")
+    parser.add_argument("--max-shown", type=int, default=MAX_SHOWN, metavar="N",
+                        help="Lineas listadas por categoria (default: %(default)s)")
+    parser.add_argument("--json", metavar="RUTA", help="Guardar reporte JSON")
+    parser.add_argument("--selftest", action="store_true",
+                        help="Chequear programas cortos con resultado conocido y salir")
+    args = parser.parse_args()
+
+    if args.selftest:
+        sys.exit(0 if selftest() else 1)
+    if not args.program:
+        parser.error("falta ARCHIVO")
+
+    try:
+        settings = load_settings(args.config, args.set)
+        t0 = time.perf_counter()
+        moves, skipped, n_lines = parse_program(args.program, args.wco, args.start, args.rtcp)
+    except (OSError, ValueError) as e:
+        print("[ERROR] %s" % e)
+        sys.exit(2)
+    t_parse = time.perf_counter() - t0
+
+    machine = Machine(settings, args.origin, args.tlo)
+    report = check_program(machine, moves, args.start, max(1, args.samples), args.singular)
+    elapsed = time.perf_counter() - t0
+
+    summary = {"lines": n_lines, "moves": len(moves["line"]), "skipped": len(skipped),
+               "time": elapsed, "parse_time": t_parse,
+               "lines_per_sec": n_lines / elapsed if elapsed > 0 else 0.0}
+    summary.update((k, len(v["line"])) for k, v in report.items())
+    print_report(report, skipped, summary, args.max_shown)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "skipped": skipped,
+                       "lines": {k: report_rows(report, k) for k in report}}, f, indent=2)
+        print("Reporte JSON: %s" % args.json)
+
+    sys.exit(1 if any(summary[k] for k in report) else 0)
+
+
+if __name__ == "__main__":
+    main()
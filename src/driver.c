@@ -26,6 +26,7 @@
 #include "serial.h"
 #include "eeprom.h"
 #include "grbl_eeprom_extensions.h"
+#include "sim_checkpoint.h"
 #include "platform.h"
 
 #include "grbl/hal.h"
@@ -411,6 +412,10 @@ void sim_process_realtime (uint_fast16_t state)
 {
     //platform_sleep(0); // yield needed? or simply trust the OS's thread scheduler...
     on_execute_realtime(state);
+
+    // Settings are written to NVS in bursts from protocol_execute_realtime(),
+    // write them back to file here, once per burst instead of once per byte.
+    eeprom_poll();
 }
 
 uint32_t millis (void)
@@ -418,6 +423,29 @@ uint32_t millis (void)
     return ticks;
 }
 
+// Saves or restores the driver state and the MCU peripherals, used by checkpoints.
+// Interrupt handlers and the UART are left as set up by this run.
+bool driver_checkpoint (checkpoint_t *cp)
+{
+    uint32_t now = ticks;
+
+    if(!(cp->data(&ticks, sizeof(ticks)) &&
+          cp->data(&delay, sizeof(delay_t)) &&
+           cp->data(&probe_invert, sizeof(probe_invert)) &&
+            cp->data(timer, sizeof(mcu_timer_t) * MCU_N_TIMERS) &&
+             cp->data(&systick_timer, sizeof(mcu_timer_t)) &&
+              cp->data(gpio, sizeof(gpio_port_t) * MCU_N_GPIO)))
+        return false;
+
+    if(cp->restore) {
+        cp->relocate(&delay.callback);
+        if(cp->reset)
+            ticks = now;    // millis() must not go back
+    }
+
+    return true;
+}
+
 bool driver_init ()
 {
     mcu_reset();
@@ -501,6 +529,8 @@ bool driver_init ()
     hal.driver_cap.limits_pull_up = On;
     hal.driver_cap.probe_pull_up = On;
 
+    checkpoint_init();
+
     // no need to move version check before init - compiler will fail any signature mismatch for existing entries
     return hal.version == 10;
 }
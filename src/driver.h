@@ -20,6 +20,8 @@
 
 */
 
+#include "grbl/checkpoint.h"
+
 #define portINT(p) portQ(p)
 #define portQ(p) GPIO ## p ## _IRQ
 
@@ -60,3 +62,5 @@
 #define PROBE_BIT           (1<<PROBE_PIN)
 #define PROBE_CONNECTED_BIT (1<<PROBE_CONNECTED_PIN)
 #define PROBE_MASK          (PROBE_BIT|PROBE_CONNECTED_BIT)
+
+bool driver_checkpoint (checkpoint_t *cp);
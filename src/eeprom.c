@@ -2,6 +2,14 @@
   eeprom.c - replacement for the avr library of the same name to provide
   replacement functionality - write to "EEPROM.dat" in working directory
 
+  The image is kept in RAM and only the dirty byte range is written back,
+  on idle (eeprom_poll() from the realtime loop), on exit or on an explicit
+  eeprom_sync(). EEPROM_Direct keeps the original byte-by-byte write-through
+  and EEPROM_Atomic writes the whole image to a temporary file and renames
+  it over the original so a crash never leaves a half written file. Each
+  atomic write costs an fsync (several ms), so eeprom_poll() holds them
+  back until the settings have not changed for ATOMIC_IDLE_NS.
+
   Part of Grbl Simulator
 
   Copyright (c) 2012 Jens Geisler
@@ -27,74 +35,190 @@
 #include <stdint.h>
 #include <string.h>
 #include <stdbool.h>
+#ifdef WIN32
+#include <windows.h>
+#include <io.h>
+#else
+#include <unistd.h>
+#endif
 
 #include "simulator.h"
+#include "platform.h"
+#include "eeprom.h"
 
 #define MAX_EEPROM_SIZE 4096   // 4KB EEPROM
+#define ATOMIC_IDLE_NS 500000000u // atomic mode: write back 0.5 s after the last change
 
 static char eeprom_file[128];
+static eeprom_mode_t eeprom_mode = EEPROM_Cached;
+static uint8_t image[MAX_EEPROM_SIZE];
+static bool loaded = false;
+static uint32_t dirty_lo = MAX_EEPROM_SIZE, dirty_hi = 0; // dirty range [lo, hi)
+static FILE *eeprom_fp = NULL;
+static uint32_t changed_ns; // platform_ns() of the last change to the image
 
 void set_eeprom_name (char *name)
 {
     strcpy(eeprom_file, name);
 }
 
-static FILE *eeprom_create_empty_file (void)
+void eeprom_set_mode (eeprom_mode_t mode)
+{
+    eeprom_mode = mode;
+}
+
+static inline void mark_dirty (uint32_t lo, uint32_t hi)
+{
+    if(lo < dirty_lo)
+        dirty_lo = lo;
+    if(hi > dirty_hi)
+        dirty_hi = hi;
+}
+
+static FILE *eeprom_open (void)
+{
+    if (!eeprom_fp && !(eeprom_fp = fopen(eeprom_file, "r+b")))
+        eeprom_fp = fopen(eeprom_file, "w+b");
+
+    return eeprom_fp;
+}
+
+// Load the image on first access, missing or short files are padded with 0xFF
+// (erased EEPROM) and written back on the next sync.
+static void eeprom_load (void)
 {
-    int i;
-    FILE* fp = fopen(eeprom_file, "w+b");
+    size_t len = 0;
+    FILE *fp;
 
-    if (fp) {
-        for(i = 0; i < MAX_EEPROM_SIZE; i++)
-            fputc(0xFF, fp);
+    loaded = true;
 
-        fseek(fp, 0, SEEK_SET);
+    if ((fp = fopen(eeprom_file, "rb"))) {
+        len = fread(image, 1, MAX_EEPROM_SIZE, fp);
+        fclose(fp);
     }
 
-    return fp;
+    if (len < MAX_EEPROM_SIZE) {
+        memset(image + len, 0xFF, MAX_EEPROM_SIZE - len);
+        mark_dirty(len, MAX_EEPROM_SIZE);
+        if (eeprom_mode == EEPROM_Direct)
+            eeprom_sync();
+    }
 }
 
-static FILE *eeprom_fp (void)
+static bool eeprom_write_atomic (void)
 {
-    static FILE* EEPROM_FP = NULL;
-    static int tried = 0;
-
-    if (!EEPROM_FP && !tried) {
-        tried = 1;
-        EEPROM_FP = fopen(eeprom_file, "r+b");
-        if (!EEPROM_FP) {
-            EEPROM_FP = eeprom_create_empty_file();
-        }
+    char tmp_file[sizeof(eeprom_file) + 4];
+    FILE *fp;
+    bool ok;
+
+    if (eeprom_fp) {
+        fclose(eeprom_fp);
+        eeprom_fp = NULL;
     }
 
-    return EEPROM_FP;
+    sprintf(tmp_file, "%s.tmp", eeprom_file);
+
+    if (!(fp = fopen(tmp_file, "wb")))
+        return false;
+
+    ok = fwrite(image, 1, MAX_EEPROM_SIZE, fp) == MAX_EEPROM_SIZE && fflush(fp) == 0;
+#ifdef WIN32
+    ok = ok && _commit(_fileno(fp)) == 0;
+#else
+    ok = ok && fsync(fileno(fp)) == 0;
+#endif
+    ok = fclose(fp) == 0 && ok;
+
+#ifdef WIN32
+    ok = ok && MoveFileExA(tmp_file, eeprom_file, MOVEFILE_REPLACE_EXISTING|MOVEFILE_WRITE_THROUGH);
+#else
+    ok = ok && rename(tmp_file, eeprom_file) == 0;
+#endif
+    if (!ok)
+        remove(tmp_file);
+
+    return ok;
 }
 
-void eeprom_close (void)
+// Write back the dirty range, returns false if the file could not be written.
+bool eeprom_sync (void)
 {
-    FILE* fp = eeprom_fp();
-    fclose(fp);
+    bool ok;
+    FILE *fp;
+
+    if (dirty_lo >= dirty_hi)
+        return true;
+
+    if (eeprom_mode == EEPROM_Atomic)
+        ok = eeprom_write_atomic();
+    else if ((ok = !!(fp = eeprom_open()))) {
+        ok = fseek(fp, dirty_lo, SEEK_SET) == 0 &&
+              fwrite(image + dirty_lo, 1, dirty_hi - dirty_lo, fp) == dirty_hi - dirty_lo &&
+               fflush(fp) == 0;
+    }
+
+    if (ok) {
+        dirty_lo = MAX_EEPROM_SIZE;
+        dirty_hi = 0;
+    }
+
+    return ok;
 }
 
-uint8_t eeprom_get_char(uint32_t addr )
+// Write back from the realtime loop: every burst in cached mode, atomic mode
+// waits until no byte has changed for ATOMIC_IDLE_NS so that a run of $x=val
+// lines ends in a single fsync. platform_ns() wraps after ~4 s, that only
+// delays the write.
+bool eeprom_poll (void)
 {
-    FILE* fp = eeprom_fp();
+    if (eeprom_mode == EEPROM_Atomic && dirty_lo < dirty_hi &&
+         (uint32_t)(platform_ns() - changed_ns) < ATOMIC_IDLE_NS)
+        return true;
 
-    if (fseek(fp, addr, SEEK_SET))
-        return 0; //no such address
+    return eeprom_sync();
+}
+
+void eeprom_close (void)
+{
+    if (loaded)
+        eeprom_sync();
 
-    return fgetc(fp);
+    if (eeprom_fp) {
+        fclose(eeprom_fp);
+        eeprom_fp = NULL;
+    }
+
+    loaded = false; // reload on next access, eg. after set_eeprom_name()
+}
+
+uint8_t eeprom_get_char (uint32_t addr)
+{
+    if (!loaded)
+        eeprom_load();
+
+    return addr < MAX_EEPROM_SIZE ? image[addr] : 0xFF; //no such address
 }
 
-void eeprom_put_char(uint32_t addr, uint8_t new_value )
+void eeprom_put_char (uint32_t addr, uint8_t new_value)
 {
-    FILE* fp = eeprom_fp();
+    if (!loaded)
+        eeprom_load();
 
-    if (fseek(fp, addr, SEEK_SET))
+    if (addr >= MAX_EEPROM_SIZE)
         return; //no such address
 
-    fputc(new_value, fp);
-    fflush(fp);
+    if (eeprom_mode == EEPROM_Direct) {
+        FILE *fp = eeprom_open();
+        image[addr] = new_value;
+        if (fp && fseek(fp, addr, SEEK_SET) == 0) {
+            fputc(new_value, fp);
+            fflush(fp);
+        }
+    } else if (image[addr] != new_value) {
+        image[addr] = new_value;
+        mark_dirty(addr, addr + 1);
+        changed_ns = platform_ns();
+    }
 }
 
 // end of file
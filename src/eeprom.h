@@ -1,8 +1,22 @@
+#ifndef _EEPROM_H_
+#define _EEPROM_H_
 
 #include <stdint.h>
 #include <stdbool.h>
 
+typedef enum {
+    EEPROM_Direct = 0,  // write-through, fseek + fputc + fflush per byte
+    EEPROM_Cached,      // RAM image, dirty range written on idle, exit or eeprom_sync()
+    EEPROM_Atomic       // as EEPROM_Cached but written as a new file renamed over the old one,
+                        // eeprom_poll() only writes after 0.5 s without changes
+} eeprom_mode_t;
+
 void eeprom_close (void);
 void set_eeprom_name (char *name);
+void eeprom_set_mode (eeprom_mode_t mode);
+bool eeprom_sync (void);
+bool eeprom_poll (void);
 uint8_t eeprom_get_char (uint32_t addr );
-void eeprom_put_char (uint32_t addr, uint8_t new_value );
\ No newline at end of file
+void eeprom_put_char (uint32_t addr, uint8_t new_value );
+
+#endif
\ No newline at end of file
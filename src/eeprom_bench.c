@@ -0,0 +1,215 @@
+/*
+  eeprom_bench.c - time settings replay against the EEPROM file backends
+
+  Part of Grbl Simulator
+
+  Replays the NVS write pattern of a settings file (one $x=val per line):
+  for each setting grblHAL rewrites the global settings block from its
+  RAM buffer (nvs_buffer_sync_physical()) and the simulator then syncs the
+  EEPROM file from its realtime loop (eeprom_poll()). The same replay is
+  timed for every write mode and the resulting files are compared byte for
+  byte. Atomic mode coalesces the replay into one write, the cost of a
+  single forced atomic write (fsync + rename) is reported separately.
+
+  Grbl is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  Grbl is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with Grbl.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "platform.h"
+#include "eeprom.h"
+#include "grbl_eeprom_extensions.h"
+#include "grbl/settings.h"
+
+#define MAX_LINES 256
+#define MAX_LINE_LENGTH 128
+#define MAX_EEPROM_IMAGE 4096
+#define BLOCK_SIZE (sizeof(settings_t) + NVS_CRC_BYTES)
+
+static const struct {
+    const char *name;
+    eeprom_mode_t mode;
+} modes[] = {
+    { "direct", EEPROM_Direct },
+    { "cached", EEPROM_Cached },
+    { "atomic", EEPROM_Atomic }
+};
+
+#define N_MODES (sizeof(modes) / sizeof(modes[0]))
+
+static char lines[MAX_LINES][MAX_LINE_LENGTH];
+static uint8_t block[BLOCK_SIZE];
+
+static int load_settings (const char *path)
+{
+    int n = 0;
+    char buf[MAX_LINE_LENGTH];
+    FILE *fp = fopen(path, "r");
+
+    if (!fp) {
+        perror("fopen");
+        printf("Error opening : %s\n", path);
+        return -1;
+    }
+
+    while (n < MAX_LINES && fgets(buf, sizeof(buf), fp)) {
+        if (buf[0] == '$' && strchr(buf, '='))
+            strcpy(lines[n++], buf);
+    }
+
+    fclose(fp);
+
+    return n;
+}
+
+// Returns elapsed time in seconds for one replay of n_lines settings.
+static double replay (const char *file, eeprom_mode_t mode, int n_lines, int repeat)
+{
+    uint32_t t0;
+    double elapsed = 0.0;
+    int i, r;
+
+    remove(file);
+    set_eeprom_name((char *)file);
+    eeprom_set_mode(mode);
+
+    // Boot: read the whole NVS area and write defaults, as settings_init() on a fresh file
+    memset(block, 0, sizeof(block));
+    memcpy_from_eeprom(block, NVS_ADDR_GLOBAL, BLOCK_SIZE, false);
+    memcpy_to_eeprom(NVS_ADDR_GLOBAL, block, BLOCK_SIZE, false);
+    eeprom_sync();
+
+    for (r = 0; r < repeat; r++) {
+        for (i = 0; i < n_lines; i++) {
+            // Each setting changes a few bytes of the block, the whole block is rewritten
+            uint32_t hash = 2166136261u;
+            char *c = lines[i];
+            while (*c)
+                hash = (hash ^ (uint8_t)*c++) * 16777619u;
+            block[hash % BLOCK_SIZE] = (uint8_t)(hash >> 8) + r;
+            block[(hash >> 12) % BLOCK_SIZE] = (uint8_t)(hash >> 16);
+
+            t0 = platform_ns();
+            memcpy_to_eeprom(NVS_ADDR_GLOBAL, block, BLOCK_SIZE, false);
+            eeprom_poll();
+            elapsed += (uint32_t)(platform_ns() - t0) * 1e-9;
+        }
+    }
+
+    t0 = platform_ns();
+    eeprom_close();
+    elapsed += (uint32_t)(platform_ns() - t0) * 1e-9;
+
+    return elapsed;
+}
+
+// Returns the mean time in seconds of n forced atomic writes, one changed byte each.
+static double atomic_write_cost (const char *file, int n)
+{
+    uint32_t t0;
+    double elapsed = 0.0;
+    int i;
+
+    remove(file);
+    set_eeprom_name((char *)file);
+    eeprom_set_mode(EEPROM_Atomic);
+    eeprom_get_char(0);
+    eeprom_sync();
+
+    for (i = 0; i < n; i++) {
+        eeprom_put_char(NVS_ADDR_GLOBAL, (uint8_t)i);
+        t0 = platform_ns();
+        eeprom_sync();
+        elapsed += (uint32_t)(platform_ns() - t0) * 1e-9;
+    }
+
+    eeprom_close();
+    remove(file);
+
+    return elapsed / n;
+}
+
+static bool same_contents (const char *a, const char *b)
+{
+    static uint8_t buf_a[2 * MAX_EEPROM_IMAGE], buf_b[2 * MAX_EEPROM_IMAGE];
+    size_t len_a = 0, len_b = 0;
+    FILE *fp;
+
+    if ((fp = fopen(a, "rb"))) {
+        len_a = fread(buf_a, 1, sizeof(buf_a), fp);
+        fclose(fp);
+    }
+
+    if ((fp = fopen(b, "rb"))) {
+        len_b = fread(buf_b, 1, sizeof(buf_b), fp);
+        fclose(fp);
+    }
+
+    return len_a && len_a == len_b && !memcmp(buf_a, buf_b, len_a);
+}
+
+int main (int argc, char *argv[])
+{
+    int n_lines, repeat = 10;
+    double t_direct = 0.0;
+    char file[N_MODES][64];
+    const char *config = "testing_config.ini";
+    uint_fast8_t m;
+    bool ok = true;
+
+    if (argc > 1)
+        config = argv[1];
+    if (argc > 2)
+        repeat = atoi(argv[2]);
+
+    if (argc > 3 || repeat < 1) {
+        printf("Usage: %s [settings file] [repeat]\n"
+               "  Replays the $x=val lines of settings file (default testing_config.ini)\n"
+               "  repeat times (default 10) with each EEPROM write mode.\n", argv[0]);
+        return EXIT_FAILURE;
+    }
+
+    if ((n_lines = load_settings(config)) <= 0) {
+        printf("No settings in %s\n", config);
+        return EXIT_FAILURE;
+    }
+
+    printf("%d settings x %d, %u bytes rewritten per setting\n\n", n_lines, repeat, (unsigned)BLOCK_SIZE);
+    printf("%-8s %10s %12s %10s\n", "mode", "total ms", "us/setting", "speedup");
+
+    for (m = 0; m < N_MODES; m++) {
+        sprintf(file[m], "eeprom_bench_%s.dat", modes[m].name);
+        double t = replay(file[m], modes[m].mode, n_lines, repeat);
+        if (m == 0)
+            t_direct = t;
+        printf("%-8s %10.2f %12.2f %9.1fx\n", modes[m].name, t * 1e3, t * 1e6 / (n_lines * repeat), t_direct / t);
+    }
+
+    printf("\natomic write (fsync + rename) %.2f us each, the atomic replay writes once\n",
+            atomic_write_cost("eeprom_bench_fsync.dat", 20) * 1e6);
+
+    for (m = 1; m < N_MODES; m++) {
+        if (!same_contents(file[0], file[m])) {
+            printf("\nERROR: %s differs from %s\n", file[m], file[0]);
+            ok = false;
+        }
+    }
+
+    for (m = 0; m < N_MODES; m++)
+        remove(file[m]);
+
+    return ok ? EXIT_SUCCESS : EXIT_FAILURE;
+}
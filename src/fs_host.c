@@ -0,0 +1,199 @@
+/*
+  fs_host.c - host directory as grblHAL file system
+
+  Part of Grbl Simulator
+
+  Maps a directory of the host file system to a grblHAL VFS mount, so
+  named subroutines (o<name> call -> /name.macro) and file streams can
+  be executed by the validator.
+
+  Grbl is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  Grbl is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with Grbl.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include <ctype.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "fs_host.h"
+#include "grbl/vfs.h"
+
+#define MAX_PATH_LENGTH 512
+
+static char root_dir[MAX_PATH_LENGTH] = "";
+
+static inline FILE *host_file (vfs_file_t *file)
+{
+    return *(FILE **)&file->handle;
+}
+
+static const char *host_path (const char *filename, char *buf)
+{
+    if(strlen(root_dir) + strlen(filename) + 2 > MAX_PATH_LENGTH)
+        return NULL;
+
+    strcpy(buf, root_dir);
+    if(*filename != '/')
+        strcat(buf, "/");
+    strcat(buf, filename);
+
+    return buf;
+}
+
+static vfs_file_t *fs_open (const char *filename, const char *mode)
+{
+    FILE *fp;
+    char path[MAX_PATH_LENGTH], fmode[4];
+    vfs_file_t *file = NULL;
+
+    if(host_path(filename, path) == NULL || strlen(mode) > 2)
+        return NULL;
+
+    // binary mode, vfs_tell() offsets must be valid for vfs_seek()
+    strcpy(fmode, mode);
+    if(!strchr(fmode, 'b'))
+        strcat(fmode, "b");
+
+    // The parser uppercases o<name> labels, try lowercase as well since
+    // host file systems are usually case sensitive (FatFs on SD is not)
+    if((fp = fopen(path, fmode)) == NULL && *fmode == 'r') {
+        char *c = path + strlen(root_dir);
+        while(*c) {
+            *c = tolower(*c);
+            c++;
+        }
+        fp = fopen(path, fmode);
+    }
+
+    if(fp) {
+        if((file = calloc(sizeof(vfs_file_t) + sizeof(FILE *), 1))) {
+            *(FILE **)&file->handle = fp;
+            if(!fseek(fp, 0, SEEK_END)) {
+                file->size = (size_t)ftell(fp);
+                fseek(fp, 0, SEEK_SET);
+            }
+        } else
+            fclose(fp);
+    }
+
+    return file;
+}
+
+static void fs_close (vfs_file_t *file)
+{
+    fclose(host_file(file));
+    free(file);
+}
+
+static size_t fs_read (void *buffer, size_t size, size_t count, vfs_file_t *file)
+{
+    return fread(buffer, size, count, host_file(file));
+}
+
+static size_t fs_write (const void *buffer, size_t size, size_t count, vfs_file_t *file)
+{
+    return fwrite(buffer, size, count, host_file(file));
+}
+
+static size_t fs_tell (vfs_file_t *file)
+{
+    return (size_t)ftell(host_file(file));
+}
+
+static int fs_seek (vfs_file_t *file, size_t offset)
+{
+    return fseek(host_file(file), (long)offset, SEEK_SET);
+}
+
+static bool fs_eof (vfs_file_t *file)
+{
+    return !!feof(host_file(file));
+}
+
+static int fs_rename (const char *from, const char *to)
+{
+    char path_from[MAX_PATH_LENGTH], path_to[MAX_PATH_LENGTH];
+
+    return host_path(from, path_from) && host_path(to, path_to) ? rename(path_from, path_to) : -1;
+}
+
+static int fs_unlink (const char *filename)
+{
+    char path[MAX_PATH_LENGTH];
+
+    return host_path(filename, path) ? remove(path) : -1;
+}
+
+static int fs_dirop (const char *path)
+{
+    return -1;
+}
+
+static vfs_dir_t *fs_opendir (const char *path)
+{
+    return NULL;
+}
+
+static void fs_closedir (vfs_dir_t *dir)
+{
+}
+
+static int fs_stat (const char *filename, vfs_stat_t *st)
+{
+    FILE *fp;
+    char path[MAX_PATH_LENGTH];
+
+    // plain stdio, <sys/stat.h> st_mtime macros clash with vfs_stat_t
+    if(host_path(filename, path) == NULL || (fp = fopen(path, "rb")) == NULL)
+        return -1;
+
+    memset(st, 0, sizeof(vfs_stat_t));
+    if(!fseek(fp, 0, SEEK_END))
+        st->st_size = (size_t)ftell(fp);
+    fclose(fp);
+
+    return 0;
+}
+
+bool fs_host_mount (const char *path, const char *dir)
+{
+    static const vfs_t fs = {
+        .fs_name = "host",
+        .fopen = fs_open,
+        .fclose = fs_close,
+        .fread = fs_read,
+        .fwrite = fs_write,
+        .ftell = fs_tell,
+        .fseek = fs_seek,
+        .feof = fs_eof,
+        .frename = fs_rename,
+        .funlink = fs_unlink,
+        .fmkdir = fs_dirop,
+        .fchdir = fs_dirop,
+        .frmdir = fs_dirop,
+        .fopendir = fs_opendir,
+        .fclosedir = fs_closedir,
+        .fstat = fs_stat
+    };
+    size_t len = strlen(dir);
+
+    if(len == 0 || len >= MAX_PATH_LENGTH)
+        return false;
+
+    strcpy(root_dir, dir);
+    while(len > 1 && (root_dir[len - 1] == '/' || root_dir[len - 1] == '\\'))
+        root_dir[--len] = '\0';
+
+    return vfs_mount(path, &fs, (vfs_st_mode_t){ .directory = true });
+}
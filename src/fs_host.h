@@ -0,0 +1,28 @@
+/*
+  fs_host.h - host directory as grblHAL file system
+
+  Part of Grbl Simulator
+
+  Grbl is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  Grbl is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with Grbl.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef _FS_HOST_H_
+#define _FS_HOST_H_
+
+#include <stdbool.h>
+
+// Mounts host directory dir at VFS path (e.g. "/")
+bool fs_host_mount (const char *path, const char *dir);
+
+#endif
@@ -0,0 +1,79 @@
+/*
+  fuzz_coverage.c - edge coverage of the instrumented G-code parser, used by bench/fuzz_parser.py
+
+  Part of grblHAL
+
+  grblHAL is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  grblHAL is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with grblHAL. If not, see <http://www.gnu.org/licenses/>.
+*/
+
+/*
+  Only built with -DVALIDATOR_FUZZ=ON: gcode.c, ngc_expr.c and ngc_flowctrl.c are compiled with
+  -fsanitize-coverage=trace-pc (GCC or Clang), which calls __sanitizer_cov_trace_pc() at the start
+  of every basic block. Consecutive blocks are hashed into an edge map with AFL style hit count
+  buckets. If GRBL_FUZZ_COVERAGE is set the map is written to that file on exit, one uint32_t
+  (edge << 8 | bucket) per edge hit. Block addresses are taken relative to this function so
+  the edge ids do not change with the load address.
+
+  This file must not be instrumented itself.
+*/
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+
+#define FUZZ_MAP_SIZE 65536
+
+static uint8_t hits[FUZZ_MAP_SIZE];
+static uint32_t prev_block = 0;
+
+void __sanitizer_cov_trace_pc (void)
+{
+    uint32_t block = (uint32_t)((uintptr_t)__builtin_return_address(0) - (uintptr_t)__sanitizer_cov_trace_pc);
+
+    block = (block * 2654435761u) >> 16;                // spread nearby addresses over the map
+    uint32_t edge = (block ^ prev_block) & (FUZZ_MAP_SIZE - 1);
+    prev_block = block >> 1;                            // A->B and B->A are different edges
+
+    if(hits[edge] != 255)
+        hits[edge]++;
+}
+
+static uint8_t bucket (uint8_t count)
+{
+    return count < 4 ? count : count < 8 ? 4 : count < 16 ? 5 : count < 32 ? 6 : count < 128 ? 7 : 8;
+}
+
+static void coverage_write (void)
+{
+    FILE *file;
+    uint32_t edge, entry;
+    const char *filename = getenv("GRBL_FUZZ_COVERAGE");
+
+    if(filename == NULL || (file = fopen(filename, "wb")) == NULL)
+        return;
+
+    for(edge = 0; edge < FUZZ_MAP_SIZE; edge++) {
+        if(hits[edge]) {
+            entry = edge << 8 | bucket(hits[edge]);
+            fwrite(&entry, sizeof(entry), 1, file);
+        }
+    }
+
+    fclose(file);
+}
+
+__attribute__((constructor)) static void coverage_init (void)
+{
+    atexit(coverage_write);
+}
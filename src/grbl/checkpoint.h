@@ -0,0 +1,40 @@
+/*
+  checkpoint.h - save and restore of the core state, used by the simulator
+
+  Part of grblHAL
+
+  grblHAL is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  grblHAL is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with grblHAL. If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef _CHECKPOINT_H_
+#define _CHECKPOINT_H_
+
+#include <stdbool.h>
+#include <stddef.h>
+
+/*! \brief Passed to the *_checkpoint() functions of the core modules.
+
+The same function saves and restores a module: data() writes the given bytes to the checkpoint,
+or reads them back when restore is true. Pointers into heap memory are saved as indices or cleared,
+pointers to static data and code are passed to relocate() after restore as the checkpoint may
+have been written by another run of the same executable (loaded at another address).
+*/
+typedef struct {
+    bool restore;                           //!< false: state is saved, true: state is restored.
+    bool reset;                             //!< Restore of the in-memory baseline ($RESTORE): the simulated clock and output keep running.
+    bool (*data)(void *data, size_t size);  //!< Writes or reads size bytes at data, false on failure.
+    void (*relocate)(void *ptr);            //!< Moves the pointer at ptr, if not NULL, to this run's load address.
+} checkpoint_t;
+
+#endif
@@ -568,6 +568,15 @@ Maximum number of parameters allowed in a block.
 #define NGC_N_ASSIGN_PARAMETERS_PER_BLOCK 10
 #endif
 
+/*! \def NGC_EXPRESSION_CACHE_SIZE
+\brief
+Number of compiled expressions kept in a least recently used cache, speeds up
+expressions that are evaluated repeatedly such as in O-word loops. Set to 0 to disable.
+*/
+#if !defined NGC_EXPRESSION_CACHE_SIZE || defined __DOXYGEN__
+#define NGC_EXPRESSION_CACHE_SIZE 32
+#endif
+
 /*! \def LATHE_UVW_OPTION
 \brief
 Allow use of UVW axis words for non-modal relative lathe motion.
@@ -355,7 +355,7 @@ int grbl_enter (void)
     polar_init();
 #endif
 
-#ifdef KINEMATICS_API
+#if defined(KINEMATICS_API) && !COREXY && !WALL_PLOTTER && !DELTA_ROBOT && !POLAR_ROBOT
     rtcp_5axis_init();
 #endif
 
@@ -26,6 +26,7 @@ typedef struct {
     float *(*transform_steps_to_cartesian)(float *position, int32_t *steps);
     float *(*transform_from_cartesian) (float *target, float *position);
     float *(*segment_line) (float *target, float *position, plan_line_data_t *pl_data, bool init); // target is cartesian, position transformed
+    uint_fast16_t (*arc_segments) (float *target, float *position, plan_line_data_t *pl_data, uint_fast16_t segments); // optional, target and position are cartesian
     uint_fast8_t (*limits_get_axis_mask)(uint_fast8_t idx);
     void (*limits_set_target_pos)(uint_fast8_t idx);
     void (*limits_set_machine_positions)(axes_signals_t cycle);
@@ -34,6 +34,7 @@
  * │ transform_from_cartesian   │ ✗ No existe    │ ✓ Requerido     │ [5]    │
  * │ transform_steps_to_cart    │ ✗ No existe    │ ✓ Requerido     │ [5]    │
  * │ segment_line               │ ✗ No existe    │ ✓ Requerido     │ [5]    │
+ * │ arc_segments               │ ✓ $12 en mc_arc│ ✓ Opcional      │ [9]    │
  * │ check_travel_limits        │ ✓ Solo cart.   │ ✓ Hook motor    │ [6]    │
  * │ apply_travel_limits        │ ✓ Clipping     │ ✓ Hook bisect   │ [7]    │
  * │ Homing functions           │ ✓ Lineales     │ ✓ Override      │ [8]    │
@@ -83,6 +84,10 @@
  *     RTCP tiene ejes lineales independientes, así que la lógica es similar
  *     pero necesitamos invalidar el caché después del homing.
  * 
+ * [9] mc_arc() divide el arco según $12 y cada cuerda pasaba otra vez por
+ *     segment_line(). Con el hook el número de cuerdas cubre también $645
+ *     y segment_line() las deja enteras (una sola segmentación).
+ * 
  * 
  * FLUJO DE EJECUCIÓN CON mc_line()
  * ================================
@@ -178,7 +183,7 @@
  *   #define KINEMATICS_API
  *   // NO definir COREXY, WALL_PLOTTER, DELTA_ROBOT
  */
-#if defined(KINEMATICS_API) && !COREXY && !WALL_PLOTTER && !DELTA_ROBOT
+#if defined(KINEMATICS_API) && !COREXY && !WALL_PLOTTER && !DELTA_ROBOT && !POLAR_ROBOT
 
 #include <math.h>
 #include <string.h>
@@ -1398,6 +1403,80 @@ static float *rtcp_segment_line(float *target, float *position,
     return (iterations == 0 || jog_cancel) ? NULL : mpos.values;
 }
 
+/**
+ * @brief Número de segmentos para un arco G2/G3 con RTCP activo
+ *
+ * mc_arc() divide el arco en cuerdas según $12 (arc_tolerance) y llama
+ * mc_line() por cada cuerda. Sin este hook cada cuerda con rotación pasaba
+ * otra vez por rtcp_segment_line(), que la volvía a dividir: doble
+ * segmentación, con los puntos intermedios sobre la cuerda y no sobre el
+ * arco. Una cuerda apenas por encima de $645 se partía en 4 bloques.
+ *
+ * Aquí se hace una sola pasada: se evalúa el error de punto medio (mismo
+ * criterio que rtcp_segment_line) sobre el arco completo y se elige el
+ * número de cuerdas para que cada una quede dentro de $645. El error por
+ * rotación escala con 1/N²: si las cuerdas de $12 ya cumplen se dejan,
+ * si no N = ceil(sqrt(error / tol)) × 2, cada cuerda queda en ~tol/4 y
+ * rtcp_segment_line la deja en 1 segmento.
+ *
+ * rtcp_segment_line sigue evaluando cada cuerda, por lo que la tolerancia
+ * se respeta aunque la estimación sobre el arco completo quede corta (p.ej.
+ * arcos casi completos, donde inicio y destino casi coinciden).
+ *
+ * @param target   Destino cartesiano del arco
+ * @param position Posición cartesiana actual
+ * @param pl_data  Datos del planificador
+ * @param segments Segmentos calculados por mc_arc() según $12
+ * @return Segmentos a generar (nunca menos que segments)
+ */
+static uint_fast16_t rtcp_arc_segments(float *target, float *position,
+                                       plan_line_data_t *pl_data, uint_fast16_t segments)
+{
+    if (!rtcp_enabled)
+        return segments;
+
+    float max_rot = fabsf(target[A_AXIS] - position[A_AXIS]);
+    #ifdef C_AXIS
+    max_rot = fmaxf(max_rot, fabsf(target[C_AXIS] - position[C_AXIS]));
+    #endif
+
+    if (max_rot <= 0.001f)
+        return segments;
+
+    uint_fast8_t idx = N_AXIS;
+    float tcp_mid[N_AXIS], motor_start[N_AXIS], motor_end[N_AXIS], motor_mid_real[N_AXIS];
+
+    do {
+        idx--;
+        tcp_mid[idx] = (position[idx] + target[idx]) * 0.5f;
+    } while(idx);
+
+    transform_from_cartesian(motor_start, position);
+    transform_from_cartesian(motor_end, target);
+    transform_from_cartesian(motor_mid_real, tcp_mid);
+
+    float err_sq = 0.0f;
+    for (idx = 0; idx < 3; idx++) {
+        float d = motor_mid_real[idx] - (motor_start[idx] + motor_end[idx]) * 0.5f;
+        err_sq += d * d;
+    }
+
+    float tol = pl_data->condition.rapid_motion
+                ? rtcp.cfg.chord_error_g0_mm
+                : rtcp.cfg.chord_error_mm;
+
+    /* Solo si las cuerdas de $12 quedarían fuera de $645 (error / N² > tol) */
+    float err = sqrtf(err_sq);
+    if (err > tol * (float)segments * (float)segments) {
+        float needed = ceilf(sqrtf(err / tol)) * 2.0f;
+        if (needed > 2000.0f) needed = 2000.0f;
+        if ((uint_fast16_t)needed > segments)
+            segments = (uint_fast16_t)needed;
+    }
+
+    return segments;
+}
+
 /* =============================================================================
  * SECCIÓN 10: SISTEMA DE CONFIGURACIÓN
  * =============================================================================
@@ -1686,6 +1765,20 @@ static status_code_t rtcp_info(sys_state_t state, char *args)
     return Status_OK;
 }
 
+/**
+ * @brief Guarda o restaura el estado RTCP (checkpoint del simulador)
+ *
+ * Incluye la configuración activa, el caché trigonométrico, el modo
+ * M450/M451 y el flag de cancelación de jog. Las variables estáticas de
+ * rtcp_segment_line() no se guardan: se inicializan en cada línea.
+ */
+bool rtcp_checkpoint(checkpoint_t *cp)
+{
+    return cp->data(&rtcp, sizeof(rtcp_state_t)) &&
+           cp->data(&rtcp_enabled, sizeof(rtcp_enabled)) &&
+           cp->data((void *)&jog_cancel, sizeof(jog_cancel));
+}
+
 /* =============================================================================
  * SECCIÓN 13: INICIALIZACIÓN
  * =============================================================================
@@ -1738,7 +1831,8 @@ void rtcp_5axis_init(void)
         kinematics.transform_from_cartesian = transform_from_cartesian;
         kinematics.transform_steps_to_cartesian = transform_steps_to_cartesian;
         kinematics.segment_line = rtcp_segment_line;
-        
+        kinematics.arc_segments = rtcp_arc_segments;
+
         kinematics.limits_get_axis_mask = rtcp_limits_get_axis_mask;
         kinematics.limits_set_target_pos = rtcp_limits_set_target_pos;
         kinematics.limits_set_machine_positions = rtcp_limits_set_machine_positions;
@@ -1795,7 +1889,7 @@ void rtcp_5axis_init(void)
     }
 }
 
-#endif /* KINEMATICS_API && !COREXY && !WALL_PLOTTER && !DELTA_ROBOT */
+#endif /* KINEMATICS_API && !COREXY && !WALL_PLOTTER && !DELTA_ROBOT && !POLAR_ROBOT */
 
 /**
  * =============================================================================
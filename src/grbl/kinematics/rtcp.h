@@ -7,6 +7,9 @@
 #ifndef _RTCP_H_
 #define _RTCP_H_
 
+#include "../checkpoint.h"
+
 void rtcp_5axis_init(void);
+bool rtcp_checkpoint(checkpoint_t *cp);
 
 #endif
@@ -298,6 +298,13 @@ void mc_arc (float *target, plan_line_data_t *pl_data, float *position, float *o
     if(2.0f * radius > settings.arc_tolerance)
         segments = (uint_fast16_t)floorf(fabsf(0.5f * angular_travel * radius) / sqrtf(settings.arc_tolerance * (2.0f * radius - settings.arc_tolerance)));
 
+#ifdef KINEMATICS_API
+    // Let the kinematics raise the segment count so that each chord is within its own tolerance,
+    // segment_line() then passes the chords through instead of splitting them again off the arc.
+    if(kinematics.arc_segments)
+        segments = kinematics.arc_segments(target, position, pl_data, segments);
+#endif
+
     if(segments) {
 
         // Multiply inverse feed_rate to compensate for the fact that this movement is approximated
@@ -1196,3 +1203,16 @@ ISR_CODE void ISR_FUNC(mc_reset)(void)
             grbl.on_reset();
     }
 }
+
+#if ENABLE_BACKLASH_COMPENSATION
+
+// Saves or restores the backlash compensation state, used by the simulator.
+bool mc_checkpoint (checkpoint_t *cp)
+{
+    return cp->data(&target_prev, sizeof(coord_data_t)) &&
+            cp->data(&backlash_comp, sizeof(coord_data_t)) &&
+             cp->data(&dir_negative, sizeof(axes_signals_t)) &&
+              cp->data(&backlash_enabled, sizeof(axes_signals_t));
+}
+
+#endif
@@ -24,6 +24,8 @@
 #ifndef _MOTION_CONTROL_H_
 #define _MOTION_CONTROL_H_
 
+#include "checkpoint.h"
+
 // System motion commands must have a line number of zero.
 #define DEFAULT_HOMING_CYCLE_LINE_NUMBER 0
 #define PARKING_MOTION_LINE_NUMBER 0
@@ -77,6 +79,7 @@ void mc_reset (void);
 #if ENABLE_BACKLASH_COMPENSATION
 void mc_backlash_init (axes_signals_t axes);
 void mc_sync_backlash_position (void);
+bool mc_checkpoint (checkpoint_t *cp);
 #endif
 
 #endif
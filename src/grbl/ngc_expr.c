@@ -692,6 +692,37 @@ static status_code_t read_atan (char *line, uint_fast8_t *pos, float *value)
     return status;
 }
 
+/*! \brief Reads the value of a setting or a bit of a setting value, for the PRM function.
+
+\param setting_id setting id.
+\param get_bit \a true to return bit \a bitnum of the setting value.
+\param bitnum bit number, 0 - 31.
+\param value pointer to float where result is to be stored.
+\returns #Status_OK enum value if processed without error, appropriate \ref status_code_t enum value if not.
+*/
+static status_code_t read_setting (int32_t setting_id, bool get_bit, int32_t bitnum, float *value)
+{
+    status_code_t status = Status_OK;
+    const setting_detail_t *setting;
+
+    if((setting = setting_get_details((setting_id_t)setting_id, NULL))) {
+
+        uint_fast8_t offset = setting_id - setting->id;
+
+        if(setting->datatype == Format_Decimal)
+            *value = setting_get_float_value(setting, offset);
+        else if(setting_is_integer(setting) || setting_is_list(setting)) {
+            *value = (float)setting_get_int_value(setting, offset);
+            if(get_bit)
+                *value = (((uint32_t)*value >> bitnum) & 0x1) ? 1.0f : 0.0f;
+        } else
+            status = Status_ExpressionArgumentOutOfRange;
+    } else
+        status = Status_ExpressionArgumentOutOfRange;
+
+    return status;
+}
+
 /*! \brief Reads the value out of an unary operation of the line, starting at the
 index given by the pos offset. The ATAN operation is
 handled specially because it is followed by two arguments.
@@ -738,7 +769,6 @@ static status_code_t read_unary (char *line, uint_fast8_t *pos, float *value)
 
                 bool get_bit;
                 int32_t setting_id, bitnum;
-                const setting_detail_t *setting;
 
                 (*pos)++;
                 if((status = ngc_read_integer_value(line, pos, &setting_id)) == Status_OK) {
@@ -756,20 +786,7 @@ static status_code_t read_unary (char *line, uint_fast8_t *pos, float *value)
 
                    (*pos)++;
 
-                   if((setting = setting_get_details((setting_id_t)setting_id, NULL))) {
-
-                       uint_fast8_t offset = setting_id - setting->id;
-
-                       if(setting->datatype == Format_Decimal)
-                           *value = setting_get_float_value(setting, offset);
-                       else if(setting_is_integer(setting) || setting_is_list(setting)) {
-                           *value = (float)setting_get_int_value(setting, offset);
-                           if(get_bit)
-                               *value = (((uint32_t)*value >> bitnum) & 0x1) ? 1.0f : 0.0f;
-                       } else
-                           status = Status_ExpressionArgumentOutOfRange;
-                   } else
-                       status = Status_ExpressionArgumentOutOfRange;
+                   status = read_setting(setting_id, get_bit, bitnum, value);
                 }
             } else if((status = ngc_eval_expression(line, pos, value)) == Status_OK) {
                 if(operation == NGCUnaryOp_ATAN)
@@ -820,9 +837,8 @@ status_code_t ngc_read_real_value (char *line, uint_fast8_t *pos, float *value)
     else
         status = (read_float(line, pos, value) ? Status_OK : Status_BadNumberFormat);
 
-    if(isnan(*value))
-        status = Status_ExpressionInvalidResult; // Calculation resulted in 'not a number'
-    else if(isinf(*value))
+    // *value is not set on errors, check the result only when there is one
+    if(status == Status_OK && (isnan(*value) || isinf(*value)))
         status = Status_ExpressionInvalidResult; // Calculation resulted in 'not a number'
 
     return status;
@@ -858,30 +874,38 @@ close to an integer, then returning the integer it is close to.
 \param value pointer to integer where result is to be stored.
 \returns #Status_OK enum value if processed without error, appropriate \ref status_code_t enum value if not.
 */
+static status_code_t float_to_integer (float fvalue, int32_t *value)
+{
+  status_code_t status = Status_OK;
+
+  *value = (int32_t)floorf(fvalue);
+  if((fvalue - (float)*value) > 0.9999f) {
+      *value = (uint32_t)ceilf(fvalue);
+  } else if((fvalue - (float)*value) > 0.0001f)
+      status = Status_GcodeCommandValueNotInteger; // not integer
+
+  return status;
+}
+
 status_code_t ngc_read_integer_value (char *line, uint_fast8_t *pos, int32_t *value)
 {
   float fvalue;
   status_code_t status;
 
-  if((status = ngc_read_real_value(line, pos, &fvalue)) == Status_OK) {
-      *value = (int32_t)floorf(fvalue);
-      if((fvalue - (float)*value) > 0.9999f) {
-          *value = (uint32_t)ceilf(fvalue);
-      } else if((fvalue - (float)*value) > 0.0001f)
-          status = Status_GcodeCommandValueNotInteger; // not integer
-  }
+  if((status = ngc_read_real_value(line, pos, &fvalue)) == Status_OK)
+      status = float_to_integer(fvalue, value);
 
   return status;
 }
 
-/*! \brief Evaluate expression and set result if successful.
+/*! \brief Parses and evaluates expression in one pass and set result if successful.
 
 \param line pointer to RS274/NGC code (block).
 \param pos offset into line where expression starts.
 \param value pointer to float where result is to be stored.
 \returns #Status_OK enum value if evaluated without error, appropriate \ref status_code_t enum value if not.
 */
-status_code_t ngc_eval_expression (char *line, uint_fast8_t *pos, float *value)
+static status_code_t eval_expression (char *line, uint_fast8_t *pos, float *value)
 {
     float values[MAX_STACK];
     ngc_binary_op_t operators[MAX_STACK];
@@ -930,6 +954,547 @@ status_code_t ngc_eval_expression (char *line, uint_fast8_t *pos, float *value)
     return Status_OK;
 }
 
+#if NGC_EXPRESSION_CACHE_SIZE
+
+/*
+  Compiled expressions.
+
+  The parser above evaluates while reading, so an expression in an O-word loop body or
+  condition is parsed again on every iteration. Expressions are compiled to a postfix
+  program on first use and kept in a least recently used cache keyed by the expression text.
+  Programs are evaluated against the live parameter store, operations are emitted in the
+  order the parser executes them so errors are reported with the same status codes.
+  Text that does not compile (syntax errors, too complex) is left to the parser.
+*/
+
+#define EXPR_MAX_OPS 48
+#define EXPR_STACK_SIZE 16
+#define EXPR_MAX_NAMES 256
+#define EXPR_HASH_PREFIX 16
+
+typedef enum {
+    NGCExprOp_Constant = 0,
+    NGCExprOp_Parameter,            //!< #n, n constant
+    NGCExprOp_ParameterIndirect,    //!< ##n, #[expr]: parameter number on stack
+    NGCExprOp_NamedParameter,       //!< #<name>
+    NGCExprOp_Exists,               //!< EXISTS[#<name>]
+    NGCExprOp_Setting,              //!< PRM[id] or PRM[id,bit]
+    NGCExprOp_Integer,              //!< integer check, as ngc_read_integer_value()
+    NGCExprOp_Negate,
+    NGCExprOp_Unary,
+    NGCExprOp_Atan,
+    NGCExprOp_Binary
+} ngc_expr_opcode_t;
+
+typedef struct {
+    uint8_t code;       //!< ngc_expr_opcode_t
+    uint8_t operation;  //!< ngc_binary_op_t or ngc_unary_op_t, for NGCExprOp_Setting true if bit number follows id
+    bool check;         //!< result must be a number, as for ngc_read_real_value()
+    union {
+        float value;
+        int32_t id;
+        uint16_t name;  //!< offset of name in entry text
+    };
+} ngc_expr_op_t;
+
+typedef struct ngc_expr_entry {
+    uint32_t hash;
+    uint8_t length;                 //!< expression text length, including brackets
+    uint8_t n_ops;
+    char *text;                     //!< expression text followed by parameter names
+    struct ngc_expr_entry *next;    //!< hash bucket chain
+    struct ngc_expr_entry *newer;
+    struct ngc_expr_entry *older;
+    ngc_expr_op_t ops[];
+} ngc_expr_entry_t;
+
+typedef struct {
+    char *line;
+    uint_fast8_t n_ops;
+    uint_fast8_t depth;
+    uint_fast16_t names_len;
+    ngc_expr_op_t ops[EXPR_MAX_OPS];
+    char names[EXPR_MAX_NAMES];
+} ngc_expr_compiler_t;
+
+static ngc_expr_compiler_t cc;
+static ngc_expr_entry_t *buckets[NGC_EXPRESSION_CACHE_SIZE] = {0}, *newest = NULL, *oldest = NULL;
+static ngc_expr_cache_stats_t stats = {0};
+
+static status_code_t compile_real_value (uint_fast8_t *pos);
+static status_code_t compile_expression (uint_fast8_t *pos);
+
+static ngc_expr_op_t *emit (ngc_expr_opcode_t code, int_fast8_t stack_change)
+{
+    ngc_expr_op_t *op = NULL;
+
+    if(cc.n_ops < EXPR_MAX_OPS && (cc.depth += stack_change) <= EXPR_STACK_SIZE) {
+        op = &cc.ops[cc.n_ops++];
+        memset(op, 0, sizeof(ngc_expr_op_t));
+        op->code = code;
+    }
+
+    return op;
+}
+
+static status_code_t emit_name (ngc_expr_opcode_t code, char *name, size_t len)
+{
+    ngc_expr_op_t *op;
+
+    if(cc.names_len + len + 1 > EXPR_MAX_NAMES || (op = emit(code, 1)) == NULL)
+        return Status_ExpressionSyntaxError;
+
+    op->name = cc.names_len;
+    memcpy(&cc.names[cc.names_len], name, len);
+    cc.names[cc.names_len + len] = '\0';
+    cc.names_len += len + 1;
+
+    return Status_OK;
+}
+
+// As ngc_read_integer_value(), a constant parameter number is resolved here.
+static status_code_t compile_integer (uint_fast8_t *pos)
+{
+    status_code_t status;
+    uint_fast8_t n_ops = cc.n_ops;
+
+    if((status = compile_real_value(pos)) == Status_OK && emit(NGCExprOp_Integer, 0) == NULL)
+        status = Status_ExpressionSyntaxError;
+
+    if(status == Status_OK && cc.n_ops == n_ops + 2 && cc.ops[n_ops].code == NGCExprOp_Constant) {
+        int32_t value;
+        if(float_to_integer(cc.ops[n_ops].value, &value) == Status_OK) {
+            cc.n_ops--;
+            cc.ops[n_ops].value = (float)value;
+        }
+    }
+
+    return status;
+}
+
+// As ngc_read_parameter() with check = false.
+static status_code_t compile_parameter (uint_fast8_t *pos)
+{
+    status_code_t status;
+
+    (*pos)++;
+
+    if(cc.line[*pos] == '<') {
+
+        char name[NGC_MAX_PARAM_LENGTH + 2];
+
+        if((status = ngc_read_name(cc.line, pos, name)) == Status_OK)
+            status = emit_name(NGCExprOp_NamedParameter, name, strlen(name));
+
+    } else if((status = compile_integer(pos)) == Status_OK) {
+
+        ngc_expr_op_t *op = &cc.ops[cc.n_ops - 1];
+
+        if(op->code == NGCExprOp_Constant && op->value >= 0.0f) {
+            op->code = NGCExprOp_Parameter;
+            op->id = (int32_t)op->value;
+        } else if(emit(NGCExprOp_ParameterIndirect, 0) == NULL)
+            status = Status_ExpressionSyntaxError;
+    }
+
+    return status;
+}
+
+// As read_unary() and read_atan().
+static status_code_t compile_unary (uint_fast8_t *pos)
+{
+    ngc_unary_op_t operation;
+    ngc_expr_op_t *op;
+    status_code_t status;
+
+    if((status = read_operation_unary(cc.line, pos, &operation)) != Status_OK)
+        return status;
+
+    if(cc.line[*pos] != '[')
+        return Status_ExpressionSyntaxError;
+
+    if(operation == NGCUnaryOp_Exists) {
+
+        char *arg = &cc.line[++(*pos)], *s = NULL;
+
+        if(*arg == '#' && *(arg + 1) == '<') {
+            arg += 2;
+            s = arg;
+            while(*s && *s != ']')
+                s++;
+        }
+
+        if(s && *s == ']' && *(s - 1) == '>') {
+            status = emit_name(NGCExprOp_Exists, arg, s - arg - 1);
+            *pos = *pos + s - arg + 3;
+        } else
+            status = Status_ExpressionSyntaxError;
+
+    } else if(operation == NGCUnaryOp_Parameter) {
+
+        bool get_bit;
+
+        (*pos)++;
+        if((status = compile_integer(pos)) == Status_OK) {
+
+            if((get_bit = cc.line[*pos] == ',')) {
+                (*pos)++;
+                if((status = compile_integer(pos)) != Status_OK)
+                    return status;
+            }
+
+            if(cc.line[*pos] != ']')
+                return Status_ExpressionSyntaxError;
+
+            (*pos)++;
+
+            if((op = emit(NGCExprOp_Setting, get_bit ? -1 : 0)))
+                op->operation = get_bit;
+            else
+                status = Status_ExpressionSyntaxError;
+        }
+
+    } else if((status = compile_expression(pos)) == Status_OK) {
+
+        if(operation == NGCUnaryOp_ATAN) {
+
+            if(cc.line[*pos] != '/')
+                return Status_ExpressionSyntaxError;
+
+            (*pos)++;
+
+            if(cc.line[*pos] != '[')
+                return Status_ExpressionSyntaxError;
+
+            if((status = compile_expression(pos)) == Status_OK && emit(NGCExprOp_Atan, -1) == NULL)
+                status = Status_ExpressionSyntaxError;
+
+        } else if((op = emit(NGCExprOp_Unary, 0)))
+            op->operation = operation;
+        else
+            status = Status_ExpressionSyntaxError;
+    }
+
+    return status;
+}
+
+// As ngc_read_real_value().
+static status_code_t compile_real_value (uint_fast8_t *pos)
+{
+    char c = cc.line[*pos], c1;
+
+    if(c == '\0')
+        return Status_ExpressionSyntaxError;
+
+    float value;
+    ngc_expr_op_t *op;
+    status_code_t status = Status_OK;
+
+    c1 = cc.line[*pos + 1];
+
+    if(c == '[')
+        status = compile_expression(pos);
+    else if(c == '#')
+        status = compile_parameter(pos);
+    else if(c == '+' && c1 && !isdigit(c1) && c1 != '.') {
+        (*pos)++;
+        status = compile_real_value(pos);
+    } else if(c == '-' && c1 && !isdigit(c1) && c1 != '.') {
+        (*pos)++;
+        if((status = compile_real_value(pos)) == Status_OK && emit(NGCExprOp_Negate, 0) == NULL)
+            status = Status_ExpressionSyntaxError;
+    } else if ((c >= 'A') && (c <= 'Z'))
+        status = compile_unary(pos);
+    else if(!read_float(cc.line, pos, &value))
+        status = Status_BadNumberFormat;
+    else if((op = emit(NGCExprOp_Constant, 1)))
+        op->value = value;
+    else
+        status = Status_ExpressionSyntaxError;
+
+    if(status == Status_OK)
+        cc.ops[cc.n_ops - 1].check = true;
+
+    return status;
+}
+
+// As eval_expression(), binary operations are emitted when the parser would execute them.
+static status_code_t compile_expression (uint_fast8_t *pos)
+{
+    ngc_binary_op_t operators[MAX_STACK];
+    uint_fast8_t stack_index = 1;
+    ngc_expr_op_t *op;
+
+    if(cc.line[*pos] != '[')
+        return Status_GcodeUnsupportedCommand;
+
+    (*pos)++;
+
+    status_code_t status;
+
+    if((status = compile_real_value(pos)) != Status_OK)
+        return status;
+
+    if((status = read_operation(cc.line, pos, operators)) != Status_OK)
+        return status;
+
+    for(; operators[0] != NGCBinaryOp_RightBracket;) {
+
+        if((status = compile_real_value(pos)) != Status_OK)
+            return status;
+
+        if((status = read_operation(cc.line, pos, operators + stack_index)) != Status_OK)
+            return status;
+
+        if (precedence(operators[stack_index]) > precedence(operators[stack_index - 1]))
+            stack_index++;
+        else { // precedence of latest operator is <= previous precedence
+            for(; precedence(operators[stack_index]) <= precedence(operators[stack_index - 1]);) {
+
+                if((op = emit(NGCExprOp_Binary, -1)) == NULL)
+                    return Status_ExpressionSyntaxError;
+
+                op->operation = operators[stack_index - 1];
+
+                operators[stack_index - 1] = operators[stack_index];
+                if(stack_index > 1 && precedence(operators[stack_index - 1]) <= precedence(operators[stack_index - 2]))
+                    stack_index--;
+                else
+                    break;
+            }
+        }
+    }
+
+    return Status_OK;
+}
+
+static status_code_t execute_program (ngc_expr_entry_t *entry, float *value)
+{
+    int32_t id, bitnum;
+    float stack[EXPR_STACK_SIZE], *top = stack - 1;
+    ngc_expr_op_t *op = entry->ops;
+    uint_fast8_t n_ops = entry->n_ops;
+    status_code_t status = Status_OK;
+
+    for(; n_ops; n_ops--, op++) {
+
+        switch((ngc_expr_opcode_t)op->code) {
+
+            case NGCExprOp_Constant:
+                *++top = op->value;
+                break;
+
+            case NGCExprOp_Parameter:
+                if(!ngc_param_get((ngc_param_id_t)op->id, ++top))
+                    status = Status_GcodeValueOutOfRange;
+                break;
+
+            case NGCExprOp_ParameterIndirect:
+                if((id = (int32_t)*top) < 0 || !ngc_param_get((ngc_param_id_t)id, top))
+                    status = Status_GcodeValueOutOfRange;
+                break;
+
+            case NGCExprOp_NamedParameter:
+                if(!ngc_named_param_get(entry->text + op->name, ++top))
+                    status = Status_BadNumberFormat;
+                break;
+
+            case NGCExprOp_Exists:
+                *++top = ngc_named_param_exists(entry->text + op->name) ? 1.0f : 0.0f;
+                break;
+
+            case NGCExprOp_Setting:
+                bitnum = 0;
+                if(op->operation) {
+                    bitnum = (int32_t)*top--;
+                    if(bitnum < 0 || bitnum > 31)
+                        return Status_ExpressionArgumentOutOfRange;
+                }
+                status = read_setting((int32_t)*top, op->operation, bitnum, top);
+                break;
+
+            case NGCExprOp_Integer:
+                if((status = float_to_integer(*top, &id)) == Status_OK)
+                    *top = (float)id;
+                break;
+
+            case NGCExprOp_Negate:
+                *top = -*top;
+                break;
+
+            case NGCExprOp_Unary:
+                status = execute_unary(top, (ngc_unary_op_t)op->operation);
+                break;
+
+            case NGCExprOp_Atan:
+                top--;
+                *top = atan2f(*top, *(top + 1)) * DEGRAD;  /* value in radians, convert to degrees */
+                break;
+
+            case NGCExprOp_Binary:
+                top--;
+                status = execute_binary(top, (ngc_binary_op_t)op->operation, top + 1);
+                break;
+        }
+
+        if(status != Status_OK)
+            return status;
+
+        if(op->check && (isnan(*top) || isinf(*top)))
+            return Status_ExpressionInvalidResult;
+    }
+
+    *value = *top;
+
+    return Status_OK;
+}
+
+static void lru_unlink (ngc_expr_entry_t *entry)
+{
+    if(entry->newer)
+        entry->newer->older = entry->older;
+    else
+        newest = entry->older;
+
+    if(entry->older)
+        entry->older->newer = entry->newer;
+    else
+        oldest = entry->newer;
+}
+
+static void lru_push (ngc_expr_entry_t *entry)
+{
+    entry->newer = NULL;
+    if((entry->older = newest))
+        newest->newer = entry;
+    else
+        oldest = entry;
+    newest = entry;
+}
+
+static void evict_oldest (void)
+{
+    ngc_expr_entry_t *entry = oldest, **link = &buckets[entry->hash % NGC_EXPRESSION_CACHE_SIZE];
+
+    while(*link != entry)
+        link = &(*link)->next;
+
+    *link = entry->next;
+    lru_unlink(entry);
+    free(entry);
+
+    stats.entries--;
+    stats.evictions++;
+}
+
+static ngc_expr_entry_t *compile (char *text, uint32_t hash)
+{
+    uint_fast8_t length = 0;
+    ngc_expr_entry_t *entry = NULL;
+
+    cc.line = text;
+    cc.n_ops = cc.depth = cc.names_len = 0;
+
+    if(compile_expression(&length) == Status_OK) {
+
+        if(stats.entries == NGC_EXPRESSION_CACHE_SIZE)
+            evict_oldest();
+
+        if((entry = malloc(sizeof(ngc_expr_entry_t) + cc.n_ops * sizeof(ngc_expr_op_t) + length + 1 + cc.names_len))) {
+
+            entry->hash = hash;
+            entry->length = length;
+            entry->n_ops = cc.n_ops;
+            memcpy(entry->ops, cc.ops, cc.n_ops * sizeof(ngc_expr_op_t));
+            entry->text = (char *)&entry->ops[cc.n_ops];
+            memcpy(entry->text, text, length);
+            entry->text[length] = '\0';
+            for(uint_fast8_t i = 0; i < cc.n_ops; i++) {
+                if(entry->ops[i].code == NGCExprOp_NamedParameter || entry->ops[i].code == NGCExprOp_Exists)
+                    entry->ops[i].name += length + 1;
+            }
+            memcpy(entry->text + length + 1, cc.names, cc.names_len);
+
+            entry->next = buckets[hash % NGC_EXPRESSION_CACHE_SIZE];
+            buckets[hash % NGC_EXPRESSION_CACHE_SIZE] = entry;
+            lru_push(entry);
+            stats.entries++;
+        }
+    }
+
+    return entry;
+}
+
+// Returns the compiled program for the expression starting at text, NULL if it has to be parsed.
+// Only a prefix is hashed, a cached text that matches in full parses to the same program and the
+// parser never reads past the closing bracket.
+static ngc_expr_entry_t *expr_cache_get (char *text)
+{
+    char c;
+    uint_fast8_t len = 0;
+    uint32_t hash = 2166136261u;    // FNV-1a
+    ngc_expr_entry_t *entry;
+
+    while(len < EXPR_HASH_PREFIX && (c = text[len++]))
+        hash = (hash ^ (uint8_t)c) * 16777619u;
+
+    if((entry = buckets[hash % NGC_EXPRESSION_CACHE_SIZE])) do {
+        if(entry->hash == hash && !strncmp(entry->text, text, entry->length))
+            break;
+    } while((entry = entry->next));
+
+    if(entry) {
+        stats.hits++;
+        if(entry != newest) {
+            lru_unlink(entry);
+            lru_push(entry);
+        }
+    } else {
+        stats.misses++;
+        entry = compile(text, hash);
+    }
+
+    return entry;
+}
+
+#endif // NGC_EXPRESSION_CACHE_SIZE
+
+/*! \brief Evaluate expression and set result if successful.
+
+Compiled programs from the expression cache are used when available.
+
+\param line pointer to RS274/NGC code (block).
+\param pos offset into line where expression starts.
+\param value pointer to float where result is to be stored.
+\returns #Status_OK enum value if evaluated without error, appropriate \ref status_code_t enum value if not.
+*/
+status_code_t ngc_eval_expression (char *line, uint_fast8_t *pos, float *value)
+{
+#if NGC_EXPRESSION_CACHE_SIZE
+    ngc_expr_entry_t *entry;
+
+    if(line[*pos] == '[' && (entry = expr_cache_get(line + *pos))) {
+        *pos += entry->length;
+        return execute_program(entry, value);
+    }
+#endif
+
+    return eval_expression(line, pos, value);
+}
+
+/*! \brief Get expression cache counters.
+
+\param cache_stats pointer to \ref ngc_expr_cache_stats_t struct to fill in, all zero if the cache is disabled.
+*/
+void ngc_expr_cache_stats (ngc_expr_cache_stats_t *cache_stats)
+{
+#if NGC_EXPRESSION_CACHE_SIZE
+    memcpy(cache_stats, &stats, sizeof(ngc_expr_cache_stats_t));
+#else
+    memset(cache_stats, 0, sizeof(ngc_expr_cache_stats_t));
+#endif
+}
+
 /**/
 
 static int8_t get_format (char c, int8_t pos, uint8_t *decimals)
@@ -3,6 +3,13 @@
 #ifndef _NGC_EXPR_H_
 #define _NGC_EXPR_H_
 
+typedef struct {
+    uint32_t hits;
+    uint32_t misses;
+    uint32_t evictions;
+    uint32_t entries;
+} ngc_expr_cache_stats_t;
+
 status_code_t ngc_read_name (char *line, uint_fast8_t *pos, char *buffer);
 status_code_t ngc_read_real_value (char *line, uint_fast8_t *pos, float *value);
 status_code_t ngc_read_integer_value(char *line, uint_fast8_t *pos, int32_t *value);
@@ -11,5 +18,6 @@ status_code_t ngc_read_parameter (char *line, uint_fast8_t *pos, float *value, b
 status_code_t ngc_eval_expression (char *line, uint_fast8_t *pos, float *value);
 char *ngc_substitute_parameters (char *line);
 char *ngc_process_comment (char *comment);
+void ngc_expr_cache_stats (ngc_expr_cache_stats_t *stats);
 
 #endif
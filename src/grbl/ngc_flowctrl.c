@@ -662,13 +662,13 @@ status_code_t ngc_flowctrl (uint32_t o_label, char *line, uint_fast8_t *pos, boo
                 if(!skipping) {
 
                     ngc_sub_t *sub = NULL;
+                    vfs_file_t *file = NULL;
 
                     if(o_label > NGC_MAX_PARAM_ID) {
 
                         char *subname;
                         if((subname = ngc_string_param_get((ngc_string_id_t)o_label))) {
                             char filename[60];
-                            vfs_file_t *file;
 #if LITTLEFS_ENABLE == 1
                             sprintf(filename, "/littlefs/%s.macro", subname);
 
@@ -691,9 +691,11 @@ status_code_t ngc_flowctrl (uint32_t o_label, char *line, uint_fast8_t *pos, boo
                             break;
                     } while((sub = sub->next));
 
-                    if(sub == NULL)
+                    if(sub == NULL) {
+                        if(file)
+                            stream_redirect_close(file);
                         status = Status_FlowControlSyntaxError;
-                    else {
+                    } else {
 
                         float params[30];
                         ngc_param_id_t param_id = 1;
@@ -726,6 +728,11 @@ status_code_t ngc_flowctrl (uint32_t o_label, char *line, uint_fast8_t *pos, boo
                                 ngc_named_param_set("_value_returned", 0.0f);
                                 vfs_seek(sub->file, sub->file_pos);
                             }
+                        } else if(file) {
+                            // The call line failed before the sub was entered, drop the redirect
+                            // opened for it or the stream keeps reading the macro with no stack entry.
+                            clear_subs(file);
+                            stream_redirect_close(file);
                         }
                     }
                 }
@@ -43,6 +43,16 @@
 #define NGC_MAX_CALL_LEVEL 10
 #endif
 
+// Number of hash buckets for read/write parameters, must be a power of 2.
+#ifndef NGC_PARAM_HASH_SIZE
+#define NGC_PARAM_HASH_SIZE 32
+#endif
+#ifndef NGC_NAMED_PARAM_HASH_SIZE
+#define NGC_NAMED_PARAM_HASH_SIZE 16
+#endif
+// Open addressing index for predefined named parameters, power of 2 and > 2 x number of entries.
+#define NGC_NAMED_RO_INDEX_SIZE 128
+
 typedef float (*ngc_param_get_ptr)(ngc_param_id_t id);
 typedef float (*ngc_named_param_get_ptr)(void);
 
@@ -56,7 +66,7 @@ typedef struct ngc_rw_param {
     void *context;
     ngc_param_id_t id;
     float value;
-    struct ngc_rw_param *next;
+    struct ngc_rw_param *next; // next in hash bucket
 } ngc_rw_param_t;
 
 typedef struct {
@@ -67,9 +77,10 @@ typedef struct {
 
 typedef struct ngc_named_rw_param {
     void *context;
+    uint32_t hash; // of name
     char name[NGC_MAX_PARAM_LENGTH + 1];
     float value;
-    struct ngc_named_rw_param *next;
+    struct ngc_named_rw_param *next; // next in hash bucket
 } ngc_named_rw_param_t;
 
 typedef struct ngc_string_param {
@@ -89,8 +100,8 @@ static int32_t call_level = -1;
 static void *call_context;
 static gc_modal_snapshot_t *modal_state;
 static ngc_param_context_t call_levels[NGC_MAX_CALL_LEVEL];
-static ngc_rw_param_t *rw_params = NULL;
-static ngc_named_rw_param_t *rw_global_params = NULL;
+static ngc_rw_param_t *rw_params[NGC_PARAM_HASH_SIZE] = {0};
+static ngc_named_rw_param_t *rw_global_params[NGC_NAMED_PARAM_HASH_SIZE] = {0};
 static ngc_string_id_t ref_id = (uint32_t)-1;
 static ngc_string_param_t *ngc_string_params = NULL;
 static on_macro_execute_ptr on_macro_execute;
@@ -321,6 +332,22 @@ PROGMEM static const ngc_ro_param_t ngc_ro_params[] = {
     { .id_min = 5599, .id_max = 5599, .get = debug_output }         // LinuxCNC
 };
 
+// Hash buckets are keyed by (context, id) so call level locals do not collide with globals.
+static inline uint_fast8_t rw_param_bucket (void *context, ngc_param_id_t id)
+{
+    return (uint_fast8_t)((((uint32_t)id ^ (uint32_t)((uintptr_t)context >> 3)) * 2654435761u) >> 24) & (NGC_PARAM_HASH_SIZE - 1);
+}
+
+static ngc_rw_param_t *rw_param_find (void *context, ngc_param_id_t id)
+{
+    ngc_rw_param_t *rw_param = rw_params[rw_param_bucket(context, id)];
+
+    while(rw_param && !(rw_param->id == id && rw_param->context == context))
+        rw_param = rw_param->next;
+
+    return rw_param;
+}
+
 bool ngc_param_get (ngc_param_id_t id, float *value)
 {
     bool found = id > 0 && id < ngc_ro_params[0].id_min;
@@ -329,15 +356,9 @@ bool ngc_param_get (ngc_param_id_t id, float *value)
     *value = 0.0f;
 
     if(found) {
-        void *context = id > (ngc_param_id_t)30 ? NULL : call_context;
-        ngc_rw_param_t *rw_param = rw_params;
-        while(rw_param) {
-            if(rw_param->context == context && rw_param->id == id) {
-                *value = rw_param->value;
-                rw_param = NULL;
-            } else
-                rw_param = rw_param->next;
-        }
+        ngc_rw_param_t *rw_param = rw_param_find(id > (ngc_param_id_t)30 ? NULL : call_context, id);
+        if(rw_param)
+            *value = rw_param->value;
     } else do {
         idx--;
         if((found = id >= ngc_ro_params[idx].id_min && id <= ngc_ro_params[idx].id_max))
@@ -364,25 +385,14 @@ bool ngc_param_set (ngc_param_id_t id, float value)
     if(ok) {
 
         void *context = id > (ngc_param_id_t)30 ? NULL : call_context;
-        ngc_rw_param_t *rw_param = rw_params, *rw_param_last = rw_params;
-
-        while(rw_param) {
-            if(rw_param->context == context && rw_param->id == id) {
-                break;
-            } else {
-                rw_param_last = rw_param;
-                rw_param = rw_param->next;
-            }
-        }
+        ngc_rw_param_t *rw_param = rw_param_find(context, id);
 
         if(rw_param == NULL && value != 0.0f && (rw_param = malloc(sizeof(ngc_rw_param_t)))) {
+            uint_fast8_t bucket = rw_param_bucket(context, id);
             rw_param->id = id;
             rw_param->context = context;
-            rw_param->next = NULL;
-            if(rw_params == NULL)
-                rw_params = rw_param;
-            else
-                rw_param_last->next = rw_param;
+            rw_param->next = rw_params[bucket];
+            rw_params[bucket] = rw_param;
         }
 
         if(rw_param)
@@ -708,31 +718,97 @@ float ngc_named_param_get_by_id (ncg_name_param_id_t id)
     return value;
 }
 
-// Lowercase name, remove control characters and spaces
-static char *ngc_name_tolower (char *s)
+#define NGC_NAME_HASH_INIT 2166136261u
+#define NGC_NAME_HASH(h, c) (((h) ^ (uint8_t)(c)) * 16777619u) // FNV-1a
+
+// Lowercase name, remove control characters and spaces and hash the result (FNV-1a) in the same pass.
+// NOTE: one extra character is kept so that names longer than NGC_MAX_PARAM_LENGTH can be rejected.
+static char *ngc_name_tolower (char *s, uint32_t *hash)
 {
-    static char name[NGC_MAX_PARAM_LENGTH + 1];
+    static char name[NGC_MAX_PARAM_LENGTH + 2];
 
     uint_fast8_t len = 0;
+    uint32_t h = NGC_NAME_HASH_INIT;
 	char c, *s1 = s, *s2 = name;
 
     while((c = *s1++) && len <= NGC_MAX_PARAM_LENGTH) {
         if(c > ' ') {
-            *s2++ = LCAPS(c);
+            *s2++ = c = LCAPS(c);
+            h = NGC_NAME_HASH(h, c);
             len++;
         }
     }
     *s2 = '\0';
+    *hash = h;
 
 	return name;
 }
 
+#define N_NAMED_RO_PARAMS (sizeof(ngc_named_ro_param) / sizeof(ngc_named_ro_param_t))
+
+static bool named_ro_indexed = false;
+static uint8_t named_ro_index[NGC_NAMED_RO_INDEX_SIZE]; // ngc_named_ro_param[] index + 1, 0 if empty
+static uint32_t named_ro_hash[N_NAMED_RO_PARAMS];
+
+static void named_ro_index_init (void)
+{
+    uint32_t hash;
+    uint_fast8_t idx = N_NAMED_RO_PARAMS, slot;
+
+    named_ro_indexed = true;
+
+    do {
+        const char *c = ngc_named_ro_param[--idx].name; // already lowercase
+        hash = NGC_NAME_HASH_INIT;
+        while(*c)
+            hash = NGC_NAME_HASH(hash, *c++);
+        named_ro_hash[idx] = hash;
+        slot = hash & (NGC_NAMED_RO_INDEX_SIZE - 1);
+        while(named_ro_index[slot])
+            slot = (slot + 1) & (NGC_NAMED_RO_INDEX_SIZE - 1);
+        named_ro_index[slot] = idx + 1;
+    } while(idx);
+}
+
+// Returns index into ngc_named_ro_param[] or -1 if name is not a predefined parameter.
+static int_fast16_t named_ro_find (char *name, uint32_t hash)
+{
+    uint_fast8_t idx, slot = hash & (NGC_NAMED_RO_INDEX_SIZE - 1);
+
+    if(!named_ro_indexed)
+        named_ro_index_init();
+
+    while((idx = named_ro_index[slot])) {
+        if(named_ro_hash[--idx] == hash && !strcmp(name, ngc_named_ro_param[idx].name))
+            return (int_fast16_t)idx;
+        slot = (slot + 1) & (NGC_NAMED_RO_INDEX_SIZE - 1);
+    }
+
+    return -1;
+}
+
+static inline uint_fast8_t named_rw_bucket (void *context, uint32_t hash)
+{
+    return (uint_fast8_t)((hash ^ (uint32_t)((uintptr_t)context >> 3)) & (NGC_NAMED_PARAM_HASH_SIZE - 1));
+}
+
+static ngc_named_rw_param_t *named_rw_find (void *context, char *name, uint32_t hash)
+{
+    ngc_named_rw_param_t *rw_param = rw_global_params[named_rw_bucket(context, hash)];
+
+    while(rw_param && !(rw_param->hash == hash && rw_param->context == context && !strcmp(rw_param->name, name)))
+        rw_param = rw_param->next;
+
+    return rw_param;
+}
+
 bool ngc_named_param_get (char *name, float *value)
 {
     bool found = false;
-    uint_fast8_t idx = sizeof(ngc_named_ro_param) / sizeof(ngc_named_ro_param_t);
+    uint32_t hash;
+    int_fast16_t idx;
 
-    name = ngc_name_tolower(name);
+    name = ngc_name_tolower(name, &hash);
 
     // Check if name is supplied, return false if not.
     if((*name == '_' ? *(name + 1) : *name) == '\0')
@@ -740,21 +816,13 @@ bool ngc_named_param_get (char *name, float *value)
 
     *value = 0.0f;
 
-     if(*name == '_') do {
-        idx--;
-        if((found = !strcmp(name, ngc_named_ro_param[idx].name)))
-            *value = ngc_named_param_get_by_id(ngc_named_ro_param[idx].id);
-    } while(idx && !found);
+    if(*name == '_' && (found = (idx = named_ro_find(name, hash)) >= 0))
+        *value = ngc_named_param_get_by_id(ngc_named_ro_param[idx].id);
 
     if(!found) {
-        void *context = *name == '_' ? NULL : call_context;
-        ngc_named_rw_param_t *rw_param = rw_global_params;
-        while(rw_param && !found) {
-            if((found = rw_param->context == context && !strcmp(rw_param->name, name)))
-                *value = rw_param->value;
-            else
-                rw_param = rw_param->next;
-        }
+        ngc_named_rw_param_t *rw_param = named_rw_find(*name == '_' ? NULL : call_context, name, hash);
+        if((found = rw_param != NULL))
+            *value = rw_param->value;
     }
 
     return found;
@@ -770,9 +838,9 @@ bool ngc_named_param_exists (char *name)
 float *ngc_named_param_set (char *name, float value)
 {
     bool ok = false;
-    uint_fast8_t idx = sizeof(ngc_named_ro_param) / sizeof(ngc_named_ro_param_t);
+    uint32_t hash;
 
-    name = ngc_name_tolower(name);
+    name = ngc_name_tolower(name, &hash);
 
     // Check if name is supplied, return false if not.
     if((*name == '_' ? *(name + 1) : *name) == '\0')
@@ -781,36 +849,21 @@ float *ngc_named_param_set (char *name, float value)
     ngc_named_rw_param_t *rw_param = NULL;
 
     // Check if it is a (read only) predefined parameter.
-    if(*name == '_') do {
-        idx--;
-        ok = !strcmp(name, ngc_named_ro_param[idx].name);
-    } while(idx && !ok);
+    if(*name == '_')
+        ok = named_ro_find(name, hash) >= 0;
 
     // If not predefined attempt to set it.
     if(!ok && (ok = strlen(name) <= NGC_MAX_PARAM_LENGTH)) {
 
         void *context = *name == '_' ? NULL : call_context;
-        ngc_named_rw_param_t *rw_param_last = rw_global_params;
-
-        rw_param = rw_global_params;
 
-        while(rw_param) {
-            if(rw_param->context == context && !strcmp(rw_param->name, name)) {
-                 break;
-            } else {
-                rw_param_last = rw_param;
-                rw_param = rw_param->next;
-            }
-        }
-
-        if(rw_param == NULL && (rw_param = malloc(sizeof(ngc_named_rw_param_t)))) {
+        if((rw_param = named_rw_find(context, name, hash)) == NULL && (rw_param = malloc(sizeof(ngc_named_rw_param_t)))) {
+            uint_fast8_t bucket = named_rw_bucket(context, hash);
             strcpy(rw_param->name, name);
+            rw_param->hash = hash;
             rw_param->context = context;
-            rw_param->next = NULL;
-            if(rw_global_params == NULL)
-                rw_global_params = rw_param;
-            else
-                rw_param_last->next = rw_param;
+            rw_param->next = rw_global_params[bucket];
+            rw_global_params[bucket] = rw_param;
          }
 
          if((ok = rw_param != NULL))
@@ -994,37 +1047,29 @@ bool ngc_call_pop (void)
 
         if(call_context) {
 
-            ngc_rw_param_t *rw_param = rw_params, *rw_param_last = rw_params;
-
-            while(rw_param) {
-                if(rw_param->context == call_context) {
-                    ngc_rw_param_t *rw_param_free = rw_param;
-                    rw_param = rw_param->next;
-                    if(rw_param_free == rw_params)
-                        rw_params = rw_param_last = rw_param;
-                    else
-                        rw_param_last->next = rw_param;
-                    free(rw_param_free);
-                } else {
-                    rw_param_last = rw_param;
-                    rw_param = rw_param->next;
+            uint_fast8_t idx;
+            ngc_rw_param_t *rw_param, **rw_link;
+            ngc_named_rw_param_t *rw_named_param, **rw_named_link;
+
+            for(idx = 0; idx < NGC_PARAM_HASH_SIZE; idx++) {
+                rw_link = &rw_params[idx];
+                while((rw_param = *rw_link)) {
+                    if(rw_param->context == call_context) {
+                        *rw_link = rw_param->next;
+                        free(rw_param);
+                    } else
+                        rw_link = &rw_param->next;
                 }
             }
 
-            ngc_named_rw_param_t *rw_named_param = rw_global_params, *rw_named_param_last = rw_global_params;
-
-            while(rw_named_param) {
-                if(rw_named_param->context == call_context) {
-                    ngc_named_rw_param_t *rw_named_param_free = rw_named_param;
-                    rw_named_param = rw_named_param->next;
-                    if(rw_named_param_free == rw_global_params)
-                        rw_global_params = rw_named_param_last = rw_named_param;
-                    else
-                        rw_named_param_last->next = rw_named_param;
-                    free(rw_named_param_free);
-                } else {
-                    rw_named_param_last = rw_named_param;
-                    rw_named_param = rw_named_param->next;
+            for(idx = 0; idx < NGC_NAMED_PARAM_HASH_SIZE; idx++) {
+                rw_named_link = &rw_global_params[idx];
+                while((rw_named_param = *rw_named_link)) {
+                    if(rw_named_param->context == call_context) {
+                        *rw_named_link = rw_named_param->next;
+                        free(rw_named_param);
+                    } else
+                        rw_named_link = &rw_named_param->next;
                 }
             }
         }
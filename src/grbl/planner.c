@@ -792,3 +792,38 @@ void plan_data_init (plan_line_data_t *plan_data)
     plan_data->acceleration_factor = gc_get_accel_factor(0);
 #endif
 }
+
+// Saves or restores the planner, used by the simulator. Block pointers are saved as
+// indices into the block buffer, messages and output commands of queued blocks are not kept.
+bool plan_checkpoint (checkpoint_t *cp)
+{
+    uint_fast16_t idx;
+    uint32_t size = block_buffer_size, block[4];
+    plan_block_t **ptr[4] = { &block_buffer_tail, &block_buffer_head, &next_buffer_head, &block_buffer_planned };
+
+    if(!cp->restore) for(idx = 0; idx < 4; idx++)
+        block[idx] = *ptr[idx] - block_buffer;
+
+    if(!(cp->data(&size, sizeof(size)) && size == block_buffer_size && cp->data(block, sizeof(block)) && cp->data(&pl, sizeof(planner_t))))
+        return false;
+
+    for(idx = 0; idx <= block_buffer_size; idx++) {
+        // Everything up to the message, the linked list of the buffer stays as built by plan_reset()
+        if(!cp->data(&block_buffer[idx], offsetof(plan_block_t, message)))
+            return false;
+        if(cp->restore) {
+            cp->relocate(&block_buffer[idx].spindle.hal);
+            cp->relocate(&block_buffer[idx].spindle.css);
+            block_buffer[idx].message = NULL;
+            block_buffer[idx].output_commands = NULL;
+        }
+    }
+
+    if(cp->restore) for(idx = 0; idx < 4; idx++) {
+        if(block[idx] > block_buffer_size)
+            return false;
+        *ptr[idx] = &block_buffer[block[idx]];
+    }
+
+    return true;
+}
@@ -24,6 +24,8 @@
 #ifndef _PLANNER_H_
 #define _PLANNER_H_
 
+#include "checkpoint.h"
+
 typedef union {
     uint32_t value;
     struct {
@@ -214,4 +216,7 @@ void plan_data_init (plan_line_data_t *plan_data);
 
 void plan_sync_velocity (void *block);
 
+// Saves or restores the planner state, see checkpoint.h.
+bool plan_checkpoint (checkpoint_t *cp);
+
 #endif
@@ -864,3 +864,29 @@ static void state_await_resumed (uint_fast16_t rt_exec)
         state_set(STATE_CYCLE);
     }
 }
+
+// Saves or restores the state machine, used by the simulator.
+bool state_checkpoint (checkpoint_t *cp)
+{
+    if(!(cp->data(&sys_state, sizeof(sys_state_t)) &&
+          cp->data(&pending_state, sizeof(sys_state_t)) &&
+           cp->data((void *)&stateHandler, sizeof(stateHandler)) &&
+            cp->data(&restore_condition, sizeof(restore_condition_t)) &&
+             cp->data(&park, sizeof(parking_data_t))))
+        return false;
+
+    if(cp->restore) {
+        uint_fast8_t idx;
+        cp->relocate((void *)&stateHandler);
+        for(idx = 0; idx < N_SYS_SPINDLE; idx++) {
+            cp->relocate(&restore_condition.spindle[idx].hal);
+            cp->relocate(&restore_condition.spindle[idx].css);
+        }
+        cp->relocate(&park.plan_data.spindle.hal);
+        cp->relocate(&park.plan_data.spindle.css);
+        park.plan_data.message = NULL;
+        park.plan_data.output_commands = NULL;
+    }
+
+    return true;
+}
@@ -24,11 +24,14 @@
 #ifndef _STATE_MACHINE_H_
 #define _STATE_MACHINE_H_
 
+#include "checkpoint.h"
+
 sys_state_t state_get (void);
 uint8_t state_get_substate (void);
 void state_set (sys_state_t state);
 void state_update (rt_exec_t rt_exec);
 bool state_door_reopened (void);
 void state_suspend_manager (void);
+bool state_checkpoint (checkpoint_t *cp);
 
 #endif
@@ -1487,3 +1487,64 @@ axes_signals_t st_get_enable_out (void)
 
     return enable;
 }
+
+// Saves or restores the stepper state and the segment buffer, used by the simulator.
+// All pointers are into static buffers except the planner block being prepped, which
+// has to be the current planner block. Messages and output commands are not kept.
+bool st_checkpoint (checkpoint_t *cp)
+{
+    uint_fast8_t idx;
+    uint8_t prepping = pl_block != NULL;
+
+    if(!cp->restore && pl_block && pl_block != plan_get_current_block())
+        return false;
+
+    if(!(cp->data(&prepping, sizeof(prepping)) &&
+          cp->data(st_block_buffer, sizeof(st_block_buffer)) &&
+           cp->data(segment_buffer, sizeof(segment_buffer)) &&
+            cp->data(&st, sizeof(stepper_t)) &&
+             cp->data(&st_hold_block, sizeof(st_block_t)) &&
+              cp->data(&prep, sizeof(prep)) &&
+               cp->data((void *)&segment_buffer_tail, sizeof(segment_t *)) &&
+                cp->data((void *)&segment_buffer_head, sizeof(segment_t *)) &&
+                 cp->data(&st_prep_block, sizeof(st_block_t *)) &&
+                  cp->data(&stepping, sizeof(stepping)) &&
+                   cp->data((void *)&exec_fast_hold, sizeof(exec_fast_hold)) &&
+#if ADAPTIVE_MULTI_AXIS_STEP_SMOOTHING
+                    cp->data(&amass, sizeof(amass_t)) &&
+#endif
+                     cp->data(&cycles_per_min, sizeof(cycles_per_min))))
+        return false;
+
+    if(cp->restore) {
+
+        for(idx = 0; idx < sizeof(st_block_buffer) / sizeof(st_block_t); idx++) {
+            cp->relocate(&st_block_buffer[idx].next);
+            cp->relocate(&st_block_buffer[idx].spindle);
+            st_block_buffer[idx].message = NULL;
+            st_block_buffer[idx].output_commands = NULL;
+        }
+
+        for(idx = 0; idx < sizeof(segment_buffer) / sizeof(segment_t); idx++) {
+            cp->relocate(&segment_buffer[idx].next);
+            cp->relocate(&segment_buffer[idx].exec_block);
+            cp->relocate(&segment_buffer[idx].update_pwm);
+            cp->relocate(&segment_buffer[idx].update_rpm);
+        }
+
+        cp->relocate(&st.exec_block);
+        cp->relocate(&st.exec_segment);
+        cp->relocate(&st_hold_block.next);
+        cp->relocate(&st_hold_block.spindle);
+        st_hold_block.message = NULL;
+        st_hold_block.output_commands = NULL;
+        cp->relocate(&prep.last_st_block);
+        cp->relocate((void *)&segment_buffer_tail);
+        cp->relocate((void *)&segment_buffer_head);
+        cp->relocate(&st_prep_block);
+
+        pl_block = prepping ? plan_get_current_block() : NULL;
+    }
+
+    return true;
+}
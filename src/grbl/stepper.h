@@ -150,6 +150,9 @@ void st_prep_buffer (void);
 // Called by planner_recalculate() when the executing block is updated by the new plan.
 void st_update_plan_block_parameters (bool fast_hold);
 
+// Saves or restores the stepper and segment buffer state, see checkpoint.h.
+bool st_checkpoint (checkpoint_t *cp);
+
 // Called by realtime status reporting if realtime rate reporting is enabled in config.h.
 float st_get_realtime_rate (void);
 
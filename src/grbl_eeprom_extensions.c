@@ -29,18 +29,19 @@
 bool memcpy_to_eeprom(uint32_t destination, uint8_t *source, uint32_t size, bool with_checksum)
 {
     uint32_t dest = destination;
+    uint16_t checksum = with_checksum ? calc_checksum(source, size) : 0;
 
     for(; size > 0; size--)
         eeprom_put_char(dest++, *(source++));
 
-    if(size > 0 && with_checksum) {
-        uint16_t checksum = calc_checksum(source, size);
-        eeprom_put_char(destination, checksum & 0xFF);
+    // Same layout as memcpy_to_ram() in grbl/nvs_buffer.c, checksum after the data
+    if(with_checksum) {
+        eeprom_put_char(dest, checksum & 0xFF);
 #if NVS_CRC_BYTES > 1
-        eeprom_put_char(++destination, checksum >> 1);
+        eeprom_put_char(++dest, checksum >> 8);
 #endif
     }
-    
+
     return true;
 }
 
@@ -52,9 +53,9 @@ bool memcpy_from_eeprom(uint8_t *destination, uint32_t source, uint32_t size, bo
         *(destination++) = eeprom_get_char(source++);
 
 #if NVS_CRC_BYTES == 1
-    return !with_checksum || calc_checksum(destination, sz) == eeprom_get_char(source);
+    return !with_checksum || calc_checksum(dest, sz) == eeprom_get_char(source);
 #else
-    return !with_checksum || calc_checksum(destination, sz) == (eeprom_get_char(source) | (eeprom_get_char(source + 1) << 8));
+    return !with_checksum || calc_checksum(dest, sz) == (eeprom_get_char(source) | (eeprom_get_char(source + 1) << 8));
 #endif
 }
 
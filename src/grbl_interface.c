@@ -23,10 +23,13 @@
 */
 
 #include <stdio.h>
+#include <math.h>
+#include <string.h>
 
 #include "mcu.h"
 #include "driver.h"
 #include "simulator.h"
+#include "sim_checkpoint.h"
 
 #include "grbl/hal.h"
 #include "grbl/protocol.h"
@@ -35,9 +38,13 @@
 int block_position[N_AXIS] = {0}; //step count after most recently planned block
 uint32_t block_number = 0;
 double next_print_time;
+static int32_t printed_position[N_AXIS]; // sys.position of the last printed line
+static plan_block_t *printed_block = NULL;  // block of the last "# block number" line
+static plan_block_t *last_block = NULL;     // block last written by printBlock()
 
 static void print_steps(bool force);
 static void printBlock(void);
+static void log_state(void);
 
 void grbl_app_init (void)
 {
@@ -47,9 +54,16 @@ void grbl_app_init (void)
 
 void grbl_per_tick (void)
 {
+    //save or restore a checkpoint requested by the grbl thread
+    checkpoint_poll();
+
     //maybe print the position every tick
     print_steps(0);
 
+    //log state changes for the -l event file
+    if(args.event_out_file)
+        log_state();
+
     //TODO:
     //  set limit pins based on position,
     //  set probe pin when probing.
@@ -145,40 +159,210 @@ void grbl_app_exit (void)
     print_steps(1);
 }
 
+/*
+  Event log (-l option): one line per event with the simulated time, for latency measurements
+  against the step output.
+
+    rx <line>    a line received from the host, when its terminator is read
+    rt 0x<hh>    a realtime command received from the host
+    tx <line>    a line sent to the host
+    state <name> sys_state changed, checked once per tick
+*/
+
+static uint8_t (*host_getchar)(void);
+static void (*host_putchar)(uint8_t);
+static char rx_line[256], tx_line[256];
+static uint_fast16_t rx_length = 0, tx_length = 0;
+
+static void log_line (const char *kind, char *line, uint_fast16_t *length)
+{
+    if(*length) {
+        line[*length] = '\0';
+        fprintf(args.event_out_file, "%12.5f %s %s\n", sim.sim_time, kind, line);
+        fflush(args.event_out_file);
+        *length = 0;
+    }
+}
+
+static uint8_t event_getchar (void)
+{
+    uint8_t c = host_getchar();
+
+    if(c >= 0x80 || c == CMD_RESET || c == CMD_STATUS_REPORT_LEGACY || c == CMD_FEED_HOLD_LEGACY || c == CMD_CYCLE_START_LEGACY) {
+        fprintf(args.event_out_file, "%12.5f rt 0x%02x\n", sim.sim_time, c);
+        fflush(args.event_out_file);
+    } else if(c == '\n' || c == '\r')
+        log_line("rx", rx_line, &rx_length);
+    else if(c >= ' ' && rx_length < sizeof(rx_line) - 1)
+        rx_line[rx_length++] = c;
+
+    return c;
+}
+
+static void event_putchar (uint8_t c)
+{
+    host_putchar(c);
+
+    if(c == '\n' || c == '\r')
+        log_line("tx", tx_line, &tx_length);
+    else if(c >= ' ' && c < 0x80 && tx_length < sizeof(tx_line) - 1)
+        tx_line[tx_length++] = c;
+}
+
+static void log_state (void)
+{
+    static const char *const names[] = {
+        "Alarm", "Check", "Home", "Run", "Hold", "Jog", "Door", "Sleep", "EStop", "Tool"
+    };
+    static sys_state_t logged = STATE_IDLE;
+    static bool started = false;
+
+    sys_state_t state = state_get();
+    uint_fast8_t idx = 0;
+
+    if(started && state == logged)
+        return;
+
+    started = true;
+    logged = state;
+
+    if(state == STATE_IDLE)
+        fprintf(args.event_out_file, "%12.5f state Idle\n", sim.sim_time);
+    else {
+        while(!(state & bit(idx)))
+            idx++;
+        fprintf(args.event_out_file, "%12.5f state %s\n", sim.sim_time, idx < sizeof(names) / sizeof(names[0]) ? names[idx] : "Unknown");
+    }
+    fflush(args.event_out_file);
+}
+
+// Starts logging host input and output to args.event_out_file, called after sim.getchar
+// and sim.putchar are set.
+void grbl_event_log_start (void)
+{
+    host_getchar = sim.getchar;
+    host_putchar = sim.putchar;
+    sim.getchar = event_getchar;
+    sim.putchar = event_putchar;
+}
+
+// Saves or restores the output tracking, used by checkpoints. After a restore the
+// blocks already queued are neither printed again nor given a new block number,
+// the report time is the one of this run. A reset to the baseline keeps the block numbering
+// and the last printed position, so the jump to the baseline position is printed.
+bool grbl_checkpoint (checkpoint_t *cp)
+{
+    uint32_t number = block_number;
+    int32_t printed[N_AXIS];
+
+    memcpy(printed, printed_position, sizeof(printed_position));
+
+    if(!(cp->data(block_position, sizeof(block_position)) &&
+          cp->data(&block_number, sizeof(block_number)) &&
+           cp->data(printed_position, sizeof(printed_position))))
+        return false;
+
+    if(cp->restore) {
+        if(cp->reset) {
+            block_number = number;
+            memcpy(printed_position, printed, sizeof(printed_position));
+        }
+        printed_block = plan_get_current_block();
+        last_block = plan_get_recent_block();
+        if (args.step_time != 0.0)
+            next_print_time = (floor(sim.sim_time / args.step_time) + 1.0) * args.step_time;
+    }
+
+    return true;
+}
+
+static void write_steps (void)
+{
+    fprintf(args.step_out_file, "%12.5f", sim.sim_time);
+    for (int i = 0; i < N_AXIS; i++) {
+        fprintf(args.step_out_file, " %d", sys.position[i]);
+        printed_position[i] = sys.position[i];
+    }
+    fprintf(args.step_out_file, "\n");
+}
+
+// true if any axis moved at least min_steps since the last printed line
+static bool steps_moved (int32_t min_steps)
+{
+    for (int i = 0; i < N_AXIS; i++) {
+        int32_t d = sys.position[i] - printed_position[i];
+        if (d >= min_steps || -d >= min_steps)
+            return true;
+    }
+    return false;
+}
+
+// next report time after now, with -r 0 (change and events modes) every tick
+static void advance_print_time (void)
+{
+    if (args.step_time == 0.0)
+        next_print_time = sim.sim_time;
+    else while (next_print_time <= sim.sim_time)
+        next_print_time += args.step_time;
+}
+
 //show current position in steps (all N_AXIS axes)
 static void print_steps (bool force)
 {
-    static plan_block_t* printed_block = NULL;
-
     plan_block_t* current_block = plan_get_current_block();
 
     if (sim.exit == exit_REQ && state_get() < STATE_HOMING )
         sim.exit = exit_OK;
 
-    if (next_print_time == 0.0)
+    // no report time: step output only in change and events modes
+    if (args.step_time == 0.0 && args.step_mode == Steps_Interval)
         return;
 
     if (current_block != printed_block) {
-        if (block_number) {
-            fprintf(args.step_out_file, "%12.5f", sim.sim_time);
-            for (int i = 0; i < N_AXIS; i++)
-                fprintf(args.step_out_file, " %d", sys.position[i]);
-            fprintf(args.step_out_file, "\n");
-        }
+        // exact sample at block exit (and entry of the next one) in every mode
+        if (block_number)
+            write_steps();
 
         printed_block = current_block;
-        if (current_block == NULL)
+        if (current_block == NULL) {
+            fflush(args.step_out_file);
             return;
+        }
         fprintf(args.step_out_file, "# block number %d\n", block_number++);
     }
-    else if ((current_block && sim.sim_time >= next_print_time) || force) {
-        fprintf(args.step_out_file, "%12.5f", sim.sim_time);
-        for (int i = 0; i < N_AXIS; i++)
-            fprintf(args.step_out_file, " %d", sys.position[i]);
-        fprintf(args.step_out_file, "\n");
+    else if (force) {
+        // the stop sample may already hold the final position, don't repeat it
+        if (steps_moved(1))
+            write_steps();
+        fflush(args.step_out_file);
+    }
+    else if (args.step_mode == Steps_Interval) {
+        if (current_block && sim.sim_time >= next_print_time) {
+            write_steps();
+            fflush(args.step_out_file);
+            advance_print_time();
+        }
+    }
+    // The planner block is released when its last segment is prepared, the stepper
+    // keeps moving until the segment buffer is empty: write the exact stop position.
+    else if (current_block == NULL && !(state_get() & (STATE_CYCLE|STATE_JOG|STATE_HOMING)) && steps_moved(1)) {
+        write_steps();
         fflush(args.step_out_file);
-        while (next_print_time <= sim.sim_time)
-            next_print_time += args.step_time;
+    }
+    else if (args.step_mode == Steps_Events) {
+        if (steps_moved(args.step_decimation ? args.step_decimation : 1))
+            write_steps();
+        if (sim.sim_time >= next_print_time) {
+            fflush(args.step_out_file);
+            advance_print_time();
+        }
+    }
+    else if (sim.sim_time >= next_print_time) {
+        if (steps_moved(1)) {
+            write_steps();
+            fflush(args.step_out_file);
+        }
+        advance_print_time();
     }
 }
 
@@ -186,8 +370,6 @@ static void print_steps (bool force)
 // but only once!
 static void printBlock (void)
 {
-    static plan_block_t *last_block;
-
     plan_block_t *b = plan_get_recent_block();
     if(b != last_block && b != NULL) {
         int i;
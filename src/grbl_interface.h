@@ -20,7 +20,11 @@
   along with Grbl.  If not, see <http://www.gnu.org/licenses/>.
 */
 
+#include "grbl/checkpoint.h"
+
 void grbl_app_init(void);  //call to setup ISRs and local tracking vars
 void grbl_per_tick(void);  //call per tick to print steps
 void grbl_per_byte(void);  //call per incoming byte to print block info
 void grbl_app_exit(void);  //call to shutdown cleanly
+bool grbl_checkpoint(checkpoint_t *cp);  //save or restore the output tracking
+void grbl_event_log_start(void);  //log host input, output and state changes to the -l file
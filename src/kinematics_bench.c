@@ -0,0 +1,343 @@
+/*
+  kinematics_bench.c - per call cost of the kinematics API
+
+  Part of Grbl Simulator
+
+  The kinematics modules are selected at compile time, CMake builds one
+  executable per module (kinematics_bench_<name>, -DKINEMATICS_BENCH=ON).
+  Each one times transform_from_cartesian(), the forward transform
+  (transform_steps_to_cartesian()), segment_line() and the
+  check_travel_limits() hook over a fixed pseudo random workload inside
+  the module's default work area, and prints the results as JSON so they
+  can be compared across commits by bench/kinematics_bench.py.
+
+  Grbl is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  Grbl is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with Grbl.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include <inttypes.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+#include "platform.h"
+#include "grbl/hal.h"
+#include "grbl/kinematics.h"
+#include "grbl/nvs_buffer.h"
+#include "grbl/planner.h"
+#include "grbl/report.h"
+#include "grbl/kinematics/corexy.h"
+#include "grbl/kinematics/delta.h"
+#include "grbl/kinematics/polar.h"
+#include "grbl/kinematics/rtcp.h"
+#include "grbl/kinematics/wall_plotter.h"
+
+#define MAX_POINTS 65536
+
+// Work area of each module with its default settings, center +/- span per axis.
+// Points are drawn uniformly inside, lines run between consecutive points.
+typedef struct {
+    const char *name;
+    float center[N_AXIS];
+    float span[N_AXIS];
+} workload_t;
+
+#if COREXY
+static const workload_t workload = {
+    .name = "corexy",
+    .center = { -100.0f, -100.0f, -100.0f },
+    .span = { 100.0f, 100.0f, 100.0f }
+};
+#elif WALL_PLOTTER
+static const workload_t workload = {
+    .name = "wall_plotter",
+    .center = { 100.0f, 150.0f, 0.0f },
+    .span = { 80.0f, 100.0f, 5.0f }
+};
+#elif DELTA_ROBOT
+static const workload_t workload = {
+    .name = "delta",
+    .center = { 0.0f, 0.0f, -335.0f },
+    .span = { 45.0f, 45.0f, 45.0f }
+};
+#elif POLAR_ROBOT
+static const workload_t workload = {
+    .name = "polar",
+    .center = { 100.0f, 0.0f, -50.0f },
+    .span = { 50.0f, 100.0f, 20.0f }
+};
+#else
+// Head over a table with A tilt and C rotation, RTCP (M451) on
+static const workload_t workload = {
+    .name = "rtcp",
+    .center = { 0.0f, 0.0f, -60.0f, 0.0f, 0.0f, 0.0f },
+    .span = { 100.0f, 100.0f, 40.0f, 30.0f, 0.0f, 180.0f }
+};
+#endif
+
+typedef struct {
+    uint32_t calls;
+    uint64_t ns;
+} timing_t;
+
+static float points[MAX_POINTS][N_AXIS], motors[MAX_POINTS][N_AXIS];
+static int32_t steps[MAX_POINTS][N_AXIS];
+static uint32_t seed = 1;
+
+// xorshift32, same sequence on every host
+static float random_float (void)
+{
+    seed ^= seed << 13;
+    seed ^= seed >> 17;
+    seed ^= seed << 5;
+
+    return (float)(seed >> 8) / (float)(1 << 24) * 2.0f - 1.0f;
+}
+
+static double ns_per (timing_t *t, uint32_t n)
+{
+    return n ? (double)t->ns / n : 0.0;
+}
+
+static float xyz_distance (float *a, float *b)
+{
+    return sqrtf((a[X_AXIS] - b[X_AXIS]) * (a[X_AXIS] - b[X_AXIS]) +
+                  (a[Y_AXIS] - b[Y_AXIS]) * (a[Y_AXIS] - b[Y_AXIS]) +
+                   (a[Z_AXIS] - b[Z_AXIS]) * (a[Z_AXIS] - b[Z_AXIS]));
+}
+
+// The work envelope is set to the motor positions of the workload, as a machine
+// sized for the work area, so each travel limits check runs over all axes.
+// The delta module sets its own cartesian envelope from the arm geometry.
+static void generate (uint32_t n_points)
+{
+    uint_fast8_t idx;
+    uint32_t i;
+
+    for (i = 0; i < n_points; i++) {
+        for (idx = 0; idx < N_AXIS; idx++)
+            points[i][idx] = workload.center[idx] + workload.span[idx] * random_float();
+        kinematics.transform_from_cartesian(motors[i], points[i]);
+        for (idx = 0; idx < N_AXIS; idx++) {
+            steps[i][idx] = lroundf(motors[i][idx] * settings.axis[idx].steps_per_mm);
+#if !DELTA_ROBOT
+            if (i == 0 || motors[i][idx] < sys.work_envelope.min.values[idx])
+                sys.work_envelope.min.values[idx] = motors[i][idx];
+            if (i == 0 || motors[i][idx] > sys.work_envelope.max.values[idx])
+                sys.work_envelope.max.values[idx] = motors[i][idx];
+#endif
+        }
+    }
+}
+
+// No persistent storage, every setting is at its default
+static uint8_t nvs_get_byte (uint32_t addr)
+{
+    return 0xFF;
+}
+
+static void nvs_put_byte (uint32_t addr, uint8_t new_value)
+{
+}
+
+static bool nvs_read (uint8_t *dest, uint32_t source, uint32_t size, bool with_checksum)
+{
+    return false;
+}
+
+static bool nvs_write (uint32_t dest, uint8_t *source, uint32_t size, bool with_checksum)
+{
+    return true;
+}
+
+static void init (void)
+{
+    memset(&grbl, 0, sizeof(grbl_t));
+    grbl.on_get_errors = errors_get_details;
+
+    memset(&hal, 0, sizeof(grbl_hal_t));
+    hal.version = HAL_VERSION;
+    hal.driver_reset = dummy_handler;
+    hal.irq_enable = dummy_handler;
+    hal.irq_disable = dummy_handler;
+    hal.nvs.size = GRBL_NVS_SIZE;
+    hal.nvs.type = NVS_EEPROM;
+    hal.nvs.get_byte = nvs_get_byte;
+    hal.nvs.put_byte = nvs_put_byte;
+    hal.nvs.memcpy_to_nvs = nvs_write;
+    hal.nvs.memcpy_from_nvs = nvs_read;
+
+    memset(&kinematics, 0, sizeof(kinematics_t));
+
+    if (!driver_init())
+        exit(EXIT_FAILURE);
+
+    memset(&sys, 0, sizeof(system_t));
+    sys.cold_start = true;
+    sys.driver_started = true;
+
+    // Same order as grbl_enter(), modules allocate their settings before they are loaded
+    limits_init();
+    nvs_buffer_alloc();
+#if COREXY
+    corexy_init();
+#elif WALL_PLOTTER
+    wall_plotter_init();
+#elif DELTA_ROBOT
+    delta_robot_init();
+#elif POLAR_ROBOT
+    polar_init();
+#else
+    rtcp_5axis_init();
+#endif
+    nvs_buffer_init();
+    settings_init();
+    report_init_fns();
+
+    gc_init(false);
+    plan_reset();
+
+#if !(COREXY || WALL_PLOTTER || DELTA_ROBOT || POLAR_ROBOT)
+    // M451, RTCP is off by default and then just passes cartesian targets through
+    parser_block_t block = {0};
+    block.user_mcode = (user_mcode_t)451;
+    grbl.user_mcode.execute(STATE_IDLE, &block);
+#endif
+
+    sys.homed.mask = sys.soft_limits.mask = AXES_BITMASK;
+}
+
+int main (int argc, char *argv[])
+{
+    uint32_t n_points = 4096, repeat = 20, i, r, t0, workload_seed;
+    uint32_t lines = 0, segments = 0, in_limits = 0;
+    timing_t inverse = {0}, forward = {0}, segment = {0}, limits = {0};
+    float cartesian[N_AXIS], max_error = 0.0f;
+    double mm = 0.0;
+    plan_line_data_t pl_data;
+    FILE *out = stdout;
+    const char *progname = argv[0];
+
+    while (argc > 2 && argv[1][0] == '-') {
+        switch (argv[1][1]) {
+
+            case 'n':
+                n_points = (uint32_t)atol(argv[2]);
+                break;
+
+            case 'r':
+                repeat = (uint32_t)atol(argv[2]);
+                break;
+
+            case 's':
+                seed = (uint32_t)atol(argv[2]);
+                break;
+
+            case 'o':
+                if ((out = fopen(argv[2], "w")) == NULL) {
+                    perror("fopen");
+                    printf("Error opening : %s\n", argv[2]);
+                    return EXIT_FAILURE;
+                }
+                break;
+
+            default:
+                argc = 0;
+                break;
+        }
+        argc -= 2;
+        argv += 2;
+    }
+
+    if (argc != 1 || n_points < 2 || n_points > MAX_POINTS || repeat < 1 || seed == 0) {
+        printf("Usage: %s [-n points] [-r repeat] [-s seed] [-o output file]\n"
+               "  Times the %s kinematics over points (default 4096, max %d) random positions,\n"
+               "  repeat times (default 20). The workload only depends on the seed (default 1, not 0).\n",
+               progname, workload.name, MAX_POINTS);
+        return EXIT_FAILURE;
+    }
+
+    init();
+    workload_seed = seed;
+    generate(n_points);
+
+    // Forward transform of the step positions, the error is the step resolution.
+    // NaN if a point is not reachable, the workload is then outside the work area.
+    for (i = 0; i < n_points; i++) {
+        kinematics.transform_steps_to_cartesian(cartesian, steps[i]);
+        float error = xyz_distance(cartesian, points[i]);
+        if (!isnan(max_error) && !(error <= max_error)) // NaN is kept
+            max_error = error;
+    }
+
+    memset(&pl_data, 0, sizeof(plan_line_data_t));
+    pl_data.feed_rate = 1000.0f;
+
+    for (r = 0; r < repeat; r++) {
+
+        // Calls are timed per pass, platform_ns() wraps after ~4 s
+        t0 = platform_ns();
+        for (i = 0; i < n_points; i++)
+            kinematics.transform_from_cartesian(motors[i], points[i]);
+        inverse.ns += (uint32_t)(platform_ns() - t0);
+        inverse.calls += n_points;
+
+        t0 = platform_ns();
+        for (i = 0; i < n_points; i++)
+            kinematics.transform_steps_to_cartesian(cartesian, steps[i]);
+        forward.ns += (uint32_t)(platform_ns() - t0);
+        forward.calls += n_points;
+
+        // As mc_line(): init with the transformed start position, then get segments until NULL
+        t0 = platform_ns();
+        for (i = 1; i < n_points; i++) {
+            kinematics.segment_line(points[i], motors[i - 1], &pl_data, true);
+            while (kinematics.segment_line(points[i], NULL, &pl_data, false))
+                segments++;
+            pl_data.feed_rate = 1000.0f;
+        }
+        segment.ns += (uint32_t)(platform_ns() - t0);
+        segment.calls += n_points - 1;
+
+        t0 = platform_ns();
+        for (i = 0; i < n_points; i++) {
+            if (grbl.check_travel_limits(points[i], sys.soft_limits, true, &sys.work_envelope))
+                in_limits++;
+        }
+        limits.ns += (uint32_t)(platform_ns() - t0);
+        limits.calls += n_points;
+    }
+
+    lines = segment.calls;
+    for (i = 1; i < n_points; i++)
+        mm += xyz_distance(points[i], points[i - 1]);
+    mm *= repeat;
+
+    fprintf(out, "{\"kinematics\": \"%s\", \"n_axis\": %d, \"points\": %" PRIu32 ", \"repeat\": %" PRIu32 ", \"seed\": %" PRIu32 ",\n",
+            workload.name, N_AXIS, n_points, repeat, workload_seed);
+    fprintf(out, " \"roundtrip_error_mm\": %.6f,\n", max_error);
+    fprintf(out, " \"transform_from_cartesian\": {\"calls\": %" PRIu32 ", \"ns_per_call\": %.1f},\n",
+            inverse.calls, ns_per(&inverse, inverse.calls));
+    fprintf(out, " \"transform_to_cartesian\": {\"calls\": %" PRIu32 ", \"ns_per_call\": %.1f},\n",
+            forward.calls, ns_per(&forward, forward.calls));
+    fprintf(out, " \"segment_line\": {\"lines\": %" PRIu32 ", \"segments\": %" PRIu32 ", \"ns_per_line\": %.1f, \"ns_per_segment\": %.1f, \"segments_per_mm\": %.4f},\n",
+            lines, segments, ns_per(&segment, lines), ns_per(&segment, segments), mm > 0.0 ? segments / mm : 0.0);
+    fprintf(out, " \"check_travel_limits\": {\"calls\": %" PRIu32 ", \"ns_per_call\": %.1f, \"in_limits\": %.4f}}\n",
+            limits.calls, ns_per(&limits, limits.calls), (double)in_limits / limits.calls);
+
+    if (out != stdout)
+        fclose(out);
+
+    return isnan(max_error) ? EXIT_FAILURE : EXIT_SUCCESS;
+}
@@ -40,6 +40,7 @@
 #include "simulator.h"
 #include "eeprom.h"
 #include "grbl_interface.h"
+#include "sim_checkpoint.h"
 
 #include "grbl/grbllib.h"
 
@@ -61,13 +62,19 @@ void print_usage(const char* badarg)
     printf("Usage: \n"
       "%s [options] [time_step] [block_file]\n"
       "  Options:\n"
-      "    -r <report time>   : minimum time step for printing stepper values. Default=0=no print.\n"
+      "    -r <report time>   : minimum time step for printing stepper values. Default=0=no print (interval mode),\n"
+      "                         every tick in change mode, only sets the flush interval in events mode.\n"
+      "    -m <step mode>     : when to print stepper values: interval, change (only if moved) or events.  default = interval\n"
+      "    -d <steps>         : in events mode print every <steps> steps of any axis.  default = 1\n"
       "    -t <time factor>   : multiplier to realtime clock. Default=1.0; 0=\"as fast as possible\"\n"
       "    -g <response file> : file to report responses from grbl.  default = stdout\n"
       "    -b <block file>    : file to report each block executed.  default = stdout\n"
       "    -s <step file>     : file to report each step executed.  default = stderr\n"
       "    -e <EEPROM file>   : file containing grblHAL settings.  default = EEPROM.DAT\n"
+      "    -w <write mode>    : EEPROM file writes: direct, cached or atomic.  default = cached\n"
       "    -p <port>          : port to open raw telnet communication.\n"
+      "    -l <event file>    : file to log received lines, realtime commands, responses and state changes with the sim time.\n"
+      "    -R <checkpoint>    : restore a file written by $CHECKPOINT=<file> before reading input.\n"
       "    -c<comment_char>   : character to print before each line from grbl.  default = '#'\n"
       "    -n                 : no comments before grbl response lines.\n"
       "    -h                 : this help.\n"
@@ -178,6 +185,7 @@ static void exithandler (int signum)
 int main(int argc, char *argv[])
 {
     int positional_args = 0;
+    const char *resume_file = NULL;
 
     //defaults
     args.step_out_file = stderr;
@@ -187,6 +195,7 @@ int main(int argc, char *argv[])
     args.speedup = 1.0f;
 
     args.step_time = 0.0f;
+    args.step_decimation = 1;
     // Get the minimum time step for printing stepper values.
     // If not given or the command line cannot be parsed to a float than
     // step_time= 0.0; This means to not print stepper values at all
@@ -229,6 +238,20 @@ int main(int argc, char *argv[])
                     set_eeprom_name(*argv);
                     break;
 
+                case 'w': //EEPROM write mode
+                    argv++; argc--;
+                    if (!strcmp(*argv, "direct"))
+                        eeprom_set_mode(EEPROM_Direct);
+                    else if (!strcmp(*argv, "cached"))
+                        eeprom_set_mode(EEPROM_Cached);
+                    else if (!strcmp(*argv, "atomic"))
+                        eeprom_set_mode(EEPROM_Atomic);
+                    else {
+                        print_usage(*argv);
+                        return EXIT_FAILURE;
+                    }
+                    break;
+
                 case 's': //Step out file.
                     argv++; argc--;
                     args.step_out_file = fopen(*argv,"w");
@@ -239,6 +262,16 @@ int main(int argc, char *argv[])
                     }
                     break;
 
+                case 'l': //event Log file
+                    argv++; argc--;
+                    args.event_out_file = fopen(*argv,"w");
+                    if (!args.event_out_file) {
+                        perror("fopen");
+                        printf("Error opening : %s\n",*argv);
+                        return EXIT_FAILURE;
+                    }
+                    break;
+
                 case 'g': //Grbl output
                     argv++; argc--;
                     args.serial_out_file = fopen(*argv,"w");
@@ -254,11 +287,39 @@ int main(int argc, char *argv[])
                     args.step_time = atof(*argv);
                     break;
 
+                case 'm':  //step Mode
+                    argv++; argc--;
+                    if (!strcmp(*argv, "interval"))
+                        args.step_mode = Steps_Interval;
+                    else if (!strcmp(*argv, "change"))
+                        args.step_mode = Steps_Change;
+                    else if (!strcmp(*argv, "events"))
+                        args.step_mode = Steps_Events;
+                    else {
+                        print_usage(*argv);
+                        return EXIT_FAILURE;
+                    }
+                    break;
+
+                case 'd':  //step Decimation for events mode
+                    argv++; argc--;
+                    if (atoi(*argv) < 1) { // used as a signed step count, 0 or less would print nothing useful
+                        print_usage(*argv);
+                        return EXIT_FAILURE;
+                    }
+                    args.step_decimation = atoi(*argv);
+                    break;
+
                 case 'p':  // Raw telnet port
                     argv++; argc--;
                     args.port = atoi(*argv);
                     break;
 
+                case 'R':  // Restore checkpoint
+                    argv++; argc--;
+                    resume_file = *argv;
+                    break;
+
                 case 'h':
                     print_usage(NULL);
                     return EXIT_SUCCESS;
@@ -407,6 +468,12 @@ int main(int argc, char *argv[])
         sim.putchar = sim_serial_out;
     }
 
+    if(resume_file)
+        checkpoint_resume_on_start(resume_file);
+
+    if(args.event_out_file)
+        grbl_event_log_start();
+
     //launch a thread with the original grbl code.
     plat_thread_t *th = platform_start_thread(grbl_main_thread); 
     if (!th){
@@ -433,6 +500,8 @@ int main(int argc, char *argv[])
 		fclose(args.step_out_file);
 	if (args.serial_out_file != stdout && args.serial_out_file != args.block_out_file)
 		fclose(args.serial_out_file);
+	if (args.event_out_file)
+		fclose(args.event_out_file);
 
     if(args.port) {
 #ifdef WIN32
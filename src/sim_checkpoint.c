@@ -0,0 +1,515 @@
+/*
+  sim_checkpoint.c - checkpoint and restore of a running simulation
+
+  Part of grblHAL
+
+  grblHAL is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  grblHAL is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with grblHAL. If not, see <http://www.gnu.org/licenses/>.
+*/
+
+/*
+  $CHECKPOINT=<file> writes the state of the controller and of the simulated MCU to a file,
+  $RESUME=<file> loads it back, in this or in a later run of the same executable.
+
+  Both commands are executed by the grbl thread between two lines, so nothing is half parsed
+  and the planner may hold queued blocks of a running program. The state itself is copied
+  by the simulator thread in checkpoint_poll() while the grbl thread waits for it: the stepper
+  "interrupt" runs in that thread, so the segment buffer and position cannot change under it.
+
+  Saved: sys, the G-code parser state, the state machine, planner and segment buffers, the
+  stepper, backlash compensation, RTCP (incl. its trig cache), the MCU timers and pins,
+  step/block output tracking and sim.masterclock.
+  Not saved: settings (must be equal, checked on restore), spindle runtime data, the input
+  and output streams, O-word flow control, non-persistent numbered parameters and G66.
+
+  Resuming a program: restore the checkpoint, then send the lines that followed the
+  $CHECKPOINT line. A file is only accepted by the executable that wrote it.
+
+  $BASELINE keeps the same state in memory, together with the value of every setting, and
+  $RESTORE goes back to it between test cases: settings that changed since are stored again,
+  then the state is restored at once, also while moving or in alarm. Unlike $RESUME the
+  simulated clock keeps running and the step output goes on (the jump to the baseline position
+  is printed). The spindle and coolant are switched off, O-word flow control is cleared,
+  numbered and named parameters are kept.
+*/
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "simulator.h"
+#include "driver.h"
+#include "grbl_interface.h"
+#include "sim_checkpoint.h"
+
+#include "grbl/hal.h"
+#include "grbl/state_machine.h"
+#include "grbl/motion_control.h"
+#include "grbl/stepper.h"
+#include "grbl/kinematics/rtcp.h"
+#include "grbl/ngc_flowctrl.h"
+
+#define CHECKPOINT_SIGNATURE "GRBLCKP1"
+
+typedef struct {
+    char signature[8];
+    uint32_t size[5];       // sizes of key structures, a mismatch means another build
+    uintptr_t data_anchor;  // &sys in the run that saved the checkpoint
+    uintptr_t code_anchor;  // checkpoint_poll in the run that saved the checkpoint
+    uint64_t masterclock;
+} checkpoint_header_t;
+
+typedef enum {
+    Checkpoint_Idle = 0,
+    Checkpoint_Save,
+    Checkpoint_Restore,
+    Checkpoint_Baseline,
+    Checkpoint_Reset
+} checkpoint_request_t;
+
+typedef struct {
+    setting_id_t id;
+    char *value;
+} baseline_setting_t;
+
+static volatile checkpoint_request_t request = Checkpoint_Idle;
+static volatile status_code_t result;
+static FILE *file;              // save
+static uint8_t *image = NULL;   // restore, the whole file
+static size_t image_size, image_pos;
+static intptr_t delta;          // load address of this run - load address of the saving run
+static const char *resume_line = NULL;
+static uint8_t (*host_getchar)(void);
+static uint8_t *baseline = NULL;    // $BASELINE state
+static size_t baseline_size = 0, baseline_allocated = 0;
+static baseline_setting_t *baseline_settings = NULL;
+static uint_fast16_t n_baseline_settings = 0;
+
+static bool cp_write (void *data, size_t size)
+{
+    return fwrite(data, 1, size, file) == size;
+}
+
+static bool cp_append (void *data, size_t size)
+{
+    if(baseline_size + size > baseline_allocated) {
+
+        uint8_t *grown;
+        size_t allocated = baseline_allocated ? baseline_allocated : 4096;
+
+        while(allocated < baseline_size + size)
+            allocated *= 2;
+
+        if((grown = realloc(baseline, allocated)) == NULL)
+            return false;
+
+        baseline = grown;
+        baseline_allocated = allocated;
+    }
+
+    memcpy(baseline + baseline_size, data, size);
+    baseline_size += size;
+
+    return true;
+}
+
+static bool cp_read (void *data, size_t size)
+{
+    if(image_pos + size > image_size)
+        return false;
+
+    memcpy(data, image + image_pos, size);
+    image_pos += size;
+
+    return true;
+}
+
+static void cp_relocate (void *ptr)
+{
+    if(*(void **)ptr)
+        *(void **)ptr = (void *)((uintptr_t)*(void **)ptr + delta);
+}
+
+static void header_init (checkpoint_header_t *header)
+{
+    memset(header, 0, sizeof(checkpoint_header_t));
+    memcpy(header->signature, CHECKPOINT_SIGNATURE, sizeof(header->signature));
+    header->size[0] = sizeof(system_t);
+    header->size[1] = sizeof(parser_state_t);
+    header->size[2] = sizeof(settings_t);
+    header->size[3] = sizeof(plan_block_t);
+    header->size[4] = N_AXIS;
+    header->data_anchor = (uintptr_t)&sys;
+    header->code_anchor = (uintptr_t)checkpoint_poll;
+    header->masterclock = sim.masterclock;
+}
+
+// The G-code parser state, pointers are to static data only.
+static bool gc_checkpoint (checkpoint_t *cp)
+{
+    uint_fast8_t idx;
+
+    if(!cp->data(&gc_state, sizeof(parser_state_t)))
+        return false;
+
+    if(cp->restore) {
+        cp->relocate(&gc_state.spindle);
+        cp->relocate(&gc_state.tool);
+        for(idx = 0; idx < N_SYS_SPINDLE; idx++) {
+            cp->relocate(&gc_state.modal.spindle[idx].hal);
+            cp->relocate(&gc_state.modal.spindle[idx].css);
+        }
+#if NGC_PARAMETERS_ENABLE
+        gc_state.g66_args = NULL;
+#endif
+    }
+
+    return true;
+}
+
+// Runs in the simulator thread, the grbl thread waits in the command.
+static bool checkpoint_modules (checkpoint_t *cp)
+{
+    return cp->data(&sys, sizeof(system_t)) &&
+            gc_checkpoint(cp) &&
+             state_checkpoint(cp) &&
+              plan_checkpoint(cp) &&
+               st_checkpoint(cp) &&
+#if ENABLE_BACKLASH_COMPENSATION
+                mc_checkpoint(cp) &&
+#endif
+#if defined(KINEMATICS_API) && !COREXY && !WALL_PLOTTER && !DELTA_ROBOT && !POLAR_ROBOT
+                 rtcp_checkpoint(cp) &&
+#endif
+                  driver_checkpoint(cp) &&
+                   grbl_checkpoint(cp);
+}
+
+void checkpoint_poll (void)
+{
+    if(request == Checkpoint_Idle)
+        return;
+
+    checkpoint_header_t header;
+    checkpoint_t cp = {
+        .restore = request == Checkpoint_Restore || request == Checkpoint_Reset,
+        .reset = request == Checkpoint_Reset,
+        .data = request == Checkpoint_Restore || request == Checkpoint_Reset ? cp_read : cp_write,
+        .relocate = cp_relocate
+    };
+
+    if(request == Checkpoint_Baseline) {
+
+        baseline_size = 0;
+        cp.data = cp_append;
+        result = checkpoint_modules(&cp) ? Status_OK : Status_FileReadError;
+        if(result != Status_OK)
+            baseline_size = 0;
+
+    } else if(cp.reset) {
+
+        // Same run, nothing to relocate and the clock is not moved.
+        image = baseline;
+        image_size = baseline_size;
+        image_pos = 0;
+        delta = 0;
+
+        if(checkpoint_modules(&cp) && image_pos == image_size)
+            result = Status_OK;
+        else {
+            mc_reset();
+            result = Status_FileReadError;
+        }
+        image = NULL;
+
+    } else if(cp.restore) {
+
+        memcpy(&header, image, sizeof(checkpoint_header_t));
+        image_pos = sizeof(checkpoint_header_t) + sizeof(settings_t);
+        delta = (intptr_t)((uintptr_t)&sys - header.data_anchor);
+
+        sim.clock_jump = (int64_t)(header.masterclock - sim.masterclock);
+        sim.masterclock = header.masterclock;
+        sim.sim_time = (double)sim.masterclock / (double)F_CPU;
+
+        if(checkpoint_modules(&cp) && image_pos == image_size)
+            result = Status_OK;
+        else {
+            // The file was checked by the grbl thread, this is a bug: do not run half a state.
+            mc_reset();
+            result = Status_FileReadError;
+        }
+
+    } else {
+
+        header_init(&header);
+
+        if(cp_write(&header, sizeof(checkpoint_header_t)) &&
+            cp_write(&settings, sizeof(settings_t)) &&
+             checkpoint_modules(&cp))
+            result = Status_OK;
+        else
+            result = Status_FileReadError;
+    }
+
+    request = Checkpoint_Idle;
+}
+
+// Called by the grbl thread, hands the request to the simulator thread and waits until done.
+static status_code_t checkpoint_execute (checkpoint_request_t what)
+{
+    result = Status_OK;
+    request = what;
+
+    while(request != Checkpoint_Idle)
+        platform_sleep(100);
+
+    return result;
+}
+
+static status_code_t checkpoint_save (sys_state_t state, char *args)
+{
+    status_code_t status;
+
+    if(args == NULL || *args == '\0')
+        return Status_InvalidStatement;
+
+    // The open file of a file run or a G66 modal macro call cannot be restored.
+#if NGC_PARAMETERS_ENABLE
+    if(gc_state.file_stream || gc_state.g66_args)
+#else
+    if(gc_state.file_stream)
+#endif
+        return Status_InvalidStatement;
+
+    if((file = fopen(args, "wb")) == NULL)
+        return Status_FileOpenFailed;
+
+    status = checkpoint_execute(Checkpoint_Save);
+
+    if(fclose(file) != 0 && status == Status_OK)
+        status = Status_FileReadError;
+
+    if(status != Status_OK)
+        remove(args);
+
+    return status;
+}
+
+// Reads and checks the file, the state is only touched if it is complete and from this build.
+static status_code_t checkpoint_load (const char *filename)
+{
+    long size;
+    FILE *in;
+    checkpoint_header_t header, expected;
+
+    if((in = fopen(filename, "rb")) == NULL)
+        return Status_FileOpenFailed;
+
+    fseek(in, 0, SEEK_END);
+    size = ftell(in);
+    fseek(in, 0, SEEK_SET);
+
+    if(size < (long)(sizeof(checkpoint_header_t) + sizeof(settings_t)) || (image = malloc(size)) == NULL) {
+        fclose(in);
+        return Status_FileReadError;
+    }
+
+    image_size = fread(image, 1, size, in);
+    fclose(in);
+
+    memcpy(&header, image, sizeof(checkpoint_header_t));
+    header_init(&expected);
+
+    if(image_size != (size_t)size ||
+        memcmp(header.signature, expected.signature, sizeof(header.signature)) ||
+         memcmp(header.size, expected.size, sizeof(header.size)) ||
+          header.code_anchor - header.data_anchor != expected.code_anchor - expected.data_anchor ||
+           memcmp(image + sizeof(checkpoint_header_t), &settings, sizeof(settings_t))) {
+        free(image);
+        image = NULL;
+        return Status_FileReadError;
+    }
+
+    return Status_OK;
+}
+
+static status_code_t checkpoint_restore (sys_state_t state, char *args)
+{
+    status_code_t status;
+
+    if(args == NULL || *args == '\0')
+        return Status_InvalidStatement;
+
+    if(!(state == STATE_IDLE || (state & STATE_ALARM)) || plan_get_current_block() != NULL)
+        return Status_IdleError;
+
+    if((status = checkpoint_load(args)) == Status_OK) {
+        status = checkpoint_execute(Checkpoint_Restore);
+        free(image);
+        image = NULL;
+    }
+
+    return status;
+}
+
+static void baseline_settings_free (void)
+{
+    while(n_baseline_settings)
+        free(baseline_settings[--n_baseline_settings].value);
+
+    free(baseline_settings);
+    baseline_settings = NULL;
+}
+
+static bool baseline_setting_add (const setting_detail_t *setting, uint_fast16_t offset, void *data)
+{
+    char *value;
+    baseline_setting_t *list;
+
+    if(setting->value == NULL || setting->datatype == Format_Password ||
+        (setting->is_available && !setting->is_available(setting, offset)) ||
+         (value = setting_get_value(setting, offset)) == NULL)
+        return true;
+
+    if((list = realloc(baseline_settings, (n_baseline_settings + 1) * sizeof(baseline_setting_t))) == NULL ||
+        (list[n_baseline_settings].value = strdup(value)) == NULL) {
+        if(list)
+            baseline_settings = list;
+        *(bool *)data = false;
+        return false;
+    }
+
+    baseline_settings = list;
+
+    list[n_baseline_settings++].id = (setting_id_t)(setting->id + offset);
+
+    return true;
+}
+
+// Stores the settings changed since $BASELINE, returns the status of the first one that fails.
+static status_code_t baseline_settings_restore (void)
+{
+    char *value, svalue[100];
+    uint_fast16_t idx;
+    const setting_detail_t *setting;
+    status_code_t status, retval = Status_OK;
+
+    for(idx = 0; idx < n_baseline_settings; idx++) {
+        if((setting = setting_get_details(baseline_settings[idx].id, NULL)) == NULL ||
+            (value = setting_get_value(setting, baseline_settings[idx].id - setting->id)) == NULL ||
+             !strcmp(value, baseline_settings[idx].value))
+            continue;
+        strncpy(svalue, baseline_settings[idx].value, sizeof(svalue) - 1);
+        svalue[sizeof(svalue) - 1] = '\0';
+        if((status = settings_store_setting(baseline_settings[idx].id, svalue)) != Status_OK && retval == Status_OK)
+            retval = status;
+    }
+
+    return retval;
+}
+
+static status_code_t baseline_save (sys_state_t state, char *args)
+{
+    bool ok = true;
+    uint_fast16_t idx;
+    status_code_t status;
+    setting_details_t *details = settings_get_details();
+
+    if(state != STATE_IDLE || plan_get_current_block() != NULL)
+        return Status_IdleError;
+
+    // As for $CHECKPOINT, and the spindle and coolant are switched off by $RESTORE.
+#if NGC_PARAMETERS_ENABLE
+    if(gc_state.file_stream || gc_state.g66_args || spindle_is_on() || hal.coolant.get_state().value)
+#else
+    if(gc_state.file_stream || spindle_is_on() || hal.coolant.get_state().value)
+#endif
+        return Status_InvalidStatement;
+
+    baseline_settings_free();
+
+    do {
+        for(idx = 0; ok && idx < details->n_settings; idx++)
+            settings_iterator(&details->settings[idx], baseline_setting_add, &ok);
+    } while(ok && (details = details->next));
+
+    if(!ok) {
+        baseline_settings_free();
+        return Status_FileReadError;
+    }
+
+    if((status = checkpoint_execute(Checkpoint_Baseline)) != Status_OK)
+        baseline_settings_free();
+
+    return status;
+}
+
+static status_code_t baseline_restore (sys_state_t state, char *args)
+{
+    status_code_t status, settings_status;
+
+    if(baseline_size == 0)
+        return Status_InvalidStatement;
+
+    // Settings first: their change handlers may touch the state that is restored next.
+    settings_status = baseline_settings_restore();
+
+    if((status = checkpoint_execute(Checkpoint_Reset)) == Status_OK) {
+        spindle_all_off(true);
+        hal.coolant.set_state((coolant_state_t){0});
+#if NGC_EXPRESSIONS_ENABLE
+        ngc_flowctrl_init();
+#endif
+        status = settings_status;
+    }
+
+    return status;
+}
+
+static uint8_t resume_getchar (void)
+{
+    if(*resume_line)
+        return (uint8_t)*resume_line++;
+
+    sim.getchar = host_getchar;
+
+    return sim.getchar();
+}
+
+void checkpoint_resume_on_start (const char *filename)
+{
+    static char line[300];
+
+    snprintf(line, sizeof(line), "$RESUME=%s\r", filename);
+    resume_line = line;
+    host_getchar = sim.getchar;
+    sim.getchar = resume_getchar;
+}
+
+void checkpoint_init (void)
+{
+    static const sys_command_t checkpoint_command_list[] = {
+        {"CHECKPOINT", checkpoint_save, { .allow_blocking = On }, { .str = "$CHECKPOINT=<file> - save the simulation state to <file>" } },
+        {"RESUME", checkpoint_restore, {}, { .str = "$RESUME=<file> - restore the simulation state saved by $CHECKPOINT" } },
+        {"BASELINE", baseline_save, { .noargs = On }, { .str = "save the current state and settings as the baseline for $RESTORE" } },
+        {"RESTORE", baseline_restore, { .noargs = On, .allow_blocking = On }, { .str = "go back to the $BASELINE state and settings" } },
+    };
+
+    static sys_commands_t checkpoint_commands = {
+        .n_commands = sizeof(checkpoint_command_list) / sizeof(sys_command_t),
+        .commands = checkpoint_command_list
+    };
+
+    system_register_commands(&checkpoint_commands);
+}
@@ -0,0 +1,33 @@
+/*
+  sim_checkpoint.h - checkpoint and restore of a running simulation
+
+  Part of grblHAL
+
+  grblHAL is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  grblHAL is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with grblHAL. If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef _SIM_CHECKPOINT_H_
+#define _SIM_CHECKPOINT_H_
+
+// Registers the $CHECKPOINT and $RESUME commands, called from driver_init().
+void checkpoint_init (void);
+
+// Executes a pending save or restore, called from the simulator thread once per tick.
+void checkpoint_poll (void);
+
+// Restores filename as soon as the simulator reads input (-R option),
+// the $RESUME command is sent ahead of any input from the host.
+void checkpoint_resume_on_start (const char *filename);
+
+#endif
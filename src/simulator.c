@@ -107,6 +107,13 @@ void sim_loop (void)
             // do app-specific per-tick processing
             sim.on_tick();
 
+            // a checkpoint restore moves the clock, keep the schedule relative to it
+            if (sim.clock_jump) {
+                target_ticks += sim.clock_jump;
+                next_byte_tick += sim.clock_jump;
+                sim.clock_jump = 0;
+            }
+
             if (read_serial) {
                 // baud rate is for symbols and UART has 1 bit per symbol.
                 // with a typical 8N1 serial, we need 10 symbols per byte
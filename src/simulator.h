@@ -36,6 +36,7 @@ typedef struct sim_vars {
     double sim_time;  // current time of the simulation, in seconds since start.
     uint8_t started;  // don't start timers until first char recieved.
     enum {exit_NO, exit_REQ, exit_OK} exit;
+    int64_t clock_jump; // set when masterclock is moved by a checkpoint restore, sim_loop moves its schedule along
     float speedup; // current factor how much faster/slower sim time is compared to real time
     int32_t baud_ticks;
 #ifdef WIN32
@@ -53,13 +54,23 @@ typedef struct sim_vars {
 
 extern sim_vars_t sim;
 
+// When print_steps writes a line, block boundaries are always written
+typedef enum {
+    Steps_Interval = 0, // every step_time while a block is executing
+    Steps_Change,       // every step_time, only if sys.position changed
+    Steps_Events        // every step_decimation steps of any axis
+} step_mode_t;
+
 typedef struct arg_vars {
     // Output file handles
     FILE *block_out_file;
     FILE *step_out_file;
     FILE *serial_out_file;
+    FILE *event_out_file;   // host input/output and state changes with the sim time, NULL if not logged
     float speedup;          // desired factor how much faster/slower sim time is compared to real time. 0 means "a fast at possible"
     double step_time;       // Minimum time step for printing stepper values, in sim time. Given by user via command line
+    step_mode_t step_mode;  // When to print stepper values, see step_mode_t
+    uint32_t step_decimation; // Steps of one axis between prints in Steps_Events mode
     uint8_t comment_char;   // Char to prefix comments; default  '#' 
     uint16_t port;          // Port number for telnet communication
 } arg_vars_t;
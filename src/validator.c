@@ -26,16 +26,26 @@
 #include <stdlib.h>
 #include <string.h>
 #include <errno.h>
+#include <math.h>
+#include <time.h>
+#ifdef _WIN32
+#include <io.h>
+#else
+#include <unistd.h>
+#endif
 
 #include "platform.h"
 #include "eeprom.h"
+#include "fs_host.h"
 #include "grbl_eeprom_extensions.h"
 #include "grbl/hal.h"
 #include "grbl/report.h"
 #include "grbl/protocol.h"
 #include "grbl/protocol.h"
 #include "grbl/nvs_buffer.h"
+#include "grbl/ngc_expr.h"
 #include "grbl/state_machine.h"
+#include "grbl/kinematics/rtcp.h"
 
 typedef struct arg_vars {
     // Output file handles
@@ -43,12 +53,23 @@ typedef struct arg_vars {
     FILE *output_file;
     uint8_t echo;
     uint8_t silent;
+    uint8_t cache_stats;
+    uint8_t all_errors;
+    char macro_dir[512];
 } arg_vars_t;
 
 arg_vars_t args;
 const char* progname;
 uint8_t exit_code = 0;
 
+// Input is read in blocks, diagnostics mode needs the line number of each error
+#define INPUT_BUFFER_SIZE 65536
+
+static char input_buffer[INPUT_BUFFER_SIZE];
+static size_t input_length = 0, input_pos = 0;
+static uint32_t input_lines = 0, n_errors = 0, n_alarms = 0, n_blocks = 0;
+static int32_t last_char = '\n';
+
 void print_usage (const char* badarg)
 {
     if (badarg)
@@ -60,17 +81,49 @@ void print_usage (const char* badarg)
      "    -o <output file> : use output file instead of stdout\n"
      "    -e        : echo input to output\n"
      "    -s        : silent, no output only return code \n"
+     "    -d <dir>  : directory for named subroutines (o<name> call), default input file directory\n"
+     "    -c        : print expression cache statistics on exit\n"
+     "    -a        : diagnostics mode, continue after errors and report every failing line\n"
+     "                as JSON (one object per line) followed by a summary with planner blocks and lines/s\n"
      "\n"
      "  Parses gcode from stdin or input line, prints grbl's expected response.\n"
      "\n"
-     "  Returns 0 on successs, or line number of error.\n"
+     "  Returns 0 on successs, or status code of (first) error.\n"
      "\n",
      progname);
 }
 
+// Current line of the input file, a line is counted when its terminating newline is read
+static uint32_t input_line (void)
+{
+    return input_lines + (last_char == '\n' ? 0 : 1);
+}
+
+static void print_json_string (const char *s)
+{
+    fputc('"', args.output_file);
+    while (*s) {
+        if (*s == '"' || *s == '\\')
+            fputc('\\', args.output_file);
+        if ((uint8_t)*s >= ' ')
+            fputc(*s, args.output_file);
+        s++;
+    }
+    fputc('"', args.output_file);
+}
+
 status_code_t validator_report_status_message (status_code_t status_code)
 {
-    if (status_code && !exit_code) {
+    if (status_code && args.all_errors) {
+        n_errors++;
+        if (!exit_code)
+            exit_code = status_code;
+        fprintf(args.output_file, "{\"line\": %" PRIu32 ", \"status\": %d, \"message\": ", input_line(), status_code);
+        print_json_string(errors_get_description(status_code));
+        fputs("}\n", args.output_file);
+        // The core skips all following blocks until the error is cleared
+        gc_state.last_error = Status_OK;
+    } else if (status_code && !exit_code) {
         printf("EXITING: error %d, %s\n", status_code, errors_get_description(status_code));
         exit_code = status_code;
         sys.abort = 1;
@@ -79,10 +132,61 @@ status_code_t validator_report_status_message (status_code_t status_code)
     return status_code;
 }
 
+// Nothing can be executed after an alarm, report it and stop
+static alarm_code_t validator_report_alarm_message (alarm_code_t alarm_code)
+{
+    n_alarms++;
+    fprintf(args.output_file, "{\"line\": %" PRIu32 ", \"alarm\": %d}\n", input_line(), alarm_code);
+    sys.abort = 1;
+
+    return alarm_code;
+}
+
+// Nothing is executed, count and drop planned motions. plan_reset() relinks
+// the whole block buffer so only call it when there is something to drop.
+// It also clears the planner position, the machine is moved to the planned
+// position first so the next motion does not start from machine zero.
+static void drop_planned (void)
+{
+    if (plan_get_current_block()) {
+        uint_fast8_t idx = N_AXIS;
+        float *position = plan_get_position();
+        do {
+            idx--;
+            sys.position[idx] = lroundf(position[idx] * settings.axis[idx].steps_per_mm);
+        } while(idx);
+        n_blocks += plan_get_buffer_size() - plan_get_block_buffer_available();
+        plan_reset();
+        plan_sync_position();
+    }
+}
+
 // Read fom input
 int32_t serial_read()
 {
-    int32_t data = fgetc(args.input_file);
+    int32_t data;
+    ssize_t n_read;
+
+    // Drop planned motions before they can start a cycle
+    drop_planned();
+
+    if (sys.abort)
+        return SERIAL_NO_DATA;
+
+    if (input_pos == input_length) {
+        input_pos = 0;
+        // read() returns what is available, a pipe or FIFO gets each response
+        // as soon as its line arrives (fread() would wait for 64 KiB or EOF)
+        do {
+            n_read = read(fileno(args.input_file), input_buffer, INPUT_BUFFER_SIZE);
+        } while (n_read < 0 && errno == EINTR);
+        if ((input_length = n_read > 0 ? (size_t)n_read : 0) == 0) {
+            sys.abort = 1;
+            return SERIAL_NO_DATA;
+        }
+    }
+
+    data = (uint8_t)input_buffer[input_pos++];
 
     if (data == PLATFORM_EXTRA_CR)
         return(0);
@@ -90,16 +194,38 @@ int32_t serial_read()
     if (args.echo)
         fputc(data, args.output_file); 
 
-    plan_reset();
-
-    if (sys.abort || feof(args.input_file) || data == 0x06 || data == -1) { 
+    if (data == 0x06) {
         sys.abort = 1;
         return SERIAL_NO_DATA;
     }
 
+    if ((last_char = data) == '\n')
+        input_lines++;
+
     return data;
 }
 
+// Nothing is executed, drop planned motions. Called at the end of each line, while
+// waiting for planner buffer space and when reading from a file stream (named subroutine).
+// A program pause (M0, M1, M60) is a feed hold waiting for cycle start, resume it at once.
+static void validator_execute_realtime (sys_state_t state)
+{
+    drop_planned();
+
+    if (sys.suspend && state == STATE_HOLD)
+        system_set_exec_state_flag(EXEC_CYCLE_START);
+}
+
+static atc_status_t atc_get_state (void)
+{
+    return ATC_None;
+}
+
+static bool serial_connected (void)
+{
+    return true;
+}
+
 // Write to output
 void serial_write (const char *data)
 {
@@ -113,12 +239,16 @@ void serial_write (const char *data)
 int main(int argc, char *argv[])
 {
     int positional_args=0;
+    bool macro_dir_set = false;
 
     //defaults
     args.input_file = stdin;
     args.output_file = stdout;
     args.echo = 0;
     args.silent = 0;
+    args.cache_stats = 0;
+    args.all_errors = 0;
+    strcpy(args.macro_dir, ".");
 
     set_eeprom_name("EEPROM.DAT");
 
@@ -137,6 +267,15 @@ int main(int argc, char *argv[])
                     args.silent = 1;
                     break;
 
+                case 'c': //expression cache statistics
+                    args.cache_stats = 1;
+                    break;
+
+                case 'a': //diagnostics mode, only JSON output
+                    args.all_errors = 1;
+                    args.silent = 1;
+                    break;
+
                 case 'o': //output file
                     argv++; argc--;
                     args.output_file = fopen(*argv,"w");
@@ -147,6 +286,16 @@ int main(int argc, char *argv[])
                     }
                     break;
 
+                case 'd': //macro directory
+                    argv++; argc--;
+                    if (argc < 1 || strlen(*argv) >= sizeof(args.macro_dir)) {
+                        print_usage(NULL);
+                        return EXIT_FAILURE;
+                    }
+                    strcpy(args.macro_dir, *argv);
+                    macro_dir_set = true;
+                    break;
+
                 case 'h':
                     print_usage(NULL);
                     return EXIT_SUCCESS;
@@ -166,6 +315,15 @@ int main(int argc, char *argv[])
                         printf("Error opening : %s\n",*argv);
                         return EXIT_FAILURE;
                     }
+                    if (!macro_dir_set && strlen(*argv) < sizeof(args.macro_dir)) {
+                        char *sep = strrchr(*argv, '/');
+                        if (!sep)
+                            sep = strrchr(*argv, '\\');
+                        if (sep) {
+                            strncpy(args.macro_dir, *argv, sep - *argv + 1);
+                            args.macro_dir[sep - *argv + 1] = '\0';
+                        }
+                    }
                     break;
 
                 default:
@@ -177,7 +335,7 @@ int main(int argc, char *argv[])
 
     // Clear all and set some core function pointers
     memset(&grbl, 0, sizeof(grbl_t));
-    grbl.on_execute_realtime = protocol_execute_noop;
+    grbl.on_execute_realtime = validator_execute_realtime;
     grbl.enqueue_gcode = protocol_enqueue_gcode;
     grbl.on_get_errors = errors_get_details;
 
@@ -188,6 +346,7 @@ int main(int argc, char *argv[])
     hal.irq_enable = dummy_handler;
     hal.irq_disable = dummy_handler;
     hal.nvs.size = GRBL_NVS_SIZE;
+    hal.tool.atc_get_state = atc_get_state;
 
     hal.nvs.type = NVS_EEPROM;
     hal.nvs.get_byte = eeprom_get_char;
@@ -200,24 +359,54 @@ int main(int argc, char *argv[])
 
     memset(&sys, 0, sizeof(system_t));
     sys.cold_start = true;
+    sys.driver_started = true; // as grbl_enter() does, else task_execute_on_startup() never returns
 
     // TODO: read settings from EEPROM.dat if exists?
     nvs_buffer_alloc();
+#ifdef KINEMATICS_API
+    rtcp_5axis_init(); // as grbl_enter(), else mc_line() calls a NULL kinematics.segment_line
+#endif
     nvs_buffer_init();
     settings_init();
+    fs_host_mount("/", args.macro_dir);
 
     report_init_fns();
     grbl.report.status_message = validator_report_status_message;
+    if (args.all_errors)
+        grbl.report.alarm_message = validator_report_alarm_message;
  //   grbl.report.feedback_message = report_feedback_message;
 
     hal.stream.read = serial_read;
     hal.stream.write = serial_write;
     hal.stream.write_all = serial_write;
+    hal.stream.is_connected = serial_connected;
 
 // state_set(STATE_CHECK_MODE);
         
     gc_init(false);
+    plan_reset(); // allocates the block buffer, as grbl_enter()
+    st_reset();   // links the segment buffer, M0/M1/M60 feed holds call st_prep_buffer()
+
+    clock_t start = clock();
+
     protocol_main_loop();
 
+    if (args.all_errors) {
+        double elapsed = (double)(clock() - start) / CLOCKS_PER_SEC;
+        fprintf(args.output_file, "{\"lines\": %" PRIu32 ", \"errors\": %" PRIu32 ", \"alarms\": %" PRIu32 ", \"blocks\": %" PRIu32 ", \"time\": %.6f, \"lines_per_sec\": %.0f}\n",
+                input_line(), n_errors, n_alarms, n_blocks, elapsed, elapsed > 0.0 ? input_line() / elapsed : 0.0);
+    }
+
+    eeprom_close();
+
+#if NGC_EXPRESSIONS_ENABLE
+    if (args.cache_stats) {
+        ngc_expr_cache_stats_t stats;
+        ngc_expr_cache_stats(&stats);
+        fprintf(args.output_file, "Expression cache: %" PRIu32 " hits, %" PRIu32 " misses, %" PRIu32 " evictions, %" PRIu32 " entries\n",
+                stats.hits, stats.misses, stats.evictions, stats.entries);
+    }
+#endif
+
     return exit_code;
 }
@@ -60,6 +60,12 @@ static void stepperPulseStart (stepper_t *stepper)
 {
 }
 
+// Nothing runs in real time, delayed tasks (stepper deenergize after st_reset()) never expire
+static uint32_t getElapsedTicks (void)
+{
+    return 0;
+}
+
 static void limitsEnable (bool on, axes_signals_t homing_cycle)
 {
 }
@@ -159,6 +165,7 @@ bool driver_init ()
     hal.rx_buffer_size = RX_BUFFER_SIZE;
     hal.f_step_timer = F_CPU;
     hal.delay_ms = driver_delay_ms;
+    hal.get_elapsed_ticks = getElapsedTicks;
     hal.settings_changed = settings_changed;
 
     hal.stepper.wake_up = stepperWakeUp;
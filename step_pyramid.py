@@ -0,0 +1,396 @@
+# -*- coding: ascii -*-
+"""
+Trazas de pasos largas (step.out) en formato columnar con piramide min/max
+=========================================================================
+Un step.out de varias horas (grblHAL_sim -s, lineas "t pasos...") tiene
+decenas de millones de filas: cualquier visor que lo cargue entero se queda
+sin memoria o tarda minutos. Este script lo convierte una vez a un archivo
+binario que se lee con numpy.memmap sin cargarlo:
+
+    time      float64 [n]           tiempo simulado de cada muestra
+    steps     int32   [ejes, n]     una columna contigua por eje
+    min_<k>   int32   [ejes, n_k]   minimo de cada grupo de 2^k muestras
+    max_<k>   int32   [ejes, n_k]   maximo de cada grupo de 2^k muestras
+    block_number, block_row  int64 [m]
+                                    lineas "# block number N" de print_steps
+                                    y fila de la primera muestra tras ellas
+
+Los niveles k = 1, 2, ... se construyen hasta que queda un solo grupo (en
+total ocupan menos que las propias muestras). Para dibujar una ventana
+[t0, t1] con 'width' pixeles se busca la ventana en 'time' (busqueda binaria
+sobre el memmap) y se elige el nivel con a lo sumo 'width' grupos en ella:
+se leen O(width) valores por eje, sin importar la longitud de la traza. La
+envolvente es exacta (ningun pico se pierde), salvo que los grupos de los
+extremos pueden incluir hasta 2^k - 1 muestras fuera de la ventana.
+
+Las muestras no estan equiespaciadas en tiempo (-m change / -m events solo
+escriben cuando hay movimiento): los grupos son de filas, no de tiempo, y el
+tiempo de cada grupo es el de su primera muestra.
+
+Uso:
+    python step_pyramid.py convert step.out traza.stp
+    python step_pyramid.py info traza.stp
+    python step_pyramid.py window traza.stp 120 180 --width 1920 --json ventana.json
+    python step_pyramid.py blocks traza.stp 120 180
+
+Desde otro script (visor):
+    from step_pyramid import StepTrace
+    trace = StepTrace("traza.stp")
+    t, lo, hi, level = trace.window(120.0, 180.0, 1920)
+    numbers, times = trace.blocks(120.0, 180.0)
+
+Requiere NumPy.
+
+Codigo de salida:
+    0 = correcto
+    2 = error de ejecucion (archivo no encontrado o con formato invalido)
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    print("[ERROR] step_pyramid.py requiere NumPy (pip install numpy)")
+    sys.exit(2)
+
+# =====================================================================
+# CONFIGURACION
+# =====================================================================
+
+MAGIC = b"GRBLSTP1"
+ALIGN = 64               # bytes; inicio de cada seccion del archivo
+READ_BYTES = 1 << 24     # bytes de step.out leidos por bloque al convertir
+CHUNK = 1 << 22          # muestras por bloque al construir los niveles (par)
+AXIS_NAMES = "XYZABCUVW"
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+# =====================================================================
+# CONVERSION step.out -> columnas
+# =====================================================================
+
+def _parse_chunk(data, n_axes):
+    """Convierte lineas completas de step.out en (t, pasos, comentarios).
+
+    comentarios = [(muestras antes de la linea, texto)], en orden.
+    """
+    comments = []
+    if b"#" in data:
+        rows = []
+        for line in data.split(b"\n"):
+            if line[:1] == b"#":
+                comments.append((len(rows), line.decode(errors="replace")))
+            elif line.strip():
+                rows.append(line)
+        data = b"\n".join(rows)
+    values = np.array(data.split(), dtype=np.float64) if data.strip() else np.zeros(0)
+    if len(values) % (n_axes + 1):
+        raise ValueError("linea de step.out con un numero de ejes distinto de %d" % n_axes)
+    values = values.reshape(-1, n_axes + 1)
+    return values, comments
+
+
+def _count_axes(path):
+    """Numero de ejes de la primera linea de muestra."""
+    with open(path, "rb") as f:
+        for line in f:
+            if line[:1] != b"#" and line.strip():
+                return len(line.split()) - 1
+    raise ValueError("%s no tiene muestras" % path)
+
+
+def _read_columns(path, tmp):
+    """Primera pasada: step.out -> archivos temporales por columna + bloques."""
+    n_axes = _count_axes(path)
+    files = [open(os.path.join(tmp, "col%d" % i), "wb") for i in range(n_axes + 1)]
+    numbers, rows = [], []
+    n = 0
+    rest = b""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(READ_BYTES)
+                if data:
+                    data = rest + data
+                    cut = data.rfind(b"\n") + 1
+                    data, rest = data[:cut], data[cut:]
+                else:
+                    data, rest = rest, b""
+                if not data:
+                    break
+                values, comments = _parse_chunk(data, n_axes)
+                for row, text in comments:
+                    if "block number" in text:
+                        numbers.append(int(text.split()[-1]))
+                        rows.append(n + row)
+                values[:, 0].tofile(files[0])
+                for i in range(n_axes):
+                    values[:, i + 1].astype(np.int32).tofile(files[i + 1])
+                n += len(values)
+    finally:
+        for f in files:
+            f.close()
+    return n_axes, n, numbers, rows
+
+
+def _levels(n):
+    """Tamano de cada nivel k = 1, 2, ... (grupos de 2^k muestras)."""
+    sizes = []
+    while n > 1:
+        n = (n + 1) // 2
+        sizes.append(n)
+    return sizes
+
+
+def _layout(n_axes, n, n_blocks):
+    """Secciones del archivo: {nombre: (offset, dtype, shape)} relativas a los datos."""
+    sections = {}
+    offset = 0
+
+    def add(name, dtype, shape):
+        nonlocal offset
+        sections[name] = (offset, dtype, shape)
+        offset = _align(offset + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+
+    add("time", "<f8", (n,))
+    add("steps", "<i4", (n_axes, n))
+    for k, size in enumerate(_levels(n), 1):
+        add("min_%d" % k, "<i4", (n_axes, size))
+        add("max_%d" % k, "<i4", (n_axes, size))
+    add("block_number", "<i8", (n_blocks,))
+    add("block_row", "<i8", (n_blocks,))
+    return sections, offset
+
+
+def _reduce(src, dst, op):
+    """dst[i] = op(src[2i], src[2i+1]) por bloques; con n impar la ultima se repite."""
+    n = src.shape[-1]
+    for start in range(0, n, CHUNK):
+        a = np.asarray(src[..., start:start + CHUNK])
+        if a.shape[-1] % 2:
+            a = np.concatenate([a, a[..., -1:]], axis=-1)
+        a = a.reshape(a.shape[:-1] + (-1, 2))
+        dst[..., start // 2:start // 2 + a.shape[-2]] = op(a[..., 0], a[..., 1])
+
+
+def convert(src, dst):
+    """Convierte step.out en el archivo de dst. Retorna la informacion del header."""
+    tmp = tempfile.mkdtemp(prefix="step_pyramid_", dir=os.path.dirname(os.path.abspath(dst)))
+    try:
+        n_axes, n, numbers, rows = _read_columns(src, tmp)
+        sections, size = _layout(n_axes, n, len(numbers))
+        header = {"version": 1, "axes": n_axes, "rows": n, "blocks": len(numbers),
+                  "levels": len(_levels(n)), "source": os.path.basename(src),
+                  "sections": dict((k, [o, d, list(s)]) for k, (o, d, s) in sections.items())}
+        text = json.dumps(header).encode()
+        data_offset = _align(len(MAGIC) + 8 + len(text))
+        header["data_offset"] = data_offset
+
+        with open(dst, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.array([data_offset, len(text)], dtype="<u4").tobytes())
+            f.write(text)
+            f.truncate(data_offset + size)
+            for i in range(n_axes + 1):
+                offset = sections["time" if i == 0 else "steps"][0]
+                if i:
+                    offset += (i - 1) * n * 4
+                f.seek(data_offset + offset)
+                with open(os.path.join(tmp, "col%d" % i), "rb") as col:
+                    shutil.copyfileobj(col, f, READ_BYTES)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    trace = StepTrace(dst, mode="r+")
+    prev_min = prev_max = trace.steps
+    for k in range(1, trace.n_levels + 1):
+        cur_min, cur_max = trace._section("min_%d" % k), trace._section("max_%d" % k)
+        _reduce(prev_min, cur_min, np.minimum)
+        _reduce(prev_max, cur_max, np.maximum)
+        prev_min, prev_max = cur_min, cur_max
+    trace._section("block_number")[:] = numbers
+    trace._section("block_row")[:] = rows
+    trace.flush()
+    return header
+
+
+# =====================================================================
+# LECTURA
+# =====================================================================
+
+class StepTrace:
+    """Archivo de convert() abierto con numpy.memmap (no se carga en memoria)."""
+
+    def __init__(self, path, mode="r"):
+        self.path = path
+        self.mode = mode
+        with open(path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError("%s no es un archivo de step_pyramid.py" % path)
+            data_offset, length = np.frombuffer(f.read(8), dtype="<u4")
+            self.header = json.loads(f.read(int(length)).decode())
+        self.data_offset = int(data_offset)
+        self.n_axes = self.header["axes"]
+        self.n_rows = self.header["rows"]
+        self.n_levels = self.header["levels"]
+        self._maps = {}
+        self.time = self._section("time")
+        self.steps = self._section("steps")
+
+    def _section(self, name):
+        if name not in self._maps:
+            offset, dtype, shape = self.header["sections"][name]
+            if 0 in shape:
+                self._maps[name] = np.zeros(shape, dtype=dtype)
+            else:
+                self._maps[name] = np.memmap(self.path, dtype=dtype, mode=self.mode,
+                                             offset=self.data_offset + offset, shape=tuple(shape))
+        return self._maps[name]
+
+    def flush(self):
+        for m in self._maps.values():
+            if isinstance(m, np.memmap):
+                m.flush()
+
+    def level(self, k):
+        """(min, max) del nivel k, [ejes, n_k]; k=0 son las muestras."""
+        if k == 0:
+            return self.steps, self.steps
+        return self._section("min_%d" % k), self._section("max_%d" % k)
+
+    def rows(self, t0, t1):
+        """Filas [lo, hi) con t0 <= time <= t1."""
+        return (int(np.searchsorted(self.time, t0, "left")),
+                int(np.searchsorted(self.time, t1, "right")))
+
+    def window(self, t0, t1, width):
+        """Envolvente de [t0, t1] con a lo sumo 'width' grupos por eje.
+
+        Retorna (t, min, max, k): t [g] tiempo de la primera muestra de cada
+        grupo, min/max [ejes, g] en pasos, k el nivel usado (grupos de 2^k).
+        """
+        lo, hi = self.rows(t0, t1)
+        if hi <= lo:
+            empty = np.zeros((self.n_axes, 0), dtype=np.int32)
+            return np.zeros(0), empty, empty, 0
+        k = 0
+        while k < self.n_levels and ((hi - 1) >> k) - (lo >> k) + 1 > max(1, width):
+            k += 1
+        b0, b1 = lo >> k, ((hi - 1) >> k) + 1
+        mins, maxs = self.level(k)
+        t = np.array(self.time[b0 << k:min(b1 << k, self.n_rows):1 << k])
+        return t, np.array(mins[:, b0:b1]), np.array(maxs[:, b0:b1]), k
+
+    def blocks(self, t0=None, t1=None):
+        """Limites de bloque entre t0 y t1: (numeros, tiempos).
+
+        El tiempo es el de la ultima muestra antes de la linea '# block number',
+        que print_steps escribe justo en el cambio de bloque (la primera
+        muestra posterior si es el primero).
+        """
+        rows = np.asarray(self._section("block_row"))
+        numbers = np.asarray(self._section("block_number"))
+        if self.n_rows == 0:
+            return numbers[:0], np.zeros(0)
+        times = np.asarray(self.time[np.clip(rows - 1, 0, self.n_rows - 1)])
+        times = np.where(rows > 0, times, self.time[0])
+        keep = np.ones(len(rows), dtype=bool)
+        if t0 is not None:
+            keep &= times >= t0
+        if t1 is not None:
+            keep &= times <= t1
+        return numbers[keep], times[keep]
+
+
+# =====================================================================
+# CLI
+# =====================================================================
+
+def _axis_name(i):
+    return AXIS_NAMES[i] if i < len(AXIS_NAMES) else "eje%d" % i
+
+
+def print_info(trace):
+    h = trace.header
+    print("%s: %d muestras, %d ejes, %d bloques, %d niveles" % (
+        trace.path, h["rows"], h["axes"], h["blocks"], h["levels"]))
+    if trace.n_rows:
+        print("  tiempo: %.5f - %.5f s" % (trace.time[0], trace.time[-1]))
+        top_min, top_max = trace.level(trace.n_levels)
+        for i in range(trace.n_axes):
+            print("  %-4s pasos %d .. %d" % (_axis_name(i), top_min[i].min(), top_max[i].max()))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="step.out a formato columnar con piramide min/max para visores",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("mode", choices=["convert", "info", "window", "blocks"])
+    parser.add_argument("file", metavar="ARCHIVO", help="step.out (convert) o archivo convertido")
+    parser.add_argument("args", nargs="*", metavar="ARG",
+                        help="convert: SALIDA; window/blocks: T0 T1 en segundos simulados")
+    parser.add_argument("--width", type=int, default=1920, metavar="N",
+                        help="window: grupos (pixeles) como maximo (default: %(default)s)")
+    parser.add_argument("--json", metavar="RUTA", help="window/blocks: guardar el resultado en JSON")
+    args = parser.parse_args()
+
+    try:
+        if args.mode == "convert":
+            if len(args.args) != 1:
+                parser.error("convert necesita ARCHIVO SALIDA")
+            t0 = time.perf_counter()
+            convert(args.file, args.args[0])
+            elapsed = time.perf_counter() - t0
+            trace = StepTrace(args.args[0])
+            print_info(trace)
+            print("  convertido en %.1f s (%.0f muestras/s), %.1f MB" % (
+                elapsed, trace.n_rows / elapsed if elapsed > 0 else 0.0,
+                os.path.getsize(args.args[0]) / 1e6))
+            return
+
+        trace = StepTrace(args.file)
+        if args.mode == "info":
+            print_info(trace)
+            return
+
+        if len(args.args) not in (0, 2):
+            parser.error("%s necesita T0 T1 o nada (toda la traza)" % args.mode)
+        t0, t1 = (float(v) for v in args.args) if args.args else (-np.inf, np.inf)
+
+        if args.mode == "window":
+            t, lo, hi, k = trace.window(t0, t1, args.width)
+            print("%d grupos de %d muestras (nivel %d)" % (len(t), 1 << k, k))
+            result = {"level": k, "time": t.tolist(),
+                      "min": dict((_axis_name(i), lo[i].tolist()) for i in range(trace.n_axes)),
+                      "max": dict((_axis_name(i), hi[i].tolist()) for i in range(trace.n_axes))}
+        else:
+            numbers, times = trace.blocks(t0, t1)
+            for number, t in zip(numbers[:20], times[:20]):
+                print("  %12.5f  bloque %d" % (t, number))
+            if len(numbers) > 20:
+                print("  ... %d bloques en total" % len(numbers))
+            result = {"block_number": numbers.tolist(), "time": times.tolist()}
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(result, f)
+            print("JSON: %s" % args.json)
+    except (OSError, ValueError) as e:
+        print("[ERROR] %s" % e)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,19 @@ Ejecutar un grupo especifico:
     python testing.py -realtime          # Realtime report |RTCP:ON/OFF|
     python testing.py -l                 # Lista todos los grupos disponibles
 
+Metricas de tiempo:
+    Al terminar se imprime p50/p95/max de latencia por tipo de comando
+    ($RTCP, G0, M451, $6xx=, realtime; medida desde el envio hasta el primer
+    byte de respuesta, tambien si llega durante la pausa fija), los tests
+    mas lentos y el tiempo total dormido vs esperando al simulador. Los datos completos se
+    guardan en testing_timing.json (cambiar con --timing-json RUTA).
+
+Reset entre tests:
+    setup() guarda el estado de referencia con $BASELINE (origen, M451 y los
+    settings de testing_config.ini); reset_position y recover_alarm vuelven a
+    el con $RESTORE, que responde ok cuando ha terminado. Con un simulador sin
+    $BASELINE se usa la secuencia anterior (M451, G0, wait_stable, Ctrl-X, $X).
+
 Guardar resultado a archivo:
     python testing.py > resultado.txt 2>&1
     python testing.py -v > debug_completo.txt 2>&1
@@ -28,16 +41,52 @@ Guardar resultado a archivo:
 Combinar grupos:
     python testing.py -matematicas -singularidad
 
+Cache de resultados (testing_cache.json):
+    Cada grupo declara sus entradas (fuentes C, binario del simulador,
+    testing_config.ini completo y su propio codigo). Si el hash de
+    entradas coincide con una ejecucion previa que paso, el grupo no se
+    ejecuta y se reporta desde cache.
+    python testing.py --no-cache         # Ejecuta todo (refresca la cache)
+    python testing.py --only-changed     # Solo grupos con entradas cambiadas
+
 Codigo de salida:
     0 = todos los tests pasaron
     1 = al menos un test fallo
     2 = error de ejecucion (simulador no arranca, conexion fallida, etc.)
+    3 = tests OK pero --compare detecto una regresion de rendimiento
+
+Barrido de geometrias (--sweep):
+    Ejecuta matematicas/coherencia/feedrate (o los grupos indicados) para
+    cada combinacion de settings, repartidas entre N simuladores que se
+    reutilizan entre geometrias (solo se reenvian los $ que cambian).
+    python testing.py --sweep "$642=150,210 $643=0,5 $100=250,400"
+    python testing.py --sweep "$642=100:250:50" --workers 2 -matematicas
+    python testing.py --sweep @geometrias.txt
+
+Latencia de jog (--jog [N]):
+    Simula un pendant: mientras la tecla esta pulsada envia un $J= cada 50 ms
+    y al soltarla el jog-cancel (0x85), con RTCP off/on y cerca del limite de X
+    (soft limits + $40, recorte por rtcp_apply_travel_limits). En tiempo
+    simulado (log de eventos -l del simulador + step.out) da p50/p95/max de
+    primer $J= -> primer paso, 0x85 -> ultimo paso y 0x85 -> Idle.
+    python testing.py -mcodes --jog 4    # 4 rafagas por tiempo de pulsacion
+
+Historial de rendimiento (testing_history.db, SQLite):
+    python testing.py                    # Guarda la ejecucion en el historial
+    python testing.py --motion           # + ciclos de programas de referencia
+    python testing.py --jog              # + latencias de jog/jog-cancel
+    python testing.py --compare 10       # Compara contra las ultimas 10
+    python testing.py --no-history       # No guarda nada
 """
 
 import argparse
+import hashlib
+import inspect
+import json
 import logging
 import math
 import os
+import select
 import socket
 import subprocess
 import sys
@@ -52,6 +101,7 @@ CONFIG_FILE = r"c:\simulador\testing_config.ini"
 PORT = 23
 TOL = 0.05       # mm tolerancia general
 TOL_MATH = 0.02  # mm tolerancia cinematica pura
+TIMING_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testing_timing.json")
 
 log = logging.getLogger("rtcp_test")
 
@@ -85,33 +135,162 @@ def get_pivot(settings):
     return (px, py, pz)
 
 
+def get_offsets(settings):
+    """Extrae offsets de ejes A/C (Y,Z) = $643/$644 del dict de settings."""
+    return (float(settings.get("$643", "0")), float(settings.get("$644", "0")))
+
+
 # Cargar config al importar para que PIVOT este disponible globalmente
+# (el modo --sweep los reasigna por geometria en cada proceso worker)
 _CONFIG_CMDS, _CONFIG_SETTINGS = load_config(CONFIG_FILE)
 PIVOT = get_pivot(_CONFIG_SETTINGS)
+OFFSETS = get_offsets(_CONFIG_SETTINGS)
+
+# =====================================================================
+# METRICAS DE LATENCIA
+# =====================================================================
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # seg
+
+REALTIME_NAMES = {"?": "?", "\x18": "^X", "\x85": "jog-cancel", "!": "!", "~": "~"}
+
+
+def cmd_key(command):
+    """Clasifica un comando en su tipo para agrupar latencias.
+
+    'G0 X5 A10' -> 'G0', '$642=150' -> '$6xx=', '$20=0' -> '$20=',
+    '$J=G91 X1 F100' -> '$J=', '$RTCP' -> '$RTCP'.
+    """
+    word = command.strip().upper().split(" ")[0] if command.strip() else ""
+    if word.startswith("$") and "=" in word:
+        num = word[1:word.index("=")]
+        if num.isdigit() and len(num) >= 3:
+            return "$%sxx=" % num[:-2]
+        return "$%s=" % num
+    return word or "(vacio)"
+
+
+def percentile(values, pct):
+    """Percentil por rango mas cercano (sin numpy)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, int(math.ceil(pct / 100.0 * len(ordered))) - 1)
+    return ordered[k]
+
+
+class Timing:
+    """Acumula latencias por tipo de comando y tiempo dormido/esperando."""
+
+    def __init__(self):
+        self.samples = {}
+        self.sleep_total = 0.0
+        self.wait_total = 0.0
+        self.started = time.perf_counter()
+        self.stopped = None
+
+    def add(self, key, seconds):
+        self.samples.setdefault(key, []).append(seconds)
+
+    def stats(self, key):
+        vals = self.samples.get(key, [])
+        return {
+            "count": len(vals),
+            "p50": percentile(vals, 50),
+            "p95": percentile(vals, 95),
+            "max": max(vals) if vals else 0.0,
+            "total": sum(vals),
+        }
+
+    def histogram(self, keys=None):
+        """Cuenta muestras por cubeta de LATENCY_BUCKETS (+ desborde)."""
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        for key, vals in self.samples.items():
+            if keys is not None and key not in keys:
+                continue
+            for v in vals:
+                i = 0
+                while i < len(LATENCY_BUCKETS) and v >= LATENCY_BUCKETS[i]:
+                    i += 1
+                counts[i] += 1
+        return counts
+
+    def elapsed(self):
+        return (self.stopped or time.perf_counter()) - self.started
+
+    def stop(self):
+        """Congela elapsed(): --motion/--jog no cuentan en suite/wall."""
+        self.stopped = time.perf_counter()
+
+    def to_dict(self):
+        return {
+            "elapsed": self.elapsed(),
+            "sleep_total": self.sleep_total,
+            "wait_total": self.wait_total,
+            "buckets": list(LATENCY_BUCKETS),
+            "latency": dict((k, dict(self.stats(k), samples=v))
+                            for k, v in sorted(self.samples.items())),
+        }
+
 
 # =====================================================================
 # CONEXION TCP AL SIMULADOR
 # =====================================================================
 
 class Sim:
-    def __init__(self):
+    def __init__(self, port=PORT, extra_args=None, eeprom=None):
+        """port/extra_args/eeprom permiten lanzar simuladores auxiliares
+        (p.ej. con -r/-s para medir ciclos) sin pisar el EEPROM principal."""
+        self.port = port
+        self.extra_args = list(extra_args or [])
+        self.eeprom = eeprom
         self.proc = None
         self.sock = None
         self.buf = b""
+        self.rx_first = None    # instante del primer byte leido por el ultimo recv()
+        self.timing = Timing()
+        self.baseline = False   # $BASELINE aceptado: reset_position usa $RESTORE
+
+    def sleep(self, seconds):
+        """time.sleep contabilizado como espera fija en self.timing."""
+        t0 = time.perf_counter()
+        time.sleep(seconds)
+        self.timing.sleep_total += time.perf_counter() - t0
+
+    def pause(self, seconds):
+        """sleep() que vigila el socket: retorna el instante (perf_counter) del
+        primer byte recibido durante la pausa, o None si no llego nada."""
+        t0 = time.perf_counter()
+        first = None
+        end = t0 + seconds
+        while True:
+            left = end - time.perf_counter()
+            if left <= 0:
+                break
+            if first is None:
+                if select.select([self.sock], [], [], left)[0]:
+                    first = time.perf_counter()
+            else:
+                time.sleep(left)
+        self.timing.sleep_total += time.perf_counter() - t0
+        return first
 
     def start(self):
-        eeprom = os.path.join(os.path.dirname(SIM_EXE), "EEPROM.DAT")
+        self.baseline = False
+        eeprom = self.eeprom or os.path.join(os.path.dirname(SIM_EXE), "EEPROM.DAT")
         if os.path.exists(eeprom):
             os.remove(eeprom)
-            log.info("EEPROM.DAT eliminado (defaults frescos)")
+            log.info("%s eliminado (defaults frescos)", os.path.basename(eeprom))
 
-        cmd = [SIM_EXE, "-p", str(PORT), "-t", "0"]
+        cmd = [SIM_EXE, "-p", str(self.port), "-t", "0"] + self.extra_args
+        if self.eeprom:
+            cmd += ["-e", self.eeprom]
         log.info("Lanzando: %s", " ".join(cmd))
         self.proc = subprocess.Popen(
             cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
             creationflags=subprocess.CREATE_NEW_PROCESS_GROUP
         )
-        time.sleep(3.0)
+        self.sleep(3.0)
         if self.proc.poll() is not None:
             err = self.proc.stderr.read().decode(errors="replace")
             raise RuntimeError("Simulador fallo: %s" % err)
@@ -121,9 +300,9 @@ class Sim:
             try:
                 self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 self.sock.settimeout(5.0)
-                self.sock.connect(("127.0.0.1", PORT))
+                self.sock.connect(("127.0.0.1", self.port))
                 log.info("TCP conectado")
-                time.sleep(1.0)
+                self.sleep(1.0)
                 self._drain()
                 return
             except (ConnectionRefusedError, socket.timeout, OSError):
@@ -132,10 +311,12 @@ class Sim:
                     self.sock.close()
                 except Exception:
                     pass
-                time.sleep(1.5)
+                self.sleep(1.5)
         raise ConnectionError("No se pudo conectar al simulador")
 
     def _drain(self):
+        # Siempre agota el timeout de 1 s: cuenta como espera fija
+        t0 = time.perf_counter()
         self.sock.settimeout(1.0)
         try:
             while True:
@@ -145,44 +326,96 @@ class Sim:
         except Exception:
             pass
         self.buf = b""
+        dt = time.perf_counter() - t0
+        self.timing.sleep_total += dt
+        self.timing.add("drain", dt)
 
     def send(self, cmd):
         self.sock.sendall((cmd.strip() + "\r\n").encode())
 
     def recv(self, timeout=5.0):
         lines = []
-        self.sock.settimeout(timeout)
-        deadline = time.time() + timeout
-        while time.time() < deadline:
-            try:
-                d = self.sock.recv(4096)
-                if not d:
+        t0 = time.perf_counter()
+        self.rx_first = None
+        try:
+            self.sock.settimeout(timeout)
+            deadline = time.time() + timeout
+            while time.time() < deadline:
+                try:
+                    d = self.sock.recv(4096)
+                    if not d:
+                        break
+                    if self.rx_first is None:
+                        self.rx_first = time.perf_counter()
+                    self.buf += d
+                    while b"\n" in self.buf:
+                        raw, self.buf = self.buf.split(b"\n", 1)
+                        line = raw.decode(errors="replace").strip().strip("\r")
+                        if line:
+                            lines.append(line)
+                            log.debug("RX << %s", line)
+                            if line.lower() == "ok" or line.lower().startswith("error"):
+                                return lines
+                except socket.timeout:
                     break
-                self.buf += d
-                while b"\n" in self.buf:
-                    raw, self.buf = self.buf.split(b"\n", 1)
-                    line = raw.decode(errors="replace").strip().strip("\r")
-                    if line:
-                        lines.append(line)
-                        log.debug("RX << %s", line)
-                        if line.lower() == "ok" or line.lower().startswith("error"):
-                            return lines
-            except socket.timeout:
-                break
-        return lines
+            return lines
+        finally:
+            self.timing.wait_total += time.perf_counter() - t0
 
     def cmd(self, command, timeout=5.0, wait=0.2):
         if wait > 0:
-            time.sleep(wait)
+            self.sleep(wait)
+        t0 = time.perf_counter()
         self.send(command)
-        time.sleep(0.1)
-        return self.recv(timeout)
+        first = self.pause(0.1)  # pausa fija; la latencia es hasta el primer byte de respuesta
+        lines = self.recv(timeout)
+        first = first or self.rx_first or time.perf_counter()
+        self.timing.add(cmd_key(command), first - t0)
+        return lines
+
+    def realtime(self, char, until=None, timeout=3.0, settle=1.0):
+        """Envia un comando realtime (sin CR/LF) y lee hasta el byte 'until'.
+
+        Retorna el texto recibido; sin 'until' solo envia y no lee nada.
+        """
+        key = "RT %s" % REALTIME_NAMES.get(char, "0x%02x" % ord(char))
+        t0 = time.perf_counter()
+        self.sock.sendall(char.encode("latin-1"))
+        if until is None:
+            self.timing.add(key, time.perf_counter() - t0)
+            return ""
+        first = self.pause(settle)  # como en cmd(), latencia hasta el primer byte
+        raw = b""
+        w0 = time.perf_counter()
+        self.sock.settimeout(timeout)
+        try:
+            while True:
+                d = self.sock.recv(4096)
+                if not d:
+                    break
+                if first is None:
+                    first = time.perf_counter()
+                raw += d
+                if until in raw:
+                    break
+        except socket.timeout:
+            pass
+        self.timing.wait_total += time.perf_counter() - w0
+        self.timing.add(key, (first or time.perf_counter()) - t0)
+        return raw.decode(errors="replace")
 
     def wait_stable(self, max_wait=20.0, interval=0.5):
+        t0 = time.perf_counter()
+        try:
+            return self._wait_stable(max_wait, interval)
+        finally:
+            self.timing.add("wait_stable", time.perf_counter() - t0)
+
+    def _wait_stable(self, max_wait, interval):
         prev = None
         deadline = time.time() + max_wait
         while time.time() < deadline:
-            time.sleep(interval)
+            self.sleep(interval)
             resp = self.cmd("$RTCP", timeout=5, wait=0.2)
             motor = None
             found = False
@@ -201,22 +434,47 @@ class Sim:
     def unlock(self):
         self._drain()
         # Soft reset (Ctrl+X) saca de ALARM
-        self.sock.sendall(b"\x18")
-        time.sleep(1.0)
+        self.realtime("\x18")
+        self.sleep(1.0)
         self._drain()
         # $X unlock por si queda en estado lock
         resp = self.cmd("$X", timeout=3, wait=0.3)
         log.debug("Unlock: %s", resp)
-        time.sleep(0.3)
+        self.sleep(0.3)
         self.cmd("G90 G21", wait=0.1)
         return resp
 
+    def save_baseline(self):
+        """Espera el fin del movimiento (G4 P0) y guarda el estado como baseline
+        del simulador: posicion, modales, RTCP, settings y estado de alarma.
+        Retorna False si el simulador no tiene $BASELINE (build anterior)."""
+        self.cmd("G4 P0", timeout=30, wait=0)
+        resp = self.cmd("$BASELINE", wait=0)
+        self.baseline = any(l.lower() == "ok" for l in resp)
+        if not self.baseline:
+            log.warning("$BASELINE rechazado: %s", resp)
+            self.cmd("", wait=0)
+        return self.baseline
+
+    def restore_baseline(self):
+        """$RESTORE: vuelve al baseline de una vez, tambien en movimiento o en
+        ALARM, y responde ok al terminar. False si no hay baseline o fallo."""
+        if not self.baseline:
+            return False
+        resp = self.cmd("$RESTORE", timeout=10, wait=0)
+        if any(l.lower() == "ok" for l in resp):
+            return True
+        log.warning("$RESTORE fallo: %s", resp)
+        self.cmd("", wait=0)
+        return False
+
     def close(self):
         if self.sock:
             try:
                 self.sock.close()
             except Exception:
                 pass
+            self.sock = None
         if self.proc:
             try:
                 self.proc.terminate()
@@ -226,6 +484,7 @@ class Sim:
                     self.proc.kill()
                 except Exception:
                     pass
+            self.proc = None
             log.info("Proceso terminado")
 
 
@@ -311,7 +570,11 @@ def has_text(lines, text):
     return any(text in l for l in lines)
 
 
-def rtcp_inverse(x, y, z, a_deg, c_deg, px=0, py=0, pz=150):
+def rtcp_inverse(x, y, z, a_deg, c_deg, px=0, py=0, pz=150, oy=0, oz=0):
+    """Misma formula que rtcp.c:transform_from_cartesian (sin TLO).
+
+    oy/oz son los offsets entre ejes A y C ($643/$644).
+    """
     a = math.radians(a_deg)
     c = math.radians(c_deg)
     ca, sa = math.cos(a), math.sin(a)
@@ -319,7 +582,9 @@ def rtcp_inverse(x, y, z, a_deg, c_deg, px=0, py=0, pz=150):
     dx, dy, dz = x - px, y - py, z - pz
     rx = cc * dx - sc * dy
     ry = sc * dx + cc * dy
-    return (rx + px, ca * ry - sa * dz + py, sa * ry + ca * dz + pz)
+    return (rx + px,
+            ca * ry - sa * dz - ca * oy + sa * oz + oy + py,
+            sa * ry + ca * dz - sa * oy - ca * oz + oz + pz)
 
 
 # =====================================================================
@@ -327,51 +592,131 @@ def rtcp_inverse(x, y, z, a_deg, c_deg, px=0, py=0, pz=150):
 # =====================================================================
 
 class TestRunner:
-    def __init__(self):
+    SLOWEST = 10  # tests mas lentos a listar en el resumen
+
+    def __init__(self, echo=True):
+        self.echo = echo   # False en workers de --sweep (solo se imprime la tabla)
         self.results = []
+        self.cached = []   # resultados reutilizados de ResultCache (no ejecutados)
+        self.max_error = {}  # grupo -> mayor error en mm reportado por los tests
         self.current_group = ""
+        self.group_times = {}
+        self._mark = time.perf_counter()
 
     def group(self, name):
         self.current_group = name
-        print("\n=== %s ===" % name)
-
-    def test(self, name, passed, detail=""):
+        self.group_times.setdefault(name, 0.0)
+        self._mark = time.perf_counter()
+        if self.echo:
+            print("\n=== %s ===" % name)
+
+    def test(self, name, passed, detail="", error=None):
+        # Duracion = trabajo hecho desde el test anterior (o inicio del grupo)
+        now = time.perf_counter()
+        duration = now - self._mark
+        self._mark = now
+        if self.current_group in self.group_times:
+            self.group_times[self.current_group] += duration
+        if error is not None:
+            self.max_error[self.current_group] = max(
+                error, self.max_error.get(self.current_group, 0.0))
         status = "[PASS]" if passed else "[FAIL]"
         msg = "  %s %s" % (status, name)
         if detail:
             msg += "  -- %s" % detail
-        print(msg)
-        self.results.append((self.current_group, name, passed))
+        if self.echo:
+            print(msg)
+        self.results.append((self.current_group, name, passed, duration))
         return passed
 
-    def summary(self):
-        total = len(self.results)
-        passed = sum(1 for _, _, p in self.results if p)
+    def replay(self, entry, digest):
+        """Reporta un grupo desde la cache sin ejecutarlo."""
+        print("\n=== [CACHE %s] %s ===" % (digest[:8], entry["group"]))
+        last = None
+        for grp, name, passed, duration in entry["results"]:
+            if grp != last:
+                print("  -- %s" % grp)
+                last = grp
+            print("  %s %s  -- cache %s" % ("[PASS]" if passed else "[FAIL]", name,
+                                           entry["created"]))
+            self.cached.append((grp, name, passed, duration))
+
+    def summary(self, timing=None):
+        everything = self.results + self.cached
+        total = len(everything)
+        passed = sum(1 for _, _, p, _ in everything if p)
         failed = total - passed
+        if timing is not None and self.results:
+            self.print_timing(timing)
         print("\n" + "=" * 55)
+        from_cache = " (%d desde cache)" % len(self.cached) if self.cached else ""
         if failed == 0:
-            print("RESULTADO: %d/%d PASADOS OK" % (passed, total))
+            print("RESULTADO: %d/%d PASADOS OK%s" % (passed, total, from_cache))
         else:
-            print("RESULTADO: %d/%d pasados, %d fallidos" % (passed, total, failed))
+            print("RESULTADO: %d/%d pasados, %d fallidos%s" % (passed, total, failed, from_cache))
             print("\nFallos:")
-            for grp, name, p in self.results:
+            for grp, name, p, _ in everything:
                 if not p:
                     print("  [FAIL] [%s] %s" % (grp, name))
         print("=" * 55)
         return failed == 0
 
+    def print_timing(self, timing):
+        print("\n" + "=" * 55)
+        print("LATENCIA POR COMANDO (seg)")
+        print("  %-12s %6s %8s %8s %8s %9s" % ("tipo", "n", "p50", "p95", "max", "total"))
+        keys = sorted(timing.samples, key=lambda k: -timing.stats(k)["total"])
+        for key in keys:
+            st = timing.stats(key)
+            print("  %-12s %6d %8.3f %8.3f %8.3f %9.2f" % (
+                key, st["count"], st["p50"], st["p95"], st["max"], st["total"]))
+
+        # Histograma de ida/vuelta (excluye agregados como wait_stable/drain)
+        counts = timing.histogram([k for k in keys if k not in ("wait_stable", "drain")])
+        print("\nHISTOGRAMA ida/vuelta")
+        peak = max(counts) or 1
+        lo = 0.0
+        for i, n in enumerate(counts):
+            label = ("%.2f-%.2f" % (lo, LATENCY_BUCKETS[i]) if i < len(LATENCY_BUCKETS)
+                     else ">=%.2f" % lo)
+            print("  %-11s %6d %s" % (label, n, "#" * int(round(40.0 * n / peak))))
+            if i < len(LATENCY_BUCKETS):
+                lo = LATENCY_BUCKETS[i]
+
+        print("\nTESTS MAS LENTOS")
+        for grp, name, p, dur in sorted(self.results, key=lambda r: -r[3])[:self.SLOWEST]:
+            print("  %7.2fs  [%s] %s" % (dur, grp, name))
+
+        wall = timing.elapsed()
+        other = max(0.0, wall - timing.sleep_total - timing.wait_total)
+        print("\nTIEMPO TOTAL %.1fs: dormido %.1fs (%.0f%%), esperando simulador %.1fs (%.0f%%), resto %.1fs"
+              % (wall, timing.sleep_total, 100.0 * timing.sleep_total / wall if wall else 0,
+                 timing.wait_total, 100.0 * timing.wait_total / wall if wall else 0, other))
+
+    def write_json(self, path, timing):
+        data = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "tests": [{"group": g, "name": n, "passed": bool(p), "duration": d}
+                      for g, n, p, d in self.results],
+            "cached": [{"group": g, "name": n, "passed": bool(p), "duration": d}
+                       for g, n, p, d in self.cached],
+            "groups": self.group_times,
+            "timing": timing.to_dict(),
+        }
+        with open(path, "w") as f:
+            json.dump(data, f, indent=1)
+        print("Metricas de tiempo: %s" % path)
+
 
 # =====================================================================
 # SETUP
 # =====================================================================
 
-def setup(sim):
-    print("\n=== SETUP ===")
-    print("  Config: %s" % CONFIG_FILE)
-
+def apply_config(sim, commands=None):
+    """Envia los comandos de testing_config.ini. Retorna (ok, errores)."""
     ok_count = 0
     err_count = 0
-    for cmd in _CONFIG_CMDS:
+    for cmd in (_CONFIG_CMDS if commands is None else commands):
         resp = sim.cmd(cmd, wait=0.1)
         if has_text(resp, "error"):
             log.warning("Error aplicando '%s': %s", cmd, resp)
@@ -379,14 +724,31 @@ def setup(sim):
         else:
             ok_count += 1
             log.debug("OK: %s", cmd)
+    if err_count:
+        # Grbl rechaza todo G-code tras un error hasta recibir una linea
+        # vacia o un '$' valido (gc_state.last_error en protocol.c)
+        sim.cmd("", wait=0.1)
+    return ok_count, err_count
+
+
+def setup(sim):
+    print("\n=== SETUP ===")
+    print("  Config: %s" % CONFIG_FILE)
+
+    ok_count, err_count = apply_config(sim)
 
-    # Mover a origen
+    # Mover a origen con RTCP activo: estado de referencia de cada test
     sim.cmd("G0 X0 Y0 Z0 A0 C0", wait=0.1)
+    sim.cmd("M451", wait=0.1)
 
     if err_count:
         print("  [WARN] %d settings con error, %d aplicados OK" % (err_count, ok_count))
     else:
         print("  %d settings aplicados OK" % ok_count)
+    if sim.save_baseline():
+        print("  Reset entre tests: $RESTORE")
+    else:
+        print("  [WARN] Simulador sin $BASELINE: reset con M451/G0/wait_stable")
     print("  Pivot: X=%.1f Y=%.1f Z=%.1f" % PIVOT)
     print("  Soft limits: %s | Hard limits: %s" % (
         "ON" if _CONFIG_SETTINGS.get("$20", "0") != "0" else "OFF",
@@ -394,6 +756,11 @@ def setup(sim):
 
 
 def reset_position(sim, rtcp_on=True):
+    # El baseline de setup() tiene RTCP activo
+    if sim.restore_baseline():
+        if not rtcp_on:
+            sim.cmd("M450", wait=0)
+        return
     if rtcp_on:
         sim.cmd("M451", wait=0.2)
     resp = sim.cmd("G0 X0 Y0 Z0 A0 C0", wait=0.2)
@@ -404,8 +771,11 @@ def reset_position(sim, rtcp_on=True):
 
 
 def recover_alarm(sim):
+    # $RESTORE sale de ALARM y deshace los settings cambiados ($20 incluido)
+    if sim.restore_baseline():
+        return
     sim.unlock()
-    time.sleep(0.5)
+    sim.sleep(0.5)
     sim.cmd("$20=0", wait=0.1)
     sim.cmd("M451", wait=0.2)
 
@@ -432,7 +802,7 @@ def test_matematicas(sim, t):
     ]
 
     for i, (name, gcode, x, y, z, a, c) in enumerate(tests, 1):
-        exp = rtcp_inverse(x, y, z, a, c, PIVOT[0], PIVOT[1], PIVOT[2])
+        exp = rtcp_inverse(x, y, z, a, c, PIVOT[0], PIVOT[1], PIVOT[2], *OFFSETS)
 
         resp = sim.cmd(gcode, timeout=10, wait=0.3)
         if has_text(resp, "ALARM"):
@@ -458,29 +828,30 @@ def test_matematicas(sim, t):
 
         if md <= TOL_MATH:
             t.test("[%2d] %s" % (i, name), True,
-                   "Motor: X=%.3f Y=%.3f Z=%.3f" % motor)
+                   "Motor: X=%.3f Y=%.3f Z=%.3f" % motor, error=md)
         else:
             t.test("[%2d] %s" % (i, name), False,
                    "diff %.3fmm en %s | Esp: X=%.3f Y=%.3f Z=%.3f | Act: X=%.3f Y=%.3f Z=%.3f"
-                   % (md, ax, exp[0], exp[1], exp[2], motor[0], motor[1], motor[2]))
+                   % (md, ax, exp[0], exp[1], exp[2], motor[0], motor[1], motor[2]), error=md)
 
         reset_position(sim)
 
     # Verificacion de formulas Python para angulos en singularidad
     t.group("MATEMATICAS: Formulas Python A=90 (Gimbal Lock)")
 
-    # A=90, pivot Z=150: motor_Y=150 (dz pivotea a Y), motor_Z=150 (queda a altura pivot)
+    # A=90: motor_Y=py+pz (dz pivotea a Y), motor_Z=pz (queda a altura pivot)
+    # (esperado con PIVOT para que el barrido --sweep de $641/$642 sea valido)
     m90 = rtcp_inverse(0, 0, 0, 90, 0, PIVOT[0], PIVOT[1], PIVOT[2])
-    t.test("Formula Python A=90: motor_Y=150",
-           abs(m90[1] - 150.0) < TOL_MATH,
+    t.test("Formula Python A=90: motor_Y=py+pz",
+           abs(m90[1] - (PIVOT[1] + PIVOT[2])) < TOL_MATH,
            "calc: X=%.3f Y=%.3f Z=%.3f" % m90)
-    t.test("Formula Python A=90: motor_Z=pz (150)",
+    t.test("Formula Python A=90: motor_Z=pz",
            abs(m90[2] - PIVOT[2]) < TOL_MATH,
            "calc: Z=%.3f, pivot_z=%.3f" % (m90[2], PIVOT[2]))
 
     m90c90 = rtcp_inverse(50, 0, 0, 90, 90, PIVOT[0], PIVOT[1], PIVOT[2])
     t.test("Formula Python A=90 C=90: calculo coherente",
-           abs(m90c90[1] - 150.0) < TOL_MATH,
+           abs(m90c90[1] - (PIVOT[1] + PIVOT[2])) < TOL_MATH,
            "calc: X=%.3f Y=%.3f Z=%.3f" % m90c90)
 
 
@@ -497,10 +868,14 @@ def test_diagnostico(sim, t):
 
     t.test("$RTCP reporta version", has_text(resp, "v17.1"))
     t.test("$RTCP reporta modo ON", data["mode"] == "ON")
-    t.test("$RTCP reporta pivot Z=150", data["pivot"].get("Z") == 150.0,
-           "pivot_z=%s" % data["pivot"].get("Z"))
-    t.test("$RTCP reporta offsets en 0",
-           data["offsets"].get("Y") == 0.0 and data["offsets"].get("Z") == 0.0)
+    pivot = tuple(data["pivot"].get(axis) for axis in "XYZ")
+    t.test("$RTCP reporta pivot configurado",
+           None not in pivot and all(abs(a - b) < TOL_MATH for a, b in zip(pivot, PIVOT)),
+           "act=%s esp=%s" % (pivot, PIVOT))
+    offsets = tuple(data["offsets"].get(axis) for axis in "YZ")
+    t.test("$RTCP reporta offsets configurados",
+           None not in offsets and all(abs(a - b) < TOL_MATH for a, b in zip(offsets, OFFSETS)),
+           "act=%s esp=%s" % (offsets, OFFSETS))
     t.test("$RTCP reporta TCP Position", data["tcp"] is not None)
     t.test("$RTCP reporta Motor Position", data["motor"] is not None)
     t.test("$RTCP reporta Rotary Axes", data["a_deg"] is not None)
@@ -525,12 +900,12 @@ def test_cache(sim, t):
     t.test("Cache Valid tras movimiento con angulo",
            data["cache"] == "Valid", "cache=%s" % data["cache"])
 
-    sim.cmd("$642=151", wait=0.2)
+    sim.cmd("$642=%g" % (PIVOT[2] + 1), wait=0.2)
     resp = sim.cmd("$RTCP", timeout=5, wait=0.5)
     data = get_rtcp_data(resp)
     t.test("Cache Invalid tras cambio de setting",
            data["cache"] == "Invalid", "cache=%s" % data["cache"])
-    sim.cmd("$642=150", wait=0.2)
+    sim.cmd("$642=%g" % PIVOT[2], wait=0.2)
 
     reset_position(sim)
 
@@ -558,8 +933,9 @@ def test_settings(sim, t):
     t.test("$644 cambia Offset Z", data["offsets"].get("Z") == 3.0,
            "offset_z=%s" % data["offsets"].get("Z"))
 
-    # Restaurar
-    for s in ["$640=0", "$641=0", "$642=150", "$643=0", "$644=0"]:
+    # Restaurar la geometria activa (testing_config.ini o geometria del sweep)
+    for s in ["$640=%g" % PIVOT[0], "$641=%g" % PIVOT[1], "$642=%g" % PIVOT[2],
+              "$643=%g" % OFFSETS[0], "$644=%g" % OFFSETS[1]]:
         sim.cmd(s, wait=0.1)
 
 
@@ -625,7 +1001,7 @@ def test_mcodes(sim, t):
     t.test("Conmutacion ON->OFF exitosa", data["mode"] == "OFF")
 
     sim.cmd("G0 X10 Y0 Z0 A0 C0", wait=0.2)
-    time.sleep(2.0)
+    sim.sleep(2.0)
     sim.wait_stable(max_wait=15, interval=0.5)
     data = get_rtcp_data(sim.cmd("$RTCP", timeout=5, wait=0.3))
     motor = data["motor"]
@@ -652,7 +1028,7 @@ def test_bypass(sim, t):
     sim.wait_stable(max_wait=10, interval=0.3)
 
     sim.cmd("G0 X5 Y0 Z0 A10 C0", wait=0.2)
-    time.sleep(3.0)
+    sim.sleep(3.0)
     sim.wait_stable(max_wait=15, interval=0.5)
     data = get_rtcp_data(sim.cmd("$RTCP", timeout=5, wait=0.5))
     motor = data["motor"]
@@ -731,14 +1107,16 @@ def test_coherencia(sim, t):
     sim.wait_stable(max_wait=15, interval=0.5)
     data80 = get_rtcp_data(sim.cmd("$RTCP", timeout=5, wait=0.5))
     motor80 = data80["motor"]
-    exp80 = rtcp_inverse(0, 0, 0, 80, 0, PIVOT[0], PIVOT[1], PIVOT[2])
+    exp80 = rtcp_inverse(0, 0, 0, 80, 0, PIVOT[0], PIVOT[1], PIVOT[2], *OFFSETS)
 
-    t.test("A=80 pivot Z=150: motor_Y correcto",
+    t.test("A=80 pivot configurado: motor_Y correcto",
            motor80 and abs(motor80["Y"] - exp80[1]) < TOL,
-           "act=%.3f esp=%.3f" % (motor80["Y"] if motor80 else 0, exp80[1]))
-    t.test("A=80 pivot Z=150: motor_Z correcto",
+           "act=%.3f esp=%.3f" % (motor80["Y"] if motor80 else 0, exp80[1]),
+           error=abs(motor80["Y"] - exp80[1]) if motor80 else None)
+    t.test("A=80 pivot configurado: motor_Z correcto",
            motor80 and abs(motor80["Z"] - exp80[2]) < TOL,
-           "act=%.3f esp=%.3f" % (motor80["Z"] if motor80 else 0, exp80[2]))
+           "act=%.3f esp=%.3f" % (motor80["Z"] if motor80 else 0, exp80[2]),
+           error=abs(motor80["Z"] - exp80[2]) if motor80 else None)
 
     reset_position(sim)
 
@@ -804,7 +1182,7 @@ def test_feedrate(sim, t):
         max_diff = max(dx, dy, dz)
         t.test("G1 llega al mismo destino que G0",
                max_diff < TOL,
-               "diff=%.4fmm" % max_diff)
+               "diff=%.4fmm" % max_diff, error=max_diff)
     else:
         t.test("G1 llega al mismo destino que G0",
                False, "No se obtuvieron posiciones")
@@ -829,7 +1207,8 @@ def test_feedrate(sim, t):
 
     t.test("Segmentacion G1: TCP X llega a 20mm",
            tcp_seg and abs(tcp_seg["X"] - 20.0) < TOL,
-           "tcp_x=%s" % (tcp_seg["X"] if tcp_seg else "N/A"))
+           "tcp_x=%s" % (tcp_seg["X"] if tcp_seg else "N/A"),
+           error=abs(tcp_seg["X"] - 20.0) if tcp_seg else None)
     t.test("Segmentacion G1: A llega a 45 deg",
            d_seg["a_deg"] is not None and abs(d_seg["a_deg"] - 45.0) < 0.1,
            "a=%s" % d_seg["a_deg"])
@@ -845,25 +1224,11 @@ def test_realtime(sim, t):
     t.group("REALTIME: Report |RTCP:ON/OFF|")
 
     sim.cmd("M451", wait=0.2)
-    time.sleep(0.3)
+    sim.sleep(0.3)
 
     # Enviar ? y leer respuesta
     sim._drain()
-    sim.send("?")
-    time.sleep(1.0)
-    sim.sock.settimeout(3.0)
-    raw = b""
-    try:
-        while True:
-            d = sim.sock.recv(4096)
-            if not d:
-                break
-            raw += d
-            if b">" in raw:
-                break
-    except socket.timeout:
-        pass
-    rt_text = raw.decode(errors="replace")
+    rt_text = sim.realtime("?", until=b">")
     log.debug("Realtime ON: %s", rt_text)
     has_on = "RTCP:ON" in rt_text
     t.test("Status report contiene RTCP:ON",
@@ -873,24 +1238,10 @@ def test_realtime(sim, t):
     # Drenar y ahora M450
     sim._drain()
     sim.cmd("M450", wait=0.3)
-    time.sleep(0.3)
+    sim.sleep(0.3)
 
     sim._drain()
-    sim.send("?")
-    time.sleep(1.0)
-    sim.sock.settimeout(3.0)
-    raw = b""
-    try:
-        while True:
-            d = sim.sock.recv(4096)
-            if not d:
-                break
-            raw += d
-            if b">" in raw:
-                break
-    except socket.timeout:
-        pass
-    rt_text = raw.decode(errors="replace")
+    rt_text = sim.realtime("?", until=b">")
     log.debug("Realtime OFF: %s", rt_text)
     has_off = "RTCP:OFF" in rt_text
     t.test("Status report contiene RTCP:OFF",
@@ -997,19 +1348,832 @@ def test_singularidad(sim, t):
 # REGISTRO DE GRUPOS
 # =====================================================================
 
+# Entradas de cada grupo para la cache de resultados:
+#   sources  - archivos del repo cuyo contenido afecta el resultado
+#   settings - opcional: prefijos de settings de testing_config.ini ("$64" =
+#              $640-$649); sin el, cuenta todo el archivo
+#   code     - funciones de test del grupo (se hashea su codigo fuente)
+RTCP_SOURCES = ["src/grbl/kinematics/rtcp.c", "src/grbl/kinematics/rtcp.h"]
+
 GROUPS = {
-    "matematicas":   ("Cinematica inversa + formulas Python", test_matematicas),
-    "singularidad": ("Gimbal Lock: proteccion A=90 (ALARM:12)", test_singularidad),
+    "matematicas":   ("Cinematica inversa + formulas Python", test_matematicas,
+                      {"sources": RTCP_SOURCES, "code": [test_matematicas]}),
+    "singularidad": ("Gimbal Lock: proteccion A=90 (ALARM:12)", test_singularidad,
+                      {"sources": RTCP_SOURCES + ["src/grbl/machine_limits.c"],
+                       "code": [test_singularidad]}),
     "funciones":     ("Diagnostico + Cache + Settings",
-                      lambda s, t: (test_diagnostico(s, t), test_cache(s, t), test_settings(s, t))),
-    "mcodes":        ("M451/M450 toggle + warning + conmutacion", test_mcodes),
-    "bypass":        ("Bypass RTCP OFF = identidad", test_bypass),
-    "coherencia":    ("Coherencia inv/directa + Pivot Z + Identidad", test_coherencia),
-    "feedrate":      ("Feedrate compensacion + segmentacion", test_feedrate),
-    "realtime":      ("Realtime report |RTCP:ON/OFF|", test_realtime),
+                      lambda s, t: (test_diagnostico(s, t), test_cache(s, t), test_settings(s, t)),
+                      {"sources": RTCP_SOURCES, "code": [test_diagnostico, test_cache, test_settings]}),
+    "mcodes":        ("M451/M450 toggle + warning + conmutacion", test_mcodes,
+                      {"sources": RTCP_SOURCES + ["src/grbl/gcode.c"], "code": [test_mcodes]}),
+    "bypass":        ("Bypass RTCP OFF = identidad", test_bypass,
+                      {"sources": RTCP_SOURCES, "code": [test_bypass]}),
+    "coherencia":    ("Coherencia inv/directa + Pivot Z + Identidad", test_coherencia,
+                      {"sources": RTCP_SOURCES, "code": [test_coherencia]}),
+    "feedrate":      ("Feedrate compensacion + segmentacion", test_feedrate,
+                      {"sources": RTCP_SOURCES + ["src/grbl/motion_control.c", "src/grbl/planner.c"],
+                       "code": [test_feedrate]}),
+    "realtime":      ("Realtime report |RTCP:ON/OFF|", test_realtime,
+                      {"sources": RTCP_SOURCES + ["src/grbl/report.c"], "code": [test_realtime]}),
+}
+
+
+# =====================================================================
+# CACHE DE RESULTADOS POR HASH DE ENTRADAS
+# =====================================================================
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILE = os.path.join(REPO_DIR, "testing_cache.json")
+CACHE_MAX_ENTRIES = 200
+
+# Codigo compartido por todos los grupos: si cambia se invalida toda la cache
+COMMON_CODE = [Sim, apply_config, setup, reset_position, recover_alarm,
+               get_rtcp_data, get_motor, has_text, rtcp_inverse]
+
+_digest_cache = {}
+
+
+def file_digest(path):
+    """SHA1 del contenido de un archivo ('missing' si no existe)."""
+    if path not in _digest_cache:
+        h = hashlib.sha1()
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            _digest_cache[path] = h.hexdigest()
+        except (IOError, OSError):
+            _digest_cache[path] = "missing"
+    return _digest_cache[path]
+
+
+def config_lines(prefixes=None):
+    """Lineas de testing_config.ini que afectan a un grupo.
+
+    Sin prefijos cuentan todas: settings como $10, $22 o $100-$105 cambian
+    resultados de casi todos los grupos. Con prefijos, los comandos G/M
+    iniciales afectan a todos y los $n=v solo si n empieza por alguno.
+    """
+    out = []
+    for cmd in _CONFIG_CMDS:
+        if prefixes is not None and cmd.startswith("$") and "=" in cmd:
+            key = cmd.split("=", 1)[0].strip()
+            if not any(key.startswith(p) for p in prefixes):
+                continue
+        out.append(cmd)
+    return out
+
+
+def group_hash(name):
+    """Hash combinado de todas las entradas declaradas por un grupo."""
+    inputs = GROUPS[name][2]
+    h = hashlib.sha1()
+    h.update(("sim:%s\n" % file_digest(SIM_EXE)).encode())
+    for src in inputs["sources"]:
+        h.update(("src:%s:%s\n" % (src, file_digest(os.path.join(REPO_DIR, src)))).encode())
+    for line in config_lines(inputs.get("settings")):
+        h.update(("cfg:%s\n" % line).encode())
+    for obj in inputs["code"] + COMMON_CODE:
+        h.update(inspect.getsource(obj).encode())
+    h.update(repr((TOL, TOL_MATH, PIVOT, OFFSETS)).encode())
+    return h.hexdigest()[:16]
+
+
+class ResultCache:
+    """Resultados de grupos que pasaron, indexados por hash de entradas."""
+
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.entries = {}
+
+    def get(self, name, digest):
+        entry = self.entries.get(digest)
+        if entry and entry.get("group") == name:
+            return entry
+        return None
+
+    def put(self, name, digest, results):
+        # Solo se cachean grupos completos sin fallos; un fallo se reintenta
+        if results and all(r[2] for r in results):
+            self.entries[digest] = {
+                "group": name,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": [list(r) for r in results],
+            }
+        else:
+            self.entries.pop(digest, None)
+
+    def save(self):
+        if len(self.entries) > CACHE_MAX_ENTRIES:
+            keep = sorted(self.entries.items(), key=lambda kv: kv[1]["created"])
+            self.entries = dict(keep[-CACHE_MAX_ENTRIES:])
+        with open(self.path, "w") as f:
+            json.dump(self.entries, f, indent=1)
+
+
+# =====================================================================
+# HISTORIAL DE TIEMPOS Y DETECCION DE REGRESIONES
+# =====================================================================
+
+HISTORY_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testing_history.db")
+MOTION_PORT = PORT + 1   # simulador auxiliar para programas de referencia
+MOTION_STEP_TIME = 0.001  # seg de simulacion entre muestras de step.out
+RX_BUFFER_SIZE = 1024     # src/grbl/stream.h (streaming por conteo de caracteres)
+
+# Regresion = valor actual > media + max(Z * desviacion, REL * media, ABS)
+REGRESSION_Z = 3.0
+REGRESSION_REL = 0.10
+REGRESSION_ABS = 0.05    # seg; evita falsas alarmas en tests de milisegundos
+REGRESSION_MIN_RUNS = 3
+
+# Programas cortos que ejercitan la segmentacion RTCP. El ciclo se mide en
+# tiempo simulado, asi que es determinista: si rtcp.c duplica los segmentos
+# cambian 'blocks' y normalmente 'cycle_time'.
+REFERENCE_PROGRAMS = {
+    "rtcp_g1_5ejes": [
+        "G21 G90 G94", "M451", "G0 X0 Y0 Z0 A0 C0", "G1 F3000",
+        "G1 X10 A10", "G1 X20 C30", "G1 Y10 A20 C60", "G1 X0 Y0 A0 C0",
+    ],
+    "rtcp_g0_rotativos": [
+        "G21 G90", "M451", "G0 X0 Y0 Z0 A0 C0",
+        "G0 X15 Y5 A30 C90", "G0 X-15 Y-5 A-30 C180", "G0 X0 Y0 A0 C0",
+    ],
+    "rtcp_off_g1": [
+        "G21 G90 G94", "M450", "G0 X0 Y0 Z0 A0 C0", "G1 F3000",
+        "G1 X10 A10", "G1 X20 C30", "G1 Y10 A20 C60", "G1 X0 Y0 A0 C0",
+    ],
 }
 
 
+def stream_program(sim, lines, timeout=60.0):
+    """Envia un programa con el protocolo de conteo de caracteres de Grbl.
+
+    Mantiene el buffer RX del simulador lleno (sin esperar cada 'ok'), asi
+    el planner nunca se vacia por culpa del host. Retorna lineas con error.
+    """
+    pending = []
+    errors = []
+    queue = [l.strip() + "\n" for l in lines if l.strip()]
+    deadline = time.time() + timeout
+    sim.sock.settimeout(0.5)
+    while (queue or pending) and time.time() < deadline:
+        while queue and sum(len(p) for p in pending) + len(queue[0]) < RX_BUFFER_SIZE - 1:
+            pending.append(queue.pop(0))
+            sim.sock.sendall(pending[-1].encode())
+        try:
+            sim.buf += sim.sock.recv(4096)
+        except socket.timeout:
+            continue
+        while b"\n" in sim.buf and pending:
+            raw, sim.buf = sim.buf.split(b"\n", 1)
+            line = raw.decode(errors="replace").strip()
+            if line == "ok" or line.startswith("error"):
+                sent = pending.pop(0)
+                if line != "ok":
+                    errors.append((sent.strip(), line))
+    return errors
+
+
+def wait_idle(sim, timeout=60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if "<Idle" in sim.realtime("?", until=b">", timeout=1.0, settle=0.05):
+            return True
+    return False
+
+
+def parse_step_cycle(path):
+    """Lee step.out y retorna (ciclo en seg simulados, bloques del planner).
+
+    Ciclo = desde la primera muestra del bloque 0 hasta la primera muestra
+    con la posicion final (la ultima linea la repite grbl_app_exit al salir).
+    """
+    first = end = None
+    last_pos = None
+    blocks = 0
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith("#"):
+                if "block number" in line:
+                    blocks += 1
+                continue
+            parts = line.split()
+            if not parts or not blocks:
+                continue
+            try:
+                t = float(parts[0])
+            except ValueError:
+                continue
+            if first is None:
+                first = t
+            if parts[1:] != last_pos:
+                last_pos = parts[1:]
+                end = t
+    if first is None:
+        return 0.0, blocks
+    return end - first, blocks
+
+
+def measure_motion(programs=None, port=MOTION_PORT):
+    """Ejecuta cada programa de referencia en un simulador propio con -r/-s."""
+    import shutil
+    import tempfile
+    results = {}
+    tmp = tempfile.mkdtemp(prefix="rtcp_motion_")
+    try:
+        for name, lines in sorted((programs or REFERENCE_PROGRAMS).items()):
+            step_path = os.path.join(tmp, "%s.step" % name)
+            ref = Sim(port=port, eeprom=os.path.join(tmp, "EEPROM_%s.DAT" % name),
+                      extra_args=["-r", str(MOTION_STEP_TIME), "-s", step_path, "-b", os.devnull])
+            try:
+                ref.start()
+                apply_config(ref)
+                t0 = time.perf_counter()
+                errors = stream_program(ref, lines)
+                idle = wait_idle(ref)
+                host = time.perf_counter() - t0
+                ref.realtime("\x06")  # Ctrl-F: salida limpia, cierra step.out
+                # Cerrar primero del lado cliente: si el simulador cierra antes,
+                # su puerto queda en TIME_WAIT y el siguiente bind falla
+                ref.sock.close()
+                ref.sock = None
+                ref.proc.wait(timeout=10)
+            except Exception as e:
+                log.warning("Programa %s: %s", name, e)
+                continue
+            finally:
+                ref.close()
+            cycle, blocks = parse_step_cycle(step_path)
+            results[name] = {"cycle_time": cycle, "blocks": blocks, "host_time": host}
+            print("  [MOTION] %-20s ciclo=%.3fs bloques=%d host=%.2fs%s%s" % (
+                name, cycle, blocks, host, "" if idle else " (sin Idle)",
+                " errores=%s" % errors if errors else ""))
+        return results
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# Pendant simulado: mientras la tecla esta pulsada envia un $J= incremental
+# cada JOG_INTERVAL (cada uno cubre JOG_OVERLAP intervalos para que el planner
+# no se vacie) y al soltarla el jog-cancel 0x85. Las latencias se miden en
+# tiempo simulado con el log de eventos (-l) y step.out (-m events -d 1), el
+# simulador corre a tiempo real (-t 1) para respetar el ritmo del pendant.
+JOG_PORT = PORT + 2
+JOG_FEED = 1000.0         # mm/min
+JOG_INTERVAL = 0.05       # seg entre $J= (20 Hz, tipico de pendant/MPG)
+JOG_OVERLAP = 1.5
+JOG_HOLDS = (0.2, 0.4, 0.6, 0.8, 1.0)  # seg de tecla pulsada por rafaga
+
+# Homing manual ($22 = habilitado + manual, sin ciclos): $H marca todos los
+# ejes como homeados en MPos=-1 sin mover, asi los soft limits ($20) y el
+# recorte de jogs ($40, rtcp_apply_travel_limits) quedan activos.
+JOG_SETUP = ["$22=33", "$44=0", "$45=0", "$46=0", "$40=1", "$H", "G21 G90 G94"]
+
+# (nombre, comandos del escenario, posicion inicial, direccion del jog)
+# Con homing el recorrido es [-$13x, 0]: los 'limite_*' empiezan a 10 mm
+# del maximo de X y los jogs mas largos quedan recortados por el limite.
+JOG_SCENARIOS = [
+    ("rtcp_off", ["$20=0", "M450"], "X-100 Y-100 Z-100 A0 C0", "X"),
+    ("rtcp_on", ["$20=0", "M451"], "X-100 Y-100 Z-100 A-30 C-45", "X"),
+    ("limite_rtcp_off", ["$20=1", "M450"], "X-10 Y-100 Z-100 A-30 C-45", "X"),
+    ("limite_rtcp_on", ["$20=1", "M451"], "X-10 Y-100 Z-100 A-30 C-45", "X"),
+]
+JOG_METRICS = ("cmd_to_motion", "cancel_to_stop", "cancel_to_idle")
+
+
+def jog_burst(sim, axis, hold, feed=JOG_FEED, interval=JOG_INTERVAL):
+    """Tecla pulsada 'hold' seg: un $J= cada 'interval' y 0x85 al soltar.
+
+    Las respuestas no se esperan (el pendant no bloquea); retorna los $J= enviados.
+    """
+    cmd = "$J=G91 %s%.3f F%.0f\n" % (axis, feed / 60.0 * interval * JOG_OVERLAP, feed)
+    t0 = time.perf_counter()
+    sent = 0
+    while sent * interval < hold:
+        sim.sock.sendall(cmd.encode())
+        sent += 1
+        pause = t0 + min(sent * interval, hold) - time.perf_counter()
+        if pause > 0:
+            sim.sleep(pause)
+    sim.realtime("\x85")
+    return sent
+
+
+def parse_event_log(path):
+    """Lee el archivo de -l: lista de (t, tipo, texto)."""
+    events = []
+    with open(path, "r") as f:
+        for line in f:
+            parts = line.split(None, 2)
+            if len(parts) < 2:
+                continue
+            try:
+                events.append((float(parts[0]), parts[1], parts[2].strip() if len(parts) > 2 else ""))
+            except ValueError:
+                continue
+    return events
+
+
+def parse_step_samples(path):
+    """Lee step.out: lista de (t, posicion en pasos) sin las lineas '#'."""
+    samples = []
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            parts = line.split()
+            try:
+                samples.append((float(parts[0]), tuple(int(p) for p in parts[1:])))
+            except (ValueError, IndexError):
+                continue
+    return samples
+
+
+def jog_latencies(events, samples):
+    """Separa las rafagas por escenario y mide cada una en tiempo simulado.
+
+    Escenario: desde la linea '(JOG nombre)'. Rafaga: primer '$J=' recibido
+    hasta el 0x85; termina en la siguiente linea recibida (reposicionado).
+      cmd_to_motion  = primer $J= -> primer paso
+      cancel_to_stop = 0x85 -> ultimo paso antes de la siguiente linea
+      cancel_to_idle = 0x85 -> siguiente 'state Idle' (0 si ya estaba en Idle)
+    Retorna {escenario: {metrica: [seg], 'errors': n, 'bursts': n}}.
+    """
+    results = {}
+    scenario = None
+    bursts = []     # (escenario, t_primer_jog, t_cancel, t_idle, t_fin, errores)
+    current = None
+    state = None
+    for t, kind, text in events:
+        if kind == "state":
+            state = text
+        if kind == "rx" and text.startswith("(JOG "):
+            scenario = text[5:].rstrip(")")
+            results[scenario] = dict((m, []) for m in JOG_METRICS)
+            results[scenario].update(errors=0, bursts=0)
+            continue
+        if scenario is None:
+            continue
+        if kind == "rx" and text.upper().startswith("$J="):
+            if current is None:
+                current = [scenario, t, None, None, None, 0]
+        elif kind == "rx" and current is not None and current[2] is not None:
+            current[4] = t
+            bursts.append(current)
+            current = None
+        elif kind == "rt" and text == "0x85" and current is not None and current[2] is None:
+            current[2] = t
+            if state == "Idle":     # el jog ya habia terminado (p.ej. recortado en el limite)
+                current[3] = t
+        elif kind == "state" and text == "Idle" and current is not None and \
+                current[2] is not None and current[3] is None:
+            current[3] = t
+        elif kind == "tx" and text.startswith("error") and current is not None:
+            current[5] += 1
+    if current is not None and current[2] is not None:
+        bursts.append(current)
+
+    for name, t_jog, t_cancel, t_idle, t_end, errors in bursts:
+        res = results[name]
+        res["bursts"] += 1
+        res["errors"] += errors
+        before = None
+        moved = last_move = None
+        for t, pos in samples:
+            if t <= t_jog:
+                before = pos
+                continue
+            if t_end is not None and t >= t_end:
+                break
+            if pos != before:
+                if moved is None:
+                    moved = t
+                last_move = t
+                before = pos
+        if moved is not None:
+            res["cmd_to_motion"].append(moved - t_jog)
+            res["cancel_to_stop"].append(max(0.0, last_move - t_cancel))
+        if t_idle is not None:
+            res["cancel_to_idle"].append(t_idle - t_cancel)
+    return results
+
+
+def measure_jog(repeat=1, port=JOG_PORT):
+    """Rafagas de jog + jog-cancel por escenario en un simulador propio.
+
+    Retorna {escenario: {metrica: {count, p50, p95, max}, 'bursts', 'errors'}}.
+    """
+    import shutil
+    import tempfile
+    tmp = tempfile.mkdtemp(prefix="rtcp_jog_")
+    try:
+        event_path = os.path.join(tmp, "jog.events")
+        step_path = os.path.join(tmp, "jog.step")
+        ref = Sim(port=port, eeprom=os.path.join(tmp, "EEPROM_jog.DAT"),
+                  extra_args=["-t", "1", "-l", event_path, "-s", step_path,
+                              "-m", "events", "-d", "1", "-r", str(MOTION_STEP_TIME),
+                              "-b", os.devnull])
+        try:
+            ref.start()
+            apply_config(ref)
+            apply_config(ref, JOG_SETUP)
+            for name, commands, start, axis in JOG_SCENARIOS:
+                ref.cmd("(JOG %s)" % name, wait=0)
+                apply_config(ref, commands)
+                for hold in JOG_HOLDS * repeat:
+                    resp = ref.cmd("G0 " + start, wait=0)
+                    if not has_text(resp, "ok") or not wait_idle(ref):
+                        log.warning("Jog %s: posicion inicial %s: %s", name, start, resp)
+                        break
+                    jog_burst(ref, axis, hold)
+                    wait_idle(ref)
+                    ref._drain()
+            ref.realtime("\x06")  # Ctrl-F: salida limpia, cierra los archivos
+            ref.sock.close()
+            ref.sock = None
+            ref.proc.wait(timeout=10)
+        except Exception as e:
+            log.warning("Benchmark de jog: %s", e)
+        finally:
+            ref.close()
+
+        results = {}
+        if not (os.path.exists(event_path) and os.path.exists(step_path)):
+            return results
+        for name, res in jog_latencies(parse_event_log(event_path),
+                                       parse_step_samples(step_path)).items():
+            out = {"bursts": res["bursts"], "errors": res["errors"]}
+            for metric in JOG_METRICS:
+                vals = res[metric]
+                out[metric] = {"count": len(vals), "p50": percentile(vals, 50),
+                               "p95": percentile(vals, 95), "max": max(vals) if vals else 0.0}
+            results[name] = out
+            print("  [JOG] %-16s rafagas=%d  %s%s" % (
+                name, res["bursts"], "  ".join(
+                    "%s p50=%.1fms p95=%.1fms" % (m, 1000 * out[m]["p50"], 1000 * out[m]["p95"])
+                    for m in JOG_METRICS),
+                "  errores=%d" % res["errors"] if res["errors"] else ""))
+        return results
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def git_commit():
+    """Hash corto de HEAD (+ '-dirty' si hay cambios sin commitear)."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        head = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=here,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"], cwd=here,
+                                stderr=subprocess.DEVNULL) != 0
+        return head + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def config_hash(commands=None):
+    """SHA1 de los comandos efectivos de testing_config.ini (sin comentarios)."""
+    text = "\n".join(_CONFIG_CMDS if commands is None else commands)
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+class History:
+    """Base SQLite con una fila por ejecucion de testing.py."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created TEXT, commit_hash TEXT, config_hash TEXT, groups TEXT,
+            passed INTEGER, failed INTEGER,
+            wall REAL, sleep_total REAL, wait_total REAL);
+        CREATE TABLE IF NOT EXISTS tests (
+            run_id INTEGER, grp TEXT, name TEXT, passed INTEGER, duration REAL);
+        CREATE TABLE IF NOT EXISTS counters (
+            run_id INTEGER, key TEXT, count INTEGER,
+            p50 REAL, p95 REAL, max REAL, total REAL);
+        CREATE TABLE IF NOT EXISTS motion (
+            run_id INTEGER, program TEXT, cycle_time REAL, blocks INTEGER, host_time REAL);
+        CREATE TABLE IF NOT EXISTS jog (
+            run_id INTEGER, scenario TEXT, metric TEXT, count INTEGER,
+            p50 REAL, p95 REAL, max REAL);
+        CREATE INDEX IF NOT EXISTS tests_run ON tests(run_id);
+        CREATE INDEX IF NOT EXISTS counters_run ON counters(run_id);
+        CREATE INDEX IF NOT EXISTS motion_run ON motion(run_id);
+        CREATE INDEX IF NOT EXISTS jog_run ON jog(run_id);
+    """
+
+    def __init__(self, path=HISTORY_DB):
+        import sqlite3
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(self.SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def store(self, runner, timing, groups, motion=None, jog=None):
+        passed = sum(1 for r in runner.results if r[2])
+        cur = self.db.execute(
+            "INSERT INTO runs (created, commit_hash, config_hash, groups, passed, failed,"
+            " wall, sleep_total, wait_total) VALUES (?,?,?,?,?,?,?,?,?)",
+            (time.strftime("%Y-%m-%dT%H:%M:%S"), git_commit(), config_hash(),
+             ",".join(groups), passed, len(runner.results) - passed,
+             timing.elapsed(), timing.sleep_total, timing.wait_total))
+        run_id = cur.lastrowid
+        self.db.executemany(
+            "INSERT INTO tests VALUES (?,?,?,?,?)",
+            [(run_id, g, n, int(bool(p)), d) for g, n, p, d in runner.results])
+        self.db.executemany(
+            "INSERT INTO counters VALUES (?,?,?,?,?,?,?)",
+            [(run_id, k, st["count"], st["p50"], st["p95"], st["max"], st["total"])
+             for k, st in ((k, timing.stats(k)) for k in timing.samples)])
+        self.db.executemany(
+            "INSERT INTO motion VALUES (?,?,?,?,?)",
+            [(run_id, name, m["cycle_time"], m["blocks"], m["host_time"])
+             for name, m in sorted((motion or {}).items())])
+        self.db.executemany(
+            "INSERT INTO jog VALUES (?,?,?,?,?,?,?)",
+            [(run_id, name, metric, st["count"], st["p50"], st["p95"], st["max"])
+             for name, res in sorted((jog or {}).items())
+             for metric, st in sorted((k, v) for k, v in res.items() if k in JOG_METRICS)])
+        self.db.commit()
+        return run_id
+
+    def metrics(self, run_id):
+        """Retorna {metrica: valor} comparable entre ejecuciones."""
+        out = {}
+        row = self.db.execute("SELECT wall FROM runs WHERE id=?", (run_id,)).fetchone()
+        if row:
+            out["suite/wall"] = row[0]
+        for grp, name, dur in self.db.execute(
+                "SELECT grp, name, duration FROM tests WHERE run_id=?", (run_id,)):
+            out["test/%s/%s" % (grp, name)] = dur
+        for grp, dur in self.db.execute(
+                "SELECT grp, SUM(duration) FROM tests WHERE run_id=? GROUP BY grp", (run_id,)):
+            out["group/%s" % grp] = dur
+        for key, p50, total in self.db.execute(
+                "SELECT key, p50, total FROM counters WHERE run_id=?", (run_id,)):
+            out["cmd/%s/p50" % key] = p50
+            out["cmd/%s/total" % key] = total
+        for prog, cycle, blocks, host in self.db.execute(
+                "SELECT program, cycle_time, blocks, host_time FROM motion WHERE run_id=?",
+                (run_id,)):
+            out["motion/%s/cycle_time" % prog] = cycle
+            out["motion/%s/blocks" % prog] = blocks
+            out["motion/%s/host_time" % prog] = host
+        for scenario, metric, p95 in self.db.execute(
+                "SELECT scenario, metric, p95 FROM jog WHERE run_id=?", (run_id,)):
+            out["jog/%s/%s/p95" % (scenario, metric)] = p95
+        return out
+
+    def previous(self, run_id):
+        """Ejecuciones anteriores (mas reciente primero) con el mismo config_hash
+        y los mismos grupos: suite/wall y group/* dependen de la seleccion."""
+        row = self.db.execute("SELECT config_hash, groups FROM runs WHERE id=?",
+                              (run_id,)).fetchone()
+        if not row:
+            return []
+        return [r[0] for r in self.db.execute(
+            "SELECT id FROM runs WHERE config_hash=? AND groups=? AND id<? ORDER BY id DESC",
+            (row[0], row[1], run_id))]
+
+    def compare(self, run_id, n=10):
+        """Compara cada metrica de run_id contra las n ejecuciones anteriores que
+        la registraron (--motion/--jog no estan en todas). Retorna lista de
+        regresiones (metrica, actual, media, desviacion, umbral) y n_base, el
+        numero de ejecuciones usadas."""
+        current = self.metrics(run_id)
+        history = dict((key, []) for key in current)
+        used = 0
+        for rid in self.previous(run_id):
+            found = False
+            for key, val in self.metrics(rid).items():
+                vals = history.get(key)
+                if vals is not None and len(vals) < n:
+                    vals.append(val)
+                    found = True
+            used += found
+            if all(len(vals) >= n for vals in history.values()):
+                break
+
+        regressions = []
+        for key, val in sorted(current.items()):
+            vals = history.get(key, [])
+            if len(vals) < REGRESSION_MIN_RUNS:
+                continue
+            mean = sum(vals) / len(vals)
+            sd = math.sqrt(sum((v - mean) ** 2 for v in vals) / (len(vals) - 1))
+            floor = 0 if key.endswith("/blocks") else REGRESSION_ABS
+            limit = mean + max(REGRESSION_Z * sd, REGRESSION_REL * abs(mean), floor)
+            if val > limit:
+                regressions.append((key, val, mean, sd, limit))
+        return regressions, used
+
+
+def print_regressions(regressions, n_base, n_req):
+    print("\n" + "=" * 55)
+    print("COMPARACION contra %d ejecuciones previas (pedidas %d, mismo config y grupos)" % (n_base, n_req))
+    if n_base < REGRESSION_MIN_RUNS:
+        print("  Historial insuficiente (minimo %d ejecuciones)" % REGRESSION_MIN_RUNS)
+    elif not regressions:
+        print("  Sin regresiones de rendimiento")
+    for key, val, mean, sd, limit in sorted(regressions, key=lambda r: -(r[1] / r[2] if r[2] else 0)):
+        print("  [SLOW] %-52s %.3f vs media %.3f (+%.0f%%, sd=%.3f)" % (
+            key[:52], val, mean, 100.0 * (val - mean) / mean if mean else 0, sd))
+
+
+# =====================================================================
+# BARRIDO DE MATRIZ DE CONFIGURACION (--sweep)
+# =====================================================================
+
+SWEEP_BASE_PORT = PORT + 10   # worker i usa SWEEP_BASE_PORT + i
+SWEEP_GROUPS = ["matematicas", "coherencia", "feedrate"]
+
+
+def parse_sweep_spec(spec):
+    """'$642=150,210 $643=0,5' -> [("$642", ["150", "210"]), ("$643", ["0", "5"])].
+
+    Valores separados por coma o rango inicio:fin:paso (fin incluido).
+    '@archivo' lee la especificacion de un archivo (una o varias lineas).
+    """
+    if spec.startswith("@"):
+        with open(spec[1:], "r") as f:
+            spec = " ".join(l.split(";")[0] for l in f if not l.lstrip().startswith("#"))
+    axes = []
+    for item in spec.replace(";", " ").split():
+        if "=" not in item or not item.startswith("$"):
+            raise ValueError("Especificacion invalida: %s" % item)
+        key, vals = item.split("=", 1)
+        values = []
+        for v in vals.split(","):
+            if v.count(":") == 2:
+                start, stop, step = (float(x) for x in v.split(":"))
+                if step <= 0:
+                    raise ValueError("Paso invalido en %s" % item)
+                n = int(math.floor((stop - start) / step + 1e-9)) + 1
+                values += ["%g" % (start + i * step) for i in range(n)]
+            elif v:
+                float(v)  # valida
+                values.append(v)
+        if not values:
+            raise ValueError("Sin valores para %s" % key)
+        axes.append((key, values))
+    return axes
+
+
+def sweep_geometries(axes):
+    """Producto cartesiano de los ejes del barrido -> lista de dicts."""
+    combos = [{}]
+    for key, values in axes:
+        combos = [dict(c, **{key: v}) for c in combos for v in values]
+    return combos
+
+
+def _settings_equal(a, b):
+    try:
+        return float(a) == float(b)
+    except (TypeError, ValueError):
+        return a == b
+
+
+def _sweep_worker(idx, groups, tasks, results, verbose):
+    """Proceso worker: un simulador caliente reutilizado para varias geometrias.
+
+    Solo se reenvian los $ que cambian respecto a la geometria anterior.
+    """
+    global PIVOT, OFFSETS
+    import shutil
+    import tempfile
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.WARNING,
+                        format="%(asctime)s [w" + str(idx) + "] %(message)s",
+                        datefmt="%H:%M:%S")
+    tmp = tempfile.mkdtemp(prefix="rtcp_sweep_")
+    sim = Sim(port=SWEEP_BASE_PORT + idx, eeprom=os.path.join(tmp, "EEPROM_sweep%d.DAT" % idx))
+    applied = None
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            n, geometry = task
+            t0 = time.perf_counter()
+            row = {"index": n, "geometry": geometry, "worker": idx,
+                   "passed": 0, "total": 0, "max_error": None,
+                   "failures": [], "error": None, "sent": 0}
+            try:
+                if applied is None:
+                    sim.close()
+                    sim.start()
+                    apply_config(sim)
+                    applied = dict(_CONFIG_SETTINGS)
+                changed = ["%s=%s" % (k, v) for k, v in sorted(geometry.items())
+                           if not _settings_equal(applied.get(k), v)]
+                _, errs = apply_config(sim, changed)
+                if errs:
+                    raise RuntimeError("%d settings rechazados: %s" % (errs, " ".join(changed)))
+                applied.update(geometry)
+                row["sent"] = len(changed)
+                PIVOT = get_pivot(applied)
+                OFFSETS = get_offsets(applied)
+                # $RESTORE volveria a los settings de la geometria anterior: nuevo baseline
+                sim.baseline = False
+                reset_position(sim)
+                sim.save_baseline()
+
+                t = TestRunner(echo=False)
+                for name in groups:
+                    GROUPS[name][1](sim, t)
+                row["total"] = len(t.results)
+                row["passed"] = sum(1 for r in t.results if r[2])
+                row["failures"] = ["%s: %s" % (r[0], r[1]) for r in t.results if not r[2]]
+                if t.max_error:
+                    row["max_error"] = max(t.max_error.values())
+            except Exception as e:
+                row["error"] = str(e) or e.__class__.__name__
+                applied = None  # estado desconocido: relanzar el simulador
+            row["duration"] = time.perf_counter() - t0
+            results.put(row)
+    finally:
+        sim.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def run_sweep(axes, groups, workers, verbose=False):
+    """Reparte las geometrias entre `workers` simuladores. Retorna filas ordenadas."""
+    import multiprocessing
+    geometries = sweep_geometries(axes)
+    workers = max(1, min(workers, len(geometries)))
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    for n, geometry in enumerate(geometries):
+        tasks.put((n, geometry))
+    for _ in range(workers):
+        tasks.put(None)
+
+    print("\n=== SWEEP: %d geometrias x %s, %d workers ===" % (
+        len(geometries), ",".join(groups), workers))
+    procs = [multiprocessing.Process(target=_sweep_worker,
+                                     args=(i, groups, tasks, results, verbose))
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+
+    rows = []
+    try:
+        while len(rows) < len(geometries):
+            try:
+                row = results.get(timeout=5.0)
+            except Exception:
+                if not any(p.is_alive() for p in procs):
+                    log.error("Workers terminados con %d/%d geometrias", len(rows), len(geometries))
+                    break
+                continue
+            rows.append(row)
+            print("  [%d/%d] %s -> %s" % (
+                len(rows), len(geometries),
+                " ".join("%s=%s" % kv for kv in sorted(row["geometry"].items())),
+                row["error"] or "%d/%d" % (row["passed"], row["total"])))
+    finally:
+        for p in procs:
+            p.join(timeout=30)
+            if p.is_alive():
+                p.terminate()
+    rows.sort(key=lambda r: r["index"])
+    return rows
+
+
+def print_sweep(axes, rows):
+    """Tabla pass/fail + error maximo por geometria. Retorna True si todas pasan."""
+    keys = [k for k, _ in axes]
+    print("\n" + "=" * 60)
+    print("SWEEP: RESULTADO POR GEOMETRIA")
+    print("=" * 60)
+    print("  " + "".join("%-9s" % k for k in keys) +
+          "%-9s %-11s %-8s %s" % ("tests", "max_err mm", "t (s)", "worker"))
+    all_ok = True
+    for row in rows:
+        ok = row["error"] is None and row["total"] and row["passed"] == row["total"]
+        all_ok = all_ok and bool(ok)
+        err = "-" if row["max_error"] is None else "%.4f" % row["max_error"]
+        print("  " + "".join("%-9s" % row["geometry"][k] for k in keys) +
+              "%-9s %-11s %-8.1f w%d %s" % (
+                  "%d/%d" % (row["passed"], row["total"]), err,
+                  row["duration"], row["worker"], "" if ok else "[FAIL]"))
+        if row["error"]:
+            print("      error: %s" % row["error"])
+        for f in row["failures"]:
+            print("      - %s" % f)
+    failed = sum(1 for r in rows if r["error"] or r["passed"] != r["total"] or not r["total"])
+    print("=" * 60)
+    print("  %d geometrias, %d con fallos" % (len(rows), failed))
+    return all_ok
+
+
 # =====================================================================
 # MAIN
 # =====================================================================
@@ -1034,19 +2198,42 @@ Ejemplos:
         """
     )
 
-    for name, (desc, _) in GROUPS.items():
+    for name, (desc, _, _) in GROUPS.items():
         parser.add_argument("-%s" % name, action="store_true", help=desc)
 
     parser.add_argument("-l", "--list", action="store_true",
                         help="Lista grupos disponibles")
     parser.add_argument("-v", "--verbose", action="store_true",
                         help="Logging verbose (DEBUG)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignorar la cache y ejecutar todos los grupos")
+    parser.add_argument("--only-changed", action="store_true",
+                        help="Ejecutar y reportar solo grupos con entradas cambiadas")
+    parser.add_argument("--cache-file", default=CACHE_FILE, metavar="RUTA",
+                        help="Cache de resultados por hash (default: %(default)s)")
+    parser.add_argument("--timing-json", default=TIMING_JSON, metavar="RUTA",
+                        help="Archivo JSON de metricas de tiempo (default: %(default)s)")
+    parser.add_argument("--history-db", default=HISTORY_DB, metavar="RUTA",
+                        help="Base SQLite del historial (default: %(default)s)")
+    parser.add_argument("--no-history", action="store_true",
+                        help="No guardar la ejecucion en el historial")
+    parser.add_argument("--motion", action="store_true",
+                        help="Medir ciclo simulado de los programas de referencia")
+    parser.add_argument("--jog", type=int, nargs="?", const=2, default=0, metavar="N",
+                        help="Latencia de jog y jog-cancel (0x85) por escenario, N rafagas"
+                             " por tiempo de pulsacion (default N=2)")
+    parser.add_argument("--compare", type=int, nargs="?", const=10, default=0, metavar="N",
+                        help="Detectar regresiones contra las ultimas N ejecuciones (default N=10)")
+    parser.add_argument("--sweep", metavar="SPEC",
+                        help="Barrido de geometrias, p.ej. '$642=150,210 $643=0,5' o @archivo")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), metavar="N",
+                        help="Simuladores en paralelo para --sweep (default: %(default)s)")
 
     args = parser.parse_args()
 
     if args.list:
         print("\nGrupos de tests disponibles:\n")
-        for name, (desc, _) in GROUPS.items():
+        for name, (desc, _, _) in GROUPS.items():
             print("  -%-15s %s" % (name, desc))
         print("\n  Sin argumentos: ejecuta TODOS los grupos")
         return
@@ -1060,22 +2247,81 @@ Ejemplos:
 
     # Determinar grupos a ejecutar
     selected = [name for name in GROUPS if getattr(args, name, False)]
+
+    if args.sweep:
+        # Sin cache ni historial: cada geometria es una configuracion distinta
+        try:
+            axes = parse_sweep_spec(args.sweep)
+        except (OSError, ValueError) as e:
+            print("\n[ERROR] --sweep: %s" % e)
+            sys.exit(2)
+        rows = run_sweep(axes, selected or SWEEP_GROUPS, args.workers, args.verbose)
+        ok = print_sweep(axes, rows)
+        sys.exit(0 if ok and len(rows) == len(sweep_geometries(axes)) else 1)
+
     if not selected:
         selected = list(GROUPS.keys())
 
     sim = Sim()
     t = TestRunner()
+    cache = ResultCache(args.cache_file)
 
     try:
-        sim.start()
-        setup(sim)
-
+        to_run = []
         for name in selected:
-            desc, func = GROUPS[name]
+            digest = group_hash(name)
+            entry = None if args.no_cache else cache.get(name, digest)
+            if entry is None:
+                to_run.append((name, digest))
+            elif not args.only_changed:
+                t.replay(entry, digest)
+
+        if not to_run:
+            print("\nSin cambios en las entradas: nada que ejecutar")
+        else:
+            sim.start()
+            setup(sim)
+
+        for name, digest in to_run:
+            desc, func, _ = GROUPS[name]
+            first = len(t.results)
             func(sim, t)
+            cache.put(name, digest, t.results[first:])
+            cache.save()
 
-        all_passed = t.summary()
-        sys.exit(0 if all_passed else 1)
+        sim.close()
+        sim.timing.stop()
+        selected = [name for name, _ in to_run]
+
+        motion = None
+        if args.motion:
+            print("\n=== MOTION: programas de referencia ===")
+            motion = measure_motion()
+
+        jog = None
+        if args.jog:
+            print("\n=== JOG: latencia de $J= y jog-cancel ===")
+            jog = measure_jog(args.jog)
+
+        all_passed = t.summary(sim.timing)
+        t.write_json(args.timing_json, sim.timing)
+
+        slow = False
+        if not args.no_history:
+            hist = History(args.history_db)
+            try:
+                run_id = hist.store(t, sim.timing, selected, motion, jog)
+                print("Historial: ejecucion #%d en %s" % (run_id, args.history_db))
+                if args.compare:
+                    regressions, n_base = hist.compare(run_id, args.compare)
+                    print_regressions(regressions, n_base, args.compare)
+                    slow = bool(regressions)
+            finally:
+                hist.close()
+
+        if not all_passed:
+            sys.exit(1)
+        sys.exit(3 if slow else 0)
 
     except Exception as e:
         print("\n[ERROR] %s" % e)
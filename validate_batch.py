@@ -0,0 +1,436 @@
+# -*- coding: ascii -*-
+"""
+grblHAL_validator en lote
+=========================
+Valida muchos archivos G-code en paralelo con grblHAL_validator y junta
+los resultados en un solo reporte (tiempo por archivo y lineas/s).
+
+Cada archivo se valida en un proceso propio dentro de un directorio
+temporal: el validador lee/escribe EEPROM.DAT en el directorio de trabajo,
+asi que procesos en paralelo no pueden compartirlo. El validador corre en
+modo diagnostico (-a): se reportan todas las lineas con error de cada
+archivo, no solo la primera.
+
+Uso basico:
+    python validate_batch.py trabajos/            # Todos los .nc/.ngc/.gcode/.tap
+    python validate_batch.py a.nc b.nc -j 8       # 8 validadores en paralelo
+    python validate_batch.py @manifiesto.txt      # Una ruta por linea (# comenta)
+    python validate_batch.py trabajos/ --eeprom EEPROM.DAT   # Settings de una maquina
+
+Cache de resultados (validate_cache.json):
+    Clave = sha256 del contenido del archivo + hash de settings (binario del
+    validador + EEPROM usado). Un archivo sin cambios no se vuelve a validar.
+    python validate_batch.py trabajos/ --no-cache # Revalida todo (refresca la cache)
+
+Autotest (--selftest):
+    Valida en lote unos programas cortos con resultado conocido (pausas
+    M0/M1/M60, error de sintaxis, fin de programa) y comprueba el estado de
+    cada uno: detecta un validador que se cuelga o termina mal.
+    python validate_batch.py --selftest --validator build/grblHAL_validator
+
+Reporte:
+    python validate_batch.py trabajos/ --json reporte.json
+    python validate_batch.py trabajos/ -q         # Solo errores + resumen
+
+Codigo de salida:
+    0 = todos los archivos validos
+    1 = al menos un archivo con error
+    2 = error de ejecucion (validador no encontrado, timeout, etc.)
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# =====================================================================
+# CONFIGURACION
+# =====================================================================
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+VALIDATOR_EXE = os.path.join(REPO_DIR, "build",
+                             "grblHAL_validator" + (".exe" if os.name == "nt" else ""))
+CACHE_FILE = os.path.join(REPO_DIR, "validate_cache.json")
+CACHE_MAX_ENTRIES = 5000
+GCODE_EXTS = (".nc", ".ngc", ".gcode", ".gc", ".tap", ".cnc")
+TIMEOUT = 120.0  # seg por archivo
+
+MAX_ERRORS_SHOWN = 10  # errores por archivo en la salida de texto (el JSON los tiene todos)
+
+log = logging.getLogger("validate_batch")
+
+
+# =====================================================================
+# ENTRADAS
+# =====================================================================
+
+def collect_files(paths):
+    """Expande directorios (recursivo) y manifiestos '@archivo'. Mantiene orden."""
+    files = []
+    for path in paths:
+        if path.startswith("@"):
+            base = os.path.dirname(os.path.abspath(path[1:]))
+            with open(path[1:], "r") as f:
+                entries = [l.strip() for l in f]
+            files += collect_files([os.path.join(base, e) for e in entries
+                                    if e and not e.startswith("#")])
+        elif os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files += [os.path.join(root, n) for n in sorted(names)
+                          if n.lower().endswith(GCODE_EXTS)]
+        else:
+            files.append(path)
+    seen = set()
+    return [f for f in files if not (f in seen or seen.add(f))]
+
+
+def file_digest(path):
+    """(sha256, lineas) del archivo en una sola pasada."""
+    h = hashlib.sha256()
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last != b"\n":
+        lines += 1  # ultima linea sin salto final
+    return h.hexdigest(), lines
+
+
+def settings_hash(exe, eeprom=None):
+    """Hash de lo que determina el resultado ademas del G-code."""
+    h = hashlib.sha256()
+    for path in [exe] + ([eeprom] if eeprom else []):
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    if not eeprom:
+        h.update(b"defaults")
+    return h.hexdigest()
+
+
+# =====================================================================
+# CACHE
+# =====================================================================
+
+class ResultCache:
+    """Resultados por 'sha_archivo:sha_settings' en un JSON (orden LRU simple)."""
+
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, result):
+        self.entries.pop(key, None)
+        self.entries[key] = {k: result[k] for k in ("lines", "status", "code", "message", "time",
+                                                    "errors")}
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        items = list(self.entries.items())[-CACHE_MAX_ENTRIES:]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(dict(items), f, indent=1)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+# =====================================================================
+# VALIDACION
+# =====================================================================
+
+def validate_file(path, exe, eeprom=None, timeout=TIMEOUT):
+    """Ejecuta grblHAL_validator sobre un archivo. Retorna dict de resultado.
+
+    El validador corre en modo diagnostico (-a): sigue despues de un error y
+    reporta cada linea con error como un objeto JSON por linea.
+    """
+    result = {"status": "ok", "code": 0, "message": "", "time": 0.0, "errors": []}
+    workdir = tempfile.mkdtemp(prefix="grbl_validate_")
+    try:
+        if eeprom:
+            shutil.copyfile(eeprom, os.path.join(workdir, "EEPROM.DAT"))
+        t0 = time.perf_counter()
+        proc = subprocess.run([exe, "-a", os.path.abspath(path)], cwd=workdir,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              timeout=timeout)
+        result["time"] = time.perf_counter() - t0
+        errors, alarm, summary = parse_diagnostics(proc.stdout.decode(errors="replace"))
+        result["errors"] = errors
+        if alarm:
+            result.update(status="alarm", code=alarm["alarm"],
+                          message="ALARM:%d (linea %d)" % (alarm["alarm"], alarm["line"]))
+        elif errors:
+            result.update(status="error", code=errors[0]["status"],
+                          message="linea %d: %s" % (errors[0]["line"], errors[0]["message"]))
+        elif summary is None or proc.returncode:
+            # Terminacion anormal (crash): no es un resultado reproducible del G-code
+            result.update(status="crash", code=proc.returncode,
+                          message="codigo de salida %d" % proc.returncode)
+    except subprocess.TimeoutExpired:
+        result.update(status="timeout", code=-1, message="sin respuesta en %.0fs" % timeout,
+                      time=timeout)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def parse_diagnostics(out):
+    """Salida de grblHAL_validator -a -> (errores, alarma o None, resumen o None)."""
+    errors, alarm, summary = [], None, None
+    for line in out.splitlines():
+        if not line.startswith("{"):
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            continue
+        if "status" in obj:
+            errors.append(obj)
+        elif "alarm" in obj:
+            alarm = obj
+        elif "lines" in obj:
+            summary = obj
+    return errors, alarm, summary
+
+
+def run_batch(files, exe, eeprom=None, jobs=4, cache=None, timeout=TIMEOUT, quiet=False,
+              refresh=False):
+    """Valida `files` con `jobs` validadores en paralelo. Retorna lista de resultados.
+
+    Los hilos solo esperan a subprocesos: el trabajo real corre en paralelo
+    en cada grblHAL_validator. refresh=True ignora la cache pero la actualiza.
+    """
+    settings = settings_hash(exe, eeprom)
+    results = []
+    pending = []
+    for path in files:
+        digest, lines = file_digest(path)
+        key = "%s:%s" % (digest, settings)
+        entry = cache.get(key) if cache is not None and not refresh else None
+        row = {"file": path, "lines": lines, "key": key, "cached": entry is not None}
+        if entry is not None:
+            row.update(entry)
+        else:
+            pending.append(row)
+        results.append(row)
+
+    def work(row):
+        row.update(validate_file(row["file"], exe, eeprom, timeout))
+        return row
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for row in pool.map(work, pending):
+            if cache is not None and row["status"] in ("ok", "error", "alarm"):
+                cache.put(row["key"], row)
+            if not quiet or row["status"] != "ok":
+                print_row(row)
+    if cache is not None:
+        cache.save()
+    for row in results:
+        if row["cached"] and (not quiet or row["status"] != "ok"):
+            print_row(row)
+    return results
+
+
+# =====================================================================
+# REPORTE
+# =====================================================================
+
+def lines_per_sec(lines, seconds):
+    return lines / seconds if seconds > 0 else 0.0
+
+
+def print_row(row):
+    status = "[OK]   " if row["status"] == "ok" else "[%s]" % row["status"].upper()
+    msg = "  %-8s %s  %d lineas %.3fs %.0f l/s%s" % (
+        status, row["file"], row["lines"], row["time"],
+        lines_per_sec(row["lines"], row["time"]), "  [CACHE]" if row["cached"] else "")
+    errors = row.get("errors", [])
+    if row["status"] != "ok" and not errors:
+        msg += "\n           -> %s %s" % (row["code"], row["message"])
+    for err in errors[:MAX_ERRORS_SHOWN]:
+        msg += "\n           -> linea %d: error %d %s" % (err["line"], err["status"], err["message"])
+    if len(errors) > MAX_ERRORS_SHOWN:
+        msg += "\n           -> ... %d errores mas" % (len(errors) - MAX_ERRORS_SHOWN)
+    print(msg)
+
+
+def summarize(results, wall):
+    executed = [r for r in results if not r["cached"]]
+    exec_lines = sum(r["lines"] for r in executed)
+    exec_time = sum(r["time"] for r in executed)
+    return {
+        "files": len(results),
+        "ok": sum(1 for r in results if r["status"] == "ok"),
+        "failed": sum(1 for r in results if r["status"] != "ok"),
+        "cached": len(results) - len(executed),
+        "lines": sum(r["lines"] for r in results),
+        "wall_time": wall,
+        "validator_time": exec_time,
+        "lines_per_sec": lines_per_sec(exec_lines, exec_time),
+        "throughput_lines_per_sec": lines_per_sec(exec_lines, wall),
+    }
+
+
+def print_summary(s):
+    print("\n" + "=" * 60)
+    print("Archivos: %d  OK: %d  Con error: %d  Desde cache: %d" % (
+        s["files"], s["ok"], s["failed"], s["cached"]))
+    print("Lineas: %d" % s["lines"])
+    print("Tiempo: %.2fs pared, %.2fs validador (suma por archivo)" % (
+        s["wall_time"], s["validator_time"]))
+    print("Velocidad: %.0f l/s por validador, %.0f l/s total en paralelo" % (
+        s["lines_per_sec"], s["throughput_lines_per_sec"]))
+    print("=" * 60)
+
+
+def write_json(path, results, summary):
+    data = {"summary": summary,
+            "files": [dict({k: r[k] for k in ("file", "lines", "status", "code", "message",
+                                              "time", "cached")}, errors=r.get("errors", []))
+                      for r in results]}
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+    print("Reporte JSON: %s" % path)
+
+
+# =====================================================================
+# AUTOTEST
+# =====================================================================
+
+# nombre -> (programa, estado esperado)
+SELFTEST_PROGRAMS = {
+    "pausa_m0.nc": ("G21 G90\nG1 X10 F500\nM0\nG1 X0\nM30\n", "ok"),
+    "pausa_m1.nc": ("G21 G90\nG1 Y10 F500\nM1\nG1 Y0\nM30\n", "ok"),
+    "pausa_m60.nc": ("T1 M60\nG1 X5 F500\nM60\nM30\n", "ok"),
+    "pausas_seguidas.nc": ("M0\nM1\nM0\nG0 X1\nM2\n", "ok"),
+    "error_sintaxis.nc": ("G1 X10 F500\nG1 X\nM30\n", "error"),
+    # llamada con parametros mal formados: antes dejaba el .macro abierto y el validador colgado
+    "llamada_mal_formada.nc": ("o<fuzz> call [1] [2]]\nM2\n", "error"),
+}
+
+# macros escritas junto a los programas (el validador las busca en el directorio del archivo)
+SELFTEST_MACROS = {
+    "fuzz.macro": "o<fuzz> sub\no<fuzz> endsub\n",
+}
+
+
+def selftest(exe, timeout=TIMEOUT):
+    """Valida SELFTEST_PROGRAMS en lote (sin cache). Retorna True si todos dan lo esperado."""
+    workdir = tempfile.mkdtemp(prefix="grbl_selftest_")
+    try:
+        files = []
+        for name, (text, _) in sorted(SELFTEST_PROGRAMS.items()):
+            files.append(os.path.join(workdir, name))
+            with open(files[-1], "w") as f:
+                f.write(text)
+        for name, text in SELFTEST_MACROS.items():
+            with open(os.path.join(workdir, name), "w") as f:
+                f.write(text)
+        results = run_batch(files, exe, jobs=len(files), timeout=timeout, quiet=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failed = 0
+    for row in results:
+        name = os.path.basename(row["file"])
+        expected = SELFTEST_PROGRAMS[name][1]
+        if row["status"] != expected:
+            failed += 1
+            print("  [FAIL] %-20s esperado %s, obtenido %s %s" % (
+                name, expected, row["status"], row["message"]))
+    print("Autotest: %d/%d programas con el resultado esperado" % (len(results) - failed, len(results)))
+    return failed == 0
+
+
+# =====================================================================
+# MAIN
+# =====================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Validacion en lote con grblHAL_validator",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("paths", nargs="*", metavar="RUTA",
+                        help="Archivos, directorios o @manifiesto")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, metavar="N",
+                        help="Validadores en paralelo (default: %(default)s)")
+    parser.add_argument("--validator", default=VALIDATOR_EXE, metavar="RUTA",
+                        help="Ejecutable grblHAL_validator (default: %(default)s)")
+    parser.add_argument("--eeprom", metavar="RUTA",
+                        help="EEPROM.DAT con los settings de la maquina (default: settings por defecto)")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, metavar="SEG",
+                        help="Timeout por archivo (default: %(default)s)")
+    parser.add_argument("--cache-file", default=CACHE_FILE, metavar="RUTA",
+                        help="Cache de resultados (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignorar la cache y validar todo (la cache se refresca)")
+    parser.add_argument("--json", metavar="RUTA", help="Guardar reporte JSON")
+    parser.add_argument("--selftest", action="store_true",
+                        help="Validar los programas de autotest y comprobar su resultado")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Solo archivos con error y resumen")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Logging verbose (DEBUG)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(message)s", datefmt="%H:%M:%S")
+
+    if not os.path.isfile(args.validator):
+        print("[ERROR] No existe el validador: %s" % args.validator)
+        sys.exit(2)
+    if args.selftest:
+        sys.exit(0 if selftest(args.validator, args.timeout) else 1)
+    if not args.paths:
+        parser.error("se necesita al menos una RUTA (o --selftest)")
+    try:
+        files = collect_files(args.paths)
+        missing = [f for f in files if not os.path.isfile(f)]
+        if missing:
+            raise OSError("No existe: %s" % ", ".join(missing[:5]))
+    except OSError as e:
+        print("[ERROR] %s" % e)
+        sys.exit(2)
+    if not files:
+        print("Sin archivos G-code que validar")
+        return
+
+    cache = ResultCache(args.cache_file)
+    log.info("%d archivos, %d validadores en paralelo", len(files), args.jobs)
+    t0 = time.perf_counter()
+    results = run_batch(files, args.validator, args.eeprom, args.jobs, cache,
+                        args.timeout, args.quiet, args.no_cache)
+    summary = summarize(results, time.perf_counter() - t0)
+    print_summary(summary)
+    if args.json:
+        write_json(args.json, results, summary)
+
+    if any(r["status"] in ("timeout", "crash") for r in results):
+        sys.exit(2)
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()